@@ -29,12 +29,20 @@ import copy
 from waitress import serve
 import time
 import queue
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import pickle
 from flask import stream_with_context, Response
 import math
+import heapq
 import traceback
-from collections import deque
+import functools
+import itertools
+import contextlib
+import numpy as np
+from collections import deque, OrderedDict
 from collections import defaultdict, Counter
+from ortools.sat.python import cp_model
 from docx import Document
 from docx.shared import Cm
 from docx.enum.section import WD_ORIENT
@@ -111,6 +119,14 @@ app = Flask(__name__)
 log_queue = queue.Queue()
 executor = ThreadPoolExecutor(max_workers=1)
 SCHEDULING_STATE = {'should_stop': False}
+ACTIVE_FITNESS_CACHE = {'cache': None}
+ACTIVE_TEACHER_CACHE = {'cache': None}
+ACTIVE_PROFILER = {'profiler': None}
+# مجمّعات العمليات (spawn) المشتركة حسب الاسم ('greedy'، 'backtracking')، تُنشأ عند أول طلب، وآخر رقم تشغيل أُرسل إليها
+PROCESS_POOLS = {}
+PROCESS_POOL_RUN_ID = {'last': 0}
+GREEDY_DEFAULT_WORKERS = 2  # التشغيلات الطماعة تتكرر مع كل محاولة وكل تهيئة، فلا تحجز كل المعالجات افتراضياً
+GREEDY_STOP_POLL_SECONDS = 0.2  # ✨ فترة تفقد زر الإيقاف أثناء انتظار نتائج عمال الطماع
 SEVERITY_PENALTIES = {
     "hard": 100,
     "high": 20,
@@ -222,6 +238,7 @@ def init_db():
     )''')
 
     add_column_if_not_exists(cursor, 'performance_log', 'algorithm_params', 'TEXT')
+    add_column_if_not_exists(cursor, 'performance_log', 'evaluation_profile', 'TEXT')
     
     conn.commit()
     conn.close()
@@ -433,22 +450,23 @@ def get_contained_identifier(course_name, identifiers_for_level):
 
 
 
-def _find_best_greedy_placement_in_slots(slots_to_search, lecture, final_schedule, teacher_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, room_schedule, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=False):
+def _find_best_greedy_placement_in_slots(slots_to_search, lecture, final_schedule, teacher_schedule, room_schedule, model, consecutive_large_hall_rule, prefer_morning_slots=False, bitsets=None):
     best_placement = None
     max_fitness = -1
+    # ✨ الفترات التي ترفضها الإعدادات مستبعدة مسبقاً؛ يبقى فحص الإشغال فقط
+    domain = model.domain(lecture)
 
-    for day_idx, slot_idx in slots_to_search:
-        # تمرير المعلومات الجديدة للدالة النهائية
-        is_valid, result_or_reason = is_placement_valid(
-            lecture, day_idx, slot_idx, final_schedule, teacher_schedule,
-            room_schedule, teacher_constraints, special_constraints,
-            identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data,
-            saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule
-        )
+    for day_idx, slot_idx in domain.allowed_slots(slots_to_search):
+        if bitsets is not None:
+            is_valid, result_or_reason = _is_placement_valid_in_bitsets(domain, lecture, day_idx, slot_idx, bitsets, consecutive_large_hall_rule)
+        else:
+            is_valid, result_or_reason = _is_placement_valid_in_domain(
+                domain, lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, consecutive_large_hall_rule
+            )
         if not is_valid: continue
         
         available_room = result_or_reason
-        current_fitness = calculate_slot_fitness(lecture.get('teacher_name'), day_idx, slot_idx, teacher_schedule, special_constraints, prefer_morning_slots=prefer_morning_slots)
+        current_fitness = calculate_slot_fitness(lecture.get('teacher_name'), day_idx, slot_idx, teacher_schedule, model.special_constraints, prefer_morning_slots=prefer_morning_slots, model=model)
 
         if current_fitness > max_fitness:
             max_fitness = current_fitness
@@ -459,7 +477,10 @@ def find_slot_for_single_lecture(lecture, final_schedule, teacher_schedule, room
                                  days, slots, rules_grid, rooms_data,
                                  teacher_constraints, globally_unavailable_slots, special_constraints,
                                  primary_slots, reserve_slots, identifiers_by_level, prioritize_primary,
-                                 saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=False):
+                                 saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=False, bitsets=None,
+                                 model=None):
+    """bitsets: أقنعة OccupancyBitsets اختيارية لنفس الجدول والخرائط؛ تُفحص بها الفترات وتُحدَّث عند الوضع.
+    model: ConstraintModel المُجمَّع للتشغيل (يُجمَّع من الإعدادات الممررة إن لم يُمرَّر)."""
     teacher = lecture.get('teacher_name')
     if not teacher: 
         return False, "المادة غير مسندة لأستاذ"
@@ -467,7 +488,11 @@ def find_slot_for_single_lecture(lecture, final_schedule, teacher_schedule, room
     best_placement = None
     is_large_room_course = lecture.get('room_type') == 'كبيرة'
     
-    args_for_placement = (lecture, final_schedule, teacher_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, room_schedule, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots)
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    args_for_placement = (lecture, final_schedule, teacher_schedule, room_schedule, model, consecutive_large_hall_rule, prefer_morning_slots, bitsets)
 
     if is_large_room_course and prioritize_primary:
         best_placement = _find_best_greedy_placement_in_slots(primary_slots, *args_for_placement)
@@ -481,14 +506,8 @@ def find_slot_for_single_lecture(lecture, final_schedule, teacher_schedule, room
 
     if best_placement:
         d_idx, s_idx, room = best_placement["day_idx"], best_placement["slot_idx"], best_placement["room"]
-        details = {
-            "id": lecture['id'], 
-            "name": lecture['name'], 
-            "teacher_name": teacher, 
-            "room": room, 
-            "room_type": lecture['room_type'],
-            "levels": lecture.get('levels', []) # <-- ✨ الإضافة الضرورية هنا
-        }
+        # ✨ وضعية ثابتة مشتركة بين كل مستويات المادة بدلاً من قاموس جديد
+        details = Placement.of(lecture, room, model=model)
         
         # --- بداية التصحيح ---
         # استخدام حلقة للمرور على قائمة المستويات بدلاً من المفتاح المفرد
@@ -500,6 +519,7 @@ def find_slot_for_single_lecture(lecture, final_schedule, teacher_schedule, room
             
         teacher_schedule.setdefault(teacher, set()).add((d_idx, s_idx))
         room_schedule.setdefault(room, set()).add((d_idx, s_idx))
+        if bitsets is not None: bitsets.place(details, d_idx, s_idx)
         if not teacher_constraints.get(teacher, {}).get('allowed_days'):
             teacher_constraints.setdefault(teacher, {}).setdefault('assigned_days', set()).add(d_idx)
         return True, "تمت الجدولة بنجاح في أفضل مكان"
@@ -507,97 +527,1580 @@ def find_slot_for_single_lecture(lecture, final_schedule, teacher_schedule, room
     return False, "لم يتم العثور على أي فترة زمنية متاحة تحقق كل القيود."
 
 
-# ================== استبدل الدالة القديمة بهذه النسخة المبسطة والصحيحة ==================
-# استبدل دالة solve_backtracking بالكامل بهذه النسخة
-def solve_backtracking(log_q, lectures_to_schedule, domains, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, start_time, timeout, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, initial_lecture_count, scheduling_state, level_specific_large_rooms, specific_small_room_assignments, num_slots, constraint_severities, consecutive_large_hall_rule, max_sessions_per_day=None, non_sharing_teacher_pairs=[]):
-    if scheduling_state.get('should_stop'):
-        raise StopByUserException()
-    
-    if time.time() - start_time > timeout:
-        raise TimeoutException()
+# ✨ نطاقات البحث بالتراجع مع فحص أمامي وسجل تراجع
+class ForwardCheckingDomains:
+    """
+    نطاقات محاضرات البحث بالتراجع (قيم يوم، فترة، قاعة) تُقلَّص عند كل وضع وتُستعاد عند التراجع.
+    - values[معرّف]: القيم الحية؛ by_slot[معرّف][(يوم، فترة)]: قيمه الأصلية في تلك الفترة.
+    - slot_peers[معرّف]: محاضرات تتعارض معه في الفترة نفسها أياً كانت القاعة: نفس الأستاذ، أو مستوى مشترك
+      مع قاعة كبيرة لأي منهما أو بنفس المعرف. room_peers[قاعة]: محاضرات في نطاقها هذه القاعة.
+    - assign يحذف من نطاقات غير الموضوعة كل قيمة تتعارض مع الوضع ويسجّل الحذف في trail، ويعيد المحاضرة
+      التي فرغ نطاقها (أو None)؛ unassign يعيد ما حُذف بعد العلامة mark = len(trail) المأخوذة قبل الوضع.
+    - pruned_by[معرّف]: المحاضرات الموضوعة التي حذفت من نطاقه (مع عدد القيم)، أي مجموعة تعارضه للقفز الخلفي.
+    - buckets: المحاضرات غير الموضوعة مصنفة بمفتاح (حجم النطاق، ثم rank لكسر التعادل) وتُنقل بين الدلاء
+      مع كل حذف واستعادة، فيعيد select محاضرة MRV دون المرور على كل المحاضرات.
+    - variable_order يحدد كسر التعادل: 'teacher_load' الأكثر محاضرات لأستاذه، 'degree' الأكثر تعارضات في الفترة،
+      'random' عشوائي من rng؛ ومع rng يُخلط أيضاً ترتيب الدخول الأول إلى الدلاء.
+    """
+    def __init__(self, lectures, domains, model, lectures_by_teacher_map, variable_order='teacher_load', rng=None):
+        self.values = {lec['id']: set(domains.get(lec['id'], ())) for lec in lectures}
+        self.by_slot, self.room_peers = {}, defaultdict(list)
+        for lec_id, values in self.values.items():
+            slots = self.by_slot[lec_id] = defaultdict(list)
+            for value in values: slots[value[:2]].append(value)
+            for room in {value[2] for value in values}: self.room_peers[room].append(lec_id)
+
+        self.slot_peers = {lec['id']: set() for lec in lectures}
+        groups = defaultdict(list)
+        for lec in lectures:
+            groups[('teacher', lec.get('teacher_name'))].append(lec)
+            for level in lec.get('levels', []): groups[('level', level)].append(lec)
+        for (kind, key), members in groups.items():
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    if kind == 'level' and first.get('room_type') != 'كبيرة' and second.get('room_type') != 'كبيرة':
+                        identifier = model.identifier_of(first['name'], key)
+                        if not identifier or identifier != model.identifier_of(second['name'], key): continue
+                    self.slot_peers[first['id']].add(second['id'])
+                    self.slot_peers[second['id']].add(first['id'])
+        self.assigned = set()
+        self.trail = []
+        self.pruned_by = defaultdict(dict)
+
+        loads = {lec['id']: len(lectures_by_teacher_map.get(lec.get('teacher_name'), [])) for lec in lectures}
+        if variable_order == 'degree':
+            loads = {lec_id: len(peers) for lec_id, peers in self.slot_peers.items()}
+        elif variable_order == 'random':
+            top = max(loads.values(), default=0)
+            loads = {lec_id: rng.randint(0, top) for lec_id in loads}
+        max_load = max(loads.values(), default=0)
+        self.rank = {lec_id: max_load - load for lec_id, load in loads.items()}
+        self.span = max_load + 1
+        max_size = max((len(values) for values in self.values.values()), default=0)
+        self.buckets = [{} for _ in range((max_size + 1) * self.span)]
+        self.key_of = {}
+        self.low = 0
+        entry_order = [lec['id'] for lec in lectures]
+        if rng is not None: rng.shuffle(entry_order)
+        for lec_id in entry_order: self._enter(lec_id)
+
+    def _enter(self, lec_id):
+        key = len(self.values[lec_id]) * self.span + self.rank[lec_id]
+        self.buckets[key][lec_id] = None
+        self.key_of[lec_id] = key
+        if key < self.low: self.low = key
+
+    def _leave(self, lec_id):
+        del self.buckets[self.key_of.pop(lec_id)][lec_id]
+
+    def size(self, lec_id):
+        return len(self.values[lec_id])
+
+    def select(self):
+        """محاضرة غير موضوعة بأصغر نطاق (أو None إن وُضعت كلها)."""
+        buckets = self.buckets
+        while self.low < len(buckets) and not buckets[self.low]: self.low += 1
+        return next(iter(buckets[self.low])) if self.low < len(buckets) else None
+
+    def _prune(self, peer, value, by):
+        values = self.values[peer]
+        if value in values:
+            self._leave(peer)
+            values.discard(value)
+            self.trail.append((peer, value, by))
+            pruners = self.pruned_by[peer]
+            pruners[by] = pruners.get(by, 0) + 1
+            self._enter(peer)
+
+    def assign(self, lec_id, value):
+        self._leave(lec_id)
+        self.assigned.add(lec_id)
+        day_idx, slot_idx, room = value
+        for peer in self.slot_peers[lec_id]:
+            if peer in self.assigned: continue
+            for peer_value in self.by_slot[peer].get((day_idx, slot_idx), ()):
+                self._prune(peer, peer_value, lec_id)
+            if not self.values[peer]: return peer
+        for peer in self.room_peers[room]:
+            if peer in self.assigned: continue
+            self._prune(peer, value, lec_id)
+            if not self.values[peer]: return peer
+        return None
 
-    num_placed = initial_lecture_count - len(lectures_to_schedule)
-    if (num_placed > 0) and (num_placed % 10 == 0):
-        log_q.put(f'   - البحث مستمر... تم توزيع {num_placed} / {initial_lecture_count} مادة')
-        time.sleep(0)
+    def unassign(self, lec_id, mark):
+        trail, values = self.trail, self.values
+        while len(trail) > mark:
+            peer, value, by = trail.pop()
+            self._leave(peer)
+            values[peer].add(value)
+            pruners = self.pruned_by[peer]
+            pruners[by] -= 1
+            if not pruners[by]: del pruners[by]
+            self._enter(peer)
+        self.assigned.discard(lec_id)
+        self._enter(lec_id)
+
+
+class NogoodStore:
+    """
+    إسنادات جزئية ثبت أنها لا تقود إلى حل (nogoods)، كل منها مجموعة (معرّف، قيمة)، بسعة محدودة وإزاحة LRU.
+    watch[(معرّف، قيمة)] يفهرس كل nogood بعناصره، فيكفي عند وضع قيمة فحص الـ nogoods التي تحويها:
+    violated_by يعيد بقية محاضرات أول nogood تكتمل بهذا الوضع (أي مجموعة التعارض) أو None.
+    """
+    def __init__(self, capacity, max_literals):
+        self.capacity, self.max_literals = capacity, max_literals
+        self.nogoods = OrderedDict()
+        self.watch = defaultdict(set)
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, literals):
+        if not literals or len(literals) > self.max_literals: return
+        literals = frozenset(literals)
+        if literals in self.nogoods:
+            self.nogoods.move_to_end(literals)
+            return
+        self.nogoods[literals] = None
+        for literal in literals: self.watch[literal].add(literals)
+        if len(self.nogoods) > self.capacity:
+            evicted, _ = self.nogoods.popitem(last=False)
+            for literal in evicted:
+                watchers = self.watch[literal]
+                watchers.discard(evicted)
+                if not watchers: del self.watch[literal]
+
+    def violated_by(self, lec_id, value, assignment):
+        for nogood in self.watch.get((lec_id, value), ()):
+            if all(other == lec_id or assignment.get(other) == other_value for other, other_value in nogood):
+                self.nogoods.move_to_end(nogood)
+                self.hits += 1
+                return [other for other, _ in nogood if other != lec_id]
+        return None
 
-    if not lectures_to_schedule:
-        failures_list = validate_teacher_constraints_in_solution(teacher_schedule, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, [], num_slots, constraint_severities, max_sessions_per_day)
-        return not failures_list
 
-    min_remaining_values = min(len(domains[lec['id']]) for lec in lectures_to_schedule) if lectures_to_schedule else 0
-    if not lectures_to_schedule or min_remaining_values == 0 : return False
+def _backtracking_value_conflicts(lecture, value, final_schedule, teacher_schedule, room_schedule, model):
+    """هل تتعارض القيمة (يوم، فترة، قاعة) مع الجدول الحالي؟ (تُفحص بها النطاقات مرة واحدة قبل البحث)"""
+    day_idx, slot_idx, room = value
+    if (day_idx, slot_idx) in teacher_schedule.get(lecture['teacher_name'], set()): return True
+    if (day_idx, slot_idx) in room_schedule.get(room, set()): return True
+    lecture_room_type_needed = lecture.get('room_type')
+    for level in lecture.get('levels', []):
+        if lecture_room_type_needed == 'كبيرة':
+            required_room = model.level_specific_large_rooms.get(level)
+            if required_room and room != required_room: return True
+        if lecture_room_type_needed == 'صغيرة':
+            required_room = model.small_room(lecture.get('name'), level)
+            if required_room and room != required_room: return True
 
-    most_constrained_lectures = [lec for lec in lectures_to_schedule if len(domains[lec['id']]) == min_remaining_values]
-    
-    next_lecture_to_schedule = max(most_constrained_lectures, key=lambda lec: len(lectures_by_teacher_map.get(lec.get('teacher_name'), [])))
-    
-    remaining_lectures = [lec for lec in lectures_to_schedule if lec['id'] != next_lecture_to_schedule['id']]
-    current_lecture = next_lecture_to_schedule
-    
-    lecture_id = current_lecture['id']
-    teacher_name = current_lecture['teacher_name']
-    
-    # ✨ التعامل مع قائمة المستويات
-    levels_for_lecture = current_lecture.get('levels', [])
-    lecture_room_type_needed = current_lecture.get('room_type')
-
-    for day_idx, slot_idx, room in list(domains[lecture_id]):
-        if (day_idx, slot_idx) in teacher_schedule.get(teacher_name, set()): continue
-        if (day_idx, slot_idx) in room_schedule.get(room, set()): continue
-
-        # ✨ حلقة للتحقق من الصلاحية في كل المستويات
-        is_valid_for_all_levels = True
-        for level in levels_for_lecture:
-            if lecture_room_type_needed == 'كبيرة':
-                required_room = level_specific_large_rooms.get(level)
-                if required_room and room != required_room:
-                    is_valid_for_all_levels = False; break
-            
-            if lecture_room_type_needed == 'صغيرة':
-                course_full_name = f"{current_lecture.get('name')} ({level})"
-                required_room = specific_small_room_assignments.get(course_full_name)
-                if required_room and room != required_room:
-                    is_valid_for_all_levels = False; break
-
-            lectures_in_slot = final_schedule[level][day_idx][slot_idx]
-            if lectures_in_slot and (lecture_room_type_needed == 'كبيرة' or any(lec.get('room_type') == 'كبيرة' for lec in lectures_in_slot)):
-                is_valid_for_all_levels = False; break
-
-            identifiers_for_level = identifiers_by_level.get(level, [])
-            current_lecture_identifier = get_contained_identifier(current_lecture['name'], identifiers_for_level)
-            if current_lecture_identifier:
-                used_identifiers_in_slot = {get_contained_identifier(p_lec['name'], identifiers_for_level) for p_lec in lectures_in_slot}
-                if current_lecture_identifier in used_identifiers_in_slot:
-                    is_valid_for_all_levels = False; break
-        
-        if not is_valid_for_all_levels:
-            continue
+        lectures_in_slot = final_schedule[level][day_idx][slot_idx]
+        if lectures_in_slot and (lecture_room_type_needed == 'كبيرة' or any(lec.get('room_type') == 'كبيرة' for lec in lectures_in_slot)):
+            return True
+        current_lecture_identifier = model.identifier_of(lecture['name'], level)
+        if current_lecture_identifier and any(model.identifier_of(p_lec['name'], level) == current_lecture_identifier for p_lec in lectures_in_slot):
+            return True
+    return False
 
-        details = {"id": current_lecture['id'], "name": current_lecture['name'], "teacher_name": teacher_name, "room": room, "room_type": lecture_room_type_needed}
-        
-        # ✨ التوزيع على كل المستويات
-        for level in levels_for_lecture:
-            final_schedule[level][day_idx][slot_idx].append(details)
-        teacher_schedule.setdefault(teacher_name, set()).add((day_idx, slot_idx))
-        room_schedule.setdefault(room, set()).add((day_idx, slot_idx))
-        
-        temp_domains = {lec_id: set(dom) for lec_id, dom in domains.items()}
-        
-        if solve_backtracking(log_q, remaining_lectures, temp_domains, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, start_time, timeout, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, initial_lecture_count, scheduling_state, level_specific_large_rooms, specific_small_room_assignments, num_slots, consecutive_large_hall_rule, max_sessions_per_day):
+
+BACKTRACKING_CHECK_INTERVAL = 1024  # عدد العقد بين فحصَي الإيقاف والمهلة
+BACKTRACKING_LOG_SECONDS = 2.0
+BACKTRACKING_NOGOOD_CAPACITY = 20000
+BACKTRACKING_NOGOOD_MAX_LITERALS = 16  # الـ nogoods الأطول نادراً ما تتكرر فلا تُحفظ
+
+def solve_backtracking(log_q, lectures_to_schedule, domains, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, start_time, timeout, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, initial_lecture_count, scheduling_state, level_specific_large_rooms, specific_small_room_assignments, num_slots, constraint_severities, consecutive_large_hall_rule, max_sessions_per_day=None, non_sharing_teacher_pairs=[], backjumping=True, variable_order='teacher_load', value_order='domain', rng=None, model=None):
+    """
+    بحث بالتراجع مع فحص أمامي: تُنقّى النطاقات مرة واحدة من تعارضاتها مع الجدول الحالي (المواد المثبتة)،
+    ثم يحذف كل وضع القيم المتعارضة معه من نطاقات المحاضرات الباقية (ويُستعاد الحذف عند التراجع)،
+    فتصبح كل قيمة حية صالحة دون إعادة فحص، ويُتراجع فوراً عند فراغ أي نطاق، ويختار MRV على النطاقات المقلَّصة.
+    البحث تكراري بمكدس قرارات صريح (لا حد للعمق)، ويُفحص الإيقاف والمهلة كل BACKTRACKING_CHECK_INTERVAL عقدة.
+    backjumping: قفز خلفي موجَّه بالتعارض (FC-CBJ): لكل قرار مجموعة تعارض (القرارات التي حذفت من نطاقه أو من
+    نطاق محاضرة فرغ بسببه)، وعند نفاد قيمه يُقفز إلى أحدث قرار فيها بدل السابق مباشرة، وتُحفظ المجموعة بقيمها
+    في NogoodStore فتُرفض أي قيمة تكمل nogood محفوظاً. False = تراجع زمني بسيط (للمقارنة).
+    ترتيب البحث (لعمال المحفظة المتوازية): variable_order يمرَّر إلى ForwardCheckingDomains، وvalue_order ترتيب قيم
+    كل محاضرة: 'domain' كما هي، 'shuffle' خلط من rng، 'morning' الفترات الأولى أولاً مع خلط داخل الفترة.
+    """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    filtered_domains = {}
+    for lecture in lectures_to_schedule:
+        filtered_domains[lecture['id']] = {value for value in domains.get(lecture['id'], ()) if not _backtracking_value_conflicts(lecture, value, final_schedule, teacher_schedule, room_schedule, model)}
+    fc_domains = ForwardCheckingDomains(lectures_to_schedule, filtered_domains, model, lectures_by_teacher_map, variable_order, rng)
+    nogoods = NogoodStore(BACKTRACKING_NOGOOD_CAPACITY, BACKTRACKING_NOGOOD_MAX_LITERALS) if backjumping else None
+    lectures_by_id = {lec['id']: lec for lec in lectures_to_schedule}
+    base_placed = initial_lecture_count - len(lectures_to_schedule)
+
+    # كل إطار: [معرّف المحاضرة، قيمها عند اختيارها، موضع القيمة التالية، علامة trail، القيمة الموضوعة، مجموعة التعارض]
+    stack = []
+    depth_of, assignment = {}, {}
+    nodes = max_depth = backjumps = backjump_distance = max_backjump = 0
+    search_start = last_log = time.time()
+
+    def place(frame):
+        lec_id, values, conflicts = frame[0], frame[1], frame[5]
+        lecture = lectures_by_id[lec_id]
+        while frame[2] < len(values):
+            value = values[frame[2]]
+            frame[2] += 1
+            if nogoods is not None:
+                culprits = nogoods.violated_by(lec_id, value, assignment)
+                if culprits is not None:
+                    conflicts.update(culprits)
+                    continue
+            mark = len(fc_domains.trail)
+            wiped = fc_domains.assign(lec_id, value)
+            if wiped is not None:
+                # نطاق محاضرة باقية فرغ: لا حاجة للنزول، والمسؤول من حذف قيمها
+                if backjumping:
+                    conflicts.update(fc_domains.pruned_by[wiped])
+                    conflicts.discard(lec_id)
+                fc_domains.unassign(lec_id, mark)
+                continue
+            day_idx, slot_idx, room = value
+            details = {"id": lec_id, "name": lecture['name'], "teacher_name": lecture['teacher_name'], "room": room, "room_type": lecture.get('room_type')}
+            for level in lecture.get('levels', []):
+                final_schedule[level][day_idx][slot_idx].append(details)
+            teacher_schedule.setdefault(lecture['teacher_name'], set()).add((day_idx, slot_idx))
+            room_schedule.setdefault(room, set()).add((day_idx, slot_idx))
+            frame[3], frame[4] = mark, value
+            assignment[lec_id] = value
             return True
+        return False
 
+    def unplace(frame):
+        lecture = lectures_by_id[frame[0]]
+        day_idx, slot_idx, room = frame[4]
         room_schedule[room].discard((day_idx, slot_idx))
-        teacher_schedule[teacher_name].discard((day_idx, slot_idx))
-        # ✨ التراجع عن التوزيع في كل المستويات
-        for level in levels_for_lecture:
+        teacher_schedule[lecture['teacher_name']].discard((day_idx, slot_idx))
+        for level in lecture.get('levels', []):
             final_schedule[level][day_idx][slot_idx].pop()
+        fc_domains.unassign(frame[0], frame[3])
+        del assignment[frame[0]]
+        frame[4] = None
+
+    def is_complete():
+        failures_list = validate_teacher_constraints_in_solution(teacher_schedule, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, [], num_slots, constraint_severities, max_sessions_per_day, model=model)
+        return not failures_list
+
+    def ordered_values(lec_id):
+        values = fc_domains.values[lec_id]
+        if value_order == 'shuffle':
+            values = sorted(values)
+            rng.shuffle(values)
+            return values
+        if value_order == 'morning':
+            return sorted(values, key=lambda value: (value[1], rng.random()))
+        return list(values)
+
+    def push():
+        """يضيف إطاراً لمحاضرة MRV التالية؛ يعيد False إن وُضعت كل المحاضرات."""
+        lec_id = fc_domains.select()
+        if lec_id is None: return False
+        depth_of[lec_id] = len(stack)
+        stack.append([lec_id, ordered_values(lec_id), 0, None, None, set()])
+        return True
+
+    try:
+        if any(not values for values in filtered_domains.values()): return False
+        if not push(): return is_complete()
+        while stack:
+            frame = stack[-1]
+            if frame[4] is not None: unplace(frame)
+            if not place(frame):
+                stack.pop()
+                lec_id = frame[0]
+                del depth_of[lec_id]
+                if not backjumping: continue
+                # مجموعة التعارض: ما رُفضت به قيمه + من حذف من نطاقه قبل اختياره
+                conflicts = frame[5]
+                conflicts.update(fc_domains.pruned_by[lec_id])
+                conflicts.discard(lec_id)
+                if not conflicts: return False  # لا قرار سابق مسؤول: لا حل
+                if len(conflicts) < len(stack):
+                    # nogood يساوي المسار كله لا يتكرر في بحث شجري، فلا يُحفظ إلا الأقصر منه
+                    nogoods.add([(other, assignment[other]) for other in conflicts])
+                target = max(depth_of[other] for other in conflicts)
+                distance = len(stack) - 1 - target
+                if distance > 0:
+                    backjumps += 1
+                    backjump_distance += distance
+                    max_backjump = max(max_backjump, distance)
+                while len(stack) - 1 > target:
+                    skipped = stack.pop()
+                    unplace(skipped)
+                    del depth_of[skipped[0]]
+                conflicts.discard(stack[-1][0])
+                stack[-1][5].update(conflicts)
+                continue
+
+            nodes += 1
+            if len(stack) > max_depth: max_depth = len(stack)
+            if nodes % BACKTRACKING_CHECK_INTERVAL == 0:
+                if scheduling_state.get('should_stop'):
+                    raise StopByUserException()
+                now = time.time()
+                if now - start_time > timeout:
+                    raise TimeoutException()
+                if now - last_log >= BACKTRACKING_LOG_SECONDS:
+                    last_log = now
+                    log_q.put(f'   - البحث مستمر... تم توزيع {base_placed + len(stack)} / {initial_lecture_count} مادة')
+                    time.sleep(0)
+
+            if not push():
+                if is_complete(): return True
+                # قيود الأساتذة تُفحص على الجدول الكامل فقط: كل القرارات مسؤولة
+                frame[5].update(other for other in depth_of if other != frame[0])
+        return False
+    finally:
+        elapsed = max(time.time() - search_start, 1e-9)
+        log_q.put(f'   - إحصائيات التراجع: {nodes} عقدة ({nodes / elapsed:.0f} عقدة/ثانية)، أقصى عمق {max_depth} / {len(lectures_to_schedule)}')
+        if backjumping:
+            average_jump = backjump_distance / backjumps if backjumps else 0
+            log_q.put(f'   - القفز الخلفي: {backjumps} قفزة (متوسط {average_jump:.1f}، أقصى {max_backjump} مستوى)، '
+                      f'nogoods: {nogoods.hits} إصابة، {len(nogoods)} محفوظ')
+
+
+# ✨ مجمّعات العمليات المشتركة (التشغيلات الطماعة ومحفظة التراجع)
+def _spawn_process_pool(name, workers, initializer=None, make_shared=None):
+    """
+    مجمّع عمليات spawn المشترك المسمى name؛ يُنشأ عند أول طلب ويُعاد إنشاؤه إن تغيّر عدد العمال.
+    make_shared(mp_context) تنشئ كائنات المزامنة المشتركة (tuple) التي تُمرَّر إلى initializer في كل عملية.
+    تعيد حالة المجمّع: {'executor', 'workers', 'shared'}.
+    """
+    pool_state = PROCESS_POOLS.get(name)
+    if pool_state is None or pool_state['workers'] != workers:
+        _shutdown_process_pool(name)
+        # spawn بدل fork: العملية الأم تحمل خيوط الخادم والمنفّذ
+        mp_context = multiprocessing.get_context('spawn')
+        shared = make_shared(mp_context) if make_shared else ()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=initializer, initargs=shared)
+        pool_state = PROCESS_POOLS[name] = {'executor': pool, 'workers': workers, 'shared': shared}
+    return pool_state
+
+def _shutdown_process_pool(name):
+    pool_state = PROCESS_POOLS.pop(name, None)
+    if pool_state is not None: pool_state['executor'].shutdown(wait=False, cancel_futures=True)
+
+def _next_process_pool_run_id():
+    """رقم فريد لكل تشغيل يُرسل إلى مجمّع (يميّز سياقه ورسائله عن التشغيلات السابقة)."""
+    PROCESS_POOL_RUN_ID['last'] += 1
+    return PROCESS_POOL_RUN_ID['last']
+
+
+# ✨ محفظة تراجع متوازية: عدة عمليات بترتيبات بحث مختلفة، وأول نتيجة حاسمة توقف البقية
+# (ترتيب المتغيرات، ترتيب القيم) لكل عامل بالدور؛ الأول هو ترتيب البحث المفرد، ويُكمل العمال الزائدون من الثاني ببذور مختلفة
+BACKTRACKING_PORTFOLIO_STRATEGIES = [
+    ('teacher_load', 'domain'),
+    ('teacher_load', 'shuffle'),
+    ('degree', 'shuffle'),
+    ('random', 'shuffle'),
+    ('degree', 'morning'),
+    ('random', 'morning'),
+]
+BACKTRACKING_PORTFOLIO_POLL_SECONDS = 0.2
+
+def _portfolio_strategy(worker_idx):
+    strategies = BACKTRACKING_PORTFOLIO_STRATEGIES
+    if worker_idx < len(strategies): return strategies[worker_idx]
+    return strategies[1 + (worker_idx - 1) % (len(strategies) - 1)]
+
+# حالة العامل داخل كل عملية فرعية: حدث الإيقاف وطابور التقدم المشتركان
+_PORTFOLIO_WORKER_STATE = {'stop_event': None, 'progress_q': None}
+
+def _portfolio_worker_init(stop_event, progress_q):
+    _PORTFOLIO_WORKER_STATE['stop_event'], _PORTFOLIO_WORKER_STATE['progress_q'] = stop_event, progress_q
+
+def _portfolio_shared_objects(mp_context):
+    """حدث الإيقاف وطابور التقدم المشتركان بين عمليات المحفظة."""
+    return mp_context.Event(), mp_context.Queue()
+
+class _PortfolioWorkerLog:
+    """بديل log_q داخل العامل: يرسل الرسائل إلى العملية الأم موسومة بالتشغيل والعامل."""
+    def __init__(self, run_id, worker_idx):
+        self.run_id, self.worker_idx = run_id, worker_idx
+
+    def put(self, message):
+        _PORTFOLIO_WORKER_STATE['progress_q'].put((self.run_id, self.worker_idx, message))
+
+class _PortfolioStopState:
+    """بديل scheduling_state داخل العامل: should_stop تقرأ حدث الإيقاف المشترك."""
+    def get(self, key, default=None):
+        if key == 'should_stop': return _PORTFOLIO_WORKER_STATE['stop_event'].is_set()
+        return default
+
+def _backtracking_portfolio_worker(run_id, worker_idx, payload, variable_order, value_order, seed, elapsed_before):
+    """
+    عامل محفظة واحد: يفك السياق (وسائط solve_backtracking بأسمائها) ويبحث بترتيبه.
+    تبدأ مهلته من لحظة بدء العامل فعلاً مطروحاً منها elapsed_before (زمن التحضير قبل الإرسال)، فلا يُحتسب زمن إنشاء العملية.
+    يعيد (الحالة، (الجدول، جدول الأساتذة، جدول القاعات) أو None)؛ النتيجة الحاسمة ('solved' أو 'unsat') توقف بقية العمال.
+    """
+    context = pickle.loads(payload)
+    context['start_time'] = time.time() - elapsed_before
+    log = _PortfolioWorkerLog(run_id, worker_idx)
+    try:
+        found = solve_backtracking(log, scheduling_state=_PortfolioStopState(), variable_order=variable_order, value_order=value_order, rng=random.Random(seed), **context)
+    except StopByUserException:
+        return 'stopped', None
+    except TimeoutException:
+        return 'timeout', None
+    # بحث كامل: فشله يثبت أنه لا حل بأي ترتيب
+    _PORTFOLIO_WORKER_STATE['stop_event'].set()
+    if not found: return 'unsat', None
+    return 'solved', (context['final_schedule'], context['teacher_schedule'], context['room_schedule'])
+
+def run_backtracking_portfolio(log_q, context, scheduling_state, num_workers, master_seed=None):
+    """
+    يشغّل solve_backtracking في num_workers عملية بترتيبات BACKTRACKING_PORTFOLIO_STRATEGIES وبذور مشتقة من master_seed.
+    context: وسائط solve_backtracking بأسمائها (عدا log_q وscheduling_state). رسائل العمال تُمرَّر إلى log_q
+    مع رقم العامل، وأول عامل يجد حلاً أو يثبت عدم وجوده يوقف البقية، كما يوقفهم زر الإيقاف.
+    تعيد (الحالة، (الجدول، جدول الأساتذة، جدول القاعات) أو None) بالحالة 'solved' أو 'unsat' أو 'timeout' أو 'stopped'،
+    أو None إن تعذر استعمال مجمّع العمليات (فيبحث المستدعي بعملية واحدة).
+    """
+    if master_seed is None: master_seed = random.getrandbits(64)
+    seed_rng = random.Random(master_seed)
+    worker_seeds = [seed_rng.getrandbits(64) for _ in range(num_workers)]
+    try:
+        payload = pickle.dumps(context, protocol=pickle.HIGHEST_PROTOCOL)
+        pool_state = _spawn_process_pool('backtracking', num_workers, _portfolio_worker_init, _portfolio_shared_objects)
+        pool, (stop_event, progress_q) = pool_state['executor'], pool_state['shared']
+        stop_event.clear()
+        run_id = _next_process_pool_run_id()
+        elapsed_before = time.time() - context['start_time']
+        futures = {}
+        for worker_idx, seed in enumerate(worker_seeds):
+            variable_order, value_order = _portfolio_strategy(worker_idx)
+            futures[pool.submit(_backtracking_portfolio_worker, run_id, worker_idx, payload, variable_order, value_order, seed, elapsed_before)] = worker_idx
+    except Exception as e:
+        log_q.put(f"   - تعذر توزيع البحث بالتراجع على عدة عمليات ({e})، سيتم البحث بعملية واحدة.")
+        _shutdown_process_pool('backtracking')
+        return None
+
+    for worker_idx in range(num_workers):
+        variable_order, value_order = _portfolio_strategy(worker_idx)
+        log_q.put(f"   - العامل {worker_idx + 1}: ترتيب المحاضرات {variable_order}، ترتيب القيم {value_order}")
+
+    def forward_progress():
+        while True:
+            try:
+                message_run, worker_idx, message = progress_q.get_nowait()
+            except queue.Empty:
+                return
+            if message_run == run_id:
+                log_q.put(f"   [العامل {worker_idx + 1}] {message.strip()}")
+
+    outcome, pool_broken = None, False
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=BACKTRACKING_PORTFOLIO_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            forward_progress()
+            for future in done:
+                try:
+                    status, result = future.result()
+                except Exception as e:
+                    log_q.put(f"   - توقف العامل {futures[future] + 1} بخطأ ({e}).")
+                    pool_broken = True
+                    continue
+                if status in ('solved', 'unsat') and outcome is None:
+                    outcome = (status, result)
+                    log_q.put(f"   >>> العامل {futures[future] + 1} أنهى البحث ({'وجد حلاً' if status == 'solved' else 'أثبت عدم وجود حل'})، تم إيقاف البقية.")
+            if outcome is not None or scheduling_state.get('should_stop'):
+                stop_event.set()
+    finally:
+        stop_event.set()
+        wait(futures)
+        time.sleep(BACKTRACKING_PORTFOLIO_POLL_SECONDS / 4)
+        forward_progress()
+        if pool_broken: _shutdown_process_pool('backtracking')
+
+    if outcome is not None:
+        status, result = outcome
+        if result is not None: result = (_reintern_schedule(result[0], context['model']), result[1], result[2])
+        return status, result
+    if pool_broken and not scheduling_state.get('should_stop'): return None
+    return ('stopped' if scheduling_state.get('should_stop') else 'timeout'), None
+
+
+# ================== عدّادات التحليل الزمني لمحرك التقييم (اختيارية) ==================
+class EvaluationProfiler:
+    """
+    عدد الاستدعاءات والزمن التراكمي لكل عائلة قيود ولكل دالة تقييم رئيسية.
+    يُفعَّل فقط عند طلبه (enable_evaluation_profiling)، وإلا لا تكلف نقاط القياس سوى فحص None.
+    أزمنة الدوال الرئيسية شاملة (calculate_fitness تتضمن زمن calculate_schedule_cost).
+    """
+    FAMILY_LABELS = {
+        'teacher_room_clashes': 'تعارضات الأساتذة والقاعات',
+        'cell_rules': 'قواعد الفترات والراحة والقاعات',
+        'identifier_clashes': 'تعارض المعرفات',
+        'shared_lectures': 'المواد المشتركة',
+        'consecutive_halls': 'توالي القاعات الكبيرة',
+        'teacher_constraints': 'قيود الأساتذة',
+        'prefer_morning': 'تفضيل الفترات المبكرة',
+    }
+
+    def __init__(self):
+        self.calls = {'families': Counter(), 'engine': Counter()}
+        self.seconds = {'families': defaultdict(float), 'engine': defaultdict(float)}
+
+    def add(self, name, elapsed, group='families'):
+        self.calls[group][name] += 1
+        self.seconds[group][name] += elapsed
+
+    def lap(self, name, since):
+        """يسجل الزمن منذ since ويعيد اللحظة الحالية لبدء القياس التالي."""
+        now = time.perf_counter()
+        self.add(name, now - since)
+        return now
+
+    def summary(self):
+        return {
+            group: [
+                {'name': name, 'calls': self.calls[group][name], 'seconds': round(seconds, 4)}
+                for name, seconds in sorted(self.seconds[group].items(), key=lambda item: item[1], reverse=True)
+            ]
+            for group in ('families', 'engine')
+        }
+
+    def log_lines(self, top=5):
+        lines = []
+        for entry in self.summary()['families'][:top]:
+            label = self.FAMILY_LABELS.get(entry['name'], entry['name'])
+            lines.append(f"   - {label}: {entry['seconds']:.3f} ث ({entry['calls']} استدعاء)")
+        return lines
+
+
+def activate_evaluation_profiler(profiler):
+    ACTIVE_PROFILER['profiler'] = profiler
+
+# ✨ خيوط طلبات API (مثل /api/validate-schedule) تقيّم الجداول أثناء تشغيل التوليد، فتُستثنى من مُحلِّله
+_UNPROFILED_THREADS = threading.local()
+
+def _active_profiler():
+    """المُحلِّل النشط، أو None داخل _without_evaluation_profiler في الخيط الحالي."""
+    if getattr(_UNPROFILED_THREADS, 'depth', 0): return None
+    return ACTIVE_PROFILER['profiler']
+
+@contextlib.contextmanager
+def _without_evaluation_profiler():
+    _UNPROFILED_THREADS.depth = getattr(_UNPROFILED_THREADS, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _UNPROFILED_THREADS.depth -= 1
+
+def _profiled(name):
+    """يسجل زمن الدالة في المُحلِّل النشط (إن وُجد) ضمن الدوال الرئيسية للمحرك."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active_profiler()
+            if profiler is None: return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.add(name, time.perf_counter() - start, group='engine')
+        return wrapper
+    return decorator
+
+
+# ================== مقاييس أداء محرك التقييم (python app.py --benchmark <الاسم>) ==================
+def _benchmark_instance(seed=0, num_levels=12, num_teachers=60, num_rooms=40, lectures_per_level=28, distribution_rule_type='required'):
+    """
+    مسألة اصطناعية بحجم قسم متوسط مع جدول أولي شبه صالح، لقياس التقييم بعيداً عن قاعدة البيانات.
+    تعيد (الإعدادات بأسماء معاملات calculate_fitness، قائمة المحاضرات، الجدول، النموذج المُجمَّع).
+    """
+    rng = random.Random(seed)
+    days = ['السبت', 'الأحد', 'الاثنين', 'الثلاثاء', 'الأربعاء', 'الخميس']
+    slots = ['08:00-09:30', '09:30-11:00', '11:00-12:30', '12:30-14:00', '14:00-15:30']
+    levels = [f"المستوى {i + 1}" for i in range(num_levels)]
+    teacher_names = [f"أستاذ {i + 1}" for i in range(num_teachers)]
+    rooms_data = [{'name': f"قاعة {i + 1}", 'type': 'كبيرة' if i < num_rooms // 5 else 'صغيرة'} for i in range(num_rooms)]
+    rooms_by_type = {room_type: [r['name'] for r in rooms_data if r['type'] == room_type] for room_type in ('كبيرة', 'صغيرة')}
+
+    all_lectures = []
+    for level in levels:
+        for _ in range(lectures_per_level):
+            all_lectures.append({
+                'id': len(all_lectures) + 1, 'name': rng.choice(['رياضيات 1', 'فيزياء 2', 'كيمياء', 'تاريخ', 'أدب']),
+                'teacher_name': rng.choice(teacher_names), 'room_type': 'كبيرة' if rng.random() < 0.25 else 'صغيرة', 'levels': [level],
+            })
+    lectures_by_teacher_map = defaultdict(list)
+    for lec in all_lectures: lectures_by_teacher_map[lec['teacher_name']].append(lec)
+    lectures_by_teacher_map['__all_lectures__'] = all_lectures
+
+    special_constraints = {}
+    for name in teacher_names:
+        constraints = {'distribution_rule': rng.choice(['يومان', 'ثلاثة أيام', 'يومان متتاليان'])}
+        if rng.random() < 0.3: constraints['start_d1_s2'] = True
+        if rng.random() < 0.3: constraints['end_s3'] = True
+        special_constraints[name] = constraints
+
+    # جدول أولي طماع: كل محاضرة في فترة يكون فيها أستاذها ومستواها وقاعة من نوعها شاغرين
+    schedule = {level: [[[] for _ in slots] for _ in days] for level in levels}
+    busy_teachers, busy_rooms = set(), set()
+    for lec in all_lectures:
+        level = lec['levels'][0]
+        candidates = [(d, s) for d in range(len(days)) for s in range(len(slots)) if (lec['teacher_name'], d, s) not in busy_teachers and not schedule[level][d][s]]
+        if not candidates: continue
+        d, s = rng.choice(candidates)
+        free_rooms = [r for r in rooms_by_type[lec['room_type']] if (r, d, s) not in busy_rooms]
+        if not free_rooms: continue
+        placed = dict(lec, room=rng.choice(free_rooms))
+        busy_teachers.add((lec['teacher_name'], d, s)); busy_rooms.add((placed['room'], d, s))
+        schedule[level][d][s].append(placed)
+
+    settings = {
+        'days': days, 'slots': slots, 'teachers': [{'name': name} for name in teacher_names], 'rooms_data': rooms_data, 'levels': levels,
+        'identifiers_by_level': {level: ['رياضيات', 'فيزياء'] for level in levels}, 'special_constraints': special_constraints,
+        'teacher_constraints': {name: {} for name in teacher_names}, 'distribution_rule_type': distribution_rule_type,
+        'lectures_by_teacher_map': dict(lectures_by_teacher_map), 'globally_unavailable_slots': set(),
+        'saturday_teachers': teacher_names[:3], 'teacher_pairs': [(teacher_names[0], teacher_names[1])],
+        'day_to_idx': {day: i for i, day in enumerate(days)}, 'rules_grid': [[[] for _ in slots] for _ in days],
+        'last_slot_restrictions': {}, 'level_specific_large_rooms': {}, 'specific_small_room_assignments': {},
+        'constraint_severities': {}, 'max_sessions_per_day': 4, 'consecutive_large_hall_rule': 'all',
+        'prefer_morning_slots': True, 'non_sharing_teacher_pairs': [],
+    }
+    return settings, all_lectures, schedule, _benchmark_model(settings)
+
+def _benchmark_model(settings):
+    return ConstraintModel(**{key: settings[key] for key in (
+        'rooms_data', 'rules_grid', 'identifiers_by_level', 'level_specific_large_rooms', 'specific_small_room_assignments',
+        'constraint_severities', 'special_constraints', 'teacher_constraints', 'globally_unavailable_slots', 'saturday_teachers', 'day_to_idx')})
+
+def _fitness_arguments(settings):
+    """(الوسائط الموضعية لـ calculate_fitness بعد all_lectures، والوسائط المسماة) من قاموس الإعدادات."""
+    positional = [settings[key] for key in ('days', 'slots', 'teachers', 'rooms_data', 'levels', 'identifiers_by_level', 'special_constraints',
+                                            'teacher_constraints', 'distribution_rule_type', 'lectures_by_teacher_map', 'globally_unavailable_slots',
+                                            'saturday_teachers', 'teacher_pairs', 'day_to_idx', 'rules_grid', 'last_slot_restrictions',
+                                            'level_specific_large_rooms', 'specific_small_room_assignments', 'constraint_severities')]
+    options = {key: settings[key] for key in ('max_sessions_per_day', 'consecutive_large_hall_rule', 'prefer_morning_slots', 'non_sharing_teacher_pairs')}
+    return positional, options
+
+def _benchmark_seconds(func, repeats):
+    """أفضل زمن (بالثواني) من عدة تكرارات، مع النتيجة الأخيرة."""
+    best, result = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def benchmark_population_evaluation(population_size=30, perturbations=(0, 3, 10, 30, 100, 300), repeats=3, seed=0):
+    """
+    يقارن PopulationFitnessEvaluator (دفعة NumPy، والوضع التلقائي مع التحول للتقييم الفردي) بتقييم كل حل على حدة،
+    على أجيال كروموسومات منسوخة من جدول شبه صالح مع تحريك k محاضرة عشوائياً في كل نسخة، ثم على أجيال عشوائية بالكامل.
+    """
+    settings, all_lectures, schedule, model = _benchmark_instance(seed)
+    positional, options = _fitness_arguments(settings)
+    codec = AssignmentCodec(all_lectures, settings['days'], settings['slots'], settings['rooms_data'], settings['levels'], model=model)
+    base = codec.encode(schedule)
+    rng = np.random.default_rng(seed)
+
+    populations = []
+    for k in perturbations:
+        population = []
+        for _ in range(population_size):
+            chromosome = base.copy()
+            moved = rng.choice(len(all_lectures), k, replace=False)
+            chromosome.positions[moved] = rng.integers(0, len(settings['days']) * len(settings['slots']), k)
+            chromosome.rooms[moved] = rng.integers(0, len(codec.room_names), k)
+            population.append(chromosome)
+        populations.append((f"k={k}", population))
+    for size in sorted({3, population_size}):
+        random.seed(seed + size)
+        initial = create_initial_population(size, all_lectures, settings['days'], settings['slots'], settings['rooms_data'], settings['levels'],
+                                            settings['level_specific_large_rooms'], settings['specific_small_room_assignments'], model=model)
+        populations.append((f"random×{size}", [codec.encode(individual) for individual in initial]))
+
+    # ذاكرتا اللياقة والأساتذة غير مفعلتين خارج التشغيل، ويُنشأ مقيّم جديد لكل تكرار حتى لا تخدمه ذاكرته من التكرار السابق
+    rows = []
+    for label, population in populations:
+        scalar_time, expected = _benchmark_seconds(lambda: [
+            calculate_fitness(codec.decode(c), all_lectures, *positional, mode="count", model=model, **options)[0] for c in population
+        ], repeats)
+        timings = {}
+        for mode, threshold in (('batch', float('inf')), ('auto', PopulationFitnessEvaluator.SCALAR_FALLBACK_DENSITY)):
+            def run():
+                evaluator = PopulationFitnessEvaluator(all_lectures, *positional, model=model, **options)
+                evaluator.SCALAR_FALLBACK_DENSITY = threshold
+                return evaluator.evaluate(population, codec=codec)
+            timings[mode], results = _benchmark_seconds(run, repeats)
+            if results != expected: raise AssertionError(f"{label}: نتيجة {mode} تخالف calculate_fitness")
+        density = PopulationFitnessEvaluator(all_lectures, *positional, model=model, **options).error_density(population, codec=codec)
+        rows.append({
+            'population': label, 'hard_errors': round(-sum(f[1] for f in expected) / len(expected), 1), 'density': round(density, 3),
+            'scalar_ms': round(scalar_time * 1000, 1), 'batch_ms': round(timings['batch'] * 1000, 1), 'auto_ms': round(timings['auto'] * 1000, 1),
+            'batch/scalar': round(timings['batch'] / scalar_time, 2),
+        })
+    return rows
+
+def benchmark_placement_checks(repeats=3, seed=0):
+    """
+    يقارن فحص صلاحية الوضع بمجموعات (يوم، فترة) (_is_placement_valid_in_domain) بفحصه بأقنعة OccupancyBitsets
+    (_is_placement_valid_in_bitsets) لكل محاضرة في كل فترة، على جدول يمثل منتصف بناء طماع (ثلثا المحاضرات موضوعة).
+    ويُتحقق قبل القياس من تطابق نتيجة المسارين في كل استعلام.
+    """
+    settings, all_lectures, schedule, model = _benchmark_instance(seed)
+    days, slots, rule = settings['days'], settings['slots'], settings['consecutive_large_hall_rule']
+    rng = random.Random(seed)
+    for grid in schedule.values():
+        for day in grid:
+            for lectures in day:
+                lectures[:] = [lec for lec in lectures if rng.random() < 2 / 3]
+    teacher_schedule, room_schedule = defaultdict(set), defaultdict(set)
+    for grid in schedule.values():
+        for day_idx, day in enumerate(grid):
+            for slot_idx, lectures in enumerate(day):
+                for lec in lectures:
+                    teacher_schedule[lec['teacher_name']].add((day_idx, slot_idx))
+                    room_schedule[lec['room']].add((day_idx, slot_idx))
+    model.presolve(all_lectures, len(days), len(slots))
+    bitsets = OccupancyBitsets(schedule, teacher_schedule, room_schedule, model, len(slots))
+    pooled = OccupancyBitsets(schedule, teacher_schedule, room_schedule, model, len(slots), rooms_data=settings['rooms_data'])
+    queries = [(model.domain(lec), lec, d, s) for lec in all_lectures for d in range(len(days)) for s in range(len(slots))]
+    by_sets = lambda domain, lec, d, s: _is_placement_valid_in_domain(domain, lec, d, s, schedule, teacher_schedule, room_schedule, rule)
+    by_bitsets = lambda domain, lec, d, s: _is_placement_valid_in_bitsets(domain, lec, d, s, bitsets, rule)
+
+    # التحقق خارج القياس: نفس البذرة قبل كل استعلام حتى يختار المساران نفس القاعة من المرشحات
+    for i, (domain, lec, d, s) in enumerate(queries):
+        random.seed(i); expected = by_sets(domain, lec, d, s)
+        random.seed(i)
+        if by_bitsets(domain, lec, d, s) != expected: raise AssertionError(f"فحص الأقنعة يخالف فحص المجموعات للمحاضرة {lec['id']} في ({d}، {s})")
+
+    rows = []
+    # مع مجمّع القاعات الشاغرة (كما يبنيها الطماع والطفرة) يُختار من الشاغرة مباشرة بدل خلط المرشحات، فتختلف القاعة المختارة
+    by_pooled = lambda domain, lec, d, s: _is_placement_valid_in_bitsets(domain, lec, d, s, pooled, rule)
+    for name, valid_in in (('sets', by_sets), ('bitsets', by_bitsets), ('bitsets+pool', by_pooled)):
+        seconds, results = _benchmark_seconds(lambda: [valid_in(*query) for query in queries], repeats)
+        rows.append({'check': name, 'queries': len(queries), 'ms': round(seconds * 1000, 1), 'queries/s': round(len(queries) / seconds)})
+    return rows
+
+def _equivalence_instance(seed):
+    """مسألة اصطناعية صغيرة تُفعِّل كل عائلات القيود: مواد مشتركة، قواعد فترات، قاعات محددة، أيام يدوية، أزواج، درجات خطورة."""
+    settings, all_lectures, schedule, _ = _benchmark_instance(seed, num_levels=4, num_teachers=14, num_rooms=8, lectures_per_level=14,
+                                                              distribution_rule_type=('required', 'allowed')[seed % 2])
+    rng = random.Random(seed)
+    days, slots, levels = settings['days'], settings['slots'], settings['levels']
+    teacher_names = [t['name'] for t in settings['teachers']]
+    large_rooms = [r['name'] for r in settings['rooms_data'] if r['type'] == 'كبيرة']
+    small_rooms = [r['name'] for r in settings['rooms_data'] if r['type'] == 'صغيرة']
+
+    # مواد مشتركة: مستوى ثانٍ لكل سابع محاضرة، بنسخة في نفس الخلية من المستوى الآخر إن كانت موضوعة
+    cells = {lec['id']: (level, d, s, lec) for level, grid in schedule.items() for d, day in enumerate(grid) for s, lectures in enumerate(day) for lec in lectures}
+    for lec in all_lectures[::7]:
+        other = rng.choice([level for level in levels if level not in lec['levels']])
+        lec['levels'].append(other)
+        if lec['id'] in cells:
+            _, d, s, placed = cells[lec['id']]
+            schedule[other][d][s].append(placed)
+    all_lectures[3]['teacher_name'] = None
+
+    for _ in range(6):
+        d, s = rng.randrange(len(days)), rng.randrange(len(slots))
+        settings['rules_grid'][d][s].append({'levels': rng.sample(levels, 1), 'rule_type': rng.choice(['ANY_HALL', 'SMALL_HALLS_ONLY', 'SPECIFIC_LARGE_HALL', 'NO_HALLS_ALLOWED']),
+                                             'hall_name': rng.choice(large_rooms)})
+    settings['globally_unavailable_slots'] = {(len(days) - 1, len(slots) - 1)}
+    settings['last_slot_restrictions'] = {teacher_names[2]: 'last_2', teacher_names[3]: 'last_1'}
+    settings['non_sharing_teacher_pairs'] = [(teacher_names[4], teacher_names[5])]
+    settings['level_specific_large_rooms'] = {levels[0]: large_rooms[0]}
+    settings['specific_small_room_assignments'] = {f"كيمياء ({levels[1]})": small_rooms[0]}
+    settings['teacher_constraints'][teacher_names[6]] = {'allowed_days': {0, 1, 2}}
+    settings['special_constraints'][teacher_names[7]] = {'always_s2_to_s4': True}
+    settings['constraint_severities'] = {family: rng.choice(['hard', 'high', 'medium', 'low']) for family in _SEVERITY_DEFAULTS}
+    settings['max_sessions_per_day'] = rng.choice([None, 2, 3])
+    settings['consecutive_large_hall_rule'] = rng.choice(['none', 'all', large_rooms[0]])
+    return settings, all_lectures, schedule, _benchmark_model(settings)
+
+def check_evaluator_equivalence(seeds=(0, 1, 2, 3), moves=150, population_size=12):
+    """
+    يتحقق من أن المسارات السريعة تعطي لياقة calculate_fitness نفسها على مسائل _equivalence_instance:
+    - AssignmentCodec: فك ترميز الكروموسوم يحفظ لياقة الجدول، وإعادة ترميزه تعيد الكروموسوم نفسه.
+    - IncrementalFitnessEvaluator: تقييم كل نقلة عشوائية قبل تطبيقها، واللياقة بعد تطبيقها وبعد التراجع عنها.
+    - PopulationFitnessEvaluator: جيل جداول وجيل كروموسومات، بالمسار المجمّع وبالتقييم الفردي.
+    البذور الفردية تفعّل ذاكرتي اللياقة والأساتذة للمقيّمات (المرجع يُحسب دائماً بدونهما)، والبذور 2 و3 بالتسلسل الصارم.
+    ترفع AssertionError عند أول اختلاف، وإلا تعيد عدد الفحوص لكل بذرة.
+    """
+    rows = []
+    saved_caches = ACTIVE_FITNESS_CACHE['cache'], ACTIVE_TEACHER_CACHE['cache']
+    try:
+        for seed in seeds:
+            settings, all_lectures, schedule, model = _equivalence_instance(seed)
+            positional, options = _fitness_arguments(settings)
+            use_strict_hierarchy = seed % 4 >= 2
+            rng = random.Random(seed)
+            checks = Counter()
+
+            def reference(candidate):
+                caches = ACTIVE_FITNESS_CACHE['cache'], ACTIVE_TEACHER_CACHE['cache']
+                activate_fitness_cache(None); activate_teacher_validation_cache(None)
+                try:
+                    return calculate_fitness(candidate, all_lectures, *positional, use_strict_hierarchy=use_strict_hierarchy, mode="count", model=model, **options)[0]
+                finally:
+                    activate_fitness_cache(caches[0]); activate_teacher_validation_cache(caches[1])
+
+            def expect(name, actual, expected):
+                if actual != expected: raise AssertionError(f"البذرة {seed}، {name}: {actual} بدل {expected}")
+                checks[name] += 1
+
+            activate_fitness_cache(FitnessCache() if seed % 2 else None)
+            activate_teacher_validation_cache(TeacherValidationCache() if seed % 2 else None)
+
+            codec = AssignmentCodec(all_lectures, settings['days'], settings['slots'], settings['rooms_data'], settings['levels'], model=model)
+            chromosome = codec.encode(schedule)
+            decoded = codec.decode(chromosome)
+            expect('codec.decode', reference(decoded), reference(schedule))
+            again = codec.encode(decoded)
+            expect('codec.encode', (again.positions.tolist(), again.rooms.tolist()), (chromosome.positions.tolist(), chromosome.rooms.tolist()))
+
+            evaluator = IncrementalFitnessEvaluator(copy.deepcopy(schedule), all_lectures, *positional, use_strict_hierarchy=use_strict_hierarchy, model=model, **options)
+            expect('incremental.reset', evaluator.fitness(), reference(evaluator.schedule))
+            rooms_by_type = {room_type: sorted(names) for room_type, names in model.rooms_by_type.items()}
+            for _ in range(moves):
+                lecture = rng.choice(all_lectures)
+                day_idx, slot_idx = rng.randrange(len(settings['days'])), rng.randrange(len(settings['slots']))
+                room = rng.choice(rooms_by_type.get(lecture['room_type'], []) + [None])
+                predicted = evaluator.evaluate_move(lecture, day_idx, slot_idx, room)
+                token = evaluator.apply((lecture, day_idx, slot_idx, room))
+                expect('incremental.evaluate_move', predicted, evaluator.fitness())
+                expect('incremental.apply', evaluator.fitness(), reference(evaluator.schedule))
+                if rng.random() < 0.3:
+                    evaluator.undo(token)
+                    expect('incremental.undo', evaluator.fitness(), reference(evaluator.schedule))
+
+            population = [copy.deepcopy(schedule)]
+            for _ in range(population_size - 1):
+                individual = chromosome.copy()
+                moved = [rng.randrange(len(codec)) for _ in range(rng.randint(1, 10))]
+                for i in moved:
+                    individual.positions[i] = rng.randrange(len(settings['days']) * len(settings['slots'])) if rng.random() < 0.9 else -1
+                    individual.rooms[i] = rng.randrange(-1, len(codec.room_names))
+                population.append(codec.decode(individual))
+            chromosomes = [codec.encode(individual) for individual in population]
+            expected = [reference(individual) for individual in population]
+            for label, density in (('population.batch', float('inf')), ('population.scalar', -1)):
+                batch_evaluator = PopulationFitnessEvaluator(all_lectures, *positional, use_strict_hierarchy=use_strict_hierarchy, model=model, **options)
+                batch_evaluator.SCALAR_FALLBACK_DENSITY = density
+                expect(f'{label}.schedules', batch_evaluator.evaluate(population), expected)
+                expect(f'{label}.chromosomes', batch_evaluator.evaluate(chromosomes, codec=codec), expected)
+            rows.append({'seed': seed, 'strict': use_strict_hierarchy, 'caches': bool(seed % 2), 'moves': checks['incremental.apply'], 'checks': sum(checks.values())})
+    finally:
+        activate_fitness_cache(saved_caches[0]); activate_teacher_validation_cache(saved_caches[1])
+    return rows
+
+def _print_benchmark(rows):
+    columns = list(rows[0])
+    print('  '.join(f"{c:>12}" for c in columns))
+    for row in rows:
+        print('  '.join(f"{str(row[c]):>12}" for c in columns))
+
+BENCHMARKS = {'population': benchmark_population_evaluation, 'bitsets': benchmark_placement_checks}
+
+def run_benchmark(name):
+    """يشغّل مقياساً من BENCHMARKS ويطبع جدول نتائجه."""
+    if name not in BENCHMARKS:
+        print(f"مقياس غير معروف: {name} (المتاح: {', '.join(BENCHMARKS)})")
+        return 1
+    _print_benchmark(BENCHMARKS[name]())
+    return 0
+
+
+# ================== النموذج المُجمَّع للقيود (Constraint Model) ==================
+# العقوبة الافتراضية لكل عائلة قيود عندما لا يحدد المستخدم درجة خطورتها
+_SEVERITY_DEFAULTS = {
+    'saturday_work': ('low', 1), 'last_slot': ('low', 1), 'max_sessions': ('low', 1),
+    'teacher_pairs': ('low', 1), 'non_sharing_days': ('hard', 100), 'distribution': ('low', 1),
+    'consecutive_halls': ('low', 1), 'prefer_morning': ('low', 1),
+    'distribution_required': ('hard', 100),  # ✨ التوزيع عندما تكون قاعدته "required" (صارم افتراضياً)
+}
+
+def _compile_penalties(constraint_severities):
+    """تحويل درجات الخطورة النصية إلى عقوبات رقمية لكل عائلة قيود."""
+    penalties = {}
+    for family, (default_severity, default_penalty) in _SEVERITY_DEFAULTS.items():
+        severity = constraint_severities.get(family, default_severity)
+        penalties[family] = 100 if severity == 'hard' else SEVERITY_PENALTIES.get(severity, default_penalty)
+    return penalties
+
+def _compile_rooms_by_type(rooms_data):
+    """{نوع القاعة: مجموعة أسماء القاعات من هذا النوع}."""
+    rooms_by_type = defaultdict(set)
+    for room in rooms_data: rooms_by_type[room.get('type')].add(room['name'])
+    return {room_type: frozenset(names) for room_type, names in rooms_by_type.items()}
+
+def _parse_distribution_rule(rule):
+    """(عدد الأيام المستهدف، هل يجب أن تكون متتالية) من نص قاعدة التوزيع."""
+    target_days = 0
+    if 'يومان' in rule or 'يومين' in rule: target_days = 2
+    elif 'ثلاثة أيام' in rule or '3 أيام' in rule: target_days = 3
+    return target_days, ('متتاليان' in rule or 'متتالية' in rule)
+
+def _slot_rules_for_level(rules_for_slot, level):
+    """(ممنوعة، أنواع القاعات المسموحة أو None إن لم تشمل أي قاعدة المستوى، القاعات المحددة) لمستوى في فترة."""
+    level_rules = [r for r in rules_for_slot if level in r.get('levels', [])]
+    if not level_rules: return False, None, ()
+    allowed_types, halls = set(), []
+    for rule in level_rules:
+        rule_type = rule.get('rule_type')
+        if rule_type == 'ANY_HALL': allowed_types.update(['كبيرة', 'صغيرة'])
+        elif rule_type == 'SMALL_HALLS_ONLY': allowed_types.add('صغيرة')
+        elif rule_type == 'SPECIFIC_LARGE_HALL':
+            allowed_types.add('كبيرة')
+            if hall := rule.get('hall_name'): halls.append(hall)
+    forbidden = any(r.get('rule_type') == 'NO_HALLS_ALLOWED' for r in level_rules)
+    return forbidden, frozenset(allowed_types), tuple(halls)
+
+
+class ConstraintModel:
+    """
+    القيود بعد تجميعها لكل تشغيل، بدلاً من إعادة تفسير الإعدادات الخام في كل تقييم:
+    - قواعد كل (مستوى، يوم، فترة) من rules_grid: المنع، أنواع القاعات المسموحة، القاعات المحددة.
+    - القاعة الصغيرة المخصصة لكل (مادة، مستوى) والقاعات المطلوبة لكل محاضرة.
+    - عدد الأيام المستهدف وشرط التوالي لكل أستاذ، والعقوبات الرقمية لكل عائلة قيود.
+    - معرّف عدم التكرار لكل (مادة، مستوى)، والنطاق الثابت لكل محاضرة (StaticDomain).
+    - سجلات Lecture ووضعيات Placement المشتركة بين كل نسخ الجدول.
+    كل جدول يُملأ عند أول طلب (أو مسبقاً عبر presolve). يُمرَّر النموذج صراحة (model=) إلى دوال التقييم
+    ومحركات البحث، والدالة التي لا تستلمه تُجمِّع نموذجاً من الإعدادات الممررة إليها.
+    النموذج مربوط بالإعدادات التي جُمِّع منها: تعديلها بعد ذلك يتطلب نموذجاً جديداً.
+    """
+    def __init__(self, rooms_data=None, rules_grid=None, identifiers_by_level=None, level_specific_large_rooms=None,
+                 specific_small_room_assignments=None, constraint_severities=None, special_constraints=None,
+                 teacher_constraints=None, globally_unavailable_slots=None, saturday_teachers=None, day_to_idx=None):
+        self.rooms_data = rooms_data if rooms_data is not None else []
+        self.rules_grid = rules_grid if rules_grid is not None else []
+        self.identifiers_by_level = identifiers_by_level if identifiers_by_level is not None else {}
+        self.level_specific_large_rooms = level_specific_large_rooms if level_specific_large_rooms is not None else {}
+        self.specific_small_room_assignments = specific_small_room_assignments if specific_small_room_assignments is not None else {}
+        self.constraint_severities = constraint_severities if constraint_severities is not None else {}
+        self.special_constraints = special_constraints if special_constraints is not None else {}
+        self.teacher_constraints = teacher_constraints if teacher_constraints is not None else {}
+        self.globally_unavailable_slots = globally_unavailable_slots if globally_unavailable_slots is not None else set()
+        self.saturday_teachers = saturday_teachers
+        self.day_to_idx = day_to_idx if day_to_idx is not None else {}
+
+        self.penalties = _compile_penalties(self.constraint_severities)
+        self.rooms_by_type = _compile_rooms_by_type(self.rooms_data)
+        self._reset_tables()
+
+    def _reset_tables(self):
+        self._slot_rules, self._small_rooms, self._identifiers = {}, {}, {}
+        self._required_halls, self._distribution_targets, self._domains = {}, {}, {}
+        self._lecture_records, self._placements = {}, {}
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """بصمة محتوى الإعدادات التي جُمِّع منها النموذج (تُحسب مرة واحدة)."""
+        if self._fingerprint is None:
+            self._fingerprint = _settings_fingerprint((
+                self.rooms_data, self.rules_grid, self.identifiers_by_level, self.level_specific_large_rooms,
+                self.specific_small_room_assignments, self.constraint_severities, self.special_constraints,
+                self.teacher_constraints, self.globally_unavailable_slots, self.saturday_teachers, self.day_to_idx
+            ))
+        return self._fingerprint
+
+    def __getstate__(self):
+        # يُرسل النموذج إلى العمليات الفرعية بإعداداته فقط، وتُبنى الجداول هناك عند الطلب
+        state = self.__dict__.copy()
+        for name in ('_slot_rules', '_small_rooms', '_identifiers', '_required_halls', '_distribution_targets',
+                     '_domains', '_lecture_records', '_placements', '_fingerprint'):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_tables()
+
+    def slot_rules(self, level, day_idx, slot_idx):
+        """(ممنوعة، أنواع القاعات المسموحة أو None، القاعات المحددة) للمستوى في الفترة."""
+        key = (level, day_idx, slot_idx)
+        rules = self._slot_rules.get(key)
+        if rules is None: rules = self._slot_rules[key] = _slot_rules_for_level(self.rules_grid[day_idx][slot_idx], level)
+        return rules
+
+    def small_room(self, course_name, level):
+        """القاعة الصغيرة المخصصة للمادة في المستوى (أو None)."""
+        key = (course_name, level)
+        room = self._small_rooms.get(key, _UNRESOLVED)
+        if room is _UNRESOLVED: room = self._small_rooms[key] = self.specific_small_room_assignments.get(f"{course_name} ({level})")
+        return room
+
+    def identifier_of(self, course_name, level):
+        """معرّف عدم التكرار المحتوى في اسم المادة لهذا المستوى (أو None)."""
+        key = (course_name, level)
+        found = self._identifiers.get(key, _UNRESOLVED)
+        if found is _UNRESOLVED:
+            found = self._identifiers[key] = get_contained_identifier(course_name, self.identifiers_by_level.get(level, [])) if course_name is not None else None
+        return found
+
+    def required_halls(self, lecture):
+        """القاعات المطلوبة للمحاضرة من تخصيصات القاعات (قبل إضافة قاعات قواعد الفترة)."""
+        key = (lecture.get('name'), tuple(lecture.get('levels', [])), lecture.get('room_type'))
+        halls = self._required_halls.get(key)
+        if halls is None:
+            name, levels, room_type = key
+            found = set()
+            for level in levels:
+                if room := self.small_room(name, level): found.add(room)
+                if room_type == 'كبيرة' and (room := self.level_specific_large_rooms.get(level)): found.add(room)
+            halls = self._required_halls[key] = frozenset(found)
+        return halls
+
+    def distribution_target(self, teacher_name):
+        """(عدد الأيام المستهدف، هل يجب أن تكون متتالية) لقاعدة توزيع الأستاذ."""
+        target = self._distribution_targets.get(teacher_name)
+        if target is None:
+            rule = self.special_constraints.get(teacher_name, {}).get('distribution_rule', 'غير محدد')
+            target = self._distribution_targets[teacher_name] = _parse_distribution_rule(rule)
+        return target
+
+    def domain(self, lecture):
+        """النطاق الثابت للمحاضرة (تُعرَّف بمحتواها)."""
+        key = (lecture.get('id'), lecture.get('name'), lecture.get('teacher_name'), lecture.get('room_type'), tuple(lecture.get('levels', [])))
+        domain = self._domains.get(key)
+        if domain is None: domain = self._domains[key] = StaticDomain(self, lecture)
+        return domain
+
+    def presolve(self, lectures, num_days, num_slots):
+        """حساب النطاق الكامل لكل محاضرة مسبقاً (مرة واحدة لكل محاولة)."""
+        for lecture in lectures:
+            domain = self.domain(lecture)
+            for day_idx in range(num_days):
+                for slot_idx in range(num_slots):
+                    domain.reason(day_idx, slot_idx); domain.rooms(day_idx, slot_idx)
+
+    def lecture_record(self, lecture):
+        """سجل Lecture المشترك لمحتوى المحاضرة (قاموس أو Placement)."""
+        if type(lecture) is Placement: return lecture.lecture
+        content = Lecture.content_of(lecture)
+        record = self._lecture_records.get(content)
+        if record is None: record = self._lecture_records.setdefault(content, Lecture(*content))
+        return record
+
+    def placement(self, lecture, room):
+        """الوضعية المشتركة للمحاضرة في القاعة room."""
+        record = self.lecture_record(lecture)
+        placement = self._placements.get((record, room))
+        if placement is None: placement = self._placements.setdefault((record, room), Placement(record, room))
+        return placement
+
+
+_UNRESOLVED = object()
+
+def _settings_fingerprint(settings):
+    """
+    بصمة محتوى إعدادات JSON (قواميس، قوائم، مجموعات، قيم بسيطة) عبر تمثيلها النصي:
+    تساوي التمثيل يعني تساوي المحتوى، واختلاف ترتيب الإدخال وحده لا يسبب إلا إخفاقاً في الذاكرة.
+    """
+    return hash(repr(settings))
+
+def _model_from_settings(model, **settings):
+    """النموذج الممرر، أو نموذج يُجمَّع من الإعدادات الممررة للدالة إن لم يُمرَّر."""
+    return model if model is not None else ConstraintModel(**settings)
+
+
+# ================== حالة الجدول على شكل مصفوفات إشغال (NumPy) ==================
+class ScheduleState:
+    """
+    تمثيل الجدول بمصفوفات إشغال بدلاً من المرور على شبكة القواميس في كل مرة:
+    - teacher_occ[t, d, s] و room_occ[r, d, s]: عدد المحاضرات الموضوعة للأستاذ/في القاعة في الفترة.
+    - level_occ[l, d, s] و level_large[l, d, s]: عدد المحاضرات وعدد محاضرات القاعات الكبيرة في خلية المستوى.
+    - clash_count[d, s]: عدد الأساتذة والقاعات التي تجاوزت محاضرة واحدة في الفترة.
+    العدّ يتم لكل نسخة، فالمادة المشتركة بين مستويين تُحسب مرتين؛ لذلك فحص التعارض هنا متحفظ
+    (لا يُسقط أي تعارض فعلي) والتفاصيل تبقى لـ _slot_clash_failures.
+    الشبكة (schedule) تبقى مرجعاً للمحاضرات نفسها؛ من يعدّلها يستدعي add_lecture/remove_lecture لإبقاء المصفوفات متزامنة.
+    """
+    def __init__(self, schedule, days, slots, levels=None, teacher_names=(), room_names=()):
+        self.schedule = schedule
+        self.num_days, self.num_slots = len(days), len(slots)
+        self.levels = [lvl for lvl in (levels if levels is not None else schedule.keys()) if lvl in schedule]
+        self.level_index = {lvl: i for i, lvl in enumerate(self.levels)}
+        self.teacher_index, self.room_index = {}, {}
+        self.teacher_names, self.room_names = [], []
+        for name in teacher_names: self._index_of(self.teacher_index, self.teacher_names, name)
+        for name in room_names: self._index_of(self.room_index, self.room_names, name)
+        self.rebuild()
+
+    @staticmethod
+    def _index_of(index_map, names, name):
+        idx = index_map.get(name)
+        if idx is None:
+            idx = index_map[name] = len(names)
+            names.append(name)
+        return idx
+
+    @staticmethod
+    def _grow(array, size):
+        if array.shape[0] >= size: return array
+        extra = np.zeros((max(size, 2 * array.shape[0]) - array.shape[0],) + array.shape[1:], dtype=array.dtype)
+        return np.concatenate([array, extra])
+
+    @staticmethod
+    def _accumulate(size, first_idx, ds_pairs, shape):
+        array = np.zeros((size,) + shape, dtype=np.int32)
+        if first_idx:
+            ds = np.asarray(ds_pairs, dtype=np.intp)
+            np.add.at(array, (np.asarray(first_idx, dtype=np.intp), ds[:, 0], ds[:, 1]), 1)
+        return array
+
+    def rebuild(self):
+        """بناء كل المصفوفات من الشبكة في مرور واحد ثم تجميعها دفعة واحدة بـ np.add.at."""
+        t_idx, t_ds, r_idx, r_ds = [], [], [], []
+        l_idx, l_ds, large_idx, large_ds = [], [], [], []
+        for level in self.levels:
+            li = self.level_index[level]
+            for d, day_slots in enumerate(self.schedule[level]):
+                for s, lectures in enumerate(day_slots):
+                    for lec in lectures:
+                        l_idx.append(li); l_ds.append((d, s))
+                        if lec.get('room_type') == 'كبيرة':
+                            large_idx.append(li); large_ds.append((d, s))
+                        if teacher := lec.get('teacher_name'):
+                            t_idx.append(self._index_of(self.teacher_index, self.teacher_names, teacher)); t_ds.append((d, s))
+                        if room := lec.get('room'):
+                            r_idx.append(self._index_of(self.room_index, self.room_names, room)); r_ds.append((d, s))
+
+        shape = (self.num_days, self.num_slots)
+        self.teacher_occ = self._accumulate(len(self.teacher_names), t_idx, t_ds, shape)
+        self.room_occ = self._accumulate(len(self.room_names), r_idx, r_ds, shape)
+        self.level_occ = self._accumulate(len(self.levels), l_idx, l_ds, shape)
+        self.level_large = self._accumulate(len(self.levels), large_idx, large_ds, shape)
+        self.clash_count = ((self.teacher_occ > 1).sum(axis=0) + (self.room_occ > 1).sum(axis=0)).astype(np.int32)
+
+    # --- تحديثات تزايدية لمحاضرة واحدة في خلية واحدة ---
+    def _bump(self, occ, idx, d, s, delta):
+        """تعديل عدّاد إشغال واحد مع تحديث clash_count عند عبور العتبة 1 <-> 2."""
+        value = occ[idx, d, s] + delta
+        occ[idx, d, s] = value
+        if delta > 0 and value == 2: self.clash_count[d, s] += 1
+        elif delta < 0 and value == 1: self.clash_count[d, s] -= 1
+
+    def _update(self, level, d, s, lec, delta):
+        li = self.level_index.get(level)
+        if li is None: return
+        self.level_occ[li, d, s] += delta
+        if lec.get('room_type') == 'كبيرة': self.level_large[li, d, s] += delta
+        if teacher := lec.get('teacher_name'):
+            ti = self.teacher_index.get(teacher)
+            if ti is None:
+                ti = self._index_of(self.teacher_index, self.teacher_names, teacher)
+                self.teacher_occ = self._grow(self.teacher_occ, ti + 1)
+            self._bump(self.teacher_occ, ti, d, s, delta)
+        if room := lec.get('room'):
+            ri = self.room_index.get(room)
+            if ri is None:
+                ri = self._index_of(self.room_index, self.room_names, room)
+                self.room_occ = self._grow(self.room_occ, ri + 1)
+            self._bump(self.room_occ, ri, d, s, delta)
+
+    def add_lecture(self, level, d, s, lec):
+        self._update(level, d, s, lec, 1)
+
+    def remove_lecture(self, level, d, s, lec):
+        self._update(level, d, s, lec, -1)
+
+    # --- استعلامات على شكل عمليات اختزال للمصفوفات ---
+    def clash_slots(self):
+        """الفترات (d, s) التي قد يكون فيها تعارض أستاذ أو قاعة."""
+        return {tuple(pos) for pos in np.argwhere(self.clash_count > 0).tolist()}
+
+    def has_clash(self, d, s):
+        return self.clash_count[d, s] > 0
+
+    def large_hall_conflicts(self):
+        """مصفوفة منطقية (مستوى، يوم، فترة): قاعة كبيرة مع مادة أخرى في نفس الخلية."""
+        return (self.level_large > 1) | ((self.level_large == 1) & (self.level_occ > 1))
+
+    def large_hall_conflict(self, level, d, s):
+        li = self.level_index.get(level)
+        if li is None: return None
+        large, total = self.level_large[li, d, s], self.level_occ[li, d, s]
+        return bool(large > 1 or (large == 1 and total > 1))
+
+
+# ================== سجلات المحاضرات والوضعيات (Lecture / Placement) ==================
+class Lecture:
+    """
+    سجل ثابت لمحتوى محاضرة (المعرّف، الاسم، نوع القاعة، الأستاذ، المستويات).
+    يُنشأ مرة واحدة لكل محتوى في ConstraintModel ويُشارَك بالمرجع بين كل وضعيات المحاضرة؛
+    تغيير إسناد الأستاذ ينتج سجلاً جديداً ولا يعدّل القديم.
+    """
+    __slots__ = ('id', 'name', 'room_type', 'teacher_name', 'levels')
+
+    def __init__(self, lecture_id, name, room_type, teacher_name, levels):
+        self.id, self.name, self.room_type, self.teacher_name, self.levels = lecture_id, name, room_type, teacher_name, levels
+
+    @staticmethod
+    def content_of(lecture):
+        return (lecture.get('id'), lecture.get('name'), lecture.get('room_type'), lecture.get('teacher_name'), tuple(lecture.get('levels', ())))
+
+    @classmethod
+    def of(cls, lecture):
+        """سجل جديد لمحتوى المحاضرة (قاموس)، أو سجل الوضعية نفسه."""
+        if type(lecture) is Placement: return lecture.lecture
+        return cls(*cls.content_of(lecture))
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state): setattr(self, name, value)
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class Placement:
+    """
+    وضعية محاضرة داخل خلية الجدول: سجل Lecture مشترك + القاعة. ثابتة، فالنسخ العميق للجدول
+    يعيد نفس الكائن ولا ينسخ إلا القوائم، والوضعية نفسها تُشارَك بين مستويات المادة المشتركة.
+    - تدعم قراءة القاموس (get و[] و in و keys) كما كانت الخلايا تُقرأ، و copy() تعيد قاموساً عادياً قابلاً للتعديل.
+    - تُحوَّل إلى القاموس المعتاد عند إرجاع الجدول للواجهة عبر render_schedule.
+    """
+    __slots__ = ('lecture', 'id', 'name', 'room_type', 'teacher_name', 'levels', 'room')
+    FIELDS = ('id', 'name', 'room_type', 'teacher_name', 'levels', 'room')
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, lecture, room):
+        self.lecture, self.room = lecture, room
+        self.id, self.name, self.room_type = lecture.id, lecture.name, lecture.room_type
+        self.teacher_name, self.levels = lecture.teacher_name, lecture.levels
+
+    @classmethod
+    def of(cls, lecture, room, model=None):
+        """وضعية المحاضرة (قاموس أو Placement) في القاعة room: المشتركة من النموذج إن مُرِّر، وإلا وضعية جديدة."""
+        if model is not None: return model.placement(lecture, room)
+        return cls(Lecture.of(lecture), room)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if name in self._FIELD_SET else default
+
+    def __getitem__(self, name):
+        if name not in self._FIELD_SET: raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name):
+        return name in self._FIELD_SET
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.FIELDS]
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'room_type': self.room_type, 'teacher_name': self.teacher_name, 'levels': list(self.levels), 'room': self.room}
+
+    copy = to_dict
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state): setattr(self, name, value)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        if type(other) is Placement: return self is other or self.to_dict() == other.to_dict()
+        if isinstance(other, dict): return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None  # كالقاموس: غير قابل للتجزئة
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def render_lecture(lecture):
+    return lecture.to_dict() if type(lecture) is Placement else lecture
+
+def render_schedule(schedule):
+    """تحويل خلايا الجدول إلى قواميس قابلة للتحويل إلى JSON (عند إرجاع الجدول للواجهة)."""
+    return {level: [[[render_lecture(lec) for lec in cell] for cell in day] for day in grid] for level, grid in schedule.items()}
+
+
+# ================== سجلات الأخطاء المضغوطة (Violation) ==================
+class Violation:
+    """
+    خطأ قيد بصيغة مضغوطة: رمز القيد ومعاملات نص السبب، الأستاذ، المادة، العقوبة، ومرجع للمحاضرات المعنية.
+    - نص السبب العربي لا يُبنى إلا عند قراءته، وقائمة المحاضرات المعنية تُرشَّح من مرجعها عند أول قراءة فقط.
+    - مفتاح إزالة التكرار هو (الرمز، المعاملات، الأستاذ، المادة) بدل النص الكامل.
+    - يدعم قراءة القاموس (get و[] و in) حتى تبقى الشيفرة المستهلكة للأخطاء كما هي،
+      ويُحوَّل إلى القاموس المعتاد عند إرجاع النتائج للواجهة عبر render_failures.
+    """
+    __slots__ = ('code', 'args', 'teacher_name', 'course_name', 'penalty', '_involved', '_involved_filter', 'key')
+
+    REASONS = {
+        'teacher_clash': "تعارض الأستاذ في {} {}",
+        'room_clash': "تعارض في القاعة {} في {} {}",
+        'rest_period': "خرق فترة الراحة العامة في {} {}",
+        'room_type_rule': "قيد الفترة في {} {} يخرق قاعدة نوع القاعة ({})",
+        'large_hall_conflict': "تعارض قاعة كبيرة مع مادة أخرى في {} {}",
+        'level_room': "قيد قاعة المستوى في {} {}: يجب أن تكون في '{}' وليس '{}'",
+        'small_room': "قيد القاعة الصغيرة في {} {}: يجب أن تكون في '{}' وليس '{}'",
+        'identifier_clash': "تعارض معرفات ({}) في {} {}",
+        'shared_distribution': "توزيع ناقص/زائد للمادة المشتركة.",
+        'shared_inconsistent': "توزيع غير متناسق للمادة المشتركة.",
+        'consecutive_hall': "حدث توالٍ غير مسموح به في القاعة الكبيرة '{}'.",
+        'prefer_morning': "توجد حصة في آخر فترة ({}) مع وجود فرصة لوضعها في وقت أبكر.",
+        'manual_days': "الأستاذ يعمل في يوم غير مسموح به يدويًا.",
+        'saturday_work': "الأستاذ لا يجب أن يعمل يوم السبت.",
+        'last_slot': "الأستاذ لا يجب أن يعمل في آخر {} حصص.",
+        'max_sessions': "تجاوز الحد الأقصى للحصص ({} > {}).",
+        'teacher_pairs': "أيام عمل الأستاذين غير متطابقة.",
+        'non_sharing_days': "يجب ألا يعمل هذان الأستاذان في نفس الأيام.",
+        'distribution_required': "يجب أن يعمل {} أيام بالضبط (يعمل حالياً {}).",
+        'distribution_allowed': "يجب أن يعمل {} أيام كحد أقصى (يعمل حالياً {}).",
+        'distribution_consecutive': "أيام عمل الأستاذ ليست متتالية كما هو مطلوب.",
+    }
+    # رموز لم تكن قواميسها تحمل الحقل teacher_name أصلاً
+    NO_TEACHER = frozenset(['rest_period', 'room_type_rule', 'level_room', 'small_room', 'shared_distribution', 'shared_inconsistent'])
+    FIELDS = ('course_name', 'teacher_name', 'reason', 'penalty', 'involved_lectures')
+
+    def __init__(self, code, args, teacher_name, course_name, penalty, involved, involved_filter=None):
+        self.code, self.args = code, args
+        self.teacher_name, self.course_name, self.penalty = teacher_name, course_name, penalty
+        self._involved, self._involved_filter = involved, involved_filter
+        self.key = (code, args, teacher_name, course_name)
+
+    @property
+    def reason(self):
+        return self.REASONS[self.code].format(*self.args)
+
+    @property
+    def involved_lectures(self):
+        if self._involved_filter is not None:
+            field, value = self._involved_filter
+            self._involved = [lec for lec in self._involved if lec.get(field) == value]
+            self._involved_filter = None
+        return self._involved
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state): setattr(self, name, value)
+
+    def _has(self, name):
+        return name in self.FIELDS and (name != 'teacher_name' or self.code not in self.NO_TEACHER)
+
+    def get(self, name, default=None):
+        return getattr(self, name) if self._has(name) else default
+
+    def __getitem__(self, name):
+        if not self._has(name): raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name):
+        return self._has(name)
+
+    def keys(self):
+        return [name for name in self.FIELDS if self._has(name)]
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def __eq__(self, other):
+        if isinstance(other, (Violation, dict)): return self.to_dict() == (other.to_dict() if isinstance(other, Violation) else other)
+        return NotImplemented
+
+    __hash__ = None  # كالقاموس: غير قابل للتجزئة
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def _violation(keys_only, code, args, teacher_name, course_name, penalty, involved=(), involved_filter=None):
+    """سجل Violation، أو في مسار العد زوج (مفتاح إزالة التكرار، العقوبة) فقط."""
+    if keys_only: return ((code, args, teacher_name, course_name), penalty)
+    return Violation(code, args, teacher_name, course_name, penalty, involved, involved_filter)
+
+def _failure_key(failure):
+    """مفتاح إزالة التكرار: المفتاح المضغوط لسجلات Violation، ونص السبب للقواميس العادية."""
+    if type(failure) is Violation: return failure.key
+    return (failure.get('reason'), failure.get('teacher_name'), failure.get('course_name'))
+
+def render_failures(failures):
+    """تحويل قائمة الأخطاء إلى قواميس عربية كاملة قابلة للتحويل إلى JSON (عند إرجاعها من واجهات API)."""
+    rendered = []
+    for failure in failures:
+        if type(failure) is Violation: failure = failure.to_dict()
+        involved = failure.get('involved_lectures')
+        if involved and any(type(lec) is Placement for lec in involved):
+            failure = dict(failure, involved_lectures=[render_lecture(lec) for lec in involved])
+        rendered.append(failure)
+    return rendered
 
+
+# ✨ دوال مساعدة لكل عائلة من القيود (تستخدمها calculate_schedule_cost والمقيّم التزايدي)
+def _slot_clash_failures(lectures_in_this_slot, day_name, slot_name, keys_only=False):
+    """تعارضات الأساتذة والقاعات داخل فترة واحدة (كل المستويات مجتمعة).
+    keys_only: يعيد أزواج (مفتاح إزالة التكرار، العقوبة) فقط دون سجلات Violation."""
+    failures = []
+    lectures_by_id = defaultdict(list)
+    for lec in lectures_in_this_slot: lectures_by_id[lec.get('id')].append(lec)
+
+    teachers_in_slot_set, rooms_in_slot_set = set(), set()
+    for lec_id, lecture_group in lectures_by_id.items():
+        rep_lec = lecture_group[0] 
+        teacher, room = rep_lec.get('teacher_name'), rep_lec.get('room')
+
+        if teacher and teacher in teachers_in_slot_set:
+            failures.append(_violation(keys_only, 'teacher_clash', (day_name, slot_name), teacher, rep_lec.get('name'), 100, lectures_in_this_slot, ('teacher_name', teacher)))
+        if teacher: teachers_in_slot_set.add(teacher)
+
+        if room and room in rooms_in_slot_set:
+            failures.append(_violation(keys_only, 'room_clash', (room, day_name, slot_name), "N/A", rep_lec.get('name'), 100, lectures_in_this_slot, ('room', room)))
+        if room: rooms_in_slot_set.add(room)
+    return failures
+
+def _cell_failures(level, day_idx, slot_idx, lectures, days, slots, model, large_hall_conflict=None, keys_only=False):
+    """القيود الصارمة الخاصة بخلية واحدة (مستوى، يوم، فترة).
+    large_hall_conflict: نتيجة مسبقة من ScheduleState.large_hall_conflicts إن توفرت.
+    keys_only: كما في _slot_clash_failures."""
+    profiler = _active_profiler()
+    if profiler is not None: mark = time.perf_counter()
+    failures = []
+    day_name, slot_name = days[day_idx], slots[slot_idx]
+
+    if (day_idx, slot_idx) in model.globally_unavailable_slots:
+        failures.append(_violation(keys_only, 'rest_period', (day_name, slot_name), None, "فترة راحة", 100, lectures))
+
+    _, allowed_room_types, _ = model.slot_rules(level, day_idx, slot_idx)
+    if allowed_room_types is not None:
+        for lec in lectures:
+            if lec.get('room_type') not in allowed_room_types:
+                failures.append(_violation(keys_only, 'room_type_rule', (day_name, slot_name, lec.get('room_type')), None, lec.get('name'), 100, [lec]))
+
+    if large_hall_conflict is None:
+        large_room_count = sum(1 for lec in lectures if lec.get('room_type') == 'كبيرة')
+        large_hall_conflict = large_room_count > 1 or (large_room_count == 1 and len(lectures) > 1)
+    if large_hall_conflict:
+        failures.append(_violation(keys_only, 'large_hall_conflict', (day_name, slot_name), level, "عدة مواد", 100, lectures))
+
+    used_identifiers_this_slot = {}
+    identifier_seconds = 0.0
+    for lec in lectures:
+        if lec.get('room_type') == 'كبيرة' and (room := model.level_specific_large_rooms.get(level)) and lec.get('room') != room:
+            failures.append(_violation(keys_only, 'level_room', (day_name, slot_name, room, lec.get('room')), None, lec.get('name'), 100, [lec]))
+        if lec.get('room_type') == 'صغيرة' and (room := model.small_room(lec.get('name'), level)) and lec.get('room') != room:
+            failures.append(_violation(keys_only, 'small_room', (day_name, slot_name, room, lec.get('room')), None, lec.get('name'), 100, [lec]))
+
+        if profiler is not None: identifier_start = time.perf_counter()
+        identifier = model.identifier_of(lec['name'], level)
+        if identifier:
+            if identifier in used_identifiers_this_slot:
+                failures.append(_violation(keys_only, 'identifier_clash', (identifier, day_name, slot_name), level, lec.get('name'), 100, used_identifiers_this_slot[identifier] + [lec]))
+            else:
+                used_identifiers_this_slot[identifier] = [lec]
+        if profiler is not None: identifier_seconds += time.perf_counter() - identifier_start
+    if profiler is not None:
+        profiler.add('cell_rules', time.perf_counter() - mark - identifier_seconds)
+        profiler.add('identifier_clashes', identifier_seconds)
+    return failures
+
+def _shared_lecture_failures(original_lec, placements, keys_only=False):
+    """التحقق من توزيع مادة مشتركة واحدة على مستوياتها."""
+    failures = []
+    required_levels, placed_levels = set(original_lec.get('levels', [])), {p['level'] for p in placements}
+    if required_levels != placed_levels:
+        failures.append(_violation(keys_only, 'shared_distribution', (), None, original_lec['name'], 100, [original_lec]))
+    if len(placements) > 1 and len(set((p['day_idx'], p['slot_idx'], p['room']) for p in placements)) > 1:
+        failures.append(_violation(keys_only, 'shared_inconsistent', (), None, original_lec['name'], 100, [original_lec]))
+    return failures
+
+def _consecutive_hall_failures(level, slot_list, consecutive_large_hall_rule, penalty, keys_only=False):
+    """قيد توالي القاعات الكبيرة ليوم واحد من أيام مستوى معين."""
+    failures = []
+    for slot_idx in range(1, len(slot_list)):
+        common_halls = {lec['room'] for lec in slot_list[slot_idx] if lec.get('room_type') == 'كبيرة'}.intersection({lec['room'] for lec in slot_list[slot_idx - 1] if lec.get('room_type') == 'كبيرة'})
+        for hall in common_halls:
+            if consecutive_large_hall_rule == 'all' or consecutive_large_hall_rule == hall:
+                # المحاضرتان في فترتين متتاليتين: الحالية أولاً ثم السابقة كما في القائمة الأصلية
+                involved = slot_list[slot_idx] + slot_list[slot_idx - 1]
+                failures.append(_violation(keys_only, 'consecutive_hall', (hall,), "N/A", f"قيد التوالي للمستوى {level}", penalty, involved, ('room', hall)))
+    return failures
+
+class _FreeRoomIndex:
+    """
+    فهرس القاعات الشاغرة لتفضيل الفترات المبكرة: عدد القاعات الشاغرة من كل نوع في كل (يوم، فترة)،
+    يُحسب عند أول طلب من مجموعات القاعات حسب النوع (المحسوبة مسبقاً) ومجموعة القاعات المشغولة في الفترة.
+    صالح ما دام الجدول لم يتغير؛ من يعدّل الجدول ينشئ فهرساً جديداً.
+    """
+    __slots__ = ('rooms_by_type', 'room_schedule_map', 'counts')
+
+    def __init__(self, rooms_by_type, room_schedule_map):
+        self.rooms_by_type = rooms_by_type
+        self.room_schedule_map = room_schedule_map
+        self.counts = {}
+
+    def has_free_room(self, day_idx, slot_idx, room_type):
+        key = (day_idx, slot_idx, room_type)
+        count = self.counts.get(key)
+        if count is None:
+            rooms_of_type = self.rooms_by_type.get(room_type)
+            if not rooms_of_type:
+                count = 0
+            else:
+                occupied = self.room_schedule_map.get((day_idx, slot_idx), ())
+                count = len(rooms_of_type) - sum(1 for room in occupied if room in rooms_of_type)
+            self.counts[key] = count
+        return count > 0
+
+def _missed_earlier_opportunity(lecture, level, day_idx, schedule, teacher_slots, first_day, prof_constraints, free_rooms, last_slot_index):
+    """هل كان بالإمكان وضع محاضرة الفترة الأخيرة في فترة أبكر من نفس اليوم؟ (free_rooms: _FreeRoomIndex)"""
+    for earlier_slot_idx in range(last_slot_index):
+        # إذا كان الأستاذ يعمل بالفعل في هذه الفترة المبكرة، فهي ليست فرصة
+        if (day_idx, earlier_slot_idx) in teacher_slots:
+            continue
+
+        is_first_day = (first_day is not None and day_idx == first_day)
+        if is_first_day:
+            if prof_constraints.get('start_d1_s2') and earlier_slot_idx < 1:
+                continue # تخطى هذه الفترة لأنها تخالف قيد الأستاذ
+            if prof_constraints.get('start_d1_s3') and earlier_slot_idx < 2:
+                continue # تخطى هذه الفترة لأنها تخالف قيد الأستاذ
+
+        # إذا كانت هناك محاضرة في قاعة كبيرة في تلك الفترة، لا يمكن استخدامها
+        if any(lec.get('room_type') == 'كبيرة' for lec in schedule[level][day_idx][earlier_slot_idx]):
+            continue
+        
+        # تحقق مما إذا كانت هناك قاعة متاحة من نفس النوع المطلوب
+        if free_rooms.has_free_room(day_idx, earlier_slot_idx, lecture.get('room_type')):
+            return True
     return False
-# ================== نهاية الدالة المُعدلة بالكامل ==================
 
+def _prefer_morning_failure(teacher, lecture, penalty, last_slot_index, keys_only=False):
+    return _violation(keys_only, 'prefer_morning', (last_slot_index + 1,), teacher, "قيد ضغط الحصص", penalty, [lecture])
 
+def _count_failure_keys(entries):
+    """(عدد الأخطاء الصارمة، عدد المرنة) من أزواج (مفتاح، عقوبة) بعد إزالة التكرار بمفتاح _dedup_failures نفسه."""
+    first_penalty = {}
+    for key, penalty in entries:
+        if key not in first_penalty: first_penalty[key] = penalty
+    hard_count = sum(1 for penalty in first_penalty.values() if penalty >= 100)
+    return hard_count, len(first_penalty) - hard_count
 
+def _dedup_failures(conflicts_list):
+    unique_failures = {}
+    for failure in conflicts_list:
+        key = _failure_key(failure)
+        if key not in unique_failures:
+            unique_failures[key] = failure
+    return list(unique_failures.values())
+
+
+@_profiled('calculate_schedule_cost')
 def calculate_schedule_cost(
     schedule, days, slots, teachers, rooms_data, levels, 
     identifiers_by_level, special_constraints, teacher_constraints, 
@@ -605,13 +2108,26 @@ def calculate_schedule_cost(
     saturday_teachers, teacher_pairs, day_to_idx, rules_grid, 
     last_slot_restrictions, level_specific_large_rooms, 
     specific_small_room_assignments, constraint_severities, # ✨ المعامل الجديد
-    max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[]
+    max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[],
+    mode="full", vector_cache=None, model=None
 ):
     """
     النسخة الكاملة والمصححة:
     - تحسب كل الأخطاء مع عقوبات ديناميكية.
     - تعيد المنطق التفصيلي لقيد تفضيل الفترات المبكرة.
+    - mode="count": تعيد (عدد الأخطاء الصارمة، عدد المرنة) فقط بعد إزالة التكرار، دون بناء قواميس الأخطاء
+      أو قوائم المحاضرات المعنية.
+    - vector_cache: ذاكرة قيود الأساتذة، يمررها calculate_fitness صراحة من التشغيل الحالي؛
+      طلبات API لا تمررها فلا تمس ذاكرة تشغيل جارٍ.
+    - model: ConstraintModel المُجمَّع لهذه الإعدادات (يُجمَّع منها إن لم يُمرَّر).
     """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    keys_only = (mode == "count")
+    profiler = _active_profiler()
+    if profiler is not None: mark = time.perf_counter()
     conflicts_list = []
     all_lectures_map = {lec['id']: lec for lec in lectures_by_teacher_map.get('__all_lectures__', [])}
 
@@ -624,128 +2140,66 @@ def calculate_schedule_cost(
                     lectures_in_this_slot.extend(schedule[level][day_idx][slot_idx])
 
             if not lectures_in_this_slot: continue
-
-            lectures_by_id = defaultdict(list)
-            for lec in lectures_in_this_slot: lectures_by_id[lec.get('id')].append(lec)
-
-            teachers_in_slot_set, rooms_in_slot_set = set(), set()
-            for lec_id, lecture_group in lectures_by_id.items():
-                rep_lec = lecture_group[0] 
-                teacher, room = rep_lec.get('teacher_name'), rep_lec.get('room')
-
-                if teacher and teacher in teachers_in_slot_set:
-                    clashing_lectures = [l for l in lectures_in_this_slot if l.get('teacher_name') == teacher]
-                    conflicts_list.append({"course_name": rep_lec.get('name'), "teacher_name": teacher, "reason": f"تعارض الأستاذ في {day_name} {slot_name}", "penalty": 100, "involved_lectures": clashing_lectures})
-                if teacher: teachers_in_slot_set.add(teacher)
-
-                if room and room in rooms_in_slot_set:
-                    clashing_lectures = [l for l in lectures_in_this_slot if l.get('room') == room]
-                    conflicts_list.append({"course_name": rep_lec.get('name'), "teacher_name": "N/A", "reason": f"تعارض في القاعة {room} في {day_name} {slot_name}", "penalty": 100, "involved_lectures": clashing_lectures})
-                if room: rooms_in_slot_set.add(room)
+            conflicts_list.extend(_slot_clash_failures(lectures_in_this_slot, day_name, slot_name, keys_only=keys_only))
+    if profiler is not None: profiler.lap('teacher_room_clashes', mark)
 
     # --- الخطوة 2: بناء الخرائط والتحقق الشامل من القيود الأخرى ---
     shared_lecture_placements = defaultdict(list)
     teacher_schedule_map = defaultdict(set)
+    # ✨ فهارس تفضيل الفترات المبكرة تُبنى في نفس المرور: القاعات المشغولة لكل فترة وأول يوم عمل لكل أستاذ
+    use_morning_rule = prefer_morning_slots and len(slots) > 1
+    room_schedule_map = defaultdict(set)
+    first_work_day_map = {}
 
     for level, day_grid in schedule.items():
         for day_idx, slot_list in enumerate(day_grid):
             for slot_idx, lectures in enumerate(slot_list):
                 if not lectures: continue
-                day_name, slot_name = days[day_idx], slots[slot_idx]
-
                 # القيود التالية دائماً صارمة
-                if (day_idx, slot_idx) in globally_unavailable_slots:
-                    conflicts_list.append({"course_name": "فترة راحة", "reason": f"خرق فترة الراحة العامة في {day_name} {slot_name}", "penalty": 100, "involved_lectures": lectures})
+                conflicts_list.extend(_cell_failures(level, day_idx, slot_idx, lectures, days, slots, model, keys_only=keys_only))
 
-                rules_for_slot = rules_grid[day_idx][slot_idx]
-                if rules_for_slot:
-                    for lec in lectures:
-                        is_level_in_any_rule, allowed_room_types = False, []
-                        for rule in rules_for_slot:
-                            if level in rule.get('levels', []):
-                                is_level_in_any_rule = True
-                                rule_type = rule.get('rule_type')
-                                if rule_type == 'ANY_HALL': allowed_room_types.extend(['كبيرة', 'صغيرة'])
-                                elif rule_type == 'SMALL_HALLS_ONLY': allowed_room_types.append('صغيرة')
-                                elif rule_type == 'SPECIFIC_LARGE_HALL': allowed_room_types.append('كبيرة')
-
-                        if is_level_in_any_rule and lec.get('room_type') not in set(allowed_room_types):
-                            conflicts_list.append({"course_name": lec.get('name'), "reason": f"قيد الفترة في {day_name} {slot_name} يخرق قاعدة نوع القاعة ({lec.get('room_type')})", "penalty": 100, "involved_lectures": [lec]})
-
-                large_room_lectures = [lec for lec in lectures if lec.get('room_type') == 'كبيرة']
-                if len(large_room_lectures) > 1 or (len(large_room_lectures) == 1 and len(lectures) > 1):
-                    conflicts_list.append({"course_name": "عدة مواد", "teacher_name": level, "reason": f"تعارض قاعة كبيرة مع مادة أخرى في {day_name} {slot_name}", "penalty": 100, "involved_lectures": lectures})
-
-                used_identifiers_this_slot = {}
                 for lec in lectures:
                     teacher_schedule_map[lec.get('teacher_name')].add((day_idx, slot_idx))
+                    if use_morning_rule:
+                        if day_idx < first_work_day_map.get(lec.get('teacher_name'), day_idx + 1): first_work_day_map[lec.get('teacher_name')] = day_idx
+                        if lec.get('room'): room_schedule_map[(day_idx, slot_idx)].add(lec.get('room'))
                     original_lec = all_lectures_map.get(lec.get('id'))
                     if original_lec and len(original_lec.get('levels', [])) > 1:
                         shared_lecture_placements[lec.get('id')].append({'level': level, 'day_idx': day_idx, 'slot_idx': slot_idx, 'room': lec.get('room')})
 
-                    if lec.get('room_type') == 'كبيرة' and (room := level_specific_large_rooms.get(level)) and lec.get('room') != room:
-                        conflicts_list.append({"course_name": lec.get('name'), "reason": f"قيد قاعة المستوى في {day_name} {slot_name}: يجب أن تكون في '{room}' وليس '{lec.get('room')}'", "penalty": 100, "involved_lectures": [lec]})
-                    if lec.get('room_type') == 'صغيرة' and (room := specific_small_room_assignments.get(f"{lec.get('name')} ({level})")) and lec.get('room') != room:
-                        conflicts_list.append({"course_name": lec.get('name'), "reason": f"قيد القاعة الصغيرة في {day_name} {slot_name}: يجب أن تكون في '{room}' وليس '{lec.get('room')}'", "penalty": 100, "involved_lectures": [lec]})
-
-                    identifier = get_contained_identifier(lec['name'], identifiers_by_level.get(level, []))
-                    if identifier:
-                        if identifier in used_identifiers_this_slot:
-                            clashing_lectures = used_identifiers_this_slot[identifier] + [lec]
-                            conflicts_list.append({"course_name": lec.get('name'), "teacher_name": level, "reason": f"تعارض معرفات ({identifier}) في {day_name} {slot_name}", "penalty": 100, "involved_lectures": clashing_lectures})
-                        else:
-                            used_identifiers_this_slot[identifier] = [lec]
-
     # --- الخطوة 3: التحقق من صحة توزيع المواد المشتركة (صارم دائماً) ---
+    if profiler is not None: mark = time.perf_counter()
     for lec_id, placements in shared_lecture_placements.items():
         original_lec = all_lectures_map.get(lec_id)
         if not original_lec: continue
+        conflicts_list.extend(_shared_lecture_failures(original_lec, placements, keys_only=keys_only))
+    if profiler is not None: mark = profiler.lap('shared_lectures', mark)
 
-        required_levels, placed_levels = set(original_lec.get('levels', [])), {p['level'] for p in placements}
-        if required_levels != placed_levels:
-            conflicts_list.append({"course_name": original_lec['name'], "reason": f"توزيع ناقص/زائد للمادة المشتركة.", "penalty": 100, "involved_lectures": [original_lec]})
-        if len(placements) > 1 and len(set((p['day_idx'], p['slot_idx'], p['room']) for p in placements)) > 1:
-            conflicts_list.append({"course_name": original_lec['name'], "reason": "توزيع غير متناسق للمادة المشتركة.", "penalty": 100, "involved_lectures": [original_lec]})
-
-    penalty_consecutive = SEVERITY_PENALTIES.get(constraint_severities.get('consecutive_halls', 'low'), 1)
+    penalties = model.penalties
     
     # --- الخطوة 4: التحقق من قيد توالي القاعات الكبيرة (ديناميكي) ---
     if consecutive_large_hall_rule != 'none':
-        penalty = 100 if constraint_severities.get('consecutive_halls') == 'hard' else penalty_consecutive
+        penalty = penalties['consecutive_halls']
         for level, day_grid in schedule.items():
             for day_idx, slot_list in enumerate(day_grid):
-                for slot_idx in range(1, len(slot_list)):
-                    common_halls = {lec['room'] for lec in slot_list[slot_idx] if lec.get('room_type') == 'كبيرة'}.intersection({lec['room'] for lec in slot_list[slot_idx - 1] if lec.get('room_type') == 'كبيرة'})
-                    for hall in common_halls:
-                        if consecutive_large_hall_rule == 'all' or consecutive_large_hall_rule == hall:
-                            involved = [l for l in slot_list[slot_idx] if l.get('room') == hall] + [l for l in slot_list[slot_idx - 1] if l.get('room') == hall]
-                            conflicts_list.append({"course_name": f"قيد التوالي للمستوى {level}", "teacher_name": "N/A", "reason": f"حدث توالٍ غير مسموح به في القاعة الكبيرة '{hall}'.", "penalty": penalty, "involved_lectures": involved})
+                conflicts_list.extend(_consecutive_hall_failures(level, slot_list, consecutive_large_hall_rule, penalty, keys_only=keys_only))
+        if profiler is not None: mark = profiler.lap('consecutive_halls', mark)
 
     # --- الخطوة 5: التحقق من قيود الأساتذة العامة (ديناميكي) ---
     # نفترض أن دالة `validate_teacher_constraints_in_solution` تم تعديلها هي الأخرى لتقبل `constraint_severities`
-    validation_failures = validate_teacher_constraints_in_solution(teacher_schedule_map, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, last_slot_restrictions, len(slots), constraint_severities, max_sessions_per_day=max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-    conflicts_list.extend(validation_failures) 
+    validation_failures = validate_teacher_constraints_in_solution(teacher_schedule_map, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, last_slot_restrictions, len(slots), constraint_severities, max_sessions_per_day=max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs, vector_cache=vector_cache, model=model)
+    if keys_only:
+        conflicts_list.extend((_failure_key(f), f.get('penalty', 1)) for f in validation_failures)
+    else:
+        conflicts_list.extend(validation_failures) 
+    if profiler is not None: mark = profiler.lap('teacher_constraints', mark)
 
-    penalty_morning = SEVERITY_PENALTIES.get(constraint_severities.get('prefer_morning', 'low'), 1)
     
     # --- الخطوة 6: تطبيق عقوبات تفضيل الفترات المبكرة (ديناميكي ومع المنطق الكامل) ---
-    if prefer_morning_slots and len(slots) > 1:
-        penalty = 100 if constraint_severities.get('prefer_morning') == 'hard' else penalty_morning
-        room_schedule_map = defaultdict(set)
-        for day_grid in schedule.values():
-            for day_idx, day_slots in enumerate(day_grid):
-                for slot_idx, lectures_in_slot in enumerate(day_slots):
-                    for lec in lectures_in_slot:
-                        if lec.get('room'): room_schedule_map[(day_idx, slot_idx)].add(lec.get('room'))
-
-        # ✨ تم إرجاع هذا المنطق من النسخة الأصلية
-        first_work_day_map = {
-            t: min(d for d, s in slots)
-            for t, slots in teacher_schedule_map.items() if slots
-        }
-        
+    if use_morning_rule:
+        penalty = penalties['prefer_morning']
+        free_rooms = _FreeRoomIndex(model.rooms_by_type, room_schedule_map)
         last_slot_index = len(slots) - 1
-        earlier_slots_indices = range(last_slot_index)
 
         for level, day_grid in schedule.items():
             for day_idx, day_slots in enumerate(day_grid):
@@ -755,53 +2209,14 @@ def calculate_schedule_cost(
                     teacher = lecture.get('teacher_name')
                     if not teacher: continue
 
-                    missed_earlier_opportunity = False
-                    for earlier_slot_idx in earlier_slots_indices:
-                        # إذا كان الأستاذ يعمل بالفعل في هذه الفترة المبكرة، فهي ليست فرصة
-                        if (day_idx, earlier_slot_idx) in teacher_schedule_map.get(teacher, set()):
-                            continue
-
-                        # ✨ تم إرجاع هذا المنطق التفصيلي من النسخة الأصلية
-                        prof_constraints = special_constraints.get(teacher, {})
-                        first_day = first_work_day_map.get(teacher)
-                        is_first_day = (first_day is not None and day_idx == first_day)
-                        
-                        if is_first_day:
-                            if prof_constraints.get('start_d1_s2') and earlier_slot_idx < 1:
-                                continue # تخطى هذه الفترة لأنها تخالف قيد الأستاذ
-                            if prof_constraints.get('start_d1_s3') and earlier_slot_idx < 2:
-                                continue # تخطى هذه الفترة لأنها تخالف قيد الأستاذ
-
-                        # إذا كانت هناك محاضرة في قاعة كبيرة في تلك الفترة، لا يمكن استخدامها
-                        if any(lec.get('room_type') == 'كبيرة' for lec in schedule[level][day_idx][earlier_slot_idx]):
-                            continue
-                        
-                        # تحقق مما إذا كانت هناك قاعة متاحة من نفس النوع المطلوب
-                        room_type_needed = lecture.get('room_type')
-                        all_rooms_of_type = {r['name'] for r in rooms_data if r.get('type') == room_type_needed}
-                        occupied_rooms_in_earlier_slot = room_schedule_map.get((day_idx, earlier_slot_idx), set())
-
-                        if all_rooms_of_type - occupied_rooms_in_earlier_slot:
-                            missed_earlier_opportunity = True
-                            break
-                    
-                    if missed_earlier_opportunity:
-                        conflicts_list.append({
-                            "course_name": "قيد ضغط الحصص",
-                            "teacher_name": teacher,
-                            "reason": f"توجد حصة في آخر فترة ({last_slot_index + 1}) مع وجود فرصة لوضعها في وقت أبكر.",
-                            "penalty": penalty,
-                            "involved_lectures": [lecture]
-                        })
+                    if _missed_earlier_opportunity(lecture, level, day_idx, schedule, teacher_schedule_map.get(teacher, set()), first_work_day_map.get(teacher), special_constraints.get(teacher, {}), free_rooms, last_slot_index):
+                        conflicts_list.append(_prefer_morning_failure(teacher, lecture, penalty, last_slot_index, keys_only=keys_only))
+        if profiler is not None: profiler.lap('prefer_morning', mark)
 
     # --- الخطوة 7: إزالة التكرارات ---
-    unique_failures = {}
-    for failure in conflicts_list:
-        key = (failure.get('reason'), failure.get('teacher_name'), failure.get('course_name'))
-        if key not in unique_failures:
-            unique_failures[key] = failure
-
-    return list(unique_failures.values())
+    if keys_only:
+        return _count_failure_keys(conflicts_list)
+    return _dedup_failures(conflicts_list)
 
 
 
@@ -818,13 +2233,19 @@ def run_tabu_search(
     mutation_hard_intensity, mutation_soft_probability, tabu_stagnation_threshold,
     max_sessions_per_day=None, initial_solution=None, max_iterations=1000, 
     tabu_tenure=10, neighborhood_size=50, consecutive_large_hall_rule="none", 
-    progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[]
+    progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], model=None
 ):
     """
     تنفيذ خوارزمية البحث المحظور (Tabu Search) مع استراتيجية موجهة بالأخطاء.
     تركز هذه النسخة على تحديد المحاضرات المسببة للأخطاء الصارمة ومحاولة إصلاحها أولاً،
     ثم تنتقل إلى الأخطاء المرنة والاستكشاف العشوائي.
     """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     log_q.put("--- بدء البحث المحظور (النسخة الموجهة بالأخطاء) ---")
     
     # --- إعدادات أولية ---
@@ -857,12 +2278,10 @@ def run_tabu_search(
             valid_slots_for_lec = teacher_specific_valid_slots.get(lec.get('teacher_name'), globally_valid_slots)
             if valid_slots_for_lec:
                 day_idx, slot_idx = random.choice(list(valid_slots_for_lec))
-                lec_with_room = lec.copy()
-                if lec['room_type'] == 'كبيرة' and large_rooms:
-                    lec_with_room['room'] = random.choice(large_rooms)
-                elif lec['room_type'] == 'صغيرة' and small_rooms:
-                    lec_with_room['room'] = random.choice(small_rooms)
-                else: lec_with_room['room'] = None
+                if lec['room_type'] == 'كبيرة' and large_rooms: room = random.choice(large_rooms)
+                elif lec['room_type'] == 'صغيرة' and small_rooms: room = random.choice(small_rooms)
+                else: room = None
+                lec_with_room = Placement.of(lec, room, model=model)
                 
                 for level_name in lec.get('levels', []):
                     if level_name in current_solution:
@@ -870,7 +2289,11 @@ def run_tabu_search(
 
 
     # حساب اللياقة الأولية للحل
-    current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    # ✨ مقيّم تزايدي يعيد فحص الخلايا والأساتذة المتأثرين بالحركة فقط بدلاً من الجدول كاملاً
+    # (يعمل على current_solution نفسه: كل نقلة تُطبَّق عبره مباشرة)
+    fitness_evaluator = IncrementalFitnessEvaluator(current_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
+    lectures_by_id = {lec['id']: lec for lec in all_lectures}
+    current_fitness = fitness_evaluator.fitness()
 
     best_fitness = current_fitness
     best_solution = copy.deepcopy(current_solution)
@@ -906,10 +2329,11 @@ def run_tabu_search(
                 consecutive_large_hall_rule, prefer_morning_slots,
                 extra_teachers_on_hard_error=intensity,
                 soft_error_shake_probability=mutation_soft_probability,
-                non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
             
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            fitness_evaluator.reset(current_solution)
+            current_fitness = fitness_evaluator.fitness()
             
             # إعادة تعيين الإشارة والعدادات
             SCHEDULING_STATE['force_mutation'] = False 
@@ -930,11 +2354,12 @@ def run_tabu_search(
                 consecutive_large_hall_rule, prefer_morning_slots,
                 extra_teachers_on_hard_error=mutation_hard_intensity,
                 soft_error_shake_probability=mutation_soft_probability,
-                non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
             
             # إعادة تقييم الحل الجديد وتصفير العدادات
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            fitness_evaluator.reset(current_solution)
+            current_fitness = fitness_evaluator.fitness()
             stagnation_counter = 0
             tabu_list.clear() # مسح قائمة الحظر بعد الهزة الكبيرة
         # ✨ --- نهاية الجزء الجديد --- ✨
@@ -952,7 +2377,7 @@ def run_tabu_search(
         # ✨ --- بداية المنطق الجديد والمحسن --- ✨
 
         # الخطوة 1: تشخيص الأخطاء وتحديد المحاضرات المسببة للمشاكل
-        _, failures_list = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+        failures_list = fitness_evaluator.failures()
         
         # إنشاء قوائم بالمحاضرات التي تسبب أخطاء صارمة (أو عدم تنسيب) أو مرنة
         hard_error_lecs_ids = {lec['id'] for f in failures_list if f.get('penalty', 0) >= 100 for lec in f.get('involved_lectures', [])}
@@ -962,7 +2387,6 @@ def run_tabu_search(
         soft_error_lecs = [lec for lec in all_lectures if lec['id'] in soft_error_lecs_ids]
 
 
-        best_neighbor = None
         best_neighbor_fitness = (-float('inf'), -float('inf'), -float('inf'))
         move_to_make = None
         
@@ -994,28 +2418,16 @@ def run_tabu_search(
 
                 potential_move = (lec_to_move['id'], new_day_idx, new_slot_idx, new_room)
 
-                neighbor_solution = copy.deepcopy(current_solution)
-                lec_id_to_move = lec_to_move.get('id')
-                for level_grid in neighbor_solution.values():
-                    for day_slots in level_grid:
-                        for slot_lectures in day_slots:
-                            slot_lectures[:] = [lec for lec in slot_lectures if lec.get('id') != lec_id_to_move]
-
-                lec_with_new_room = lec_to_move.copy()
-                lec_with_new_room['room'] = new_room
-                for level_name in lec_to_move.get('levels', []):
-                    if level_name in neighbor_solution:
-                        neighbor_solution[level_name][new_day_idx][new_slot_idx].append(lec_with_new_room)
-                # --- نهاية كود توليد الجار ---
+                # --- نهاية كود توليد الجار (تُقيَّم النقلة على الحالة نفسها ثم يُتراجع عنها) ---
 
-                neighbor_fitness, _ = calculate_fitness(neighbor_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                neighbor_fitness = fitness_evaluator.evaluate_move(lec_to_move, new_day_idx, new_slot_idx, new_room)
 
                 if potential_move not in tabu_list or neighbor_fitness > best_fitness:
                     best_neighbor_unplaced, best_neighbor_hard, _ = -best_neighbor_fitness[0], -best_neighbor_fitness[1], -best_neighbor_fitness[2]
                     neighbor_unplaced, neighbor_hard, _ = -neighbor_fitness[0], -neighbor_fitness[1], -neighbor_fitness[2]
                     is_better_neighbor = (neighbor_unplaced < best_neighbor_unplaced) or (neighbor_unplaced == best_neighbor_unplaced and neighbor_hard < best_neighbor_hard) or (neighbor_unplaced == best_neighbor_unplaced and neighbor_hard == best_neighbor_hard and neighbor_fitness > best_neighbor_fitness)
                     if is_better_neighbor:
-                        best_neighbor_fitness, best_neighbor, move_to_make = neighbor_fitness, neighbor_solution, potential_move
+                        best_neighbor_fitness, move_to_make = neighbor_fitness, potential_move
 
             for _ in range(num_soft_attempts):
                 lec_to_move = random.choice(soft_error_lecs or all_lectures)
@@ -1031,25 +2443,14 @@ def run_tabu_search(
                 if lec_to_move['room_type'] == 'كبيرة' and large_rooms: new_room = random.choice(large_rooms)
                 elif lec_to_move['room_type'] == 'صغيرة' and small_rooms: new_room = random.choice(small_rooms)
                 potential_move = (lec_to_move['id'], new_day_idx, new_slot_idx, new_room)
-                neighbor_solution = copy.deepcopy(current_solution)
-                lec_id_to_move = lec_to_move.get('id')
-                for level_grid in neighbor_solution.values():
-                    for day_slots in level_grid:
-                        for slot_lectures in day_slots:
-                            slot_lectures[:] = [lec for lec in slot_lectures if lec.get('id') != lec_id_to_move]
-                lec_with_new_room = lec_to_move.copy()
-                lec_with_new_room['room'] = new_room
-                for level_name in lec_to_move.get('levels', []):
-                    if level_name in neighbor_solution:
-                        neighbor_solution[level_name][new_day_idx][new_slot_idx].append(lec_with_new_room)
-                # --- نهاية كود توليد الجار ---
-                neighbor_fitness, _ = calculate_fitness(neighbor_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                # --- نهاية كود توليد الجار (تُقيَّم النقلة على الحالة نفسها ثم يُتراجع عنها) ---
+                neighbor_fitness = fitness_evaluator.evaluate_move(lec_to_move, new_day_idx, new_slot_idx, new_room)
                 if potential_move not in tabu_list or neighbor_fitness > best_fitness:
                     best_neighbor_unplaced, best_neighbor_hard, _ = -best_neighbor_fitness[0], -best_neighbor_fitness[1], -best_neighbor_fitness[2]
                     neighbor_unplaced, neighbor_hard, _ = -neighbor_fitness[0], -neighbor_fitness[1], -neighbor_fitness[2]
                     is_better_neighbor = (neighbor_unplaced < best_neighbor_unplaced) or (neighbor_unplaced == best_neighbor_unplaced and neighbor_hard < best_neighbor_hard) or (neighbor_unplaced == best_neighbor_unplaced and neighbor_hard == best_neighbor_hard and neighbor_fitness > best_neighbor_fitness)
                     if is_better_neighbor:
-                        best_neighbor_fitness, best_neighbor, move_to_make = neighbor_fitness, neighbor_solution, potential_move
+                        best_neighbor_fitness, move_to_make = neighbor_fitness, potential_move
         else:
             # --- الحالة الثانية: لا توجد أخطاء صارمة، نستخدم كل الجهد (100%) للأخطاء المرنة ---
             for _ in range(neighborhood_size): # نستخدم حجم الجوار الكامل
@@ -1066,38 +2467,28 @@ def run_tabu_search(
                 if lec_to_move['room_type'] == 'كبيرة' and large_rooms: new_room = random.choice(large_rooms)
                 elif lec_to_move['room_type'] == 'صغيرة' and small_rooms: new_room = random.choice(small_rooms)
                 potential_move = (lec_to_move['id'], new_day_idx, new_slot_idx, new_room)
-                neighbor_solution = copy.deepcopy(current_solution)
-                lec_id_to_move = lec_to_move.get('id')
-                for level_grid in neighbor_solution.values():
-                    for day_slots in level_grid:
-                        for slot_lectures in day_slots:
-                            slot_lectures[:] = [lec for lec in slot_lectures if lec.get('id') != lec_id_to_move]
-                lec_with_new_room = lec_to_move.copy()
-                lec_with_new_room['room'] = new_room
-                for level_name in lec_to_move.get('levels', []):
-                    if level_name in neighbor_solution:
-                        neighbor_solution[level_name][new_day_idx][new_slot_idx].append(lec_with_new_room)
-                # --- نهاية كود توليد الجار ---
-                neighbor_fitness, _ = calculate_fitness(neighbor_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                # --- نهاية كود توليد الجار (تُقيَّم النقلة على الحالة نفسها ثم يُتراجع عنها) ---
+                neighbor_fitness = fitness_evaluator.evaluate_move(lec_to_move, new_day_idx, new_slot_idx, new_room)
                 if potential_move not in tabu_list or neighbor_fitness > best_fitness:
                     best_neighbor_unplaced, best_neighbor_hard, _ = -best_neighbor_fitness[0], -best_neighbor_fitness[1], -best_neighbor_fitness[2]
                     neighbor_unplaced, neighbor_hard, _ = -neighbor_fitness[0], -neighbor_fitness[1], -neighbor_fitness[2]
                     is_better_neighbor = (neighbor_unplaced < best_neighbor_unplaced) or (neighbor_unplaced == best_neighbor_unplaced and neighbor_hard < best_neighbor_hard) or (neighbor_unplaced == best_neighbor_unplaced and neighbor_hard == best_neighbor_hard and neighbor_fitness > best_neighbor_fitness)
                     if is_better_neighbor:
-                        best_neighbor_fitness, best_neighbor, move_to_make = neighbor_fitness, neighbor_solution, potential_move
+                        best_neighbor_fitness, move_to_make = neighbor_fitness, potential_move
         # ==================================================================================
         
         # ✨ --- نهاية المنطق الجديد والمحسن --- ✨
 
         # --- تحديث الحالة ---
-        if best_neighbor is None:
+        if move_to_make is None:
             # لم يتم العثور على جار أفضل (حتى لو كان أسوأ من الحالي)، استمر في البحث
             continue
 
-        current_solution = best_neighbor
+        # ✨ تثبيت الجار المختار فقط: المقيّم يعدّل current_solution نفسه
+        tabu_list.append(move_to_make)
+        moved_lec_id, moved_day_idx, moved_slot_idx, moved_room = move_to_make
+        fitness_evaluator.apply((lectures_by_id[moved_lec_id], moved_day_idx, moved_slot_idx, moved_room))
         current_fitness = best_neighbor_fitness
-        if move_to_make:
-            tabu_list.append(move_to_make)
         
         # إذا كان الحل الحالي هو الأفضل على الإطلاق، قم بتحديثه
         if current_fitness > best_fitness:
@@ -1109,7 +2500,7 @@ def run_tabu_search(
             log_q.put(f"   - دورة {i+1}: تم العثور على حل أفضل. لياقة (نقص, صارم, مرن)=({unplaced}, {hard}, {soft})")
             
             # تحديث شريط التقدم بناءً على أفضل حل تم العثور عليه
-            _, errors_for_best = calculate_fitness(best_solution, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            errors_for_best = fitness_evaluator.failures() # الحل الحالي هو أفضل حل في هذه اللحظة
             progress_percentage = calculate_progress_percentage(errors_for_best)
             log_q.put(f"PROGRESS:{progress_percentage:.1f}")
 
@@ -1130,7 +2521,7 @@ def run_tabu_search(
         identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
         lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
         day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
-        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
     )
     
     # تحويل اللياقة النهائية (tuple) إلى تكلفة رقمية واحدة للحفاظ على التوافق
@@ -1149,40 +2540,251 @@ def run_tabu_search(
 
 
 
+# ================== ذاكرة اللياقة: بصمة Zobrist مع إزاحة LRU ==================
+class ZobristHasher:
+    """
+    بصمة Zobrist للجدول: مفتاح عشوائي 64-بت لكل وضعية (مستوى، يوم، فترة، ترتيبها في الخلية، معرّف المحاضرة، الأستاذ، القاعة)،
+    والبصمة الكلية هي XOR لمفاتيح كل الوضعيات في الجدول.
+    - الأستاذ جزء من الوضعية لأن إسناد الأساتذة قد يتغير دون أن تتحرك المحاضرة.
+    - الترتيب داخل الخلية جزء منها لأن تفاصيل الأخطاء (المادة الممثلة والمحاضرات المتورطة) تتبع ترتيب الخلية.
+    لذلك يكفي بعد تعديل خلية تطبيق XOR لمساهمتها القديمة ثم الجديدة.
+    المفاتيح تُولَّد عند أول ظهور للوضعية، والمولّد مستقل عن random العام حتى لا يتغير تسلسل الخوارزميات بوجود الذاكرة.
+    """
+    def __init__(self, seed=0x5EED):
+        self._rng = random.Random(seed)
+        self._keys = {}
+
+    def placement_key(self, level, day_idx, slot_idx, position, lecture):
+        feature = (level, day_idx, slot_idx, position, lecture.get('id'), lecture.get('teacher_name'), lecture.get('room'))
+        key = self._keys.get(feature)
+        if key is None: key = self._keys.setdefault(feature, self._rng.getrandbits(64))
+        return key
+
+    def cell_contribution(self, level, day_idx, slot_idx, lectures):
+        """مساهمة خلية واحدة: XOR مفاتيح وضعياتها."""
+        contribution = 0
+        for position, lec in enumerate(lectures): contribution ^= self.placement_key(level, day_idx, slot_idx, position, lec)
+        return contribution
+
+    def schedule_hash(self, schedule, scheduled_ids=None):
+        """بصمة الجدول كاملاً، مع جمع معرّفات المحاضرات الموضوعة في نفس المرور إن طُلب ذلك."""
+        keys, rng = self._keys, self._rng
+        schedule_hash = 0
+        for level, grid in schedule.items():
+            for day_idx, day in enumerate(grid):
+                for slot_idx, lectures in enumerate(day):
+                    for position, lec in enumerate(lectures):
+                        lec_id = lec.get('id')
+                        feature = (level, day_idx, slot_idx, position, lec_id, lec.get('teacher_name'), lec.get('room'))
+                        key = keys.get(feature)
+                        if key is None: key = keys.setdefault(feature, rng.getrandbits(64))
+                        schedule_hash ^= key
+                        if scheduled_ids is not None: scheduled_ids.add(lec_id)
+        return schedule_hash
+
+
+class FitnessCache:
+    """
+    ذاكرة LRU محدودة الحجم أمام calculate_fitness والمقيّم التزايدي: (سياق التقييم، بصمة الجدول) -> النتيجة.
+    - السياق مشتق من محتوى الإعدادات لا من هويات كائناتها: بصمة ConstraintModel المُجمَّع وبصمة بقية خيارات التقييم
+      (الأيام، الفترات، المستويات، أزواج الأساتذة، القيود الرقمية...).
+    - إسناد الأساتذة (lectures_by_teacher_map) ليس جزءاً من السياق: من يغيره أثناء التشغيل يستدعي clear_fitness_cache.
+    - عدّادات الإصابة والإخفاق والإزاحة تُكتب في سجل التشغيل لضبط الحجم (fitness_cache_size) لكل حالة.
+    """
+    def __init__(self, max_size=4096):
+        self.max_size = max(1, int(max_size))
+        self.hasher = ZobristHasher()
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def context_key(model, options):
+        """سياق التقييم: بصمة النموذج المُجمَّع وبصمة محتوى الخيارات غير المُجمَّعة فيه."""
+        return model.fingerprint, _settings_fingerprint(options)
+
+    def get(self, key, accept=None):
+        """accept: شرط اختياري على المدخل (مدخل لا يحققه يُعامل كإخفاق)."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or (accept is not None and not accept(entry)):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """إفراغ المداخل (مثلاً بعد تغيير إسناد الأساتذة داخل نفس كائنات الإعدادات)."""
+        with self._lock:
+            self.entries.clear()
+
+    def stats_message(self):
+        lookups = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return (f"   - ذاكرة اللياقة: {self.hits} إصابة، {self.misses} إخفاق ({hit_rate:.1f}% إصابات)، "
+                f"{self.evictions} إزاحة، الحجم {len(self.entries)}/{self.max_size}")
+
+
+class TeacherValidationCache:
+    """
+    ذاكرة LRU لقيود الأساتذة الفردية: (الأستاذ، مجموعة فتراته) -> متجه أخطائه حسب القسم (_teacher_violation_vector).
+    النقلة الواحدة لا تغيّر إلا أستاذاً أو اثنين، فلا يُعاد فحص إلا من تغيرت فتراته؛ قيود الأزواج وعدم التشارك
+    تُعاد من أيام العمل المحفوظة في متجهات الشريكين.
+    الذاكرة مربوطة بكائنات الإعدادات (بالهوية) وتُفرَّغ تلقائياً عند تغيرها.
+    """
+    def __init__(self, max_size=8192):
+        self.max_size = max(1, int(max_size))
+        self.entries = OrderedDict()
+        self.settings = None
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _same_setting(a, b):
+        return a is b or (isinstance(a, (bool, int, float, str)) and type(a) is type(b) and a == b)
+
+    def bind(self, settings):
+        if self.settings is not None and len(self.settings) == len(settings) and all(map(self._same_setting, self.settings, settings)):
+            return
+        with self._lock:
+            self.entries.clear()
+            self.settings = settings
+
+    def vector(self, teacher_name, assigned_slots, compute):
+        key = (teacher_name, frozenset(assigned_slots))
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = compute()
+        with self._lock:
+            self.entries[key] = entry
+            if len(self.entries) > self.max_size: self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats_message(self):
+        lookups = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return f"   - ذاكرة قيود الأساتذة: {self.hits} إصابة، {self.misses} إخفاق ({hit_rate:.1f}% إصابات)، الحجم {len(self.entries)}/{self.max_size}"
+
+
+def _cost_cache_options(days, slots, levels, distribution_rule_type, teacher_pairs, last_slot_restrictions,
+                        max_sessions_per_day, consecutive_large_hall_rule, prefer_morning_slots, non_sharing_teacher_pairs):
+    """خيارات تكلفة الجدول غير المُجمَّعة في ConstraintModel (سياق مشترك بين calculate_fitness والتقييم الدفعي)."""
+    return ('cost', days, slots, levels, distribution_rule_type, teacher_pairs, last_slot_restrictions,
+            max_sessions_per_day, consecutive_large_hall_rule, prefer_morning_slots, non_sharing_teacher_pairs)
+
+def activate_teacher_validation_cache(cache):
+    ACTIVE_TEACHER_CACHE['cache'] = cache
+
+def activate_fitness_cache(cache):
+    """تفعيل (أو إلغاء تفعيل بـ None) ذاكرة اللياقة للتشغيل الحالي."""
+    ACTIVE_FITNESS_CACHE['cache'] = cache
+
+def clear_fitness_cache():
+    cache = ACTIVE_FITNESS_CACHE['cache']
+    if cache is not None: cache.clear()
+    # متجهات قيود الأساتذة تحمل قوائم المحاضرات المتورطة من نفس الإسناد
+    teacher_cache = ACTIVE_TEACHER_CACHE['cache']
+    if teacher_cache is not None: teacher_cache.clear()
+
+
 # =====================================================================
 # START: DYNAMIC MULTI-OBJECTIVE FITNESS CALCULATION
 # =====================================================================
+@_profiled('calculate_fitness')
 def calculate_fitness(schedule, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
                     # ✨✨ --- المعامل الجديد والمهم --- ✨✨
                     use_strict_hierarchy=False, 
-                    max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[]):
+                    max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[],
+                    mode="full", model=None):
     """
     تحسب "جودة" الحل بإحدى طريقتين بناءً على المعامل use_strict_hierarchy:
     - False (الافتراضي): الطريقة الهرمية العادية.
     - True (الصارمة): يجب حل الأخطاء الصارمة أولاً بشكل كامل.
+    mode="count": مسار سريع يحسب العدادات فقط ويعيد (اللياقة، None) لمن يتجاهل قائمة الأخطاء.
+    model: ConstraintModel المُجمَّع للتشغيل (يُجمَّع من الإعدادات الممررة إن لم يُمرَّر).
     """
-    # 1. حساب قائمة الأخطاء الكاملة (هذا الجزء مشترك بين الطريقتين)
-    errors_list = calculate_schedule_cost(
-        schedule, days, slots, teachers, rooms_data, levels, identifiers_by_level, 
-        special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, 
-        globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, 
-        last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
-        max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, 
-        prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-    )
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    # ✨ ذاكرة اللياقة: أخطاء القيود تعتمد على الجدول والإعدادات فقط، فتُحفظ ببصمة Zobrist للجدول.
+    # أما المواد الناقصة فتُحسب دائماً من جديد (إسناد الأساتذة قد يتغير دون تغير الجدول).
+    cache = ACTIVE_FITNESS_CACHE['cache']
+    cached = cache_key = None
+    if cache is not None:
+        scheduled_ids = set()
+        cache_key = (cache.context_key(model, _cost_cache_options(
+            days, slots, levels, distribution_rule_type, teacher_pairs, last_slot_restrictions,
+            max_sessions_per_day, consecutive_large_hall_rule, prefer_morning_slots, non_sharing_teacher_pairs
+        )), cache.hasher.schedule_hash(schedule, scheduled_ids))
+        # مدخل مسار العد لا يحوي قائمة الأخطاء، فلا يكفي لطلب تفصيلي
+        cached = cache.get(cache_key, accept=None if mode == "count" else (lambda entry: entry[0] is not None))
+
+    if cached is not None:
+        cached_errors, hard_errors_count, soft_errors_count = cached
+        errors_list = list(cached_errors) if mode != "count" else None
+    elif mode == "count":
+        errors_list = None
+        hard_errors_count, soft_errors_count = calculate_schedule_cost(
+            schedule, days, slots, teachers, rooms_data, levels, identifiers_by_level, 
+            special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, 
+            globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, 
+            last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
+            max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, 
+            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count",
+            vector_cache=ACTIVE_TEACHER_CACHE['cache'], model=model
+        )
+        if cache is not None:
+            cache.put(cache_key, (None, hard_errors_count, soft_errors_count))
+    else:
+        # 1. حساب قائمة الأخطاء الكاملة (هذا الجزء مشترك بين الطريقتين)
+        errors_list = calculate_schedule_cost(
+            schedule, days, slots, teachers, rooms_data, levels, identifiers_by_level, 
+            special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, 
+            globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, 
+            last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
+            max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, 
+            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs,
+            vector_cache=ACTIVE_TEACHER_CACHE['cache'], model=model
+        )
+
+        hard_errors_count = 0
+        soft_errors_count = 0
+        for error in errors_list:
+            if error.get('penalty', 1) >= 100:
+                hard_errors_count += 1
+            else:
+                soft_errors_count += 1
+        if cache is not None:
+            cache.put(cache_key, (tuple(errors_list), hard_errors_count, soft_errors_count))
     
     # 2. حساب المواد الناقصة والأخطاء (هذا الجزء مشترك أيضاً)
-    scheduled_ids = {lec.get('id') for grid in schedule.values() for day in grid for slot in day for lec in slot}
-    unplaced_lectures = [lec for lec in all_lectures if lec.get('id') not in scheduled_ids and lec.get('teacher_name')]
-    unplaced_count = len(unplaced_lectures)
-    
-    hard_errors_count = 0
-    soft_errors_count = 0
-    for error in errors_list:
-        if error.get('penalty', 1) >= 100:
-            hard_errors_count += 1
-        else:
-            soft_errors_count += 1
+    if cache is None:
+        scheduled_ids = {lec.get('id') for grid in schedule.values() for day in grid for slot in day for lec in slot}
+    if mode == "count":
+        unplaced_lectures = ()
+        unplaced_count = sum(1 for lec in all_lectures if lec.get('id') not in scheduled_ids and lec.get('teacher_name'))
+    else:
+        unplaced_lectures = [lec for lec in all_lectures if lec.get('id') not in scheduled_ids and lec.get('teacher_name')]
+        unplaced_count = len(unplaced_lectures)
 
     # (اختياري) إضافة تفاصيل النقص إلى قائمة الأخطاء للعرض
     for lec in unplaced_lectures:
@@ -1207,16 +2809,1127 @@ def calculate_fitness(schedule, all_lectures, days, slots, teachers, rooms_data,
 # END: DYNAMIC FITNESS CALCULATION
 # =====================================================================
 
+# =====================================================================
+# START: INCREMENTAL (DELTA) FITNESS EVALUATOR
+# =====================================================================
+class IncrementalFitnessEvaluator:
+    """
+    مقيّم لياقة تزايدي يعطي نفس نتيجة calculate_fitness لكن دون إعادة فحص الجدول كاملاً.
+    - تُقسم الأخطاء إلى وحدات محلية: فترة، خلية (مستوى/يوم/فترة)، مادة مشتركة، يوم مستوى،
+      أستاذ، زوج أساتذة، وتفضيل الفترات المبكرة لكل أستاذ.
+    - عند تحريك محاضرة يعاد حساب الوحدات المتأثرة فقط، ثم تُطبق إزالة التكرار نفسها بعدّاد للمفاتيح.
+    - يعمل على الجدول المُمرر مباشرة (in-place)، لذا يجب تمرير نسخة إن لزم.
+    """
+    def __init__(self, schedule, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities,
+                 use_strict_hierarchy=False, max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[],
+                 model=None):
+        self.model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                          level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                          constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                          globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+        self.all_lectures = all_lectures
+        self.days, self.slots, self.levels = days, slots, levels
+        self.rooms_data = rooms_data
+        self.identifiers_by_level = identifiers_by_level
+        self.special_constraints = special_constraints
+        self.teacher_constraints = teacher_constraints
+        self.distribution_rule_type = distribution_rule_type
+        self.lectures_by_teacher_map = lectures_by_teacher_map
+        self.globally_unavailable_slots = globally_unavailable_slots
+        self.saturday_teachers = saturday_teachers
+        self.teacher_pairs = teacher_pairs
+        self.non_sharing_teacher_pairs = non_sharing_teacher_pairs
+        self.day_to_idx = day_to_idx
+        self.rules_grid = rules_grid
+        self.last_slot_restrictions = last_slot_restrictions
+        self.level_specific_large_rooms = level_specific_large_rooms
+        self.specific_small_room_assignments = specific_small_room_assignments
+        self.constraint_severities = constraint_severities
+        self.use_strict_hierarchy = use_strict_hierarchy
+        self.max_sessions_per_day = max_sessions_per_day
+        self.consecutive_large_hall_rule = consecutive_large_hall_rule
+        self.use_morning_rule = prefer_morning_slots and len(slots) > 1
+        self.last_slot_index = len(slots) - 1
+
+        penalties = self.model.penalties
+        self.penalty_consecutive = penalties['consecutive_halls']
+        self.penalty_morning = penalties['prefer_morning']
+
+        self.all_lectures_map = {lec['id']: lec for lec in lectures_by_teacher_map.get('__all_lectures__', [])}
+        self.shared_ids = {lec_id for lec_id, lec in self.all_lectures_map.items() if len(lec.get('levels', [])) > 1}
+        self.required_counts = Counter(lec.get('id') for lec in all_lectures if lec.get('teacher_name'))
+        self.teacher_names = [t['name'] for t in teachers]
+        self.room_names = [r['name'] for r in rooms_data]
+        self.rooms_by_type = self.model.rooms_by_type
+
+        # ربط كل أستاذ بوحدات الأزواج التي ينتمي إليها
+        self.pair_units_by_teacher = defaultdict(list)
+        for i, (t1, t2) in enumerate(teacher_pairs):
+            for t in (t1, t2): self.pair_units_by_teacher[t].append(('pair', i))
+        for i, (t1, t2) in enumerate(non_sharing_teacher_pairs):
+            for t in (t1, t2): self.pair_units_by_teacher[t].append(('non_sharing', i))
+
+        # ✨ بصمة Zobrist تُحدَّث مع كل تعديل على الخلايا، فتُستعمل ذاكرة اللياقة لتقييم الحركات المتكررة
+        self.fitness_cache = ACTIVE_FITNESS_CACHE['cache']
+        if self.fitness_cache is not None:
+            # النتيجة تشمل المواد الناقصة، فالمحاضرات المطلوبة جزء من السياق
+            self.cache_context = self.fitness_cache.context_key(self.model, _cost_cache_options(
+                days, slots, levels, distribution_rule_type, teacher_pairs, last_slot_restrictions,
+                max_sessions_per_day, consecutive_large_hall_rule, prefer_morning_slots, non_sharing_teacher_pairs
+            ) + ('delta', use_strict_hierarchy, self.required_counts))
+
+        self.reset(schedule)
+
+    # ----------------------------------------------------------------- الحالة
+    @_profiled('evaluator.reset')
+    def reset(self, schedule):
+        """يعيد بناء كل الفهارس والوحدات من جدول كامل."""
+        self.schedule = schedule
+        self.id_counts = Counter()
+        self.positions = defaultdict(Counter)
+        self.teacher_slots = defaultdict(Counter)
+        self.teacher_days = defaultdict(Counter)
+        self.room_slots = defaultdict(Counter)
+        # ✨ مصفوفات الإشغال (أستاذ/قاعة/مستوى × يوم × فترة) تُحدَّث مع كل تعديل على الخلايا
+        self.state = ScheduleState(schedule, self.days, self.slots, teacher_names=self.teacher_names, room_names=self.room_names)
+        self.unplaced_count = sum(self.required_counts.values())
+        self.units = {}
+        self.key_counts = Counter()
+        self.key_penalty = {}
+        self.hard_count = self.soft_count = 0
+        self.penalty_total = self.morning_total = 0
+        self.schedule_hash = 0
+
+        for level, grid in schedule.items():
+            for d, day in enumerate(grid):
+                for s in range(len(day)):
+                    self._add_cell_contrib((level, d, s), update_state=False)
+
+        # الفترات الخالية من التعارض حسب المصفوفات لا تحتاج إلى فحص تفصيلي
+        profiler = _active_profiler()
+        for d, s in sorted(self.state.clash_slots()):
+            self._set_unit(('slot', d, s), self._compute_unit(('slot', d, s)) if profiler is None else self._compute_unit_timed(('slot', d, s), profiler))
+        large_hall_conflicts = self.state.large_hall_conflicts()
+        for level, grid in schedule.items():
+            li = self.state.level_index[level]
+            for d, day in enumerate(grid):
+                for s in range(len(day)):
+                    self._set_unit(('cell', level, d, s), self._cell_unit_failures(level, d, s, bool(large_hall_conflicts[li, d, s])))
+
+        all_units = [('shared', lec_id) for lec_id in self.positions if lec_id in self.shared_ids]
+        if self.consecutive_large_hall_rule != 'none':
+            all_units += [('consec', level, d) for level, grid in schedule.items() for d in range(len(grid))]
+        all_units += [('teacher', t) for t in self.teacher_slots]
+        all_units += [('pair', i) for i in range(len(self.teacher_pairs))]
+        all_units += [('non_sharing', i) for i in range(len(self.non_sharing_teacher_pairs))]
+        if self.use_morning_rule:
+            all_units += [('morning', t) for t in self.teacher_slots if t]
+        for unit in all_units:
+            self._set_unit(unit, self._compute_unit(unit) if profiler is None else self._compute_unit_timed(unit, profiler))
+
+    def _add_cell_contrib(self, cell, update_state=True):
+        level, d, s = cell
+        if self.fitness_cache is not None:
+            self.schedule_hash ^= self.fitness_cache.hasher.cell_contribution(level, d, s, self.schedule[level][d][s])
+        for lec in self.schedule[level][d][s]:
+            if update_state: self.state.add_lecture(level, d, s, lec)
+            lec_id = lec.get('id')
+            if self.id_counts[lec_id] == 0 and lec_id in self.required_counts:
+                self.unplaced_count -= self.required_counts[lec_id]
+            self.id_counts[lec_id] += 1
+            self.positions[lec_id][cell] += 1
+            self.teacher_slots[lec.get('teacher_name')][(d, s)] += 1
+            self.teacher_days[lec.get('teacher_name')][d] += 1
+            if lec.get('room'): self.room_slots[(d, s)][lec.get('room')] += 1
+
+    def _remove_cell_contrib(self, cell):
+        level, d, s = cell
+        if self.fitness_cache is not None:
+            self.schedule_hash ^= self.fitness_cache.hasher.cell_contribution(level, d, s, self.schedule[level][d][s])
+        for lec in self.schedule[level][d][s]:
+            self.state.remove_lecture(level, d, s, lec)
+            lec_id = lec.get('id')
+            self.id_counts[lec_id] -= 1
+            if self.id_counts[lec_id] == 0:
+                del self.id_counts[lec_id]
+                if lec_id in self.required_counts: self.unplaced_count += self.required_counts[lec_id]
+            _counter_discard(self.positions[lec_id], cell)
+            if not self.positions[lec_id]: del self.positions[lec_id]
+            teacher = lec.get('teacher_name')
+            _counter_discard(self.teacher_slots[teacher], (d, s))
+            if not self.teacher_slots[teacher]: del self.teacher_slots[teacher]
+            _counter_discard(self.teacher_days[teacher], d)
+            if not self.teacher_days[teacher]: del self.teacher_days[teacher]
+            if lec.get('room'): _counter_discard(self.room_slots[(d, s)], lec.get('room'))
+
+    # ----------------------------------------------------------------- الوحدات
+    def _set_unit(self, unit, failures):
+        for failure in self.units.get(unit, ()):
+            key = _failure_key(failure)
+            self.key_counts[key] -= 1
+            if self.key_counts[key] == 0:
+                del self.key_counts[key]
+                penalty = self.key_penalty.pop(key)
+                if penalty >= 100: self.hard_count -= 1
+                else: self.soft_count -= 1
+                self.penalty_total -= penalty
+                if unit[0] == 'morning': self.morning_total -= penalty
+        for failure in failures:
+            key = _failure_key(failure)
+            if self.key_counts[key] == 0:
+                penalty = failure.get('penalty', 1)
+                self.key_penalty[key] = penalty
+                if penalty >= 100: self.hard_count += 1
+                else: self.soft_count += 1
+                self.penalty_total += penalty
+                if unit[0] == 'morning': self.morning_total += penalty
+            self.key_counts[key] += 1
+        if failures: self.units[unit] = failures
+        else: self.units.pop(unit, None)
+
+    _UNIT_FAMILIES = {'slot': 'teacher_room_clashes', 'shared': 'shared_lectures', 'consec': 'consecutive_halls',
+                      'teacher': 'teacher_constraints', 'pair': 'teacher_constraints', 'non_sharing': 'teacher_constraints',
+                      'morning': 'prefer_morning'}
+
+    def _compute_unit_timed(self, unit, profiler):
+        """_compute_unit مع تسجيل الزمن لعائلة القيد (وحدات الخلايا تسجل زمنها داخل _cell_failures)."""
+        family = self._UNIT_FAMILIES.get(unit[0])
+        if family is None: return self._compute_unit(unit)
+        start = time.perf_counter()
+        failures = self._compute_unit(unit)
+        profiler.add(family, time.perf_counter() - start)
+        return failures
+
+    def _compute_unit(self, unit):
+        kind = unit[0]
+        if kind == 'slot':
+            _, d, s = unit
+            if not self.state.has_clash(d, s): return []
+            lectures_in_this_slot = []
+            for level in self.levels:
+                if self.schedule.get(level) and d < len(self.schedule[level]) and s < len(self.schedule[level][d]):
+                    lectures_in_this_slot.extend(self.schedule[level][d][s])
+            if not lectures_in_this_slot: return []
+            return _slot_clash_failures(lectures_in_this_slot, self.days[d], self.slots[s])
+        if kind == 'cell':
+            _, level, d, s = unit
+            return self._cell_unit_failures(level, d, s, self.state.large_hall_conflict(level, d, s))
+        if kind == 'shared':
+            lec_id = unit[1]
+            placements = []
+            for (level, d, s) in self.positions.get(lec_id, ()):
+                for lec in self.schedule[level][d][s]:
+                    if lec.get('id') == lec_id:
+                        placements.append({'level': level, 'day_idx': d, 'slot_idx': s, 'room': lec.get('room')})
+            if not placements: return []
+            return _shared_lecture_failures(self.all_lectures_map[lec_id], placements)
+        if kind == 'consec':
+            _, level, d = unit
+            return _consecutive_hall_failures(level, self.schedule[level][d], self.consecutive_large_hall_rule, self.penalty_consecutive)
+        if kind == 'teacher':
+            return self._teacher_failures(unit[1])
+        if kind in ('pair', 'non_sharing'):
+            pair = (self.teacher_pairs if kind == 'pair' else self.non_sharing_teacher_pairs)[unit[1]]
+            sub_schedule = {t: set(self.teacher_slots[t]) for t in pair if t in self.teacher_slots}
+            return validate_teacher_constraints_in_solution(
+                sub_schedule, {}, {}, self.lectures_by_teacher_map, self.distribution_rule_type, [],
+                [pair] if kind == 'pair' else [], self.day_to_idx, {}, len(self.slots), self.constraint_severities,
+                max_sessions_per_day=None, non_sharing_teacher_pairs=[pair] if kind == 'non_sharing' else [], model=self.model
+            )
+        if kind == 'morning':
+            return self._morning_failures(unit[1])
+        return []
+
+    def _cell_unit_failures(self, level, d, s, large_hall_conflict):
+        lectures = self.schedule[level][d][s]
+        if not lectures: return []
+        return _cell_failures(level, d, s, lectures, self.days, self.slots, self.model, large_hall_conflict)
+
+    def _teacher_failures(self, teacher):
+        """قيود الأستاذ الفردية (كل شيء عدا الأزواج) عبر نفس دالة التحقق العامة."""
+        if teacher not in self.teacher_slots: return []
+        pick = lambda source: {teacher: source[teacher]} if teacher in source else {}
+        return validate_teacher_constraints_in_solution(
+            {teacher: set(self.teacher_slots[teacher])}, pick(self.special_constraints), pick(self.teacher_constraints),
+            self.lectures_by_teacher_map, self.distribution_rule_type, self.saturday_teachers, [], self.day_to_idx,
+            pick(self.last_slot_restrictions), len(self.slots), self.constraint_severities,
+            max_sessions_per_day=self.max_sessions_per_day, non_sharing_teacher_pairs=[], model=self.model
+        )
+
+    def _morning_failures(self, teacher):
+        """قيد تفضيل الفترات المبكرة لأستاذ واحد (خطأ واحد على الأكثر بعد إزالة التكرار)."""
+        teacher_slots = self.teacher_slots.get(teacher)
+        if not teacher_slots: return []
+        first_day = min(self.teacher_days[teacher])
+        prof_constraints = self.special_constraints.get(teacher, {})
+        free_rooms = _FreeRoomIndex(self.rooms_by_type, _CounterSetView(self.room_slots))
+        for level, day_grid in self.schedule.items():
+            for day_idx, day_slots in enumerate(day_grid):
+                for lecture in day_slots[self.last_slot_index]:
+                    if lecture.get('teacher_name') != teacher: continue
+                    if _missed_earlier_opportunity(lecture, level, day_idx, self.schedule, teacher_slots, first_day, prof_constraints, free_rooms, self.last_slot_index):
+                        return [_prefer_morning_failure(teacher, lecture, self.penalty_morning, self.last_slot_index)]
+        return []
+
+    def _affected_units(self, cells, touched_teachers, touched_ids):
+        units = set()
+        touched_days = set()
+        for (level, d, s) in cells:
+            units.add(('slot', d, s))
+            units.add(('cell', level, d, s))
+            if self.consecutive_large_hall_rule != 'none': units.add(('consec', level, d))
+            touched_days.add(d)
+        for lec_id in touched_ids:
+            if lec_id in self.shared_ids: units.add(('shared', lec_id))
+        for teacher in touched_teachers:
+            units.add(('teacher', teacher))
+            units.update(self.pair_units_by_teacher.get(teacher, ()))
+        if self.use_morning_rule:
+            morning_teachers = {t for t in touched_teachers if t}
+            for day_grid in self.schedule.values():
+                for d in touched_days:
+                    morning_teachers.update(lec.get('teacher_name') for lec in day_grid[d][self.last_slot_index] if lec.get('teacher_name'))
+            units.update(('morning', t) for t in morning_teachers)
+        return units
+
+    # ----------------------------------------------------------------- التعديل والتراجع
+    def _replace_cells(self, new_contents):
+        """يستبدل محتوى خلايا محددة ويعيد رمز تراجع (المحتوى القديم + الوحدات القديمة)."""
+        old_contents = {}
+        touched_teachers, touched_ids = set(), set()
+        for cell, new_list in new_contents.items():
+            level, d, s = cell
+            current = self.schedule[level][d][s]
+            old_contents[cell] = list(current)
+            for lec in current: touched_teachers.add(lec.get('teacher_name')); touched_ids.add(lec.get('id'))
+            for lec in new_list: touched_teachers.add(lec.get('teacher_name')); touched_ids.add(lec.get('id'))
+            self._remove_cell_contrib(cell)
+            current[:] = new_list
+            self._add_cell_contrib(cell)
+        saved_units = {}
+        profiler = _active_profiler()
+        for unit in self._affected_units(new_contents.keys(), touched_teachers, touched_ids):
+            saved_units[unit] = self.units.get(unit, [])
+            self._set_unit(unit, self._compute_unit(unit) if profiler is None else self._compute_unit_timed(unit, profiler))
+        return old_contents, saved_units
+
+    def undo(self, token):
+        """يعيد الحالة كما كانت قبل apply (أو أي تعديل أعاد رمز التراجع)."""
+        old_contents, saved_units = token
+        for cell, old_list in old_contents.items():
+            level, d, s = cell
+            self._remove_cell_contrib(cell)
+            self.schedule[level][d][s][:] = old_list
+            self._add_cell_contrib(cell)
+        for unit, failures in saved_units.items():
+            self._set_unit(unit, failures)
+
+    def _move_contents(self, lecture, day_idx, slot_idx, room):
+        """نفس بناء الجار في البحث المحظور: إزالة المحاضرة من كل مكان ثم وضع نسخة بالقاعة الجديدة."""
+        lec_id = lecture.get('id')
+        new_contents = {}
+        for (level, d, s) in list(self.positions.get(lec_id, ())):
+            new_contents[(level, d, s)] = [l for l in self.schedule[level][d][s] if l.get('id') != lec_id]
+        moved_lecture = Placement.of(lecture, room, model=self.model)
+        for level_name in lecture.get('levels', []):
+            if level_name in self.schedule:
+                cell = (level_name, day_idx, slot_idx)
+                new_contents[cell] = list(new_contents.get(cell, self.schedule[level_name][day_idx][slot_idx])) + [moved_lecture]
+        return new_contents
+
+    def _schedule_diff(self, other_schedule):
+        new_contents = {}
+        for level, grid in other_schedule.items():
+            for d, day in enumerate(grid):
+                for s, lectures in enumerate(day):
+                    if lectures != self.schedule[level][d][s]:
+                        new_contents[(level, d, s)] = list(lectures)
+        return new_contents
+
+    # ----------------------------------------------------------------- الواجهة العامة
+    def fitness(self):
+        unplaced_count, hard_errors_count, soft_errors_count = self.unplaced_count, self.hard_count, self.soft_count
+        if self.use_strict_hierarchy:
+            if unplaced_count > 0 or hard_errors_count > 0:
+                return (-unplaced_count, -hard_errors_count, 0)
+            return (0, 0, -soft_errors_count)
+        return (-unplaced_count, -hard_errors_count, -soft_errors_count)
+
+    def penalty_totals(self):
+        """(تكلفة القيود، تكلفة الضغط) كما تحسبها دالة التحسين والضغط."""
+        return self.penalty_total - self.morning_total, self.morning_total
+
+    def failures(self):
+        """قائمة الأخطاء الحالية (بعد إزالة التكرار) مع المواد الناقصة، لأغراض التشخيص."""
+        errors_list = _dedup_failures([f for unit_failures in self.units.values() for f in unit_failures])
+        for lec in self.all_lectures:
+            if lec.get('teacher_name') and lec.get('id') not in self.id_counts:
+                errors_list.append({"course_name": lec.get('name'), "teacher_name": lec.get('teacher_name'), "reason": "المادة لم يتم جدولتها (نقص).", "penalty": 1000})
+        return errors_list
+
+    def _cache_key_after(self, new_contents):
+        """مفتاح ذاكرة اللياقة للجدول بعد استبدال الخلايا المعطاة (تحديث تزايدي للبصمة دون تطبيق)."""
+        if self.fitness_cache is None: return None
+        contribution = self.fitness_cache.hasher.cell_contribution
+        schedule_hash = self.schedule_hash
+        for (level, d, s), new_list in new_contents.items():
+            schedule_hash ^= contribution(level, d, s, self.schedule[level][d][s]) ^ contribution(level, d, s, new_list)
+        return self.cache_context, schedule_hash
+
+    def _evaluate_contents(self, new_contents):
+        cache_key = self._cache_key_after(new_contents)
+        if cache_key is not None:
+            cached = self.fitness_cache.get(cache_key)
+            if cached is not None: return cached
+        token = self._replace_cells(new_contents)
+        result = self.fitness()
+        self.undo(token)
+        if cache_key is not None: self.fitness_cache.put(cache_key, result)
+        return result
+
+    @_profiled('evaluator.evaluate_move')
+    def evaluate_move(self, lecture, day_idx, slot_idx, room):
+        """لياقة الجدول بعد نقل المحاضرة، دون تغيير الحالة."""
+        return self._evaluate_contents(self._move_contents(lecture, day_idx, slot_idx, room))
+
+    def evaluate_move_penalties(self, lecture, day_idx, slot_idx, room):
+        token = self._replace_cells(self._move_contents(lecture, day_idx, slot_idx, room))
+        result = self.penalty_totals()
+        self.undo(token)
+        return result
+
+    @_profiled('evaluator.apply')
+    def apply(self, move):
+        """
+        يطبّق النقلة (المحاضرة، اليوم، الفترة، القاعة) على الجدول نفسه ويعيد رمز تراجع لـ undo.
+        الإزالة تمر بفهرس المواضع (معرّف المحاضرة -> خلاياها) فلا تلمس إلا خلايا مستويات المحاضرة.
+        """
+        lecture, day_idx, slot_idx, room = move
+        return self._replace_cells(self._move_contents(lecture, day_idx, slot_idx, room))
+
+    @_profiled('evaluator.apply_move')
+    def apply_move(self, lecture, day_idx, slot_idx, room):
+        self.apply((lecture, day_idx, slot_idx, room))
+        return self.fitness()
+
+    @_profiled('evaluator.evaluate_schedule')
+    def evaluate_schedule(self, other_schedule):
+        """لياقة جدول آخر يختلف عن الحالي في بعض الخلايا فقط (مثل نتيجة الهدم وإعادة البناء)."""
+        return self._evaluate_contents(self._schedule_diff(other_schedule))
+
+    def evaluate_schedule_penalties(self, other_schedule):
+        token = self._replace_cells(self._schedule_diff(other_schedule))
+        result = self.penalty_totals()
+        self.undo(token)
+        return result
+
+    @_profiled('evaluator.sync')
+    def sync(self, other_schedule):
+        """يجعل الحالة مطابقة لجدول آخر بتطبيق الفروقات فقط."""
+        self._replace_cells(self._schedule_diff(other_schedule))
+        return self.fitness()
+
+
+def _counter_discard(counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0: del counter[key]
+
+
+class _CounterSetView:
+    """واجهة قراءة تجعل قاموس العدّادات يبدو كقاموس مجموعات (لإعادة استخدام دوال الفحص كما هي)."""
+    def __init__(self, counters):
+        self.counters = counters
+
+    def get(self, key, default=None):
+        counter = self.counters.get(key)
+        return counter.keys() if counter else (default if default is not None else set())
+
+# =====================================================================
+# END: INCREMENTAL (DELTA) FITNESS EVALUATOR
+# =====================================================================
+
+# =====================================================================
+# START: ASSIGNMENT-VECTOR CHROMOSOME
+# =====================================================================
+class Chromosome:
+    """
+    فرد مرمَّز للخوارزميات السكانية: لكل محاضرة (بترتيب المرمِّز) خانة زمنية واحدة (يوم × عدد الفترات + فترة، أو -1 إن لم توضع)
+    ومعرّف قاعة (-1 = بدون قاعة). النسخ والتهجين عمليات على مصفوفتين صغيرتين بدل نسخ شبكات المستويات.
+    """
+    __slots__ = ('positions', 'rooms')
+
+    def __init__(self, positions, rooms):
+        self.positions, self.rooms = positions, rooms
+
+    def copy(self):
+        return Chromosome(self.positions.copy(), self.rooms.copy())
+
+    def key(self):
+        return hash((self.positions.tobytes(), self.rooms.tobytes()))
+
+
+class AssignmentCodec:
+    """
+    تحويل بين جدول المستويات {level: [[[...]]]} والكروموسوم Chromosome لقائمة محاضرات ثابتة.
+    - encode: كل محاضرة تأخذ أول موضع تظهر فيه في الجدول (المادة المشتركة لها نفس الموضع في كل مستوياتها).
+    - decode: يعيد بناء الجدول بوضعيات Placement المشتركة؛ يُستدعى لأفضل حل فقط أو للمستويات المشتبه بها عند التقييم.
+    """
+    _serials = itertools.count()
+
+    def __init__(self, lectures, days, slots, rooms_data, levels, model=None):
+        self.model = model
+        # رقم تسلسلي لا يتكرر: مفاتيح الكروموسومات لا تُقارن إلا بين حلول المرمِّز نفسه
+        self.serial = next(AssignmentCodec._serials)
+        self.lectures = list(lectures)
+        self.num_days, self.num_slots = len(days), len(slots)
+        self.levels = list(levels)
+        self.lecture_index = {}
+        for i, lec in enumerate(self.lectures): self.lecture_index.setdefault(lec.get('id'), i)
+        self.room_names = [r['name'] for r in rooms_data]
+        self.room_index = {name: i for i, name in enumerate(self.room_names)}
+        level_set = set(self.levels)
+        self.level_lectures = {level: [] for level in self.levels}
+        for i, lec in enumerate(self.lectures):
+            for level in dict.fromkeys(lec.get('levels', [])):
+                if level in level_set: self.level_lectures[level].append(i)
+        # نسخ المحاضرات في الجدول المفكوك: (المحاضرة، ترتيب المستوى) بترتيب المستويات ثم المحاضرات
+        level_position = {level: j for j, level in enumerate(self.levels)}
+        copies = [(i, level_position[level]) for level in self.levels for i in self.level_lectures[level]]
+        self.copy_lecture = np.array([i for i, _ in copies], dtype=np.int64)
+        self.copy_level = np.array([j for _, j in copies], dtype=np.int64)
+        self.required = np.array([bool(lec.get('teacher_name')) for lec in self.lectures], dtype=bool)
+        self._placements = {}
+
+    def __len__(self):
+        return len(self.lectures)
+
+    def _room_id(self, room):
+        if not room: return -1
+        room_id = self.room_index.get(room)
+        if room_id is None:
+            # قاعة غير معرفة (من حل مبدئي قديم مثلاً): تُضاف حتى لا تضيع عند فك الترميز
+            room_id = self.room_index[room] = len(self.room_names)
+            self.room_names.append(room)
+        return room_id
+
+    def encode(self, schedule):
+        positions = np.full(len(self.lectures), -1, dtype=np.int32)
+        rooms = np.full(len(self.lectures), -1, dtype=np.int32)
+        for grid in schedule.values():
+            for d, day in enumerate(grid):
+                for s, cell in enumerate(day):
+                    for lec in cell:
+                        i = self.lecture_index.get(lec.get('id'))
+                        if i is not None and positions[i] < 0:
+                            positions[i] = d * self.num_slots + s
+                            rooms[i] = self._room_id(lec.get('room'))
+        return Chromosome(positions, rooms)
+
+    def placement(self, i, room_id):
+        placement = self._placements.get((i, room_id))
+        if placement is None:
+            placement = self._placements[(i, room_id)] = Placement.of(self.lectures[i], self.room_names[room_id] if room_id >= 0 else None, model=self.model)
+        return placement
+
+    def decode_level(self, chromosome, level):
+        grid = [[[] for _ in range(self.num_slots)] for _ in range(self.num_days)]
+        positions, rooms = chromosome.positions, chromosome.rooms
+        for i in self.level_lectures.get(level, ()):
+            position = int(positions[i])
+            if position >= 0:
+                d, s = divmod(position, self.num_slots)
+                grid[d][s].append(self.placement(i, int(rooms[i])))
+        return grid
+
+    def decode(self, chromosome):
+        return {level: self.decode_level(chromosome, level) for level in self.levels}
+
+    def view(self, chromosome):
+        return _DecodedSchedule(self, chromosome)
+
+    def crossover(self, parent1, parent2):
+        """طفلان بتبادل المقطع الأوسط (نقطتا قطع) من محور المحاضرات."""
+        if len(self.lectures) < 2:
+            return parent1.copy(), parent2.copy()
+        point1, point2 = sorted(random.sample(range(len(self.lectures)), 2))
+        child1, child2 = parent1.copy(), parent2.copy()
+        child1.positions[point1:point2], child2.positions[point1:point2] = parent2.positions[point1:point2], parent1.positions[point1:point2]
+        child1.rooms[point1:point2], child2.rooms[point1:point2] = parent2.rooms[point1:point2], parent1.rooms[point1:point2]
+        return child1, child2
+
+    def unplaced_count(self, chromosome):
+        return int(np.count_nonzero(self.required & (chromosome.positions < 0)))
+
+
+class _DecodedSchedule:
+    """واجهة قراءة لجدول كروموسوم: يُفك ترميز المستوى عند أول طلب له فقط."""
+    __slots__ = ('codec', 'chromosome', 'grids')
+
+    def __init__(self, codec, chromosome):
+        self.codec, self.chromosome, self.grids = codec, chromosome, {}
+
+    def get(self, level, default=None):
+        if level not in self.codec.level_lectures: return default
+        grid = self.grids.get(level)
+        if grid is None: grid = self.grids[level] = self.codec.decode_level(self.chromosome, level)
+        return grid
+
+    def __getitem__(self, level):
+        grid = self.get(level)
+        if grid is None: raise KeyError(level)
+        return grid
+
+# =====================================================================
+# END: ASSIGNMENT-VECTOR CHROMOSOME
+# =====================================================================
+
+# =====================================================================
+# START: BATCHED POPULATION FITNESS
+# =====================================================================
+class PopulationFitnessEvaluator:
+    """
+    تقييم جيل كامل (الجينية، الميميتيك، CLONALG) دفعة واحدة، بنفس نتيجة calculate_fitness(mode="count") لكل حل.
+    - يُسطَّح الجيل إلى مصفوفة (حل × نسخة محاضرة موضوعة) بأعمدة: المستوى، اليوم، الفترة، المحاضرة، الأستاذ، القاعة...
+    - عمليات عدّ وتجميع NumPy على الجيل كله تحدد الفترات والخلايا والمواد المشتركة وأيام المستويات التي قد تحوي خطأ،
+      ثم تُستخرج مفاتيح الأخطاء بدوال الفحص نفسها (keys_only) لتلك المواضع فقط؛ ما عداها خالٍ من الأخطاء حتماً.
+    - قيود الأساتذة مقسمة لكل أستاذ ولكل زوج كما في المقيّم التزايدي، ونتيجتها محفوظة حسب فترات عمل الأستاذ،
+      فلا يعاد فحص أستاذ تكررت فترات عمله بين الحلول أو الأجيال.
+    - تفضيل الفترات المبكرة يُحسب كاملاً على مصفوفات الإشغال.
+    """
+    MAX_MEMO = 65536
+    # ✨ التصفية بـ NumPy لا توفر شيئاً إذا اشتُبه في معظم المواضع، فتستخرج الأخطاء منها كلها فوق كلفة المصفوفات.
+    # فوق هذه النسبة (فترات وخلايا مشتبه بها لكل محاضرة موضوعة) يُقيَّم كل حل على حدة، وكذلك الدفعات الأصغر من الحد الأدنى.
+    # القيمتان مأخوذتان من benchmark_population_evaluation (python app.py --benchmark population).
+    SCALAR_FALLBACK_DENSITY = 0.2
+    SCALAR_FALLBACK_MIN_BATCH = 2
+
+    def __init__(self, all_lectures, days, slots, teachers, rooms_data, levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities,
+                 use_strict_hierarchy=False, max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[],
+                 model=None):
+        self.model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                          level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                          constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                          globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+        self.all_lectures = all_lectures
+        self.days, self.slots, self.levels = days, slots, levels
+        self.teachers = teachers
+        self.rooms_data = rooms_data
+        self.identifiers_by_level = identifiers_by_level
+        self.special_constraints = special_constraints
+        self.teacher_constraints = teacher_constraints
+        self.distribution_rule_type = distribution_rule_type
+        self.lectures_by_teacher_map = lectures_by_teacher_map
+        self.globally_unavailable_slots = globally_unavailable_slots
+        self.saturday_teachers = saturday_teachers
+        self.teacher_pairs = teacher_pairs
+        self.non_sharing_teacher_pairs = non_sharing_teacher_pairs
+        self.day_to_idx = day_to_idx
+        self.rules_grid = rules_grid
+        self.last_slot_restrictions = last_slot_restrictions
+        self.level_specific_large_rooms = level_specific_large_rooms
+        self.specific_small_room_assignments = specific_small_room_assignments
+        self.constraint_severities = constraint_severities
+        self.use_strict_hierarchy = use_strict_hierarchy
+        self.max_sessions_per_day = max_sessions_per_day
+        self.consecutive_large_hall_rule = consecutive_large_hall_rule
+        self.prefer_morning_slots = prefer_morning_slots
+        self.use_morning_rule = prefer_morning_slots and len(slots) > 1
+        self.last_slot_index = len(slots) - 1
+
+        penalties = self.model.penalties
+        self.penalty_consecutive = penalties['consecutive_halls']
+        self.penalty_morning = penalties['prefer_morning']
+
+        # نفس سياق ذاكرة اللياقة في calculate_fitness حتى تتشارك المداخل
+        self.cache_options = _cost_cache_options(
+            days, slots, levels, distribution_rule_type, teacher_pairs, last_slot_restrictions,
+            max_sessions_per_day, consecutive_large_hall_rule, prefer_morning_slots, non_sharing_teacher_pairs
+        )
+
+        self.all_lectures_map = {lec['id']: lec for lec in lectures_by_teacher_map.get('__all_lectures__', [])}
+        self.required_counts = Counter(lec.get('id') for lec in all_lectures if lec.get('teacher_name'))
+
+        # ترميز القيم إلى أعداد صحيحة (يتوسع تلقائياً عند ظهور قيمة جديدة)
+        self.codes = {kind: {} for kind in ('level', 'lecture', 'teacher', 'room', 'type', 'name', 'identifier')}
+        self.values = {kind: [] for kind in self.codes}
+        self.room_names = sorted({r['name'] for r in rooms_data}, key=str)
+        for lec_id in self.required_counts: self._code('lecture', lec_id)
+        for r in rooms_data: self._code('room', r['name']); self._code('type', r.get('type'))
+        self.lecture_codes = {}
+        self._chromosome_codes = None
+        self._tables_signature = None
+        self.teacher_memo = {}
+
+    def _code(self, kind, value):
+        codes = self.codes[kind]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.values[kind].append(value)
+        return code
+
+    # ----------------------------------------------------------------- الجداول الثابتة
+    def _build_tables(self):
+        """جداول البحث المشتقة من الإعدادات لكل قيمة مرمَّزة؛ تُبنى من جديد فقط إذا ظهرت قيم جديدة."""
+        num_days, num_slots = len(self.days), len(self.slots)
+        level_names, name_values = self.values['level'], self.values['name']
+        large_code = self.codes['type'].get('كبيرة', -1)
+        small_code = self.codes['type'].get('صغيرة', -1)
+
+        large_room = np.full(len(level_names), -1, dtype=np.int64)
+        for lv, level in enumerate(level_names):
+            if room := self.level_specific_large_rooms.get(level): large_room[lv] = self._code('room', room)
+        small_room = np.full((len(name_values), len(level_names)), -1, dtype=np.int64)
+        identifier = np.full((len(name_values), len(level_names)), -1, dtype=np.int64)
+        for nm, name in enumerate(name_values):
+            for lv, level in enumerate(level_names):
+                if room := self.model.small_room(name, level): small_room[nm, lv] = self._code('room', room)
+                if name is not None and (found := self.model.identifier_of(name, level)):
+                    identifier[nm, lv] = self._code('identifier', found)
+
+        type_values = self.values['type']
+        disallowed = np.zeros((len(level_names), num_days, num_slots, len(type_values)), dtype=bool)
+        for lv, level in enumerate(level_names):
+            for d in range(num_days):
+                for s in range(num_slots):
+                    _, allowed_room_types, _ = self.model.slot_rules(level, d, s)
+                    if allowed_room_types is not None:
+                        disallowed[lv, d, s] = [t not in allowed_room_types for t in type_values]
+
+        rest = np.zeros((num_days, num_slots), dtype=bool)
+        for d in range(num_days):
+            for s in range(num_slots):
+                rest[d, s] = (d, s) in self.globally_unavailable_slots
+
+        lecture_ids, num_levels = self.values['lecture'], len(level_names)
+        required_weight = np.array([self.required_counts.get(lec_id, 0) for lec_id in lecture_ids], dtype=np.int64)
+        is_shared = np.zeros(len(lecture_ids), dtype=bool)
+        required_levels = np.zeros((len(lecture_ids), num_levels), dtype=bool)
+        required_level_count = np.zeros(len(lecture_ids), dtype=np.int64)
+        for lc, lec_id in enumerate(lecture_ids):
+            original_lec = self.all_lectures_map.get(lec_id)
+            if original_lec and len(original_lec.get('levels', [])) > 1:
+                is_shared[lc] = True
+                wanted = set(original_lec.get('levels', []))
+                required_level_count[lc] = len(wanted)
+                required_levels[lc] = [level in wanted for level in level_names]
+
+        teacher_values, room_values = self.values['teacher'], self.values['room']
+        teacher_truthy = np.array([bool(t) for t in teacher_values], dtype=bool)
+        room_truthy = np.array([bool(r) for r in room_values], dtype=bool)
+        start_s2 = np.array([bool(self.special_constraints.get(t, {}).get('start_d1_s2')) if t else False for t in teacher_values], dtype=bool)
+        start_s3 = np.array([bool(self.special_constraints.get(t, {}).get('start_d1_s3')) if t else False for t in teacher_values], dtype=bool)
+
+        # القاعات المعرفة (بالاسم) وأنواعها، لفحص وجود قاعة شاغرة من النوع المطلوب
+        room_slot = {name: i for i, name in enumerate(self.room_names)}
+        defined_room = np.array([room_slot.get(r, -1) if r else -1 for r in room_values], dtype=np.int64)
+        room_types = np.zeros((len(self.room_names), len(type_values)), dtype=np.int32)
+        for r in self.rooms_data:
+            room_types[room_slot[r['name']], self.codes['type'][r.get('type')]] = 1
+
+        self.tables = {
+            'large_code': large_code, 'small_code': small_code, 'large_room': large_room, 'small_room': small_room,
+            'identifier': identifier, 'disallowed': disallowed, 'rest': rest, 'in_levels': np.array([lvl in self.levels for lvl in level_names], dtype=bool),
+            'required_weight': required_weight, 'is_shared': is_shared, 'required_levels': required_levels,
+            'required_level_count': required_level_count, 'teacher_truthy': teacher_truthy, 'room_truthy': room_truthy,
+            'start_s2': start_s2, 'start_s3': start_s3, 'defined_room': defined_room, 'room_types': room_types,
+            'room_type_count': room_types.sum(axis=0),
+        }
+        self._tables_signature = tuple(len(self.values[kind]) for kind in self.codes)
+
+    # ----------------------------------------------------------------- الترميز
+    def _encode(self, population):
+        """مصفوفة (نسخة موضوعة × 9): الحل، المستوى، اليوم، الفترة، المحاضرة، الأستاذ، القاعة، نوع القاعة، الاسم."""
+        code, rows, lecture_codes = self._code, [], self.lecture_codes
+        for p, schedule in enumerate(population):
+            for level, grid in schedule.items():
+                lv = code('level', level)
+                for d, day in enumerate(grid):
+                    for s, lectures in enumerate(day):
+                        for lec in lectures:
+                            content = (lec.get('id'), lec.get('teacher_name'), lec.get('room'), lec.get('room_type'), lec.get('name'))
+                            codes = lecture_codes.get(content)
+                            if codes is None:
+                                codes = lecture_codes[content] = (code('lecture', content[0]), code('teacher', content[1]), code('room', content[2]), code('type', content[3]), code('name', content[4]))
+                            rows.append((p, lv, d, s) + codes)
+        self._refresh_tables()
+        return np.array(rows, dtype=np.int64).reshape(-1, 9)
+
+    def _codec_codes(self, codec):
+        """رموز حقول كل محاضرة ومستوى وقاعة في المرمِّز (خانة القاعة الأخيرة لمعرّف -1، أي بدون قاعة)."""
+        cached = self._chromosome_codes
+        if cached is None or cached[0] is not codec or cached[1] != len(codec.room_names):
+            code, lectures = self._code, codec.lectures
+            codes = {
+                'lecture': np.array([code('lecture', lec.get('id')) for lec in lectures], dtype=np.int64),
+                'teacher': np.array([code('teacher', lec.get('teacher_name')) for lec in lectures], dtype=np.int64),
+                'type': np.array([code('type', lec.get('room_type')) for lec in lectures], dtype=np.int64),
+                'name': np.array([code('name', lec.get('name')) for lec in lectures], dtype=np.int64),
+                'level': np.array([code('level', level) for level in codec.levels], dtype=np.int64),
+                'room': np.array([code('room', name) for name in codec.room_names] + [code('room', None)], dtype=np.int64),
+            }
+            cached = self._chromosome_codes = (codec, len(codec.room_names), codes)
+        return cached[2]
+
+    def _encode_chromosomes(self, chromosomes, codec):
+        """نفس مصفوفة _encode لكروموسومات، مبنية مباشرة من المصفوفات وبترتيب الجدول المفكوك (المستوى، اليوم، الفترة، المحاضرة)."""
+        codes = self._codec_codes(codec)
+        positions = np.stack([c.positions for c in chromosomes]).astype(np.int64).reshape(len(chromosomes), len(codec))
+        rooms = np.stack([c.rooms for c in chromosomes]).astype(np.int64).reshape(len(chromosomes), len(codec))
+        copy_positions = positions[:, codec.copy_lecture]
+        p, e = np.nonzero(copy_positions >= 0)
+        lec, level, position = codec.copy_lecture[e], codec.copy_level[e], copy_positions[p, e]
+        order = np.lexsort((lec, position, level, p))
+        p, lec, level, position = p[order], lec[order], level[order], position[order]
+        d, s = np.divmod(position, len(self.slots))
+        self._refresh_tables()
+        return np.stack((p, codes['level'][level], d, s, codes['lecture'][lec], codes['teacher'][lec], codes['room'][rooms[p, lec]], codes['type'][lec], codes['name'][lec]), axis=1).astype(np.int64).reshape(-1, 9)
+
+    def _refresh_tables(self):
+        if self._tables_signature != tuple(len(self.values[kind]) for kind in self.codes):
+            self._build_tables()
+            # بناء الجداول قد يرمِّز قاعات أو معرّفات جديدة
+            if self._tables_signature != tuple(len(self.values[kind]) for kind in self.codes): self._build_tables()
+
+    @staticmethod
+    def _repeated(keys):
+        """القيم التي تتكرر في المصفوفة."""
+        values, counts = np.unique(keys, return_counts=True)
+        return values[counts > 1]
+
+    # ----------------------------------------------------------------- العائلات
+    def _slot_clash_flags(self, columns):
+        """مفاتيح (حل، يوم، فترة) التي قد تحوي تعارض أستاذ أو قاعة."""
+        p, lv, d, s, lec, teacher, room = columns[:7]
+        t = self.tables
+        num_days, num_slots = len(self.days), len(self.slots)
+        num_lectures = len(self.values['lecture'])
+        slot_key = (p * num_days + d) * num_slots + s
+        flagged = set()
+        for item, valid, base in ((teacher, t['teacher_truthy'], len(self.values['teacher'])), (room, t['room_truthy'], len(self.values['room']))):
+            mask = t['in_levels'][lv] & valid[item]
+            # عدد المحاضرات المختلفة لكل (فترة، أستاذ/قاعة): أكثر من واحدة يعني تعارضاً محتملاً
+            distinct = np.unique((slot_key[mask] * base + item[mask]) * num_lectures + lec[mask])
+            flagged.update((self._repeated(distinct // num_lectures) // base).tolist())
+        return flagged
+
+    def _slot_clash_keys(self, population, flagged, entries):
+        num_days, num_slots = len(self.days), len(self.slots)
+        for key in sorted(flagged):
+            pi, rem = divmod(key, num_days * num_slots)
+            di, si = divmod(rem, num_slots)
+            schedule = population[pi]
+            lectures_in_this_slot = []
+            for level in self.levels:
+                if schedule.get(level) and di < len(schedule[level]) and si < len(schedule[level][di]):
+                    lectures_in_this_slot.extend(schedule[level][di][si])
+            if lectures_in_this_slot:
+                entries[pi].extend(_slot_clash_failures(lectures_in_this_slot, self.days[di], self.slots[si], keys_only=True))
+
+    def _cell_flags(self, population_size, columns, cell_key):
+        """مفاتيح الخلايا (حل، مستوى، يوم، فترة) التي قد تخالف قواعدها، مع عدد القاعات الكبيرة في كل خلية."""
+        p, lv, d, s, lec, teacher, room, room_type, name = columns
+        t = self.tables
+        num_levels, num_days, num_slots = len(self.values['level']), len(self.days), len(self.slots)
+        is_large, is_small = room_type == t['large_code'], room_type == t['small_code']
+
+        suspect = t['rest'][d, s] | t['disallowed'][lv, d, s, room_type]
+        suspect |= is_large & (t['large_room'][lv] >= 0) & (room != t['large_room'][lv])
+        small_room = t['small_room'][name, lv]
+        suspect |= is_small & (small_room >= 0) & (room != small_room)
+        flagged = set(cell_key[suspect].tolist())
+
+        num_cells = population_size * num_levels * num_days * num_slots
+        total = np.bincount(cell_key, minlength=num_cells)
+        large = np.bincount(cell_key[is_large], minlength=num_cells)
+        flagged.update(np.flatnonzero((large > 1) | ((large == 1) & (total > 1))).tolist())
+
+        identifier = t['identifier'][name, lv]
+        has_identifier = identifier >= 0
+        num_identifiers = max(1, len(self.values['identifier']))
+        flagged.update((self._repeated(cell_key[has_identifier] * num_identifiers + identifier[has_identifier]) // num_identifiers).tolist())
+        return flagged, large
+
+    def _cell_keys(self, population, flagged, entries):
+        num_levels, num_days, num_slots = len(self.values['level']), len(self.days), len(self.slots)
+        level_names = self.values['level']
+        for key in sorted(flagged):
+            pi, rem = divmod(key, num_levels * num_days * num_slots)
+            li, rem = divmod(rem, num_days * num_slots)
+            di, si = divmod(rem, num_slots)
+            level = level_names[li]
+            entries[pi].extend(_cell_failures(level, di, si, population[pi][level][di][si], self.days, self.slots, self.model, keys_only=True))
+
+    def _shared_keys(self, columns, entries):
+        p, lv, d, s, lec, teacher, room = columns[:7]
+        t = self.tables
+        mask = t['is_shared'][lec]
+        if not mask.any(): return
+        num_lectures, num_levels = len(self.values['lecture']), len(self.values['level'])
+        num_positions = len(self.days) * len(self.slots) * len(self.values['room'])
+        p, lv, d, s, lec, room = p[mask], lv[mask], d[mask], s[mask], lec[mask], room[mask]
+        group = p * num_lectures + lec
+
+        flagged = set(group[~t['required_levels'][lec, lv]].tolist())
+        groups, level_counts = np.unique(np.unique(group * num_levels + lv) // num_levels, return_counts=True)
+        flagged.update(groups[level_counts != t['required_level_count'][groups % num_lectures]].tolist())
+        position = (d * len(self.slots) + s) * len(self.values['room']) + room
+        flagged.update((self._repeated(np.unique(group * num_positions + position) // num_positions)).tolist())
+        if not flagged: return
+
+        order = np.argsort(group, kind='stable')
+        sorted_groups = group[order]
+        level_names, room_values, lecture_ids = self.values['level'], self.values['room'], self.values['lecture']
+        for key in sorted(flagged):
+            start, end = np.searchsorted(sorted_groups, [key, key + 1])
+            placements = [{'level': level_names[lv[i]], 'day_idx': int(d[i]), 'slot_idx': int(s[i]), 'room': room_values[room[i]]} for i in order[start:end].tolist()]
+            pi, lc = divmod(key, num_lectures)
+            entries[pi].extend(_shared_lecture_failures(self.all_lectures_map[lecture_ids[lc]], placements, keys_only=True))
+
+    def _consecutive_keys(self, population, columns, cell_key, entries):
+        s, room, room_type = columns[3], columns[6], columns[7]
+        num_rooms, num_slots = len(self.values['room']), len(self.slots)
+        is_large = room_type == self.tables['large_code']
+        hall_key = cell_key[is_large] * num_rooms + room[is_large]
+        later = is_large & (s >= 1)
+        # نفس القاعة الكبيرة في فترتين متتاليتين لنفس المستوى واليوم
+        repeated = np.isin((cell_key[later] - 1) * num_rooms + room[later], hall_key)
+        flagged = np.unique(cell_key[later][repeated] // num_slots).tolist()
+        num_levels, num_days = len(self.values['level']), len(self.days)
+        level_names = self.values['level']
+        for key in flagged:
+            pi, rem = divmod(key, num_levels * num_days)
+            li, di = divmod(rem, num_days)
+            level = level_names[li]
+            entries[pi].extend(_consecutive_hall_failures(level, population[pi][level][di], self.consecutive_large_hall_rule, self.penalty_consecutive, keys_only=True))
+
+    @staticmethod
+    def _failure_keys(failures):
+        return tuple((_failure_key(f), f.get('penalty', 1)) for f in failures)
+
+    def _memo(self, key, compute):
+        result = self.teacher_memo.get(key)
+        if result is None:
+            if len(self.teacher_memo) >= self.MAX_MEMO: self.teacher_memo.clear()
+            result = self.teacher_memo[key] = compute()
+        return result
+
+    def _slot_set(self, positions):
+        num_slots = len(self.slots)
+        return {divmod(int(x), num_slots) for x in np.frombuffer(positions, dtype=np.int64)}
+
+    def _teacher_keys(self, teacher, positions):
+        """قيود الأستاذ الفردية (كل شيء عدا الأزواج) كما في IncrementalFitnessEvaluator._teacher_failures."""
+        pick = lambda source: {teacher: source[teacher]} if teacher in source else {}
+        return self._failure_keys(validate_teacher_constraints_in_solution(
+            {teacher: self._slot_set(positions)}, pick(self.special_constraints), pick(self.teacher_constraints),
+            self.lectures_by_teacher_map, self.distribution_rule_type, self.saturday_teachers, [], self.day_to_idx,
+            pick(self.last_slot_restrictions), len(self.slots), self.constraint_severities,
+            max_sessions_per_day=self.max_sessions_per_day, non_sharing_teacher_pairs=[], model=self.model
+        ))
+
+    def _pair_keys(self, kind, pair, positions):
+        sub_schedule = {t: self._slot_set(pos) for t, pos in zip(pair, positions) if pos is not None}
+        return self._failure_keys(validate_teacher_constraints_in_solution(
+            sub_schedule, {}, {}, self.lectures_by_teacher_map, self.distribution_rule_type, [],
+            [pair] if kind == 'pair' else [], self.day_to_idx, {}, len(self.slots), self.constraint_severities,
+            max_sessions_per_day=None, non_sharing_teacher_pairs=[pair] if kind == 'non_sharing' else [], model=self.model
+        ))
+
+    def _teacher_constraint_keys(self, population_size, columns, entries):
+        p, d, s, teacher = columns[0], columns[2], columns[3], columns[5]
+        num_teachers, num_positions = len(self.values['teacher']), len(self.days) * len(self.slots)
+        # فترات كل أستاذ في كل حل: مفاتيح مرتبة ومقسمة حسب (حل، أستاذ)
+        keys = np.unique((p * num_teachers + teacher) * num_positions + d * len(self.slots) + s)
+        owners = keys // num_positions
+        positions = keys % num_positions
+        bounds = np.flatnonzero(np.diff(owners)) + 1
+        teacher_positions = [{} for _ in range(population_size)]
+        teacher_values = self.values['teacher']
+        if keys.size:
+            for owner, chunk in zip(owners[np.concatenate(([0], bounds))].tolist(), np.split(positions, bounds)):
+                pi, tc = divmod(owner, num_teachers)
+                teacher_positions[pi][teacher_values[tc]] = chunk.tobytes()
+
+        for pi, by_teacher in enumerate(teacher_positions):
+            for teacher_name, positions_bytes in by_teacher.items():
+                entries[pi].extend(self._memo(('teacher', teacher_name, positions_bytes), lambda: self._teacher_keys(teacher_name, positions_bytes)))
+            for kind, pairs in (('pair', self.teacher_pairs), ('non_sharing', self.non_sharing_teacher_pairs)):
+                for i, pair in enumerate(pairs):
+                    pair_positions = tuple(by_teacher.get(t) for t in pair)
+                    entries[pi].extend(self._memo((kind, i, pair_positions), lambda: self._pair_keys(kind, pair, pair_positions)))
+
+    def _morning_keys(self, population_size, columns, large_per_cell, entries):
+        p, lv, d, s, lec, teacher, room, room_type = columns[:8]
+        t = self.tables
+        num_levels, num_days, num_slots = len(self.values['level']), len(self.days), len(self.slots)
+        num_teachers, last = len(self.values['teacher']), self.last_slot_index
+
+        candidate = (s == last) & t['teacher_truthy'][teacher]
+        if not candidate.any(): return
+        busy = np.zeros((population_size, num_teachers, num_days, num_slots), dtype=bool)
+        busy[p, teacher, d, s] = True
+        first_day = np.full((population_size, num_teachers), num_days, dtype=np.int64)
+        np.minimum.at(first_day, (p, teacher), d)
+        large_in_cell = large_per_cell.reshape(population_size, num_levels, num_days, num_slots) > 0
+
+        occupied = np.zeros((population_size, num_days, num_slots, len(self.room_names)), dtype=np.int32)
+        defined = t['defined_room'][room]
+        mask = defined >= 0
+        occupied[p[mask], d[mask], s[mask], defined[mask]] = 1
+        # توجد قاعة شاغرة من النوع إذا زاد عدد قاعات النوع عن المشغول منها
+        free_of_type = t['room_type_count'] > (occupied @ t['room_types'])
+
+        cp, ct, cd, cl, crt = p[candidate], teacher[candidate], d[candidate], lv[candidate], room_type[candidate]
+        earlier = np.arange(last)
+        opportunity = ~busy[cp, ct, cd, :last]
+        on_first_day = (cd == first_day[cp, ct])[:, None]
+        opportunity &= ~(on_first_day & ((t['start_s2'][ct][:, None] & (earlier < 1)) | (t['start_s3'][ct][:, None] & (earlier < 2))))
+        opportunity &= ~large_in_cell[cp, cl, cd, :last]
+        opportunity &= free_of_type[cp[:, None], cd[:, None], earlier[None, :], crt[:, None]]
+
+        missed = np.unique(cp[opportunity.any(axis=1)] * num_teachers + ct[opportunity.any(axis=1)]).tolist()
+        teacher_values = self.values['teacher']
+        for key in missed:
+            pi, tc = divmod(key, num_teachers)
+            entries[pi].append(_prefer_morning_failure(teacher_values[tc], None, self.penalty_morning, last, keys_only=True))
+
+    # ----------------------------------------------------------------- الواجهة العامة
+    def _screen(self, population_size, placements):
+        """أعمدة المصفوفة ومفتاح الخلية، مع الفترات والخلايا المشتبه بها ونسبتها إلى المحاضرات الموضوعة."""
+        columns = tuple(placements[:, i] for i in range(9))
+        p, lv, d, s = columns[:4]
+        cell_key = ((p * len(self.values['level']) + lv) * len(self.days) + d) * len(self.slots) + s
+        clash_slots = self._slot_clash_flags(columns)
+        cells, large_per_cell = self._cell_flags(population_size, columns, cell_key)
+        density = (len(clash_slots) + len(cells)) / max(1, len(placements))
+        return columns, cell_key, clash_slots, cells, large_per_cell, density
+
+    def _count_batch(self, population, placements):
+        """
+        (عدد المواد الناقصة، الأخطاء الصارمة، المرنة) لكل حل، بترتيب عائلات calculate_schedule_cost.
+        يعيد None إذا تجاوزت نسبة المواضع المشتبه بها SCALAR_FALLBACK_DENSITY.
+        """
+        population_size = len(population)
+        columns, cell_key, clash_slots, cells, large_per_cell, density = self._screen(population_size, placements)
+        if density > self.SCALAR_FALLBACK_DENSITY: return None
+        p, lec = columns[0], columns[4]
+        t = self.tables
+
+        placed = np.zeros((population_size, len(self.values['lecture'])), dtype=bool)
+        placed[p, lec] = True
+        unplaced = int(t['required_weight'].sum()) - placed.astype(np.int64) @ t['required_weight']
+
+        entries = [[] for _ in range(population_size)]
+        self._slot_clash_keys(population, clash_slots, entries)
+        self._cell_keys(population, cells, entries)
+        self._shared_keys(columns, entries)
+        if self.consecutive_large_hall_rule != 'none':
+            self._consecutive_keys(population, columns, cell_key, entries)
+        self._teacher_constraint_keys(population_size, columns, entries)
+        if self.use_morning_rule:
+            self._morning_keys(population_size, columns, large_per_cell, entries)
+        return [(int(unplaced[pi]),) + _count_failure_keys(entries[pi]) for pi in range(population_size)]
+
+    def _count_individually(self, batch, codec=None):
+        """نفس نتيجة _count_batch بتقييم كل حل على حدة بمسار العد في calculate_schedule_cost."""
+        counts = []
+        for individual in batch:
+            schedule = individual if codec is None else codec.decode(individual)
+            if codec is None:
+                scheduled_ids = {lec.get('id') for grid in schedule.values() for day in grid for lectures in day for lec in lectures}
+                unplaced_count = sum(1 for lec in self.all_lectures if lec.get('id') not in scheduled_ids and lec.get('teacher_name'))
+            else:
+                unplaced_count = codec.unplaced_count(individual)
+            hard_errors_count, soft_errors_count = calculate_schedule_cost(
+                schedule, self.days, self.slots, self.teachers, self.rooms_data, self.levels, self.identifiers_by_level,
+                self.special_constraints, self.teacher_constraints, self.distribution_rule_type, self.lectures_by_teacher_map,
+                self.globally_unavailable_slots, self.saturday_teachers, self.teacher_pairs, self.day_to_idx, self.rules_grid,
+                self.last_slot_restrictions, self.level_specific_large_rooms, self.specific_small_room_assignments, self.constraint_severities,
+                max_sessions_per_day=self.max_sessions_per_day, consecutive_large_hall_rule=self.consecutive_large_hall_rule,
+                prefer_morning_slots=self.prefer_morning_slots, non_sharing_teacher_pairs=self.non_sharing_teacher_pairs, mode="count",
+                vector_cache=ACTIVE_TEACHER_CACHE['cache'], model=self.model
+            )
+            counts.append((unplaced_count, hard_errors_count, soft_errors_count))
+        return counts
+
+    def error_density(self, population, codec=None):
+        """نسبة الفترات والخلايا المشتبه بها إلى المحاضرات الموضوعة في الجيل (المعيار الذي يقارن بـ SCALAR_FALLBACK_DENSITY)."""
+        placements = self._encode(population) if codec is None else self._encode_chromosomes(population, codec)
+        return self._screen(len(population), placements)[-1]
+
+    def _fitness_tuple(self, unplaced_count, hard_errors_count, soft_errors_count):
+        if self.use_strict_hierarchy:
+            if unplaced_count > 0 or hard_errors_count > 0:
+                return (-unplaced_count, -hard_errors_count, 0)
+            return (0, 0, -soft_errors_count)
+        return (-unplaced_count, -hard_errors_count, -soft_errors_count)
+
+    @_profiled('population.evaluate')
+    def evaluate(self, population, codec=None):
+        """
+        قائمة اللياقة لكل حل في الجيل، بنفس ترتيبه.
+        codec: إن مُرِّر فالجيل كروموسومات Chromosome لهذا المرمِّز، تُقيَّم دون فك ترميزها إلى جداول.
+        """
+        results = [None] * len(population)
+        pending = list(range(len(population)))
+        cache = ACTIVE_FITNESS_CACHE['cache']
+        if cache is not None:
+            # مفتاح الكروموسوم مرتبط بترقيم المرمِّز للمحاضرات والقاعات
+            options = self.cache_options if codec is None else self.cache_options + ('chromosome', codec.serial)
+            context, pending, cache_keys = cache.context_key(self.model, options), [], {}
+            for i, individual in enumerate(population):
+                if codec is None:
+                    scheduled_ids = set()
+                    cache_keys[i] = (context, cache.hasher.schedule_hash(individual, scheduled_ids))
+                else:
+                    cache_keys[i] = (context, individual.key())
+                cached = cache.get(cache_keys[i])
+                if cached is None:
+                    pending.append(i)
+                    continue
+                if codec is None:
+                    unplaced_count = sum(1 for lec in self.all_lectures if lec.get('id') not in scheduled_ids and lec.get('teacher_name'))
+                else:
+                    unplaced_count = codec.unplaced_count(individual)
+                results[i] = self._fitness_tuple(unplaced_count, cached[1], cached[2])
+
+        if pending:
+            batch = [population[i] for i in pending]
+            if len(batch) < self.SCALAR_FALLBACK_MIN_BATCH:
+                counts = None
+            elif codec is None:
+                counts = self._count_batch(batch, self._encode(batch))
+            else:
+                counts = self._count_batch([codec.view(c) for c in batch], self._encode_chromosomes(batch, codec))
+            if counts is None: counts = self._count_individually(batch, codec)
+            for i, (unplaced_count, hard_errors_count, soft_errors_count) in zip(pending, counts):
+                if cache is not None: cache.put(cache_keys[i], (None, hard_errors_count, soft_errors_count))
+                results[i] = self._fitness_tuple(unplaced_count, hard_errors_count, soft_errors_count)
+        return results
+
+# =====================================================================
+# END: BATCHED POPULATION FITNESS
+# =====================================================================
+
 
 # النسخة النهائية والمكتملة للخوارزمية الجينية
-def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, ga_population_size, ga_generations, ga_mutation_rate, ga_elitism_count, rules_grid, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, initial_solution_seed=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, ga_stagnation_threshold=15):
+def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, ga_population_size, ga_generations, ga_mutation_rate, ga_elitism_count, rules_grid, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, initial_solution_seed=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, ga_stagnation_threshold=15, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     
     
     log_q.put('--- بدء الخوارزمية الجينية ---')
     
     # 1. إنشاء الجيل الأول
     log_q.put(f'   - جاري إنشاء الجيل الأول ({ga_population_size} حل)...')
-    population = create_initial_population(ga_population_size, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments)
+    # ✨ الأفراد كروموسومات (موضع وقاعة لكل محاضرة)؛ لا يُفك ترميز إلا أفضل حل
+    codec = AssignmentCodec(lectures_to_schedule, days, slots, rooms_data, all_levels, model=model)
+    population = [codec.encode(schedule) for schedule in create_initial_population(ga_population_size, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments, model=model)]
     time.sleep(0)
 
     # --- ✨ بداية الإضافة الجديدة: زرع البذرة (الحل الطماع) ---
@@ -1224,10 +3937,11 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         log_q.put('   - تم دمج الحل المبدئي (الطماع) في الجيل الأول.')
         if population:
             # استبدال الحل العشوائي الأول بالحل الأفضل القادم من الخوارزمية الطماعة
-            population[0] = initial_solution_seed
+            population[0] = codec.encode(initial_solution_seed)
     # --- نهاية الإضافة الجديدة ---
 
     best_solution_so_far = None
+    best_chromosome_so_far = None
     best_fitness_so_far = (-float('inf'), -float('inf'), -float('inf'))
     # --- ✨ بداية الإضافة: متغيرات كشف الركود --- ✨
     stagnation_counter = 0
@@ -1245,6 +3959,9 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
     stagnation_percentage = float(ga_stagnation_threshold) / 100.0
     STAGNATION_LIMIT = max(15, int(ga_generations * stagnation_percentage))
     # --- ✨ نهاية الإضافة --- ✨
+
+    # ✨ تقييم كل جيل دفعة واحدة (نفس نتيجة calculate_fitness لكل حل)
+    population_evaluator = PopulationFitnessEvaluator(lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
     
     # 2. حلقة التطور عبر الأجيال
     for gen in range(ga_generations):
@@ -1258,15 +3975,15 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
             
             # في الخوارزمية الجينية، سنقوم بطفرة أفضل حل واستبدال أسوأ حل به
             if best_solution_so_far and population:
-                mutated_solution = mutate(
-                    best_solution_so_far, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                mutated_solution = mutate_chromosome(
+                    codec, best_chromosome_so_far, days, slots, rooms_data, teachers, all_levels,
                     teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                     globally_unavailable_slots, saturday_teachers, day_to_idx,
                     level_specific_large_rooms, specific_small_room_assignments, constraint_severities,
                     consecutive_large_hall_rule, prefer_morning_slots,
                     extra_teachers_on_hard_error=intensity,
                     soft_error_shake_probability=mutation_soft_probability,
-                    non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
                 # استبدال أسوأ فرد في الجيل الحالي (الأخير في القائمة قبل الفرز) بالنسخة المطفرة
                 population[-1] = mutated_solution
@@ -1281,13 +3998,13 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         if stagnation_counter >= STAGNATION_LIMIT:
             log_q.put(f'   >>> ⚠️ تم كشف الركود لـ {STAGNATION_LIMIT} جيل. تفعيل إعادة التشغيل الجزئي...')
             # نحتفظ بأفضل حل لدينا ونضعه في بداية الجيل الجديد
-            new_population = [best_solution_so_far]
+            new_population = [best_chromosome_so_far]
             # ننشئ بقية السكان بشكل عشوائي لزيادة التنوع
             new_random_solutions = create_initial_population(
                 ga_population_size - 1, lectures_to_schedule, days, slots, rooms_data, all_levels, 
-                level_specific_large_rooms, specific_small_room_assignments
+                level_specific_large_rooms, specific_small_room_assignments, model=model
             )
-            population = new_population + new_random_solutions
+            population = new_population + [codec.encode(schedule) for schedule in new_random_solutions]
             stagnation_counter = 0 # إعادة تصفير العداد
             log_q.put(f'   >>> تم حقن {ga_population_size - 1} حل عشوائي جديد لاستكشاف مناطق أخرى.')
             # ننتقل مباشرة للجيل التالي بالجيل الجديد
@@ -1300,10 +4017,7 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         # --- نهاية التعديل ---
 
         # تقييم جودة كل حل في الجيل الحالي
-        population_with_fitness = []
-        for schedule in population:
-            fitness, _ = calculate_fitness(schedule, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-            population_with_fitness.append((schedule, fitness))
+        population_with_fitness = list(zip(population, population_evaluator.evaluate(population, codec=codec)))
         
         population_with_fitness.sort(key=lambda item: item[1], reverse=True)
 
@@ -1311,12 +4025,13 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         # تحديث أفضل حل تم العثور عليه
         if population_with_fitness[0][1] > best_fitness_so_far:
             best_fitness_so_far = population_with_fitness[0][1]
-            best_solution_so_far = copy.deepcopy(population_with_fitness[0][0])
+            best_chromosome_so_far = population_with_fitness[0][0].copy()
+            best_solution_so_far = codec.decode(best_chromosome_so_far)
             if progress_channel: progress_channel['best_solution_so_far'] = best_solution_so_far
 
             log_q.put(f'   >>> إنجاز جديد! أفضل أخطاء = ({-best_fitness_so_far[0]}, {-best_fitness_so_far[1]}, {-best_fitness_so_far[2]})')
 
-            _, errors_for_best = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            _, errors_for_best = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
             progress_percentage = calculate_progress_percentage(errors_for_best)
             log_q.put(f"PROGRESS:{progress_percentage:.1f}")
 
@@ -1336,18 +4051,18 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         for _ in range(offspring_to_produce // 2):
             parent1 = select_one_parent_tournament(population_with_fitness)
             parent2 = select_one_parent_tournament(population_with_fitness)
-            child1, child2 = crossover(parent1, parent2, all_levels, days, slots)
-            # تطبيق الطفرة الاحتمالية على الابن الأول
+            child1, child2 = codec.crossover(parent1, parent2)
+            # تطبيق الطفرة الاحتمالية على الابن الأول (على مصفوفتي الكروموسوم مباشرة)
             if random.random() < current_mutation_rate:
-                mutated_child1 = mutate(
-                    child1, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                mutated_child1 = mutate_chromosome(
+                    codec, child1, days, slots, rooms_data, teachers, all_levels,
                     teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                     globally_unavailable_slots, saturday_teachers, day_to_idx, 
                     level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule, 
                     prefer_morning_slots,
                     extra_teachers_on_hard_error=mutation_hard_intensity,
                     soft_error_shake_probability=mutation_soft_probability, 
-                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter
+                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter, model=model
                 )
                 next_generation.append(mutated_child1)
             else:
@@ -1356,15 +4071,15 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
             # تطبيق الطفرة الاحتمالية على الابن الثاني
             if len(next_generation) < ga_population_size:
                 if random.random() < current_mutation_rate:
-                    mutated_child2 = mutate(
-                        child2, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                    mutated_child2 = mutate_chromosome(
+                        codec, child2, days, slots, rooms_data, teachers, all_levels,
                         teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                         globally_unavailable_slots, saturday_teachers, day_to_idx, 
                         level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule, 
                         prefer_morning_slots,
                         extra_teachers_on_hard_error=mutation_hard_intensity,
                         soft_error_shake_probability=mutation_soft_probability, 
-                        non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter
+                        non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter, model=model
                     )
                     next_generation.append(mutated_child2)
                 else:
@@ -1397,16 +4112,16 @@ def run_genetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
     log_q.put('انتهت الخوارزمية الجينية.')
 
     if not best_solution_so_far:
-        best_solution_so_far = population_with_fitness[0][0] if population_with_fitness else create_initial_population(1, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments)[0]
+        best_solution_so_far = codec.decode(population_with_fitness[0][0]) if population_with_fitness else create_initial_population(1, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments, model=model)[0]
 
     # 1. حساب قائمة الأخطاء النهائية والتكلفة الموزونة
-    final_constraint_violations = calculate_schedule_cost(best_solution_so_far, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots)
+    final_constraint_violations = calculate_schedule_cost(best_solution_so_far, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, model=model)
     scheduled_ids = {lec.get('id') for grid in best_solution_so_far.values() for day in grid for slot in day for lec in slot}
     final_unplaced_lectures = [
         {"course_name": lec.get('name'), "teacher_name": lec.get('teacher_name'), "reason": "المادة لم يتم جدولتها في الحل النهائي (نقص).", "penalty": 1000}
         for lec in lectures_to_schedule if lec.get('id') not in scheduled_ids and lec.get('teacher_name')
     ]
-    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
 
     # === ✨ السطر المصحح: إعادة حساب التكلفة من الـ tuple ===
     unplaced_count = -final_fitness[0]
@@ -1544,13 +4259,19 @@ def run_hyper_heuristic(
     heuristic_tabu_tenure=3,
     budget_mode='time', llh_time_budget=5.0, llh_iterations=30,
     stagnation_limit=15,
-    algorithm_settings=None):
+    algorithm_settings=None, model=None):
     """
     Executes a combined Hyper-Heuristic framework.
     This version integrates the elegant fitness model (from the new version)
     with the powerful features like stagnation control, full LLH support,
     and adaptive learning from the original version.
     """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     log_q.put(f'--- بدء النظام الخبير (النسخة المدمجة | وضع التحكم: {budget_mode}) ---')
 
     if algorithm_settings is None:
@@ -1574,7 +4295,7 @@ def run_hyper_heuristic(
     
     if not low_level_heuristics:
         log_q.put("  - تحذير: لم يتم اختيار أي خوارزميات. سيعود بالحل المبدئي.")
-        _, initial_failures = calculate_fitness(initial_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+        _, initial_failures = calculate_fitness(initial_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
         # Note: original returned len(initial_failures), this is a minor change to keep consistency
         return initial_solution, sum(f.get('penalty', 1) for f in initial_failures), initial_failures
     
@@ -1605,7 +4326,7 @@ def run_hyper_heuristic(
         identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
         lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
         day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
-        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model
     )
     current_solution = copy.deepcopy(initial_solution)
     best_fitness_so_far = current_fitness
@@ -1630,7 +4351,7 @@ def run_hyper_heuristic(
             log_q.put(f"--- 📊 الحالة الحالية: أفضل لياقة (ن,ص,م) = ({unplaced}, {hard}, {soft}) ---")
 
         # تحديد الحالة الحالية واختيار الخوارزمية (Action)
-        _, current_failures_list = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+        _, current_failures_list = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
         current_state = get_state_from_failures_dominant(current_failures_list, -current_fitness[0])
         
         available_actions = [action for action in actions if action not in tabu_list]
@@ -1832,7 +4553,7 @@ def run_hyper_heuristic(
             day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms,
             specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy,
             max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
-            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
         )
         
         reward = calculate_reward_from_fitness(current_fitness, new_fitness)
@@ -1865,7 +4586,7 @@ def run_hyper_heuristic(
             unplaced, hard, soft = -best_fitness_so_far[0], -best_fitness_so_far[1], -best_fitness_so_far[2]
             log_q.put(f'  >>> ✅ إنجاز! {action} حسّن اللياقة إلى (نقص: {unplaced}, صارم: {hard}, مرن: {soft})')
             
-            _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
             progress_percentage = calculate_progress_percentage(errors_for_best)
             log_q.put(f"PROGRESS:{progress_percentage:.1f}")
         
@@ -1895,7 +4616,7 @@ def run_hyper_heuristic(
         day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms,
         specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy,
         max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
-        prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
     )
 
     unplaced, hard, soft = -final_fitness[0], -final_fitness[1], -final_fitness[2]
@@ -1919,11 +4640,17 @@ def run_error_driven_local_search(
     lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
     day_to_idx, rules_grid, prioritize_primary, level_specific_large_rooms, 
     specific_small_room_assignments, constraint_severities, last_slot_restrictions, max_iterations=1, # يكفي تكرار واحد لكل استدعاء
-    consecutive_large_hall_rule="none", prefer_morning_slots=False, use_strict_hierarchy=False, max_sessions_per_day=None, non_sharing_teacher_pairs=[]
+    consecutive_large_hall_rule="none", prefer_morning_slots=False, use_strict_hierarchy=False, max_sessions_per_day=None, non_sharing_teacher_pairs=[], model=None
 ):
     """
     بحث محلي ذكي وموجه نحو الأخطاء. يحدد خطأً صارماً، يزيل المحاضرات المسببة له، ثم يحاول إعادة بنائها.
     """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     improved_schedule = copy.deepcopy(schedule_to_improve)
     
     for _ in range(max_iterations):
@@ -1935,7 +4662,7 @@ def run_error_driven_local_search(
             day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
             specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy,
             max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
-            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
         )
         
         if current_fitness[1] == 0: # لا توجد أخطاء صارمة
@@ -1996,7 +4723,7 @@ def run_error_driven_local_search(
                 (primary_slots if is_primary else reserve_slots).append((day_idx, slot_idx))
 
         for lecture in sorted(lectures_to_reinsert, key=lambda l: calculate_lecture_difficulty(l, lectures_by_teacher_map.get(l.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True):
-            find_slot_for_single_lecture(lecture, temp_schedule, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots)
+            find_slot_for_single_lecture(lecture, temp_schedule, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots, model=model)
 
         # الخطوة 5: تقييم الحل الجديد وقبوله فقط إذا كان أفضل
         new_fitness, _ = calculate_fitness(
@@ -2006,7 +4733,7 @@ def run_error_driven_local_search(
             day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
             specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy,
             max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
-            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model
         )
 
         # استخراج عدد الأخطاء من tuple اللياقة للمقارنة
@@ -2034,22 +4761,31 @@ def run_error_driven_local_search(
 # =====================================================================
 # START: MEMETIC ALGORITHM (ENHANCED VERSION)
 # =====================================================================
-def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, prioritize_primary, ma_population_size, ma_generations, ma_mutation_rate, ma_elitism_count, ma_local_search_iterations, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, initial_solution_seed=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, ga_stagnation_threshold=15):
+def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, prioritize_primary, ma_population_size, ma_generations, ma_mutation_rate, ma_elitism_count, ma_local_search_iterations, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, initial_solution_seed=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, ga_stagnation_threshold=15, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
 
     log_q.put('--- بدء الخوارزمية الميميتيك (GA + LS) ---')
 
     # 1. إنشاء الجيل الأول
     log_q.put(f'   - جاري إنشاء الجيل الأول ({ma_population_size} حل)...')
 
-    population = create_initial_population(ma_population_size, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments)
+    # ✨ الأفراد كروموسومات؛ البحث المحلي والطفرة يعملان على الجدول المفكوك للابن ثم يُعاد ترميزه
+    codec = AssignmentCodec(lectures_to_schedule, days, slots, rooms_data, all_levels, model=model)
+    population = [codec.encode(schedule) for schedule in create_initial_population(ma_population_size, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments, model=model)]
     time.sleep(0)
 
     if initial_solution_seed:
         log_q.put('   - تم دمج الحل المبدئي (الطماع) في الجيل الأول.')
         if population:
-            population[0] = initial_solution_seed
+            population[0] = codec.encode(initial_solution_seed)
 
     best_solution_so_far = None
+    best_chromosome_so_far = None
     # تكييف نظام اللياقة ليتوافق مع البرنامج الحالي
     best_fitness_so_far = (-float('inf'), -float('inf'), -float('inf'))
 
@@ -2067,6 +4803,9 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
     MIN_MUTATION_RATE = 0.02  # (2%)
     # --- ✨ نهاية الإضافة ---
 
+    # ✨ تقييم كل جيل دفعة واحدة؛ قائمة الأخطاء التفصيلية تُحسب لأفضل حل فقط عند تحسنه
+    population_evaluator = PopulationFitnessEvaluator(lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
+
     # 2. حلقة التطور عبر الأجيال
     for gen in range(ma_generations):
         if scheduling_state.get('should_stop'):
@@ -2080,15 +4819,15 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
             # في الخوارزمية الميميتيك، سنقوم بنفس منطق الجينية
             # نطفر أفضل حل ونستبدل به أسوأ حل في الجيل الحالي
             if best_solution_so_far and population:
-                mutated_solution = mutate(
-                    best_solution_so_far, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                mutated_solution = mutate_chromosome(
+                    codec, best_chromosome_so_far, days, slots, rooms_data, teachers, all_levels,
                     teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                     globally_unavailable_slots, saturday_teachers, day_to_idx,
                     level_specific_large_rooms, specific_small_room_assignments, constraint_severities,
                     consecutive_large_hall_rule, prefer_morning_slots,
                     extra_teachers_on_hard_error=intensity,
                     soft_error_shake_probability=mutation_soft_probability,
-                    non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
                 # استبدال أسوأ فرد في الجيل الحالي (الأخير في القائمة قبل الفرز) بالنسخة المطفرة
                 population[-1] = mutated_solution
@@ -2102,12 +4841,12 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
 
         if stagnation_counter >= STAGNATION_LIMIT:
             log_q.put(f'   >>> ⚠️ تم كشف الركود لـ {STAGNATION_LIMIT} جيل. تفعيل إعادة التشغيل الجزئي...')
-            new_population = [best_solution_so_far]
+            new_population = [best_chromosome_so_far]
             new_random_solutions = create_initial_population(
                 ma_population_size - 1, lectures_to_schedule, days, slots, rooms_data, all_levels, 
-                level_specific_large_rooms, specific_small_room_assignments
+                level_specific_large_rooms, specific_small_room_assignments, model=model
             )
-            population = new_population + new_random_solutions
+            population = new_population + [codec.encode(schedule) for schedule in new_random_solutions]
             stagnation_counter = 0 
             log_q.put(f'   >>> تم حقن {ma_population_size - 1} حل عشوائي جديد.')
             continue
@@ -2115,17 +4854,16 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         log_q.put(f'--- الجيل {gen + 1}/{ma_generations} | أفضل أخطاء (نقص, صارمة, مرنة) = ({-best_fitness_so_far[0]}, {-best_fitness_so_far[1]}, {-best_fitness_so_far[2]}) ---')
         time.sleep(0)
 
-        population_with_fitness = []
-        for schedule in population:
-            fitness, failures = calculate_fitness(schedule, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-            population_with_fitness.append((schedule, fitness, failures))
+        population_with_fitness = [(schedule, fitness, None) for schedule, fitness in zip(population, population_evaluator.evaluate(population, codec=codec))]
 
         population_with_fitness.sort(key=lambda item: item[1], reverse=True)
 
        # --- ✨ بداية الكود الجديد والمعدل ---
         if population_with_fitness[0][1] > best_fitness_so_far:
-            best_solution_so_far, best_fitness_so_far, best_failures_list = population_with_fitness[0]
-            best_solution_so_far = copy.deepcopy(best_solution_so_far)
+            best_chromosome_so_far, best_fitness_so_far, _ = population_with_fitness[0]
+            best_chromosome_so_far = best_chromosome_so_far.copy()
+            best_solution_so_far = codec.decode(best_chromosome_so_far)
+            _, best_failures_list = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
 
             if progress_channel: progress_channel['best_solution_so_far'] = best_solution_so_far
             log_q.put(f'   >>> إنجاز جديد! أفضل أخطاء = ({-best_fitness_so_far[0]}, {-best_fitness_so_far[1]}, {-best_fitness_so_far[2]})')
@@ -2148,54 +4886,55 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
             if not population_with_fitness: break
             parent1 = select_one_parent_tournament(population_with_fitness)
             parent2 = select_one_parent_tournament(population_with_fitness)
-            child1, child2 = crossover(parent1, parent2, all_levels, days, slots)
+            child1, child2 = codec.crossover(parent1, parent2)
 
             if random.random() < current_mutation_rate:
-                mutated_child1 = mutate(
-                    child1, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                # الطفرة على مصفوفتي الكروموسوم، ويُفك الترميز للبحث المحلي
+                mutated_child1 = codec.decode(mutate_chromosome(
+                    codec, child1, days, slots, rooms_data, teachers, all_levels,
                     teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                     globally_unavailable_slots, saturday_teachers, day_to_idx, 
                     level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule, 
                     prefer_morning_slots,
                     extra_teachers_on_hard_error=mutation_hard_intensity,
                     soft_error_shake_probability=mutation_soft_probability, 
-                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter
-                )
+                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter, model=model
+                ))
             else:
-                mutated_child1 = child1
+                mutated_child1 = codec.decode(child1)
 
             improved_child1 = run_error_driven_local_search(
                 mutated_child1, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, 
                 identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
                 lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
                 day_to_idx, rules_grid, prioritize_primary, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, last_slot_restrictions,
-                max_iterations=ma_local_search_iterations, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                max_iterations=ma_local_search_iterations, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
-            next_generation.append(improved_child1)
+            next_generation.append(codec.encode(improved_child1))
 
             if len(next_generation) < ma_population_size:
                 if random.random() < current_mutation_rate:
-                    mutated_child2 = mutate(
-                        child2, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                    mutated_child2 = codec.decode(mutate_chromosome(
+                        codec, child2, days, slots, rooms_data, teachers, all_levels,
                         teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                         globally_unavailable_slots, saturday_teachers, day_to_idx, 
                         level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule, 
                         prefer_morning_slots,
                         extra_teachers_on_hard_error=mutation_hard_intensity,
                         soft_error_shake_probability=mutation_soft_probability, 
-                        non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter
-                    )
+                        non_sharing_teacher_pairs=non_sharing_teacher_pairs, stagnation_counter=stagnation_counter, model=model
+                    ))
                 else:
-                    mutated_child2 = child2
+                    mutated_child2 = codec.decode(child2)
 
                 improved_child2 = run_error_driven_local_search(
                     mutated_child2, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, 
                     identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
                     lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
                     day_to_idx, rules_grid, prioritize_primary, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, last_slot_restrictions,
-                    max_iterations=ma_local_search_iterations, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    max_iterations=ma_local_search_iterations, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
-                next_generation.append(improved_child2)
+                next_generation.append(codec.encode(improved_child2))
 
         # === ✨✨ بداية الإضافة: آلية تجديد السكان ✨✨ ===
         
@@ -2218,7 +4957,7 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
 
     log_q.put('انتهت الخوارزمية الميميتيك.')
     if not best_solution_so_far:
-        best_solution_so_far = population_with_fitness[0][0] if population_with_fitness else create_initial_population(1, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments)[0]
+        best_solution_so_far = codec.decode(population_with_fitness[0][0]) if population_with_fitness else create_initial_population(1, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments, model=model)[0]
 
     # --- بداية التصحيح: نستخدم دالة `calculate_fitness` للحصول على النتائج النهائية الموحدة ---
     final_fitness, final_failures_list = calculate_fitness(
@@ -2227,7 +4966,7 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
         lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
         day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
         specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, 
-        consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
     )
 
     # حساب التكلفة النهائية من tuple اللياقة
@@ -2249,7 +4988,9 @@ def run_memetic_algorithm(log_q, lectures_to_schedule, days, slots, rooms_data,
 # END: ENHANCED MEMETIC ALGORITHM
 # =====================================================================
 
-def create_initial_population(population_size, lectures, days, slots, rooms_data, levels, level_specific_large_rooms, specific_small_room_assignments):
+def create_initial_population(population_size, lectures, days, slots, rooms_data, levels, level_specific_large_rooms, specific_small_room_assignments, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments)
     population = []
     small_rooms = [r['name'] for r in rooms_data if r['type'] == 'صغيرة']
     large_rooms = [r['name'] for r in rooms_data if r['type'] == 'كبيرة']
@@ -2257,8 +4998,6 @@ def create_initial_population(population_size, lectures, days, slots, rooms_data
     for _ in range(population_size):
         schedule = {level: [[[] for _ in slots] for _ in days] for level in levels}
         for lec in lectures:
-            lec_with_room = lec.copy()
-            
             # ✨ التصحيح يبدأ هنا
             # بما أن القاعة يجب أن تكون نفسها لكل المستويات، نستخدم المستوى الأول كمرجع لاختيارها
             first_level = lec.get('levels', [None])[0]
@@ -2266,21 +5005,23 @@ def create_initial_population(population_size, lectures, days, slots, rooms_data
             if lec['room_type'] == 'كبيرة' and large_rooms:
                 required_room = level_specific_large_rooms.get(first_level)
                 if required_room and required_room in large_rooms:
-                    lec_with_room['room'] = required_room
+                    room = required_room
                 else:
-                    lec_with_room['room'] = random.choice(large_rooms)
+                    room = random.choice(large_rooms)
             elif lec['room_type'] == 'صغيرة' and small_rooms:
                 if first_level:
                     course_full_name = f"{lec.get('name')} ({first_level})"
                     required_room = specific_small_room_assignments.get(course_full_name)
                     if required_room and required_room in small_rooms:
-                        lec_with_room['room'] = required_room
+                        room = required_room
                     else:
-                        lec_with_room['room'] = random.choice(small_rooms)
+                        room = random.choice(small_rooms)
                 else:
-                     lec_with_room['room'] = random.choice(small_rooms)
+                     room = random.choice(small_rooms)
             else:
-                lec_with_room['room'] = None
+                room = None
+            # ✨ وضعية ثابتة واحدة لكل مستويات المادة (النسخ العميق للأفراد لا ينسخها)
+            lec_with_room = Placement.of(lec, room, model=model)
 
             day_idx = random.randint(0, len(days) - 1)
             slot_idx = random.randint(0, len(slots) - 1)
@@ -2308,105 +5049,124 @@ def select_one_parent_tournament(population_with_fitness, tournament_size=3):
 
 
 
-def crossover(parent1, parent2, all_levels, days, slots):
-    """
-    يقوم بإنتاج طفلين عبر تبادل الجينات بين الأبوين باستخدام نقطتي قطع.
-    (نسخة محسنة وأكثر أمانًا تضمن النسخ العميق للبيانات)
-    """
-    child1 = {}
-    child2 = {}
-
-    # 1. إنشاء "كروموسوم" خطي يمثل كل خانة زمنية ممكنة في الجدول
-    chromosome_map = []
-    for level in all_levels:
-        for day_idx in range(len(days)):
-            for slot_idx in range(len(slots)):
-                chromosome_map.append({'level': level, 'd': day_idx, 's': slot_idx})
-
-    chromosome_length = len(chromosome_map)
-    if chromosome_length < 2:
-        # إذا كان الكروموسوم قصيرًا جدًا، أعد نسخًا من الآباء
-        return copy.deepcopy(parent1), copy.deepcopy(parent2)
-
-    # 2. اختيار نقطتي قطع عشوائيتين
-    point1, point2 = sorted(random.sample(range(chromosome_length), 2))
-
-    # 3. بناء الأبناء جيناً بعد جين
-    for i in range(chromosome_length):
-        gene_info = chromosome_map[i]
-        level = gene_info['level']
-        d = gene_info['d']
-        s = gene_info['s']
-
-        # تهيئة القواميس الداخلية للأبناء إذا لم تكن موجودة
-        if level not in child1:
-            child1[level] = [[[] for _ in slots] for _ in days]
-            child2[level] = [[[] for _ in slots] for _ in days]
-
-        # تحديد من أي أب سيتم الوراثة
-        if point1 <= i < point2:
-            # المنطقة الوسطى: الطفل الأول يرث من الأب الثاني، والعكس صحيح
-            child1[level][d][s] = copy.deepcopy(parent2[level][d][s])
-            child2[level][d][s] = copy.deepcopy(parent1[level][d][s])
-        else:
-            # الأطراف: كل طفل يرث من أبيه الموافق
-            child1[level][d][s] = copy.deepcopy(parent1[level][d][s])
-            child2[level][d][s] = copy.deepcopy(parent2[level][d][s])
-
-    return child1, child2
-
 # ====================== النسخة النهائية والأكثر قوة لدالة الطفرة (مع إعدادات مرنة) =======================
 # ====================== النسخة النهائية والأكثر قوة لدالة الطفرة (مع إعدادات مرنة) =======================
-def _calculate_lecture_regret(lecture, temp_schedule, temp_teacher_schedule, temp_room_schedule, all_possible_slots, **kwargs):
+class RegretRepair:
     """
-    تحسب "درجة الندم" لمحاضرة معينة عن طريق عد عدد الأماكن الصالحة المتاحة لها.
+    إصلاح بالندم: تُعاد المحاضرات إلى الجدول واحدة تلو الأخرى، والأقل أماكن صالحة أولاً (التعادل بترتيب القائمة).
+    - عدد الأماكن الصالحة لكل محاضرة قناع فترات (bit لكل (يوم، فترة)) في كومة heapq مفتاحها عدد البتات.
+    - بعد كل وضع لا يُعاد الحساب إلا لمن يتأثر به: يُعاد فحص الفترة المشغولة والتي تليها فقط، ولمن كانت
+      محسوبة صالحة له (الأستاذ، إشغال المستويات والقاعة، توالي القاعات الكبيرة)؛ ويُعاد القناع كاملاً فقط لمحاضرات
+      نفس الأستاذ ذات البداية المتأخرة إذا تقدّم أول يوم عمل له، لأنه الحالة الوحيدة التي يفتح فيها الوضع فترات جديدة.
+    - الوضع نفسه عبر find_slot_for_single_lecture بنفس الأقنعة، فتبقى الخرائط والجدول متزامنة.
+    تستعملها mutate وإصلاح LNS و _perform_flexible_swap.
     """
-    valid_placements = 0
-    for day_idx, slot_idx in all_possible_slots:
-        is_valid, _ = is_placement_valid(
-            lecture, day_idx, slot_idx, temp_schedule, temp_teacher_schedule, temp_room_schedule, **kwargs
+    def __init__(self, schedule, teacher_schedule, room_schedule, days, slots, rules_grid, rooms_data,
+                 teacher_constraints, globally_unavailable_slots, special_constraints, identifiers_by_level,
+                 saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments,
+                 consecutive_large_hall_rule, prefer_morning_slots=False,
+                 primary_slots=None, reserve_slots=None, prioritize_primary=True, bitsets=None, model=None):
+        self.model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                          level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                          special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                          globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+        self.schedule, self.teacher_schedule, self.room_schedule = schedule, teacher_schedule, room_schedule
+        self.days, self.slots, self.rules_grid, self.rooms_data = days, slots, rules_grid, rooms_data
+        self.teacher_constraints, self.globally_unavailable_slots = teacher_constraints, globally_unavailable_slots
+        self.special_constraints, self.identifiers_by_level = special_constraints, identifiers_by_level
+        self.saturday_teachers, self.day_to_idx = saturday_teachers, day_to_idx
+        self.level_specific_large_rooms, self.specific_small_room_assignments = level_specific_large_rooms, specific_small_room_assignments
+        self.consecutive_large_hall_rule, self.prefer_morning_slots = consecutive_large_hall_rule, prefer_morning_slots
+        self.all_possible_slots = [(d, s) for d in range(len(days)) for s in range(len(slots))]
+        # الافتراضي كما في mutate: كل الفترات احتياطية مع أولوية الفترات الأساسية للقاعات الكبيرة
+        self.primary_slots = primary_slots if primary_slots is not None else []
+        self.reserve_slots = reserve_slots if reserve_slots is not None else self.all_possible_slots
+        self.prioritize_primary = prioritize_primary
+        self.bitsets = bitsets if bitsets is not None else OccupancyBitsets(schedule, teacher_schedule, room_schedule, self.model, len(slots), rooms_data=rooms_data)
+
+    def _domain(self, lecture):
+        return self.model.domain(lecture)
+
+    def _open_mask(self, domain, lecture):
+        mask = 0
+        for day_idx, slot_idx in domain.allowed_slots(self.all_possible_slots):
+            if _slot_open_in_bitsets(domain, lecture, day_idx, slot_idx, self.bitsets, self.consecutive_large_hall_rule):
+                mask |= self.bitsets.bit(day_idx, slot_idx)
+        return mask
+
+    def regret(self, lecture):
+        """عدد الفترات الصالحة حالياً للمحاضرة."""
+        return bin(self._open_mask(self._domain(lecture), lecture)).count('1')
+
+    def place(self, lecture):
+        """وضع محاضرة واحدة في أفضل مكان طماع؛ تعيد (نجاح، رسالة) كما find_slot_for_single_lecture."""
+        return find_slot_for_single_lecture(
+            lecture, self.schedule, self.teacher_schedule, self.room_schedule,
+            self.days, self.slots, self.rules_grid, self.rooms_data,
+            self.teacher_constraints, self.globally_unavailable_slots, self.special_constraints,
+            self.primary_slots, self.reserve_slots, self.identifiers_by_level,
+            self.prioritize_primary, self.saturday_teachers, self.day_to_idx, self.level_specific_large_rooms,
+            self.specific_small_room_assignments, self.consecutive_large_hall_rule, self.prefer_morning_slots, bitsets=self.bitsets,
+            model=self.model
         )
-        if is_valid:
-            valid_placements += 1
-    return valid_placements
+
+    def repair(self, lectures):
+        """إعادة إدراج lectures بترتيب الندم؛ تعيد قائمة المحاضرات التي لم يُعثر لها على مكان."""
+        bitsets, positions = self.bitsets, self.bitsets.placed.positions
+        domains = [self._domain(lec) for lec in lectures]
+        masks = [self._open_mask(domain, lec) for domain, lec in zip(domains, lectures)]
+        counts = [bin(mask).count('1') for mask in masks]
+        heap = [(count, i) for i, count in enumerate(counts)]
+        heapq.heapify(heap)
+        by_teacher = defaultdict(list)
+        for i, lec in enumerate(lectures): by_teacher[lec.get('teacher_name')].append(i)
+        pending = set(range(len(lectures)))
+        failed = []
+
+        while heap:
+            count, i = heapq.heappop(heap)
+            if i not in pending or count != counts[i]: continue
+            pending.discard(i)
+            lecture = lectures[i]
+            teacher = lecture.get('teacher_name')
+            placed_before, first_day_before = len(positions.get(lecture['id'], ())), bitsets.first_day(teacher)
+            success, _ = self.place(lecture)
+            if not success:
+                failed.append(lecture)
+                continue
+            if len(positions.get(lecture['id'], ())) == placed_before: continue
+            _, day_idx, slot_idx = positions[lecture['id']][-1]
+            touched = [(day_idx, slot_idx)] + ([(day_idx, slot_idx + 1)] if slot_idx + 1 < len(self.slots) else [])
+            # تقديم أول يوم عمل للأستاذ قد يفتح فترات بداية الدوام لمحاضراته ذات البداية المتأخرة
+            restarted = set(by_teacher[teacher]) if bitsets.first_day(teacher) != first_day_before else ()
+
+            for j in pending:
+                if j in restarted and domains[j].dynamic_start:
+                    masks[j] = self._open_mask(domains[j], lectures[j])
+                else:
+                    mask = masks[j]
+                    for d, s in touched:
+                        bit = bitsets.bit(d, s)
+                        if mask & bit and not _slot_open_in_bitsets(domains[j], lectures[j], d, s, bitsets, self.consecutive_large_hall_rule):
+                            mask &= ~bit
+                    if mask == masks[j]: continue
+                    masks[j] = mask
+                new_count = bin(masks[j]).count('1')
+                if new_count != counts[j]:
+                    counts[j] = new_count
+                    heapq.heappush(heap, (new_count, j))
+        return failed
 
 # ====================== النسخة النهائية والمدمجة من دالة الطفرة (مع التصحيح) =======================
 # ====================== النسخة النهائية والمدمجة من دالة الطفرة (مع التصحيح) =======================
-def mutate(
-    schedule, all_lectures, days, slots, rooms_data, teachers, all_levels,
-    teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
-    globally_unavailable_slots, saturday_teachers, day_to_idx, 
-    level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule, 
-    prefer_morning_slots,
-    extra_teachers_on_hard_error,
-    soft_error_shake_probability,
-    stagnation_counter=0,
-    mutation_intensity=1.0, 
-    non_sharing_teacher_pairs=[]
-    ):
+def _select_teachers_to_shake(unplaced_lectures, diagnose, work_days, teachers, extra_teachers_on_hard_error,
+                              soft_error_shake_probability, stagnation_counter=0, mutation_intensity=1.0):
     """
-    تقوم بطفرة ذكية وموجهة (نسخة مدمجة):
-    - شدة متكيفة (Adaptive Intensity) بناءً على الركود.
-    - هزة مترابطة (Related Shake) لاستهداف ذكي.
-    - إصلاح بالندم (Regret Repair) لإعادة بناء فعالة.
+    اختيار الأساتذة الذين تُهز محاضراتهم في الطفرة (مشترك بين mutate و mutate_chromosome):
+    أستاذ مادة ناقصة إن وُجدت، وإلا أستاذ خطأ صارم مع أساتذة مرتبطين به، أو أستاذ خطأ مرن مع غيره.
+    diagnose() تعيد قائمة الأخطاء و work_days() أيام عمل كل أستاذ، وتُستدعيان عند الحاجة فقط.
     """
-    mutated_schedule = copy.deepcopy(schedule)
     teachers_to_shake = []
-
-    # --- 1. تشخيص الأخطاء ---
-    current_failures = calculate_schedule_cost(
-        mutated_schedule, days, slots, teachers, rooms_data, all_levels,
-        identifiers_by_level, special_constraints, teacher_constraints, 'allowed',
-        lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, [],
-        day_to_idx, rules_grid, {}, level_specific_large_rooms, 
-        specific_small_room_assignments, constraint_severities, max_sessions_per_day=99, 
-        consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-    )
-
-    scheduled_ids = {lec.get('id') for grid in mutated_schedule.values() for day in grid for slot in day for lec in slot}
-    unplaced_lectures = [lec for lec in all_lectures if lec.get('id') not in scheduled_ids and lec.get('teacher_name')]
-    
-    # --- 2. تحديد الأساتذة المستهدفين وآلية الهزة ---
     adaptive_bonus = stagnation_counter // 10
     
     base_intensity = math.ceil(mutation_intensity * extra_teachers_on_hard_error) if mutation_intensity > 1.0 else extra_teachers_on_hard_error
@@ -2415,6 +5175,7 @@ def mutate(
         teacher_name = random.choice(unplaced_lectures).get('teacher_name')
         if teacher_name: teachers_to_shake.append(teacher_name)
     else:
+        current_failures = diagnose()
         teachers_with_hard_errors = {err.get('teacher_name') for err in current_failures if err.get('teacher_name') and err.get('penalty', 1) >= 100}
         
         if teachers_with_hard_errors:
@@ -2423,12 +5184,7 @@ def mutate(
             
             final_intensity = base_intensity + adaptive_bonus
             
-            teacher_work_days = defaultdict(set)
-            for level_grid in mutated_schedule.values():
-                for d, day_slots in enumerate(level_grid):
-                    for lects in day_slots:
-                        for l in lects:
-                            if l.get('teacher_name'): teacher_work_days[l['teacher_name']].add(d)
+            teacher_work_days = work_days()
             main_teacher_days = teacher_work_days.get(main_teacher, set())
             related_teachers = [t['name'] for t in teachers if t['name'] != main_teacher and main_teacher_days.intersection(teacher_work_days.get(t['name'], set()))]
             unrelated_teachers = [t['name'] for t in teachers if t['name'] != main_teacher and t['name'] not in related_teachers]
@@ -2462,60 +5218,297 @@ def mutate(
             selected_teachers = random.sample(teachers, num_to_shake)
             teachers_to_shake = [t['name'] for t in selected_teachers]
 
+    return teachers_to_shake
+
+def mutate(
+    schedule, all_lectures, days, slots, rooms_data, teachers, all_levels,
+    teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
+    globally_unavailable_slots, saturday_teachers, day_to_idx, 
+    level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule, 
+    prefer_morning_slots,
+    extra_teachers_on_hard_error,
+    soft_error_shake_probability,
+    stagnation_counter=0,
+    mutation_intensity=1.0, 
+    non_sharing_teacher_pairs=[], model=None
+    ):
+    """
+    تقوم بطفرة ذكية وموجهة (نسخة مدمجة):
+    - شدة متكيفة (Adaptive Intensity) بناءً على الركود.
+    - هزة مترابطة (Related Shake) لاستهداف ذكي.
+    - إصلاح بالندم (Regret Repair) لإعادة بناء فعالة.
+    """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
+    mutated_schedule = copy.deepcopy(schedule)
+
+    # ✨ فهرس المواضع يُبنى مرة واحدة: منه المواد الناقصة، ومنه تُحذف مواد الهزة من خلاياها مباشرة
+    placed_index = PlacedLectureIndex(mutated_schedule)
+    unplaced_lectures = placed_index.unplaced(all_lectures)
+
+    # --- 1. تشخيص الأخطاء (لا يلزم إن وُجد نقص) ---
+    def diagnose():
+        return calculate_schedule_cost(
+            mutated_schedule, days, slots, teachers, rooms_data, all_levels,
+            identifiers_by_level, special_constraints, teacher_constraints, 'allowed',
+            lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, [],
+            day_to_idx, rules_grid, {}, level_specific_large_rooms, 
+            specific_small_room_assignments, constraint_severities, max_sessions_per_day=99, 
+            consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
+        )
+
+    def work_days():
+        teacher_work_days = defaultdict(set)
+        for level_grid in mutated_schedule.values():
+            for d, day_slots in enumerate(level_grid):
+                for lects in day_slots:
+                    for l in lects:
+                        if l.get('teacher_name'): teacher_work_days[l['teacher_name']].add(d)
+        return teacher_work_days
+
+    # --- 2. تحديد الأساتذة المستهدفين وآلية الهزة ---
+    teachers_to_shake = _select_teachers_to_shake(
+        unplaced_lectures, diagnose, work_days, teachers, extra_teachers_on_hard_error,
+        soft_error_shake_probability, stagnation_counter, mutation_intensity
+    )
+
     # --- 3. تنفيذ التدمير والإصلاح الموجه بالندم ---
     if not teachers_to_shake: return mutated_schedule
 
-    unique_teachers_to_shake = list(set(teachers_to_shake))
-    lectures_to_reinsert = [lec for lec in all_lectures if lec.get('teacher_name') in unique_teachers_to_shake]
-    if not lectures_to_reinsert: return mutated_schedule
+    unique_teachers_to_shake = list(set(teachers_to_shake))
+    lectures_to_reinsert = [lec for lec in all_lectures if lec.get('teacher_name') in unique_teachers_to_shake]
+    if not lectures_to_reinsert: return mutated_schedule
+
+    ids_to_remove = {lec['id'] for lec in lectures_to_reinsert}
+    placed_index.remove(mutated_schedule, ids_to_remove)
+
+    teacher_schedule_rebuild = defaultdict(set)
+    room_schedule_rebuild = defaultdict(set)
+    for grid in mutated_schedule.values():
+        for day_idx, day in enumerate(grid):
+            for slot_idx, lectures in enumerate(day):
+                for lec in lectures:
+                    if lec.get('teacher_name'): teacher_schedule_rebuild[lec['teacher_name']].add((day_idx, slot_idx))
+                    if lec.get('room'): room_schedule_rebuild[lec.get('room')].add((day_idx, slot_idx))
+
+    # ✨ أقنعة الإشغال تُبنى مرة واحدة وتُحدَّث مع كل إعادة إدراج
+    bitsets = OccupancyBitsets(mutated_schedule, teacher_schedule_rebuild, room_schedule_rebuild, model, len(slots), placed=placed_index, rooms_data=rooms_data)
+    # ✨ إصلاح بالندم عبر كومة أولويات تُحدَّث فقط للمحاضرات المتأثرة بكل وضع
+    RegretRepair(
+        mutated_schedule, teacher_schedule_rebuild, room_schedule_rebuild, days, slots, rules_grid, rooms_data,
+        teacher_constraints, globally_unavailable_slots, special_constraints, identifiers_by_level,
+        saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments,
+        consecutive_large_hall_rule, prefer_morning_slots, bitsets=bitsets, model=model
+    ).repair(lectures_to_reinsert)
+
+    return mutated_schedule
+
+
+def mutate_chromosome(
+    codec, chromosome, days, slots, rooms_data, teachers, all_levels,
+    teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
+    globally_unavailable_slots, saturday_teachers, day_to_idx,
+    level_specific_large_rooms, specific_small_room_assignments, constraint_severities, consecutive_large_hall_rule,
+    prefer_morning_slots,
+    extra_teachers_on_hard_error,
+    soft_error_shake_probability,
+    stagnation_counter=0,
+    mutation_intensity=1.0,
+    non_sharing_teacher_pairs=[], model=None
+    ):
+    """
+    نفس طفرة mutate لكروموسوم Chromosome من المرمِّز codec، وتعيد كروموسوماً جديداً:
+    - المواد الناقصة وأيام عمل الأساتذة وإشغال الأساتذة والقاعات تُقرأ من مصفوفتي المواضع والقاعات.
+    - الهزة تفريغ خانات محاضرات الأساتذة المختارين في المصفوفتين.
+    - يُفك الترميز لتشخيص الأخطاء (عند عدم وجود نقص) وللإصلاح بالندم فقط، ثم تُكتب مواضع المحاضرات
+      المعاد إدراجها وحدها في المصفوفتين دون إعادة ترميز الجدول.
+    """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
+    mutated = chromosome.copy()
+    positions, rooms = mutated.positions, mutated.rooms
+    lectures, num_slots = codec.lectures, codec.num_slots
+    unplaced_lectures = [lectures[i] for i in np.flatnonzero(codec.required & (positions < 0))]
+    decoded = {}
+
+    def diagnose():
+        decoded['schedule'] = codec.decode(mutated)
+        return calculate_schedule_cost(
+            decoded['schedule'], days, slots, teachers, rooms_data, all_levels,
+            identifiers_by_level, special_constraints, teacher_constraints, 'allowed',
+            lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, [],
+            day_to_idx, rules_grid, {}, level_specific_large_rooms,
+            specific_small_room_assignments, constraint_severities, max_sessions_per_day=99,
+            consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
+        )
+
+    def work_days():
+        teacher_work_days = defaultdict(set)
+        for i in np.flatnonzero(positions >= 0):
+            if lectures[i].get('teacher_name'): teacher_work_days[lectures[i]['teacher_name']].add(int(positions[i]) // num_slots)
+        return teacher_work_days
+
+    teachers_to_shake = set(_select_teachers_to_shake(
+        unplaced_lectures, diagnose, work_days, teachers, extra_teachers_on_hard_error,
+        soft_error_shake_probability, stagnation_counter, mutation_intensity
+    ))
+    reinsert = [i for i, lec in enumerate(lectures) if lec.get('teacher_name') in teachers_to_shake]
+    if not reinsert: return mutated
+
+    # الهزة على المصفوفتين؛ الجدول المفكوك للتشخيص (إن وُجد) تُحذف منه نفس المحاضرات
+    positions[reinsert] = -1
+    rooms[reinsert] = -1
+    if 'schedule' in decoded:
+        schedule = decoded['schedule']
+        placed_index = PlacedLectureIndex(schedule)
+        placed_index.remove(schedule, {lectures[i]['id'] for i in reinsert})
+    else:
+        schedule = codec.decode(mutated)
+        placed_index = PlacedLectureIndex(schedule)
+
+    teacher_schedule_rebuild = defaultdict(set)
+    room_schedule_rebuild = defaultdict(set)
+    for i in np.flatnonzero(positions >= 0):
+        slot = divmod(int(positions[i]), num_slots)
+        if lectures[i].get('teacher_name'): teacher_schedule_rebuild[lectures[i]['teacher_name']].add(slot)
+        if rooms[i] >= 0: room_schedule_rebuild[codec.room_names[rooms[i]]].add(slot)
+
+    bitsets = OccupancyBitsets(schedule, teacher_schedule_rebuild, room_schedule_rebuild, model, len(slots), placed=placed_index, rooms_data=rooms_data)
+    RegretRepair(
+        schedule, teacher_schedule_rebuild, room_schedule_rebuild, days, slots, rules_grid, rooms_data,
+        teacher_constraints, globally_unavailable_slots, special_constraints, identifiers_by_level,
+        saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments,
+        consecutive_large_hall_rule, prefer_morning_slots, bitsets=bitsets, model=model
+    ).repair([lectures[i] for i in reinsert])
+
+    # كتابة المواضع الجديدة للمحاضرات المعاد إدراجها فقط
+    for i in reinsert:
+        cells = placed_index.positions.get(lectures[i]['id'])
+        if not cells: continue
+        level, day_idx, slot_idx = cells[-1]
+        placement = next(lec for lec in schedule[level][day_idx][slot_idx] if lec.get('id') == lectures[i]['id'])
+        positions[i] = day_idx * num_slots + slot_idx
+        rooms[i] = codec._room_id(placement.get('room'))
+    return mutated
+    
+# ======================== بداية الدالة المساعدة الجديدة ========================
+def _greedy_single_start(context, scheduling_state):
+    """
+    تشغيل طماع واحد من الجدول المبدئي حسب context (قاموس يجمع إعدادات run_greedy_search_for_best_result).
+    يستعمل random العام، فيُهيَّأ بذرة التشغيل قبل استدعائها. تعيد (الجدول، الأخطاء، عدد المواد الناقصة).
+    يتفقد scheduling_state['should_stop'] قبل كل محاضرة ويرفع StopByUserException عند طلب الإيقاف.
+    """
+    days, slots, rooms_data, teachers, all_levels = context['days'], context['slots'], context['rooms_data'], context['teachers'], context['all_levels']
+    teacher_constraints, special_constraints = context['teacher_constraints'], context['special_constraints']
+    identifiers_by_level, model = context['identifiers_by_level'], context['model']
+    base_initial_schedule = context['base_initial_schedule']
+
+    # في كل محاولة، ابدأ من الجدول المبدئي (الذي قد يحتوي على مواد مثبتة)
+    current_schedule = copy.deepcopy(base_initial_schedule) if base_initial_schedule else {level: [[[] for _ in slots] for _ in days] for level in all_levels}
+    current_teacher_schedule = {t['name']: set() for t in teachers}
+    current_room_schedule = {r['name']: set() for r in rooms_data}
+
+    # إعادة بناء جداول الحجوزات من الجدول المبدئي
+    for grid in current_schedule.values():
+        for d_idx, day in enumerate(grid):
+            for s_idx, lectures in enumerate(day):
+                for lec in lectures:
+                    if lec.get('teacher_name'): current_teacher_schedule[lec['teacher_name']].add((d_idx, s_idx))
+                    if lec.get('room'): current_room_schedule[lec.get('room')].add((d_idx, s_idx))
+    current_bitsets = OccupancyBitsets(current_schedule, current_teacher_schedule, current_room_schedule, model, len(slots), rooms_data=rooms_data)
+
+    current_failures = []
+    current_unplaced_count = 0
+
+    for lecture in context['lectures_sorted']:
+        if scheduling_state.get('should_stop'):
+            raise StopByUserException()
+        # نتأكد من عدم جدولة المواد المثبتة مرة أخرى (من فهرس المواضع بدل المرور على الجدول)
+        if lecture['id'] in current_bitsets.placed:
+            continue
+
+        success, message = find_slot_for_single_lecture(
+            lecture, current_schedule, current_teacher_schedule, current_room_schedule,
+            days, slots, context['rules_grid'], rooms_data,
+            teacher_constraints, context['globally_unavailable_slots'], special_constraints,
+            context['primary_slots'], context['reserve_slots'], identifiers_by_level,
+            context['prioritize_primary'], context['saturday_teachers'], context['day_to_idx'], context['level_specific_large_rooms'],
+            context['specific_small_room_assignments'], context['consecutive_large_hall_rule'],
+            prefer_morning_slots=context['prefer_morning_slots'], bitsets=current_bitsets, model=model
+        )
+        if not success:
+            current_unplaced_count += 1
+            current_failures.append({
+                "course_name": lecture.get('name'), "teacher_name": lecture.get('teacher_name'),
+                "reason": message
+            })
+
+    greedy_validation_failures = validate_teacher_constraints_in_solution(
+        current_teacher_schedule, special_constraints, teacher_constraints,
+        context['lectures_by_teacher_map'], context['distribution_rule_type'], context['saturday_teachers'],
+        context['teacher_pairs'], context['day_to_idx'], {}, len(slots), context['constraint_severities'],
+        max_sessions_per_day=None, non_sharing_teacher_pairs=context['non_sharing_teacher_pairs'], model=model
+    )
+    current_failures.extend(greedy_validation_failures)
+    return current_schedule, current_failures, current_unplaced_count
+
+
+# حالة العامل داخل كل عملية فرعية: آخر سياق فُكَّ (يُعاد فكه مع نموذجه عند تغيّر السياق فقط) وحدث الإيقاف المشترك
+_GREEDY_WORKER_STATE = {'context_id': None, 'context': None, 'stop_event': None}
+
+def _greedy_worker_init(stop_event):
+    _GREEDY_WORKER_STATE['stop_event'] = stop_event
 
-    ids_to_remove = {lec['id'] for lec in lectures_to_reinsert}
-    for level_grid in mutated_schedule.values():
-        for day_slots in level_grid:
-            for slot_lectures in day_slots:
-                slot_lectures[:] = [lec for lec in slot_lectures if lec.get('id') not in ids_to_remove]
+def _greedy_shared_objects(mp_context):
+    """حدث الإيقاف المشترك بين عمليات الطماع (إلغاء المهام المنتظرة لا يوقف التي بدأت)."""
+    return (mp_context.Event(),)
 
-    teacher_schedule_rebuild = defaultdict(set)
-    room_schedule_rebuild = defaultdict(set)
-    for grid in mutated_schedule.values():
-        for day_idx, day in enumerate(grid):
-            for slot_idx, lectures in enumerate(day):
-                for lec in lectures:
-                    if lec.get('teacher_name'): teacher_schedule_rebuild[lec['teacher_name']].add((day_idx, slot_idx))
-                    if lec.get('room'): room_schedule_rebuild[lec.get('room')].add((day_idx, slot_idx))
+class _GreedyStopState:
+    """بديل scheduling_state داخل عامل الطماع: should_stop تقرأ حدث الإيقاف المشترك."""
+    def get(self, key, default=None):
+        if key == 'should_stop': return _GREEDY_WORKER_STATE['stop_event'].is_set()
+        return default
 
-    all_possible_slots = [(d, s) for d in range(len(days)) for s in range(len(slots))]
-    kwargs_for_regret = {
-        "rooms_data": rooms_data, "teacher_constraints": teacher_constraints, "special_constraints": special_constraints,
-        "identifiers_by_level": identifiers_by_level, "rules_grid": rules_grid, "globally_unavailable_slots": globally_unavailable_slots,
-        "saturday_teachers": saturday_teachers, "day_to_idx": day_to_idx, "level_specific_large_rooms": level_specific_large_rooms,
-        "specific_small_room_assignments": specific_small_room_assignments, "consecutive_large_hall_rule": consecutive_large_hall_rule
-    }
+def _greedy_start_in_worker(context_id, payload, run_seed):
+    """
+    نقطة دخول التشغيل الطماع داخل عملية فرعية؛ payload هو السياق مُسلسلاً بـ pickle.
+    تعيد None إن أُوقف التشغيل بحدث الإيقاف قبل اكتماله.
+    """
+    state = _GREEDY_WORKER_STATE
+    if state['context_id'] != context_id:
+        context = pickle.loads(payload)
+        activate_fitness_cache(None)
+        activate_teacher_validation_cache(None)
+        activate_evaluation_profiler(None)
+        # النموذج يصل بإعداداته فقط (نفس كائنات السياق بعد الفك)، فتُحسب نطاقاته هنا مرة واحدة لكل سياق
+        context['model'].presolve(context['lectures_sorted'], len(context['days']), len(context['slots']))
+        state['context_id'], state['context'] = context_id, context
+    random.seed(run_seed)
+    try:
+        return _greedy_single_start(state['context'], _GreedyStopState())
+    except StopByUserException:
+        return None
+
+def _reintern_schedule(schedule, model):
+    """استبدال وضعيات جدول عائد من عملية فرعية بوضعيات النموذج المشتركة (مع إبقاء المشاركة بين المستويات)."""
+    interned = {}
+    for grid in schedule.values():
+        for day in grid:
+            for cell in day:
+                cell[:] = [
+                    interned.setdefault(id(lec), Placement.of(lec.to_dict(), lec.room, model=model)) if type(lec) is Placement else lec
+                    for lec in cell
+                ]
+    return schedule
 
-    while lectures_to_reinsert:
-        lecture_with_regret = []
-        for lec in lectures_to_reinsert:
-            regret_score = _calculate_lecture_regret(
-                lec, mutated_schedule, teacher_schedule_rebuild, room_schedule_rebuild, all_possible_slots, **kwargs_for_regret
-            )
-            lecture_with_regret.append((lec, regret_score))
-        
-        lecture_with_regret.sort(key=lambda x: x[1])
-        most_constrained_lecture = lecture_with_regret[0][0]
-
-        find_slot_for_single_lecture(
-            most_constrained_lecture, mutated_schedule, teacher_schedule_rebuild, room_schedule_rebuild, 
-            days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, 
-            special_constraints, [], all_possible_slots, identifiers_by_level,
-            True, saturday_teachers, day_to_idx, level_specific_large_rooms, 
-            specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots
-        )
-        
-        lectures_to_reinsert = [lec for lec in lectures_to_reinsert if lec['id'] != most_constrained_lecture['id']]
-        
-    return mutated_schedule
-    
-# ======================== بداية الدالة المساعدة الجديدة ========================
 def run_greedy_search_for_best_result(
     log_q, lectures_sorted, days, slots, rules_grid, rooms_data, teachers, all_levels,
     teacher_constraints, globally_unavailable_slots, special_constraints,
@@ -2525,79 +5518,395 @@ def run_greedy_search_for_best_result(
     lectures_by_teacher_map, distribution_rule_type, teacher_pairs,
     constraint_severities, non_sharing_teacher_pairs,
     # معامل جديد لاستقبال الجدول المبدئي (مع المواد المثبتة)
-    base_initial_schedule=None
+    base_initial_schedule=None,
+    num_starts=30, master_seed=None, max_workers=None, model=None, scheduling_state=None
 ):
     """
-    تقوم بتشغيل الخوارزمية الطماعة 10 مرات وتختار أفضل نتيجة من حيث عدد المواد الناقصة ثم عدد الأخطاء.
+    تقوم بتشغيل الخوارزمية الطماعة num_starts مرة وتختار أفضل نتيجة من حيث عدد المواد الناقصة ثم عدد الأخطاء.
+    - لكل تشغيل بذرة خاصة مشتقة من master_seed (أو من random العام إن كانت None)، فالنتيجة محددة لنفس البذرة.
+    - تُوزَّع التشغيلات على max_workers عملية (None: GREEDY_DEFAULT_WORKERS، ولا تتجاوز عدد المعالجات)، وتُدمج
+      النتائج بترتيب التشغيلات فلا يؤثر ترتيب انتهائها؛ 1 أو فشل المجمّع يعني التشغيل المتتالي في نفس العملية.
+    - يتوقف البحث عند أول تشغيل (بالترتيب) بلا مواد ناقصة ولا أخطاء، وتتوقف التشغيلات الجارية في العمال معه.
+    - scheduling_state['should_stop'] يرفع StopByUserException بعد إيقاف العمال.
     """
+    if scheduling_state is None: scheduling_state = {}
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
     best_result = {
         "schedule": {level: [[[] for _ in slots] for _ in days] for level in all_levels},
         "failures": [],
         "unplaced_count": float('inf')
     }
-    num_of_runs = 30
-    
-    for run in range(num_of_runs):
-        # في كل محاولة، ابدأ من الجدول المبدئي (الذي قد يحتوي على مواد مثبتة)
-        current_schedule = copy.deepcopy(base_initial_schedule) if base_initial_schedule else {level: [[[] for _ in slots] for _ in days] for level in all_levels}
-        current_teacher_schedule = {t['name']: set() for t in teachers}
-        current_room_schedule = {r['name']: set() for r in rooms_data}
-        
-        # إعادة بناء جداول الحجوزات من الجدول المبدئي
-        for grid in current_schedule.values():
-            for d_idx, day in enumerate(grid):
-                for s_idx, lectures in enumerate(day):
-                    for lec in lectures:
-                        if lec.get('teacher_name'): current_teacher_schedule[lec['teacher_name']].add((d_idx, s_idx))
-                        if lec.get('room'): current_room_schedule[lec.get('room')].add((d_idx, s_idx))
+    num_of_runs = max(1, int(num_starts))
+    if master_seed is None: master_seed = random.getrandbits(64)
+    seed_rng = random.Random(master_seed)
+    run_seeds = [seed_rng.getrandbits(64) for _ in range(num_of_runs)]
+
+    context = {
+        'lectures_sorted': lectures_sorted, 'days': days, 'slots': slots, 'rules_grid': rules_grid, 'rooms_data': rooms_data,
+        'teachers': teachers, 'all_levels': all_levels, 'teacher_constraints': teacher_constraints,
+        'globally_unavailable_slots': globally_unavailable_slots, 'special_constraints': special_constraints,
+        'primary_slots': primary_slots, 'reserve_slots': reserve_slots, 'identifiers_by_level': identifiers_by_level,
+        'prioritize_primary': prioritize_primary, 'saturday_teachers': saturday_teachers, 'day_to_idx': day_to_idx,
+        'level_specific_large_rooms': level_specific_large_rooms, 'specific_small_room_assignments': specific_small_room_assignments,
+        'consecutive_large_hall_rule': consecutive_large_hall_rule, 'prefer_morning_slots': prefer_morning_slots,
+        'lectures_by_teacher_map': lectures_by_teacher_map, 'distribution_rule_type': distribution_rule_type,
+        'teacher_pairs': teacher_pairs, 'constraint_severities': constraint_severities,
+        'non_sharing_teacher_pairs': non_sharing_teacher_pairs, 'base_initial_schedule': base_initial_schedule,
+        'model': model,
+    }
 
-        current_failures = []
-        current_unplaced_count = 0
+    workers = min(num_of_runs, os.cpu_count() or 1, max_workers if max_workers is not None else GREEDY_DEFAULT_WORKERS)
+    futures = stop_event = None
+    if workers > 1:
+        try:
+            context_id = _next_process_pool_run_id()
+            payload = pickle.dumps(context, protocol=pickle.HIGHEST_PROTOCOL)
+            pool_state = _spawn_process_pool('greedy', workers, _greedy_worker_init, _greedy_shared_objects)
+            pool, (stop_event,) = pool_state['executor'], pool_state['shared']
+            stop_event.clear()
+            futures = [pool.submit(_greedy_start_in_worker, context_id, payload, seed) for seed in run_seeds]
+        except Exception as e:
+            log_q.put(f"   - تعذر توزيع المحاولات الطماعة على عدة عمليات ({e})، سيتم تشغيلها بالتتابع.")
+            _shutdown_process_pool('greedy')
+            futures = None
+
+    def sequential_run(run_seed):
+        # نفس تهيئة العامل، مع إرجاع حالة random العامة كما كانت
+        saved_state = random.getstate()
+        random.seed(run_seed)
+        try:
+            return _greedy_single_start(context, scheduling_state)
+        finally:
+            random.setstate(saved_state)
 
-        for lecture in lectures_sorted:
-            # نتأكد من عدم جدولة المواد المثبتة مرة أخرى
-            is_already_placed = any(lec.get('id') == lecture['id'] for grid in current_schedule.values() for day in grid for slot in day for lec in slot)
-            if is_already_placed:
-                continue
+    def pool_result(future):
+        # انتظار على دفعات حتى يُلاحَظ زر الإيقاف والعمال مشغولون
+        while not wait([future], timeout=GREEDY_STOP_POLL_SECONDS).done:
+            if scheduling_state.get('should_stop'): stop_event.set()
+        return future.result()
 
-            success, message = find_slot_for_single_lecture(
-                lecture, current_schedule, current_teacher_schedule, current_room_schedule,
-                days, slots, rules_grid, rooms_data,
-                teacher_constraints, globally_unavailable_slots, special_constraints,
-                primary_slots, reserve_slots, identifiers_by_level,
-                prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms,
-                specific_small_room_assignments, consecutive_large_hall_rule,
-                prefer_morning_slots=prefer_morning_slots
-            )
-            if not success:
-                current_unplaced_count += 1
-                current_failures.append({
-                    "course_name": lecture.get('name'), "teacher_name": lecture.get('teacher_name'),
-                    "reason": message
-                })
+    try:
+        for run in range(num_of_runs):
+            if scheduling_state.get('should_stop'):
+                raise StopByUserException()
+            if futures is not None:
+                try:
+                    result = pool_result(futures[run])
+                    if result is None: raise StopByUserException()
+                    current_schedule, current_failures, current_unplaced_count = result
+                    current_schedule = _reintern_schedule(current_schedule, model)
+                except StopByUserException:
+                    raise
+                except Exception as e:
+                    log_q.put(f"   - توقف مجمّع العمليات ({e})، ستُكمل المحاولات الطماعة بالتتابع.")
+                    for future in futures: future.cancel()
+                    _shutdown_process_pool('greedy')
+                    futures = None
+            if futures is None:
+                current_schedule, current_failures, current_unplaced_count = sequential_run(run_seeds[run])
+
+            log_q.put(f"   - المحاولة الطماعة {run + 1}/{num_of_runs}: اكتملت مع {current_unplaced_count} مواد ناقصة.")
+
+            if current_unplaced_count < best_result['unplaced_count'] or \
+               (current_unplaced_count == best_result['unplaced_count'] and len(current_failures) < len(best_result['failures'])):
+                if current_unplaced_count < best_result['unplaced_count']:
+                     log_q.put(f"   >>> نتيجة أفضل! تم تقليل النقص إلى {current_unplaced_count}.")
+
+                best_result['unplaced_count'] = current_unplaced_count
+                best_result['schedule'] = current_schedule
+                best_result['failures'] = current_failures
+
+            if current_unplaced_count == 0 and not current_failures:
+                if run + 1 < num_of_runs:
+                    log_q.put(f"   >>> حل كامل بلا أخطاء، تم إيقاف المحاولات الطماعة المتبقية.")
+                break
+    finally:
+        if futures is not None:
+            # الإلغاء يكفي للمهام المنتظرة؛ الجارية تتوقف عند تفقدها حدث الإيقاف قبل المحاضرة التالية
+            stop_event.set()
+            for future in futures: future.cancel()
+            wait(futures)
 
-        greedy_validation_failures = validate_teacher_constraints_in_solution(
-            current_teacher_schedule, special_constraints, teacher_constraints,
-            lectures_by_teacher_map, distribution_rule_type, saturday_teachers,
-            teacher_pairs, day_to_idx, {}, len(slots), constraint_severities,
-            max_sessions_per_day=None, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-        )
-        current_failures.extend(greedy_validation_failures)
+    return best_result['schedule'], best_result['failures']
+# ========================= نهاية الدالة المساعدة الجديدة =========================
 
-        log_q.put(f"   - المحاولة الطماعة {run + 1}/{num_of_runs}: اكتملت مع {current_unplaced_count} مواد ناقصة.")
-        time.sleep(0.05)
+# ================== محرك CP-SAT (OR-Tools) ==================
+class _CpSatProgress(cp_model.CpSolverSolutionCallback):
+    """يبث كل حل أفضل يجده CP-SAT كلياقة (نقص، صارم، مرن) عبر طابور السجل."""
+    def __init__(self, log_q, unplaced_vars, penalty_terms):
+        super().__init__()
+        self.log_q = log_q
+        self.unplaced_vars, self.penalty_terms = unplaced_vars, penalty_terms
+        self.solutions = 0
 
-        if current_unplaced_count < best_result['unplaced_count'] or \
-           (current_unplaced_count == best_result['unplaced_count'] and len(current_failures) < len(best_result['failures'])):
-            if current_unplaced_count < best_result['unplaced_count']:
-                 log_q.put(f"   >>> نتيجة أفضل! تم تقليل النقص إلى {current_unplaced_count}.")
-            
-            best_result['unplaced_count'] = current_unplaced_count
-            best_result['schedule'] = copy.deepcopy(current_schedule)
-            best_result['failures'] = copy.deepcopy(current_failures)
+    def on_solution_callback(self):
+        self.solutions += 1
+        unplaced = sum(self.Value(var) for var in self.unplaced_vars)
+        hard = sum(self.Value(var) for var, penalty in self.penalty_terms if penalty >= 100)
+        soft = sum(self.Value(var) for var, penalty in self.penalty_terms if penalty < 100)
+        self.log_q.put(f"   - CP-SAT: حل #{self.solutions} بعد {self.WallTime():.1f} ثانية. لياقة (نقص, صارم, مرن)=({unplaced}, {hard}, {soft})")
+
+
+def run_cp_sat_solver(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, time_limit=30, num_workers=None, max_sessions_per_day=None, consecutive_large_hall_rule="none", prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], model=None):
+    """
+    جدولة كل المحاضرات بنموذج CP-SAT واحد:
+    - متغير منطقي لكل (محاضرة، يوم، فترة) يسمح بها النطاق الثابت (قواعد الفترات وأنواع القاعات، الأيام اليدوية،
+      السبت، فترات الراحة)، ومتغير "نقص" لكل محاضرة. المحاضرة المشتركة متغير واحد لكل مستوياتها.
+    - القيود الصارمة: تعارض الأستاذ، القاعة المحددة، عدد قاعات كل نوع في الفترة، انفراد القاعة الكبيرة بالمستوى،
+      والمعرفات.
+    - الأيام اليدوية للأساتذة قيد صارم.
+    - قيود الأساتذة وتوالي القاعات الكبيرة متغيرات مخالفة موزونة بعقوبات constraint_severities في الهدف (مع 1000 لكل نقص).
+    قاعات النوع الواحد متكافئة في النموذج فتُسند بعد الحل (القاعة المحددة أولاً، وتجنب توالي القاعات الكبيرة)؛
+    المحاضرة التي لا تبقى لها قاعة شاغرة تبقى ناقصة ويُسجَّل ذلك.
+    """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    num_days, num_slots = len(days), len(slots)
+    penalties = model.penalties
+    # ✨ أسماء قاعات فريدة لكل نوع: الاسم المكرر في rooms_data (ولو بنوع آخر) يُحتسب مرة واحدة بنوعه الأول كما في FreeRoomPool،
+    # فسعة كل نوع في النموذج هي عدد القاعات التي يمكن إسنادها فعلاً بعد الحل
+    rooms_in_order, seen_rooms = defaultdict(list), set()
+    for room in rooms_data:
+        if room.get('name') in seen_rooms: continue
+        seen_rooms.add(room.get('name'))
+        rooms_in_order[room.get('type')].append(room.get('name'))
+    all_slots = [(day_idx, slot_idx) for day_idx in range(num_days) for slot_idx in range(num_slots)]
+    log_q.put('--- CP-SAT: بناء النموذج ---')
+
+    cp_sat = cp_model.CpModel()
+    domains, placement_vars, unplaced_vars = {}, {}, []
+    penalty_terms = []  # (متغير المخالفة، عقوبته)
+    by_teacher_slot, by_teacher_day = defaultdict(list), defaultdict(list)
+    by_level_slot, large_by_level_slot, by_identifier_slot = defaultdict(list), defaultdict(list), defaultdict(list)
+    by_type_slot, by_hall_slot = defaultdict(list), defaultdict(list)
+    bound_large_hall_by_level_slot = defaultdict(list)  # ✨ (مستوى، يوم، فترة، قاعة كبيرة) ← متغيرات لا قاعة لها غيرها
+
+    for lecture in lectures_to_schedule:
+        lecture_id, teacher = lecture['id'], lecture.get('teacher_name')
+        domain = domains[lecture_id] = model.domain(lecture)
+        choices = []
+        for day_idx, slot_idx in domain.allowed_slots(all_slots):
+            var = placement_vars[(lecture_id, day_idx, slot_idx)] = cp_sat.NewBoolVar(f"x_{lecture_id}_{day_idx}_{slot_idx}")
+            choices.append(var)
+            by_teacher_slot[(teacher, day_idx, slot_idx)].append(var)
+            by_teacher_day[(teacher, day_idx)].append(var)
+            by_type_slot[(domain.room_type, day_idx, slot_idx)].append(var)
+            candidate_halls, specific_hall = domain.rooms(day_idx, slot_idx)
+            if specific_hall: by_hall_slot[(specific_hall, day_idx, slot_idx)].append(var)
+            bound_hall = specific_hall or (candidate_halls[0] if len(candidate_halls) == 1 else None)
+            for level in domain.levels:
+                by_level_slot[(level, day_idx, slot_idx)].append(var)
+                if domain.room_type == 'كبيرة': large_by_level_slot[(level, day_idx, slot_idx)].append(var)
+                if domain.room_type == 'كبيرة' and bound_hall and consecutive_large_hall_rule in ('all', bound_hall):
+                    bound_large_hall_by_level_slot[(level, day_idx, slot_idx, bound_hall)].append(var)
+                if domain.identifiers[level]: by_identifier_slot[(level, domain.identifiers[level], day_idx, slot_idx)].append(var)
+        unplaced = cp_sat.NewBoolVar(f"unplaced_{lecture_id}")
+        cp_sat.AddExactlyOne(choices + [unplaced])
+        unplaced_vars.append(unplaced)
+
+    # --- القيود الصارمة ---
+    for group in list(by_teacher_slot.values()) + list(by_hall_slot.values()) + list(by_identifier_slot.values()):
+        if len(group) > 1: cp_sat.AddAtMostOne(group)
+    for (room_type, day_idx, slot_idx), group in by_type_slot.items():
+        cp_sat.Add(sum(group) <= len(rooms_in_order.get(room_type, ())))
+    for key, group in by_level_slot.items():
+        large = large_by_level_slot.get(key)
+        # محاضرة في قاعة كبيرة تنفرد بفترة المستوى: المجموع + (n-1) × الكبيرة <= n
+        if large and len(group) > 1: cp_sat.Add(sum(group) + (len(group) - 1) * sum(large) <= len(group))
+
+    # --- قيود الأساتذة (مخالفات موزونة) ---
+    work_days = {}
+    def works(teacher, day_idx):
+        key = (teacher, day_idx)
+        if key not in work_days:
+            var = work_days[key] = cp_sat.NewBoolVar(f"w_{len(work_days)}")
+            day_vars = by_teacher_day.get(key)
+            if day_vars: cp_sat.AddMaxEquality(var, day_vars)
+            else: cp_sat.Add(var == 0)
+        return work_days[key]
+
+    def violation(penalty):
+        var = cp_sat.NewBoolVar(f"v_{len(penalty_terms)}")
+        penalty_terms.append((var, penalty))
+        return var
+
+    scheduled_teachers = sorted({lec.get('teacher_name') for lec in lectures_to_schedule if lec.get('teacher_name')})
+    for teacher, restriction in (last_slot_restrictions or {}).items():
+        restricted_indices = []
+        if restriction == 'last_1' and num_slots >= 1: restricted_indices = [num_slots - 1]
+        elif restriction == 'last_2' and num_slots >= 2: restricted_indices = [num_slots - 1, num_slots - 2]
+        restricted_vars = [var for day_idx in range(num_days) for slot_idx in restricted_indices for var in by_teacher_slot.get((teacher, day_idx, slot_idx), [])]
+        if restricted_vars:
+            broken = violation(penalties['last_slot'])
+            for var in restricted_vars: cp_sat.AddImplication(var, broken)
+
+    if max_sessions_per_day:
+        for (teacher, day_idx), day_vars in by_teacher_day.items():
+            if len(day_vars) > max_sessions_per_day:
+                broken = violation(penalties['max_sessions'])
+                cp_sat.Add(sum(day_vars) <= max_sessions_per_day + (len(day_vars) - max_sessions_per_day) * broken)
+
+    # ✨ الأيام اليدوية صارمة دائماً (عقوبتها 100 في التحقق) حتى لو قدّم النطاق الثابت قيد الفترات 2-4 عليها
+    for teacher in scheduled_teachers:
+        allowed_days = teacher_constraints.get(teacher, {}).get('allowed_days')
+        if not allowed_days: continue
+        for day_idx in range(num_days):
+            if day_idx not in allowed_days: cp_sat.Add(works(teacher, day_idx) == 0)
+
+    for teacher in scheduled_teachers:
+        prof_constraints = special_constraints.get(teacher)
+        if prof_constraints is None or teacher_constraints.get(teacher, {}).get('allowed_days'): continue
+        day_flags = [works(teacher, day_idx) for day_idx in range(num_days)]
+
+        # أوقات البدء والانتهاء في أول وآخر يوم عمل فعلي (مرنة عند غياب الأيام اليدوية، وعقوبتها 1)
+        if not prof_constraints.get('always_s2_to_s4'):
+            for flag, first_allowed in (('start_d1_s2', 1), ('start_d1_s3', 2)):
+                if not prof_constraints.get(flag): continue
+                broken = violation(1)
+                for day_idx in range(num_days):
+                    for slot_idx in range(min(first_allowed, num_slots)):
+                        for var in by_teacher_slot.get((teacher, day_idx, slot_idx), []):
+                            cp_sat.Add(var <= broken + sum(day_flags[:day_idx]))
+            for flag, last_allowed in (('end_s3', 2), ('end_s4', 3)):
+                if not prof_constraints.get(flag): continue
+                broken = violation(1)
+                for day_idx in range(num_days):
+                    for slot_idx in range(last_allowed + 1, num_slots):
+                        for var in by_teacher_slot.get((teacher, day_idx, slot_idx), []):
+                            cp_sat.Add(var <= broken + sum(day_flags[day_idx + 1:]))
+
+        target_days, needs_consecutive_days = model.distribution_target(teacher)
+        if target_days == 0: continue
+        if distribution_rule_type == 'required':
+            cp_sat.Add(sum(day_flags) == target_days).OnlyEnforceIf(violation(penalties['distribution_required']).Not())
+        elif distribution_rule_type == 'allowed':
+            cp_sat.Add(sum(day_flags) <= target_days).OnlyEnforceIf(violation(penalties['distribution']).Not())
+        if needs_consecutive_days:
+            broken = violation(penalties['distribution'])
+            for first in range(num_days):
+                for middle in range(first + 1, num_days):
+                    for last in range(middle + 1, num_days):
+                        cp_sat.AddBoolOr([day_flags[first].Not(), day_flags[middle], day_flags[last].Not(), broken])
+
+    for t1, t2 in teacher_pairs:
+        broken = violation(penalties['teacher_pairs'])
+        for day_idx in range(num_days):
+            cp_sat.AddBoolOr([works(t1, day_idx).Not(), works(t2, day_idx), broken])
+            cp_sat.AddBoolOr([works(t2, day_idx).Not(), works(t1, day_idx), broken])
+    for t1, t2 in non_sharing_teacher_pairs:
+        broken = violation(penalties['non_sharing_days'])
+        for day_idx in range(num_days):
+            cp_sat.AddBoolOr([works(t1, day_idx).Not(), works(t2, day_idx).Not(), broken])
+
+    # ✨ توالي القاعات الكبيرة: مخالفة لكل (مستوى، يوم، فترتين متتاليتين، قاعة) حين لا يبقى للمحاضرتين إلا القاعة نفسها؛
+    # أما المحاضرات ذات القاعات البديلة فيتجنب إسناد القاعات بعد الحل التوالي فيها قدر الإمكان
+    if consecutive_large_hall_rule != 'none':
+        for (level, day_idx, slot_idx, hall), current in bound_large_hall_by_level_slot.items():
+            previous = bound_large_hall_by_level_slot.get((level, day_idx, slot_idx - 1, hall))
+            if previous:
+                broken = violation(penalties['consecutive_halls'])
+                cp_sat.Add(sum(current) + sum(previous) <= 1 + broken)
+
+    if prefer_morning_slots and num_slots > 1:
+        # تقريب قيد ضغط الحصص: كل محاضرة في الفترة الأخيرة مخالفة (لكل مستوى من مستوياتها)
+        for (lecture_id, day_idx, slot_idx), var in placement_vars.items():
+            if slot_idx == num_slots - 1:
+                for _ in domains[lecture_id].levels: penalty_terms.append((var, penalties['prefer_morning']))
+
+    cp_sat.Minimize(1000 * sum(unplaced_vars) + sum(penalty * var for var, penalty in penalty_terms))
+
+    # --- الحل ---
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = float(time_limit)
+    solver.parameters.num_search_workers = num_workers or os.cpu_count() or 1
+    log_q.put(f"--- CP-SAT: {len(placement_vars)} متغير وضع، {len(penalty_terms)} مخالفة موزونة، {solver.parameters.num_search_workers} عمليات بحث، مهلة {time_limit} ثانية ---")
+
+    # الإيقاف اليدوي يُفحص في خيط مراقب لأن استدعاء الحلول لا يُنفَّذ إلا عند إيجاد حل
+    search_done = threading.Event()
+    def watch_stop_flag():
+        while not search_done.wait(0.2):
+            if scheduling_state.get('should_stop'):
+                solver.StopSearch()
+                return
+    threading.Thread(target=watch_stop_flag, daemon=True).start()
+    try:
+        status = solver.Solve(cp_sat, _CpSatProgress(log_q, unplaced_vars, penalty_terms))
+    finally:
+        search_done.set()
+
+    if scheduling_state.get('should_stop'):
+        raise StopByUserException()
+    log_q.put(f"--- CP-SAT: الحالة {solver.StatusName(status)} بعد {solver.WallTime():.1f} ثانية ---")
+
+    # --- بناء الجدول وإسناد القاعات ---
+    best_schedule = {level: [[[] for _ in slots] for _ in days] for level in all_levels}
+    without_room = []
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        chosen = defaultdict(list)
+        for lecture in lectures_to_schedule:
+            for day_idx, slot_idx in domains[lecture['id']].allowed_slots(all_slots):
+                if solver.BooleanValue(placement_vars[(lecture['id'], day_idx, slot_idx)]):
+                    chosen[(day_idx, slot_idx)].append(lecture)
+        level_rooms = defaultdict(set)
+        for day_idx, slot_idx in all_slots:
+            lectures_here = chosen.get((day_idx, slot_idx), [])
+            used_rooms, assigned = set(), []
+            for lecture in lectures_here:
+                specific_hall = domains[lecture['id']].rooms(day_idx, slot_idx)[1]
+                if specific_hall:
+                    used_rooms.add(specific_hall); assigned.append((lecture, specific_hall))
+            for lecture in lectures_here:
+                domain = domains[lecture['id']]
+                if domain.rooms(day_idx, slot_idx)[1]: continue
+                free = [name for name in rooms_in_order[domain.room_type] if name not in used_rooms]
+                def consecutive_clash(room):
+                    rule = consecutive_large_hall_rule
+                    return rule != 'none' and domain.room_type == 'كبيرة' and slot_idx > 0 and (rule == 'all' or rule == room) and \
+                        any(room in level_rooms[(level, day_idx, slot_idx - 1)] for level in domain.levels)
+                if not free:
+                    # القاعات المحددة لمحاضرات أخرى قد تستنفد النوع؛ تبقى المحاضرة ناقصة بدل إسناد قاعة مشغولة
+                    without_room.append(lecture)
+                    continue
+                room = next((name for name in free if not consecutive_clash(name)), free[0])
+                used_rooms.add(room); assigned.append((lecture, room))
+            for lecture, room in assigned:
+                details = Placement.of(lecture, room, model=model)
+                for level in lecture.get('levels', []):
+                    if level in best_schedule:
+                        best_schedule[level][day_idx][slot_idx].append(details)
+                        level_rooms[(level, day_idx, slot_idx)].add(room)
+
+    final_fitness, final_failures_list = calculate_fitness(
+        best_schedule, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels,
+        identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type,
+        lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs,
+        day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms,
+        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
+    )
+    unplaced, hard, soft = -final_fitness[0], -final_fitness[1], -final_fitness[2]
+    final_cost = (unplaced * 1000) + (hard * 100) + soft
+
+    if without_room:
+        log_q.put(f"   - CP-SAT: لم تبق قاعة شاغرة من النوع لـ {len(without_room)} محاضرة بعد الحل، فبقيت ناقصة: {'، '.join(str(lec.get('name')) for lec in without_room)}")
+    # ✨ أوقات البدء والانتهاء لذوي الأيام اليدوية لا تُنمذج (يقرّبها النطاق الثابت بأيامهم اليدوية)، فلا تظهر مخالفاتها إلا في إعادة التقييم
+    manual_start_end = [
+        teacher for teacher in scheduled_teachers
+        if teacher_constraints.get(teacher, {}).get('allowed_days') and any(special_constraints.get(teacher, {}).get(flag) for flag in ('start_d1_s2', 'start_d1_s3', 'end_s3', 'end_s4'))
+    ]
+    if manual_start_end:
+        found = sum(1 for f in final_failures_list if f.get('teacher_name') in manual_start_end and f.get('course_name') in ('قيد البدء اليدوي', 'قيد الإنهاء اليدوي'))
+        log_q.put(f"   - CP-SAT: أوقات البدء والانتهاء غير منمذجة لذوي الأيام اليدوية ({'، '.join(manual_start_end)})؛ مخالفاتها في إعادة التقييم: {found}")
+
+    final_progress = calculate_progress_percentage(final_failures_list)
+    log_q.put(f"PROGRESS:{final_progress:.1f}")
+    log_q.put(f'=== انتهت الخوارزمية نهائياً - أفضل تكلفة موزونة: {final_cost} ===')
+    return best_schedule, final_cost, final_failures_list
 
-    return best_result['schedule'], best_result['failures']
-# ========================= نهاية الدالة المساعدة الجديدة =========================
 
 # ابحث عن هذه الدالة في ملف app.py واستبدلها بالكامل بهذا الكود
 @app.route('/api/generate-schedule', methods=['POST'])
@@ -2624,6 +5933,17 @@ def generate_schedule():
             ga_stagnation_threshold = int(algorithm_settings.get('ga_stagnation_threshold', 15))
             lns_stagnation_threshold = int(algorithm_settings.get('lns_stagnation_threshold', 100))
             vns_stagnation_threshold = int(algorithm_settings.get('vns_stagnation_threshold', 50))
+            fitness_cache_size = int(algorithm_settings.get('fitness_cache_size', 4096))
+            # ✨ التشغيلات الطماعة المتعددة: عددها، عدد العمليات (فارغ = GREEDY_DEFAULT_WORKERS، 0 = عدد المعالجات،
+            # 1 = تتابعي في نفس العملية)، والبذرة الرئيسية (فارغة = عشوائية)
+            greedy_starts = int(algorithm_settings.get('greedy_starts', 30) or 30)
+            greedy_workers_str = str(algorithm_settings.get('greedy_workers', '')).strip()
+            greedy_workers = (int(greedy_workers_str) or (os.cpu_count() or 1)) if greedy_workers_str.isdigit() else None
+            greedy_seed_str = str(algorithm_settings.get('greedy_seed', '')).strip()
+            greedy_seed = int(greedy_seed_str) if greedy_seed_str.lstrip('-').isdigit() else None
+            # ✨ تحليل زمني اختياري لمحرك التقييم (يتراكم عبر كل المحاولات)
+            evaluation_profiler = EvaluationProfiler() if algorithm_settings.get('enable_evaluation_profiling', False) else None
+            activate_evaluation_profiler(evaluation_profiler)
             
             if intensive_attempts > 1:
                 log_q.put(f"--- بدء البحث المكثف لـ {intensive_attempts} محاولات ---")
@@ -2790,6 +6110,20 @@ def generate_schedule():
                     if lec.get('teacher_name'):
                         lectures_by_teacher_map[lec.get('teacher_name')].append(lec)
                 lectures_by_teacher_map['__all_lectures__'] = lectures_to_schedule
+
+                # ✨ تجميع القيود مرة واحدة لهذه المحاولة (معرّفات صحيحة، قواعد الفترات، القاعات المطلوبة، العقوبات)
+                # يُمرَّر صراحةً إلى دوال التقييم والمحركات
+                model = ConstraintModel(
+                    rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                    level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                    constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                    globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx
+                )
+                # ✨ النطاق الثابت لكل محاضرة (ما تسمح به الإعدادات من فترات وقاعات) يُحسب مرة واحدة هنا
+                model.presolve(lectures_to_schedule, len(days), len(slots))
+                # ✨ ذاكرة لياقة جديدة لكل محاولة (0 يعطلها)
+                activate_fitness_cache(FitnessCache(fitness_cache_size) if fitness_cache_size > 0 else None)
+                activate_teacher_validation_cache(TeacherValidationCache())
                 
                 lectures_sorted = sorted(
                     lectures_to_schedule, 
@@ -2800,9 +6134,9 @@ def generate_schedule():
                 # --- الجزء 5: تجهيز الحل المبدئي الطماع للخوارزميات المتقدمة (الجزء المفقود الثاني) ---
                 greedy_initial_schedule = None
                 if method in ['tabu_search', 'large_neighborhood_search', 'variable_neighborhood_search', 'memetic_algorithm', 'clonalg', 'genetic_algorithm', 'hyper_heuristic']:
-                    log_q.put(f"جاري تحضير أفضل حل مبدئي (عبر 10 محاولات طماعة) لـ {method}...")
+                    log_q.put(f"جاري تحضير أفضل حل مبدئي (عبر {greedy_starts} محاولة طماعة) لـ {method}...")
                     
-                    # استدعاء الدالة المساعدة الجديدة للحصول على أفضل حل من 10 محاولات
+                    # استدعاء الدالة المساعدة الجديدة للحصول على أفضل حل من greedy_starts محاولة
                     greedy_initial_schedule, _ = run_greedy_search_for_best_result(
                         log_q, lectures_sorted, days, slots, rules_grid, rooms_data, teachers, all_levels,
                         teacher_constraints, globally_unavailable_slots, special_constraints,
@@ -2811,7 +6145,9 @@ def generate_schedule():
                         specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots,
                         lectures_by_teacher_map, distribution_rule_type, teacher_pairs,
                         constraint_severities, non_sharing_teacher_pairs,
-                        base_initial_schedule=initial_final_schedule # تمرير المواد المثبتة
+                        base_initial_schedule=initial_final_schedule, # تمرير المواد المثبتة
+                        num_starts=greedy_starts, master_seed=None if greedy_seed is None else greedy_seed + attempt, max_workers=greedy_workers, model=model,
+                        scheduling_state=scheduling_state
                     )
                 
                 detailed_failures = []
@@ -2819,6 +6155,14 @@ def generate_schedule():
                 if method == 'backtracking':
                     start_time = time.time()
                     timeout = int(algorithm_settings.get('timeout', 30))
+                    # ✨ القفز الخلفي وذاكرة nogoods (False = تراجع زمني بسيط للمقارنة)
+                    backtracking_backjumping = bool(algorithm_settings.get('backtracking_backjumping', True))
+                    # ✨ محفظة البحث المتوازية: عدد العمليات (1 افتراضياً = بحث واحد في نفس العملية، 0 = عدد المعالجات)
+                    # والبذرة الرئيسية (فارغة = عشوائية)
+                    backtracking_workers_str = str(algorithm_settings.get('backtracking_workers', '1')).strip()
+                    backtracking_workers = (int(backtracking_workers_str) or (os.cpu_count() or 1)) if backtracking_workers_str.isdigit() else 1
+                    backtracking_seed_str = str(algorithm_settings.get('backtracking_seed', '')).strip()
+                    backtracking_seed = int(backtracking_seed_str) if backtracking_seed_str.lstrip('-').isdigit() else None
                     
                     final_schedule, teacher_schedule, room_schedule = initial_final_schedule, initial_teacher_schedule, initial_room_schedule
 
@@ -2826,6 +6170,7 @@ def generate_schedule():
                     domains = {}
                     total_lectures = len(lectures_to_schedule)
                     timeout_occured = False
+                    bitsets = OccupancyBitsets(final_schedule, teacher_schedule, room_schedule, model, len(slots), rooms_data=rooms_data)
                     for idx, lecture in enumerate(lectures_to_schedule):
                         # ---- تعديل: إضافة تفقد حالة الإيقاف هنا ----
                         if scheduling_state.get('should_stop'):
@@ -2843,21 +6188,22 @@ def generate_schedule():
                         lecture_id = lecture['id']
                         lecture_domains = set()
                         is_large_room_course = lecture.get('room_type') == 'كبيرة'
+                        static_domain = model.domain(lecture)
 
                         if is_large_room_course and prioritize_primary:
-                            for day_idx, slot_idx in primary_slots:
-                                is_possible, result_room = is_placement_valid(lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule)
+                            for day_idx, slot_idx in static_domain.allowed_slots(primary_slots):
+                                is_possible, result_room = _is_placement_valid_in_bitsets(static_domain, lecture, day_idx, slot_idx, bitsets, consecutive_large_hall_rule)
                                 if is_possible:
                                     lecture_domains.add((day_idx, slot_idx, result_room))
                             if not lecture_domains:
-                                for day_idx, slot_idx in reserve_slots:
-                                    is_possible, result_room = is_placement_valid(lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule)
+                                for day_idx, slot_idx in static_domain.allowed_slots(reserve_slots):
+                                    is_possible, result_room = _is_placement_valid_in_bitsets(static_domain, lecture, day_idx, slot_idx, bitsets, consecutive_large_hall_rule)
                                     if is_possible:
                                         lecture_domains.add((day_idx, slot_idx, result_room))
                         else:
                             slots_to_search_bt = primary_slots + reserve_slots
-                            for day_idx, slot_idx in slots_to_search_bt:
-                                is_possible, result_room = is_placement_valid(lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule)
+                            for day_idx, slot_idx in static_domain.allowed_slots(slots_to_search_bt):
+                                is_possible, result_room = _is_placement_valid_in_bitsets(static_domain, lecture, day_idx, slot_idx, bitsets, consecutive_large_hall_rule)
                                 if is_possible:
                                     lecture_domains.add((day_idx, slot_idx, result_room))
                         domains[lecture_id] = lecture_domains
@@ -2871,8 +6217,34 @@ def generate_schedule():
                         log_q.put('... انتهت مرحلة التحضير. بدء البحث الفعلي.')
                     
                         try:
-                            # ---- تعديل: تمرير حالة الإيقاف للدالة ----
-                            solution_found = solve_backtracking(log_q, lectures_to_schedule, domains, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, start_time, timeout, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, total_lectures, scheduling_state, level_specific_large_rooms, specific_small_room_assignments, num_slots, constraint_severities, consecutive_large_hall_rule, max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                            portfolio_outcome = None
+                            if backtracking_workers > 1:
+                                log_q.put(f'   - محفظة بحث متوازية بـ {backtracking_workers} عملية بترتيبات مختلفة.')
+                                portfolio_context = {
+                                    'lectures_to_schedule': lectures_to_schedule, 'domains': domains, 'final_schedule': final_schedule,
+                                    'teacher_schedule': teacher_schedule, 'room_schedule': room_schedule, 'teacher_constraints': teacher_constraints,
+                                    'special_constraints': special_constraints, 'identifiers_by_level': identifiers_by_level, 'rules_grid': rules_grid,
+                                    'globally_unavailable_slots': globally_unavailable_slots, 'rooms_data': rooms_data, 'start_time': start_time,
+                                    'timeout': timeout, 'lectures_by_teacher_map': lectures_by_teacher_map, 'distribution_rule_type': distribution_rule_type,
+                                    'saturday_teachers': saturday_teachers, 'teacher_pairs': teacher_pairs, 'day_to_idx': day_to_idx,
+                                    'initial_lecture_count': total_lectures, 'level_specific_large_rooms': level_specific_large_rooms,
+                                    'specific_small_room_assignments': specific_small_room_assignments, 'num_slots': num_slots,
+                                    'constraint_severities': constraint_severities, 'consecutive_large_hall_rule': consecutive_large_hall_rule,
+                                    'max_sessions_per_day': max_sessions_per_day, 'non_sharing_teacher_pairs': non_sharing_teacher_pairs,
+                                    'backjumping': backtracking_backjumping, 'model': model,
+                                }
+                                portfolio_outcome = run_backtracking_portfolio(log_q, portfolio_context, scheduling_state, backtracking_workers, None if backtracking_seed is None else backtracking_seed + attempt)
+                            if portfolio_outcome is not None:
+                                portfolio_status, portfolio_result = portfolio_outcome
+                                if portfolio_status == 'stopped': raise StopByUserException()
+                                if portfolio_status == 'timeout': raise TimeoutException()
+                                solution_found = portfolio_status == 'solved'
+                                if solution_found: final_schedule, teacher_schedule, room_schedule = portfolio_result
+                            else:
+                                # ✨ مع البذرة: خلط قابل للتكرار لترتيب القيم (البذرة + رقم المحاولة) لإعادة تشغيل نفس البحث للمقارنة
+                                seeded_order = {} if backtracking_seed is None else {'value_order': 'shuffle', 'rng': random.Random(backtracking_seed + attempt)}
+                                # ---- تعديل: تمرير حالة الإيقاف للدالة ----
+                                solution_found = solve_backtracking(log_q, lectures_to_schedule, domains, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, start_time, timeout, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, total_lectures, scheduling_state, level_specific_large_rooms, specific_small_room_assignments, num_slots, constraint_severities, consecutive_large_hall_rule, max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs, backjumping=backtracking_backjumping, **seeded_order, model=model)
                             if not solution_found:
                                 failures.append({"course_name": "N/A", "teacher_name": "Algorithm", "reason": "فشلت الخوارزمية في إيجاد حل صالح يحقق جميع القيود المحددة. قد تكون القيود متضاربة أو شديدة الصعوبة."})
                                 final_schedule = {level: [[[] for _ in slots] for _ in days] for level in all_levels}
@@ -2942,7 +6314,7 @@ def generate_schedule():
                             max_sessions_per_day=max_sessions_per_day,
                             consecutive_large_hall_rule=consecutive_large_hall_rule,
                             prefer_morning_slots=prefer_morning_slots,
-                            use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                            use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                         )
                         
                         if final_cost > 0:
@@ -3022,7 +6394,7 @@ def generate_schedule():
                             specific_small_room_assignments, constraint_severities, initial_solution_seed=greedy_initial_schedule,
                             max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots,
                             mutation_hard_intensity=mutation_hard_intensity, mutation_soft_probability=mutation_soft_probability, use_strict_hierarchy=use_strict_hierarchy,
-                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, ga_stagnation_threshold=ga_stagnation_threshold
+                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, ga_stagnation_threshold=ga_stagnation_threshold, model=model
                         )
                         
                         if final_cost > 0:
@@ -3076,7 +6448,7 @@ def generate_schedule():
                             prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy,
                             non_sharing_teacher_pairs=non_sharing_teacher_pairs, initial_solution=greedy_initial_schedule,
                             mutation_hard_intensity=mutation_hard_intensity, mutation_soft_probability=mutation_soft_probability,
-                            lns_stagnation_threshold=lns_stagnation_threshold
+                            lns_stagnation_threshold=lns_stagnation_threshold, model=model
                         )
                         
                         if final_cost > 0:
@@ -3123,7 +6495,7 @@ def generate_schedule():
                             prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy,
                             non_sharing_teacher_pairs=non_sharing_teacher_pairs, algorithm_settings=algorithm_settings, initial_solution=greedy_initial_schedule,
                             mutation_hard_intensity=mutation_hard_intensity, mutation_soft_probability=mutation_soft_probability,
-                            vns_stagnation_threshold=vns_stagnation_threshold
+                            vns_stagnation_threshold=vns_stagnation_threshold, model=model
                         )
                         
                         if final_cost > 0:
@@ -3178,7 +6550,7 @@ def generate_schedule():
                             max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
                             prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs,
                             mutation_hard_intensity=mutation_hard_intensity, mutation_soft_probability=mutation_soft_probability,
-                            vns_stagnation_threshold=vns_stagnation_threshold
+                            vns_stagnation_threshold=vns_stagnation_threshold, model=model
                         )
                         
                         if final_cost > 0:
@@ -3218,7 +6590,7 @@ def generate_schedule():
                             consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots,
                             mutation_hard_intensity=mutation_hard_intensity,
                             mutation_soft_probability=mutation_soft_probability, use_strict_hierarchy=use_strict_hierarchy, 
-                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, ga_stagnation_threshold=ga_stagnation_threshold
+                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, ga_stagnation_threshold=ga_stagnation_threshold, model=model
                         )
 
                         if final_cost > 0:
@@ -3257,7 +6629,7 @@ def generate_schedule():
                             consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots,
                             mutation_hard_intensity=mutation_hard_intensity,
                             mutation_soft_probability=mutation_soft_probability, use_strict_hierarchy=use_strict_hierarchy, 
-                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, ga_stagnation_threshold=ga_stagnation_threshold
+                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, ga_stagnation_threshold=ga_stagnation_threshold, model=model
                         )
 
                         if final_cost > 0:
@@ -3316,15 +6688,50 @@ def generate_schedule():
                             llh_time_budget=hh_time_budget,
                             llh_iterations=hh_llh_iterations,
                             stagnation_limit=hh_stagnation_limit,
-                            algorithm_settings=algorithm_settings, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                            algorithm_settings=algorithm_settings, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                         )
                         failures.extend(detailed_failures)
                     except StopByUserException:
                         failures.append({"course_name": "N/A", "teacher_name": "Algorithm", "reason": "تم إيقاف العملية من قبل المستخدم."})
                         final_schedule = {level: [[[] for _ in slots] for _ in days] for level in all_levels}
                 
+                elif method == 'cp_sat':
+                    cp_sat_time_limit = int(algorithm_settings.get('timeout', 30))
+                    cp_sat_workers = int(algorithm_settings.get('cp_sat_workers', 0)) or None
+                    try:
+                        final_schedule, final_cost, detailed_failures = run_cp_sat_solver(
+                            log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                            identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type,
+                            lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs,
+                            day_to_idx, rules_grid, scheduling_state, last_slot_restrictions, level_specific_large_rooms,
+                            specific_small_room_assignments, constraint_severities,
+                            time_limit=cp_sat_time_limit, num_workers=cp_sat_workers,
+                            max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
+                            prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy,
+                            non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
+                        )
+
+                        if final_cost > 0:
+                            failures.append({
+                                "course_name": "N/A",
+                                "teacher_name": "CP-SAT",
+                                "reason": f"انتهت الخوارزمية بأفضل حل يحتوي على {final_cost} تعارضات."
+                            })
+                            for i, detail in enumerate(detailed_failures[:10]):
+                                failures.append({"course_name": f"   - التفصيل #{i+1}", "teacher_name": "", "reason": detail})
+
+                    except StopByUserException:
+                        log_q.put('\n--- تم إيقاف محلل القيود CP-SAT من قبل المستخدم. ---')
+                        failures.append({"course_name": "N/A", "teacher_name": "Algorithm", "reason": "تم إيقاف العملية من قبل المستخدم."})
+                        final_schedule = {level: [[[] for _ in slots] for _ in days] for level in all_levels}
+
+                    except Exception as e:
+                        log_q.put(f'\nحدث خطأ في محلل القيود CP-SAT: {str(e)}')
+                        failures.append({"course_name": "N/A", "teacher_name": "Algorithm", "reason": f"خطأ في الخوارزمية: {str(e)}"})
+                        final_schedule = {level: [[[] for _ in slots] for _ in days] for level in all_levels}
+
                 elif method == 'greedy':
-                    log_q.put("--- بدء الخوارزمية الطماعة (سيتم تشغيلها 10 مرات لاختيار الأفضل) ---")
+                    log_q.put(f"--- بدء الخوارزمية الطماعة (سيتم تشغيلها {greedy_starts} مرة لاختيار الأفضل) ---")
                     
                     # استدعاء الدالة المساعدة للحصول على أفضل حل وأخطائه
                     final_schedule, failures = run_greedy_search_for_best_result(
@@ -3335,7 +6742,9 @@ def generate_schedule():
                         specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots,
                         lectures_by_teacher_map, distribution_rule_type, teacher_pairs,
                         constraint_severities, non_sharing_teacher_pairs,
-                        base_initial_schedule=initial_final_schedule
+                        base_initial_schedule=initial_final_schedule,
+                        num_starts=greedy_starts, master_seed=None if greedy_seed is None else greedy_seed + attempt, max_workers=greedy_workers, model=model,
+                        scheduling_state=scheduling_state
                     )
                     
                     total_greedy_cost = sum(f.get('penalty', 1) for f in failures)
@@ -3376,6 +6785,13 @@ def generate_schedule():
                 level_counts_list = [{'level': lvl, 'count': cnt} for lvl, cnt in sorted(level_counts.items())]
                 # --- نهاية الكود المصحح ---
 
+                fitness_cache = ACTIVE_FITNESS_CACHE['cache']
+                if fitness_cache is not None and (fitness_cache.hits or fitness_cache.misses):
+                    log_q.put(fitness_cache.stats_message())
+                teacher_cache = ACTIVE_TEACHER_CACHE['cache']
+                if teacher_cache is not None and (teacher_cache.hits or teacher_cache.misses):
+                    log_q.put(teacher_cache.stats_message())
+
                 all_results.append({
                     "cost": current_attempt_cost,
                     "schedule": copy.deepcopy(final_schedule),
@@ -3403,6 +6819,13 @@ def generate_schedule():
             if scheduling_state.get('should_stop'):
                 raise StopByUserException()
 
+            evaluation_profile = None
+            if evaluation_profiler is not None:
+                evaluation_profile = evaluation_profiler.summary()
+                log_q.put("--- أكثر عائلات القيود استهلاكاً لزمن التقييم ---")
+                for line in evaluation_profiler.log_lines():
+                    log_q.put(line)
+
             # ================== بداية كود تسجيل الأداء ==================
             if settings_profile_name and settings_profile_name != 'إعدادات حالية':
                 try:
@@ -3458,6 +6881,18 @@ def generate_schedule():
                             "التكرارات": algo_settings.get('vns_iterations'),
                             "أقصى جوار (k)": algo_settings.get('vns_k_max')
                         }
+                    elif algorithm_name == 'backtracking':
+                        params_to_save = {
+                            "المهلة": algo_settings.get('timeout'),
+                            "العمليات": algo_settings.get('backtracking_workers'),
+                            "القفز الخلفي": algo_settings.get('backtracking_backjumping'),
+                            "البذرة": algo_settings.get('backtracking_seed')
+                        }
+                    elif algorithm_name == 'cp_sat':
+                        params_to_save = {
+                            "المهلة": algo_settings.get('timeout'),
+                            "العمليات": algo_settings.get('cp_sat_workers')
+                        }
                     elif algorithm_name == 'hyper_heuristic':
                         llh_list = algo_settings.get('hh_selected_llh', [])
                         # تحويل قائمة الخوارزميات إلى نص للعرض
@@ -3476,9 +6911,10 @@ def generate_schedule():
                     cursor_log = conn_log.cursor()
 
                     cursor_log.execute('''
-                        INSERT INTO performance_log (settings_name, algorithm_name, unplaced_count, hard_errors, soft_errors, total_cost, execution_time, algorithm_params)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (settings_profile_name, algorithm_name, unplaced_count, hard_errors, soft_errors, total_cost, execution_time, params_json))
+                        INSERT INTO performance_log (settings_name, algorithm_name, unplaced_count, hard_errors, soft_errors, total_cost, execution_time, algorithm_params, evaluation_profile)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (settings_profile_name, algorithm_name, unplaced_count, hard_errors, soft_errors, total_cost, execution_time, params_json,
+                          json.dumps(evaluation_profile, ensure_ascii=False) if evaluation_profile else None))
                     conn_log.commit()
                     conn_log.close()
                     log_q.put(f"   - تم تسجيل أداء الخوارزمية '{algorithm_name}' للإعدادات '{settings_profile_name}'.")
@@ -3526,16 +6962,18 @@ def generate_schedule():
             unassigned_courses = [c for c in courses if not c.get('teacher_name')]
             
             final_result = {
-                "schedule": best_result['schedule'], 
+                "schedule": render_schedule(best_result['schedule']), 
                 "days": best_result['days'], 
                 "slots": best_result['slots'], 
-                "failures": best_result['failures'], 
+                "failures": render_failures(best_result['failures']), 
                 "burden_stats": best_result['burden'], 
                 "unassigned_courses": unassigned_courses,
                 "level_counts": level_counts_list,
                 "swapped_lecture_ids": list(swapped_lecture_ids),
                 "placed_level_counts": placed_level_counts_list
             }
+            if evaluation_profile:
+                final_result["evaluation_profile"] = evaluation_profile
             log_q.put("DONE" + json.dumps(final_result, ensure_ascii=False))
 
         except StopByUserException:
@@ -3576,6 +7014,9 @@ def generate_schedule():
         finally:
             # التأكد من إعادة تعيين الحالة دائماً بعد انتهاء المهمة
             scheduling_state['should_stop'] = False
+            activate_fitness_cache(None)
+            activate_teacher_validation_cache(None)
+            activate_evaluation_profiler(None)
             
     # ------ بداية منطق الاستدعاء من خارج المهمة الخلفية ------
     SCHEDULING_STATE['should_stop'] = False
@@ -3609,21 +7050,6 @@ def generate_schedule():
 
     
 
-def find_available_room(day_idx, slot_idx, room_schedule, rooms_data, allowed_room_types, specific_hall=None):
-    if specific_hall:
-        if (day_idx, slot_idx) not in room_schedule.get(specific_hall, set()):
-            for room in rooms_data:
-                if room.get('name') == specific_hall and room.get('type') in allowed_room_types:
-                    return specific_hall
-        return None
-    potential_rooms = [room for room in rooms_data if room.get("type") in allowed_room_types]
-    random.shuffle(potential_rooms)
-    for room in potential_rooms:
-        room_name = room.get('name')
-        if (day_idx, slot_idx) not in room_schedule.get(room_name, set()):
-            return room_name
-    return None
-
 def calculate_lecture_difficulty(lecture, all_lectures_for_teacher, special_constraints, manual_days):
     """
     تحسب درجة الصعوبة لمحاضرة معينة بناءً على عدة عوامل.
@@ -3664,106 +7090,154 @@ def calculate_lecture_difficulty(lecture, all_lectures_for_teacher, special_cons
 
     return score
 
-# ✨✨ --- بداية الإضافة: دالة مساعدة جديدة للبحث عن قاعة صالحة --- ✨✨
-def _find_valid_and_available_room(lecture, day_idx, slot_idx, final_schedule, room_schedule, rooms_data, rules_grid, identifiers_by_level, level_specific_large_rooms, specific_small_room_assignments):
+# ✨✨ --- بداية الإضافة: النطاقات الثابتة للمحاضرات --- ✨✨
+class StaticDomain:
     """
-    تقوم هذه الدالة بالبحث عن قاعة شاغرة وصالحة لمحاضرة معينة في فترة محددة،
-    مع الأخذ في الاعتبار كل القيود المعقدة (قواعد الفترة، تخصيص القاعات، إلخ).
+    النطاق الثابت لمحاضرة: ما تحدده الإعدادات وحدها في كل (يوم، فترة)، دون النظر إلى إشغال الجدول.
+    - reason(d, s): سبب الرفض السابق لفحص القاعات (فترة راحة، السبت، الأيام اليدوية، always_s2_to_s4) أو None.
+    - rooms(d, s): (القاعات المرشحة بترتيب rooms_data، القاعة المحددة أو None)، أو None إذا رفضت قواعد
+      المستويات أو متطلبات القاعات هذه الفترة مسبقاً.
+    - dynamic_start: فحص بداية اليوم الأول يبقى مرتبطاً بأول يوم عمل فعلي للأستاذ (عند غياب الأيام اليدوية).
+    كل مدخل يُحسب مرة واحدة عند أول طلب، أو مسبقاً لكل الفترات عبر ConstraintModel.presolve.
     """
-    levels_for_lecture = lecture.get('levels', [])
-    lecture_room_type_needed = lecture.get('room_type')
-    required_halls_from_all_levels = set()
-    allowed_types_per_level_list = []
+    def __init__(self, model, lecture):
+        self.model = model
+        self.teacher = lecture.get('teacher_name')
+        self.name, self.room_type = lecture.get('name'), lecture.get('room_type')
+        self.levels = tuple(lecture.get('levels', []))
+        self.identifiers = {level: model.identifier_of(lecture['name'], level) for level in self.levels}
+        self.halls = model.required_halls(lecture)
+
+        prof_special_constraints = model.special_constraints.get(self.teacher, {})
+        self.manual_days = model.teacher_constraints.get(self.teacher, {}).get('allowed_days')
+        self.always_s2_to_s4 = bool(prof_special_constraints.get('always_s2_to_s4'))
+        self.start_s2, self.start_s3 = bool(prof_special_constraints.get('start_d1_s2')), bool(prof_special_constraints.get('start_d1_s3'))
+        self.end_s3, self.end_s4 = bool(prof_special_constraints.get('end_s3')), bool(prof_special_constraints.get('end_s4'))
+        self.dynamic_start = not self.always_s2_to_s4 and not self.manual_days and (self.start_s2 or self.start_s3)
+        self._reasons, self._rooms = {}, {}
+
+    def reason(self, day_idx, slot_idx):
+        key = (day_idx, slot_idx)
+        if key not in self._reasons: self._reasons[key] = self._compute_reason(day_idx, slot_idx)
+        return self._reasons[key]
+
+    def rooms(self, day_idx, slot_idx):
+        key = (day_idx, slot_idx)
+        if key not in self._rooms: self._rooms[key] = self._compute_rooms(day_idx, slot_idx)
+        return self._rooms[key]
+
+    def allows(self, day_idx, slot_idx):
+        return self.reason(day_idx, slot_idx) is None and self.rooms(day_idx, slot_idx) is not None
+
+    def allowed_slots(self, slots_to_search):
+        """الفترات التي لا ترفضها الإعدادات، بنفس ترتيب slots_to_search."""
+        return [(day_idx, slot_idx) for day_idx, slot_idx in slots_to_search if self.allows(day_idx, slot_idx)]
+
+    def _compute_reason(self, day_idx, slot_idx):
+        model = self.model
+        if (day_idx, slot_idx) in model.globally_unavailable_slots:
+            return "Slot unavailable for teacher or general rest period"
+
+        saturday_idx = model.day_to_idx.get('السبت', -1)
+        if saturday_idx != -1 and model.saturday_teachers and day_idx == saturday_idx and self.teacher not in model.saturday_teachers:
+            return "الأستاذ غير مسموح له بالعمل يوم السبت"
+
+        if self.always_s2_to_s4:
+            if slot_idx < 1 or slot_idx > 3: return "Strict violation: always_s2_to_s4"
+        elif self.manual_days:
+            if day_idx not in self.manual_days: return "Manual day constraint violation"
+            if day_idx == min(self.manual_days) and ((self.start_s2 and slot_idx < 1) or (self.start_s3 and slot_idx < 2)): return "Manual start time violation"
+            if day_idx == max(self.manual_days) and ((self.end_s3 and slot_idx > 2) or (self.end_s4 and slot_idx > 3)): return "Manual end time violation"
+        return None
+
+    def _compute_rooms(self, day_idx, slot_idx):
+        model = self.model
+        required_halls = set(self.halls)
+        allowed_types_per_level_list = []
+        for level in self.levels:
+            # تجميع أنواع القاعات المسموحة حسب قواعد الفترة الزمنية
+            forbidden, level_allowed_types, rule_halls = model.slot_rules(level, day_idx, slot_idx)
+            if forbidden:
+                return None # الفترة ممنوعة لهذا المستوى
+            allowed_types_per_level_list.append(level_allowed_types if level_allowed_types is not None else {'كبيرة', 'صغيرة'})
+            required_halls.update(rule_halls)
+
+        if len(required_halls) > 1:
+            return None # متطلبات قاعات متضاربة
+        if not allowed_types_per_level_list or any(self.room_type not in allowed for allowed in allowed_types_per_level_list):
+            return None # نوع القاعة غير مسموح به
+
+        if required_halls:
+            specific_hall = required_halls.pop()
+            if not any(room.get('name') == specific_hall and room.get('type') == self.room_type for room in model.rooms_data):
+                return None
+            return (specific_hall,), specific_hall
+        candidates = tuple(room.get('name') for room in model.rooms_data if room.get('type') == self.room_type)
+        return (candidates, None) if candidates else None
+
+
+def _available_room_in_domain(domain, day_idx, slot_idx, final_schedule, room_schedule):
+    """القاعة الشاغرة الصالحة من قاعات النطاق الثابت بعد فحص إشغال المستويات والقاعات."""
+    room_spec = domain.rooms(day_idx, slot_idx)
+    if room_spec is None:
+        return None
 
-    for level in levels_for_lecture:
+    for level in domain.levels:
         # التحقق من التعارضات الفورية داخل المستوى (قاعة كبيرة ومعرفات)
         lectures_in_slot = final_schedule[level][day_idx][slot_idx]
-        if lectures_in_slot and (lecture_room_type_needed == 'كبيرة' or any(l.get('room_type') == 'كبيرة' for l in lectures_in_slot)):
+        if not lectures_in_slot: continue
+        if domain.room_type == 'كبيرة' or any(l.get('room_type') == 'كبيرة' for l in lectures_in_slot):
             return None # خطأ: تعارض قاعة كبيرة
 
-        current_identifier = get_contained_identifier(lecture['name'], identifiers_by_level.get(level, []))
-        if current_identifier:
-            used_identifiers = {get_contained_identifier(l['name'], identifiers_by_level.get(level, [])) for l in lectures_in_slot}
-            if current_identifier in used_identifiers:
-                return None # خطأ: تعارض معرفات
+        current_identifier = domain.identifiers[level]
+        if current_identifier and any(domain.model.identifier_of(l['name'], level) == current_identifier for l in lectures_in_slot):
+            return None # خطأ: تعارض معرفات
 
-        # تجميع متطلبات القاعات المحددة
-        course_full_name = f"{lecture.get('name')} ({level})"
-        if room := specific_small_room_assignments.get(course_full_name):
-            required_halls_from_all_levels.add(room)
-        if lecture_room_type_needed == 'كبيرة':
-            if room := level_specific_large_rooms.get(level):
-                required_halls_from_all_levels.add(room)
-
-        # تجميع أنواع القاعات المسموحة حسب قواعد الفترة الزمنية
-        rules_for_slot = rules_grid[day_idx][slot_idx]
-        level_specific_rules = [r for r in rules_for_slot if level in r.get('levels', [])]
-        if any(r.get('rule_type') == 'NO_HALLS_ALLOWED' for r in level_specific_rules):
-            return None # خطأ: الفترة ممنوعة لهذا المستوى
+    candidates, specific_hall = room_spec
+    if specific_hall:
+        return specific_hall if (day_idx, slot_idx) not in room_schedule.get(specific_hall, set()) else None
+    # أول قاعة شاغرة من المرشحات بعد خلطها عشوائياً
+    potential_rooms = list(candidates)
+    random.shuffle(potential_rooms)
+    for room_name in potential_rooms:
+        if (day_idx, slot_idx) not in room_schedule.get(room_name, set()):
+            return room_name
+    return None
 
-        if not level_specific_rules:
-            allowed_types_per_level_list.append({'كبيرة', 'صغيرة'})
-        else:
-            current_level_allowed_types = set()
-            for rule in level_specific_rules:
-                rule_type = rule.get('rule_type')
-                if rule_type == 'ANY_HALL': current_level_allowed_types.update(['كبيرة', 'صغيرة'])
-                elif rule_type == 'SMALL_HALLS_ONLY': current_level_allowed_types.add('صغيرة')
-                elif rule_type == 'SPECIFIC_LARGE_HALL':
-                    current_level_allowed_types.add('كبيرة')
-                    if hall := rule.get('hall_name'): required_halls_from_all_levels.add(hall)
-            allowed_types_per_level_list.append(current_level_allowed_types)
-
-    # التحقق النهائي من القيود المجمعة
-    if len(required_halls_from_all_levels) > 1:
-        return None # خطأ: متطلبات قاعات متضاربة
-
-    final_allowed_types = set.intersection(*allowed_types_per_level_list) if allowed_types_per_level_list else set()
-    if lecture_room_type_needed not in final_allowed_types:
-        return None # خطأ: نوع القاعة غير مسموح به
-
-    # إيجاد قاعة متاحة تحقق كل الشروط
-    final_specific_hall = required_halls_from_all_levels.pop() if required_halls_from_all_levels else None
-    return find_available_room(day_idx, slot_idx, room_schedule, rooms_data, [lecture_room_type_needed], final_specific_hall)
+def _find_valid_and_available_room(lecture, day_idx, slot_idx, final_schedule, room_schedule, rooms_data, rules_grid, identifiers_by_level, level_specific_large_rooms, specific_small_room_assignments, model=None):
+    """
+    تقوم هذه الدالة بالبحث عن قاعة شاغرة وصالحة لمحاضرة معينة في فترة محددة،
+    مع الأخذ في الاعتبار كل القيود المعقدة (قواعد الفترة، تخصيص القاعات، إلخ).
+    """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments)
+    domain = model.domain(lecture)
+    return _available_room_in_domain(domain, day_idx, slot_idx, final_schedule, room_schedule)
 # ✨✨ --- نهاية الإضافة --- ✨✨
 
-# ✨✨✨ النسخة الجديدة والمبسطة - استبدل الدالة بالكامل بهذه ✨✨✨
-def is_placement_valid(lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule):
-    teacher = lecture.get('teacher_name')
-
-    # --- 1. التحقق من القيود التي لا تتعلق بالقاعات ---
-    if (day_idx, slot_idx) in globally_unavailable_slots or \
-       (day_idx, slot_idx) in teacher_schedule.get(teacher, set()):
+def _is_placement_valid_in_domain(domain, lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, consecutive_large_hall_rule):
+    """is_placement_valid بعد حساب النطاق الثابت: لا يبقى إلا فحص الإشغال الفعلي."""
+    # --- 1. القيود الثابتة (من النطاق) وانشغال الأستاذ ---
+    reason = domain.reason(day_idx, slot_idx)
+    teacher_slots = teacher_schedule.get(domain.teacher, set())
+    if reason == "Slot unavailable for teacher or general rest period" or (day_idx, slot_idx) in teacher_slots:
         return False, "Slot unavailable for teacher or general rest period"
+    if reason:
+        return False, reason
 
-    saturday_idx = day_to_idx.get('السبت', -1)
-    if saturday_idx != -1 and saturday_teachers and day_idx == saturday_idx and teacher not in saturday_teachers:
-        return False, "الأستاذ غير مسموح له بالعمل يوم السبت"
-
-    prof_manual_days_indices = teacher_constraints.get(teacher, {}).get('allowed_days')
-    prof_special_constraints = special_constraints.get(teacher, {})
-    if prof_special_constraints.get('always_s2_to_s4'):
-        if slot_idx < 1 or slot_idx > 3: return False, "Strict violation: always_s2_to_s4"
-    else:
-        if prof_manual_days_indices:
-            if day_idx not in prof_manual_days_indices: return False, "Manual day constraint violation"
-            first_manual_day_idx, last_manual_day_idx = min(prof_manual_days_indices), max(prof_manual_days_indices)
-            if day_idx == first_manual_day_idx and ((prof_special_constraints.get('start_d1_s2') and slot_idx < 1) or (prof_special_constraints.get('start_d1_s3') and slot_idx < 2)): return False, "Manual start time violation"
-            if day_idx == last_manual_day_idx and ((prof_special_constraints.get('end_s3') and slot_idx > 2) or (prof_special_constraints.get('end_s4') and slot_idx > 3)): return False, "Manual end time violation"
-        else:
-            teacher_slots = teacher_schedule.get(teacher, set())
-            if not teacher_slots or day_idx < min(d for d, s in teacher_slots):
-                if (prof_special_constraints.get('start_d1_s2') and slot_idx < 1) or (prof_special_constraints.get('start_d1_s3') and slot_idx < 2): return False, "Start time violation"
+    if domain.dynamic_start and ((domain.start_s2 and slot_idx < 1) or (domain.start_s3 and slot_idx < 2)):
+        if not teacher_slots or day_idx < min(d for d, s in teacher_slots):
+            return False, "Start time violation"
 
-    # --- 2. استدعاء المساعد للتحقق من كل ما يتعلق بالقاعات والمستوى ---
-    available_room = _find_valid_and_available_room(lecture, day_idx, slot_idx, final_schedule, room_schedule, rooms_data, rules_grid, identifiers_by_level, level_specific_large_rooms, specific_small_room_assignments)
+    # --- 2. القاعات والمستوى ---
+    available_room = _available_room_in_domain(domain, day_idx, slot_idx, final_schedule, room_schedule)
 
     if not available_room:
         return False, "No valid and available room found"
 
     # --- 3. التحقق من قيد التوالي (آخر قيد) ---
     rule = consecutive_large_hall_rule
-    if rule != 'none' and lecture.get('room_type') == 'كبيرة' and slot_idx > 0:
+    if rule != 'none' and domain.room_type == 'كبيرة' and slot_idx > 0:
         for level in lecture.get('levels', []):
             previous_slot_lectures = final_schedule.get(level, [[]] * (slot_idx + 1))[day_idx][slot_idx - 1]
             if any(prev_lec.get('room') == available_room and (rule == 'all' or rule == available_room) for prev_lec in previous_slot_lectures):
@@ -3772,11 +7246,265 @@ def is_placement_valid(lecture, day_idx, slot_idx, final_schedule, teacher_sched
     return True, available_room
 
 
+class PlacedLectureIndex:
+    """
+    فهرس المحاضرات الموضوعة في الجدول: positions[معرّف] = خلايا (مستوى، يوم، فترة) التي تحويه.
+    يُبنى بمرور واحد على الجدول ثم يُحدَّث مع كل وضع (add) أو إزالة (remove)، فيصبح سؤال "هل وُضعت المادة؟"
+    و"أين هي؟" بكلفة ثابتة بدل المرور على كل خلايا كل المستويات.
+    """
+    def __init__(self, schedule=None):
+        self.positions = defaultdict(list)
+        for level, grid in (schedule or {}).items():
+            for day_idx, day in enumerate(grid):
+                for slot_idx, lectures in enumerate(day):
+                    for lec in lectures:
+                        self.positions[lec.get('id')].append((level, day_idx, slot_idx))
+
+    def __contains__(self, lecture_id):
+        return lecture_id in self.positions
+
+    def add(self, lecture_id, level, day_idx, slot_idx):
+        self.positions[lecture_id].append((level, day_idx, slot_idx))
+
+    def remove(self, schedule, lecture_ids):
+        """حذف المحاضرات ذات المعرّفات lecture_ids من خلاياها فقط (مع إبقاء ترتيب بقية الخلية)."""
+        cells = {cell for lecture_id in lecture_ids for cell in self.positions.pop(lecture_id, ())}
+        for level, day_idx, slot_idx in cells:
+            cell = schedule[level][day_idx][slot_idx]
+            cell[:] = [lec for lec in cell if lec.get('id') not in lecture_ids]
+
+    def unplaced(self, lectures):
+        """المحاضرات المسندة لأستاذ والغائبة عن الجدول."""
+        return [lec for lec in lectures if lec.get('id') not in self.positions and lec.get('teacher_name')]
+
+
+class FreeRoomPool:
+    """
+    القاعات الشاغرة لكل (يوم، فترة، نوع قاعة): قائمة أسماء مع موضع كل قاعة فيها، فيكون الحجز (take) والتحرير
+    (release) والاختيار العشوائي (choice) بكلفة ثابتة بدل تصفية rooms_data وخلطها وفحص كل قاعة.
+    - is_occupied(قاعة، يوم، فترة) يقرأ الإشغال الحالي، وتُبنى قائمة كل (يوم، فترة، نوع) منه عند أول طلب فقط؛
+      لذا يُستدعى take و release بعد تحديث الإشغال نفسه.
+    - free(يوم، فترة) يعيد كل القاعات الشاغرة (لعرض القاعات الفارغة وتصديره).
+    """
+    def __init__(self, rooms_data, is_occupied):
+        self.rooms_data = rooms_data
+        self.is_occupied = is_occupied
+        self.rooms_by_type, self.room_types = {}, {}
+        for room in rooms_data:
+            name, room_type = room.get('name'), room.get('type')
+            if name in self.room_types: continue
+            self.room_types[name] = room_type
+            self.rooms_by_type.setdefault(room_type, []).append(name)
+        self.pools = {}
+
+    @classmethod
+    def from_schedule(cls, schedule, rooms_data):
+        """مجمّع لجدول مستويات كامل (القاعة مشغولة إذا وُضعت فيها محاضرة في أي مستوى)."""
+        occupied = set()
+        for grid in schedule.values():
+            for day_idx, day in enumerate(grid):
+                for slot_idx, lectures in enumerate(day):
+                    for lec in lectures:
+                        if lec.get('room'): occupied.add((lec.get('room'), day_idx, slot_idx))
+        return cls(rooms_data, lambda room, day_idx, slot_idx: (room, day_idx, slot_idx) in occupied)
+
+    def _pool(self, day_idx, slot_idx, room_type):
+        key = (day_idx, slot_idx, room_type)
+        pool = self.pools.get(key)
+        if pool is None:
+            names = [name for name in self.rooms_by_type.get(room_type, ()) if not self.is_occupied(name, day_idx, slot_idx)]
+            pool = self.pools[key] = (names, {name: i for i, name in enumerate(names)})
+        return pool
+
+    def take(self, day_idx, slot_idx, room):
+        pool = self.pools.get((day_idx, slot_idx, self.room_types.get(room)))
+        if pool is None: return  # تُبنى لاحقاً من الإشغال المحدَّث
+        names, positions = pool
+        i = positions.pop(room, None)
+        if i is None: return
+        last = names.pop()
+        if i < len(names):
+            names[i] = last
+            positions[last] = i
+
+    def release(self, day_idx, slot_idx, room):
+        pool = self.pools.get((day_idx, slot_idx, self.room_types.get(room)))
+        if pool is None or room in pool[1]: return
+        names, positions = pool
+        positions[room] = len(names)
+        names.append(room)
+
+    def choice(self, day_idx, slot_idx, room_type):
+        """قاعة شاغرة عشوائية من النوع (أو None)."""
+        names = self._pool(day_idx, slot_idx, room_type)[0]
+        return random.choice(names) if names else None
+
+    def available(self, day_idx, slot_idx, room_type):
+        """القاعات الشاغرة من النوع (القائمة الداخلية نفسها: للقراءة فقط)."""
+        return self._pool(day_idx, slot_idx, room_type)[0]
+
+    def free(self, day_idx, slot_idx):
+        return [name for room_type in self.rooms_by_type for name in self._pool(day_idx, slot_idx, room_type)[0]]
+
+
+class OccupancyBitsets:
+    """
+    إشغال الجدول على شكل أقنعة أعداد صحيحة، البت (يوم × عدد الفترات + فترة) لكل خانة:
+    - teacher[t] و room[r]: فترات الأستاذ والقاعة (من teacher_schedule و room_schedule).
+    - level_any[lv] و level_large[lv]: خلايا المستوى المشغولة، والتي فيها محاضرة قاعة كبيرة.
+    - level_identifier[(lv, معرّف)]: خلايا المستوى التي فيها مادة تحمل المعرّف.
+    - level_room[(lv, قاعة)]: خلايا المستوى التي تستعمل القاعة (لقيد توالي القاعات الكبيرة).
+    - placed: فهرس PlacedLectureIndex لمواضع المحاضرات (يُمرَّر إن كان مبنياً لنفس الجدول، وإلا يُبنى).
+    - free_rooms: FreeRoomPool للقاعات الشاغرة عند تمرير rooms_data (وإلا None ويُعاد إلى خلط القاعات المرشحة).
+    تُبنى مرة واحدة من الجدول والخرائط؛ ومن يضع محاضرة بعد ذلك يستدعي place لإبقائها متزامنة
+    (find_slot_for_single_lecture يفعل ذلك عند تمرير bitsets).
+    """
+    def __init__(self, final_schedule, teacher_schedule, room_schedule, model, num_slots, placed=None, rooms_data=None):
+        self.num_slots = num_slots
+        self.placed = placed if placed is not None else PlacedLectureIndex(final_schedule)
+        self.free_rooms = FreeRoomPool(rooms_data, self.room_busy) if rooms_data is not None else None
+        self.model = model
+        self.teacher = {teacher: self._mask(slots) for teacher, slots in teacher_schedule.items()}
+        self.room = {room: self._mask(slots) for room, slots in room_schedule.items()}
+        self.level_any, self.level_large = defaultdict(int), defaultdict(int)
+        self.level_identifier, self.level_room = defaultdict(int), defaultdict(int)
+        self.levels = set(final_schedule)
+        for level, grid in final_schedule.items():
+            for day_idx, day in enumerate(grid):
+                for slot_idx, lectures in enumerate(day):
+                    for lec in lectures:
+                        self._mark_level(level, lec, self.bit(day_idx, slot_idx))
+
+    def bit(self, day_idx, slot_idx):
+        return 1 << (day_idx * self.num_slots + slot_idx)
+
+    def _mask(self, slots):
+        mask = 0
+        for day_idx, slot_idx in slots: mask |= self.bit(day_idx, slot_idx)
+        return mask
+
+    def _mark_level(self, level, lec, bit):
+        self.level_any[level] |= bit
+        if lec.get('room_type') == 'كبيرة': self.level_large[level] |= bit
+        identifier = self.model.identifier_of(lec['name'], level)
+        if identifier: self.level_identifier[(level, identifier)] |= bit
+        if lec.get('room'): self.level_room[(level, lec.get('room'))] |= bit
+
+    def room_busy(self, room, day_idx, slot_idx):
+        return bool(self.room.get(room, 0) & self.bit(day_idx, slot_idx))
+
+    def first_day(self, teacher):
+        """أول يوم عمل للأستاذ (أدنى بت في قناعه)، أو None إن لم يعمل بعد."""
+        mask = self.teacher.get(teacher, 0)
+        return ((mask & -mask).bit_length() - 1) // self.num_slots if mask else None
+
+    def place(self, placement, day_idx, slot_idx):
+        """تسجيل وضع محاضرة (بعد إضافتها إلى الجدول والخرائط)."""
+        bit = self.bit(day_idx, slot_idx)
+        if teacher := placement.get('teacher_name'): self.teacher[teacher] = self.teacher.get(teacher, 0) | bit
+        room = placement.get('room')
+        self.room[room] = self.room.get(room, 0) | bit
+        if self.free_rooms is not None: self.free_rooms.take(day_idx, slot_idx, room)
+        for level in placement.get('levels', []):
+            if level in self.levels:
+                self._mark_level(level, placement, bit)
+                self.placed.add(placement.get('id'), level, day_idx, slot_idx)
+
+
+def _slot_conflict_in_bitsets(domain, day_idx, slot_idx, bit, bitsets):
+    """سبب رفض الفترة قبل اختيار القاعة (القيود الثابتة، الأستاذ، بداية الدوام، إشغال المستويات)، أو None."""
+    reason = domain.reason(day_idx, slot_idx)
+    teacher_mask = bitsets.teacher.get(domain.teacher, 0)
+    if reason == "Slot unavailable for teacher or general rest period" or teacher_mask & bit:
+        return "Slot unavailable for teacher or general rest period"
+    if reason:
+        return reason
+
+    if domain.dynamic_start and ((domain.start_s2 and slot_idx < 1) or (domain.start_s3 and slot_idx < 2)):
+        if not teacher_mask or day_idx < bitsets.first_day(domain.teacher):
+            return "Start time violation"
+
+    if domain.rooms(day_idx, slot_idx) is None:
+        return "No valid and available room found"
+    for level in domain.levels:
+        if not bitsets.level_any.get(level, 0) & bit: continue
+        if domain.room_type == 'كبيرة' or bitsets.level_large.get(level, 0) & bit:
+            return "No valid and available room found"
+        identifier = domain.identifiers[level]
+        if identifier and bitsets.level_identifier.get((level, identifier), 0) & bit:
+            return "No valid and available room found"
+    return None
+
+def _consecutive_hall_clash_in_bitsets(domain, lecture, slot_idx, bit, room, bitsets, consecutive_large_hall_rule):
+    """هل تكون القاعة room في الفترة نفسها من الفترة السابقة لأحد مستويات المحاضرة (قيد توالي القاعات الكبيرة)؟"""
+    rule = consecutive_large_hall_rule
+    if rule != 'none' and domain.room_type == 'كبيرة' and slot_idx > 0 and (rule == 'all' or rule == room):
+        previous_bit = bit >> 1
+        return any(bitsets.level_room.get((level, room), 0) & previous_bit for level in lecture.get('levels', []))
+    return False
+
+def _is_placement_valid_in_bitsets(domain, lecture, day_idx, slot_idx, bitsets, consecutive_large_hall_rule):
+    """نفس نتيجة _is_placement_valid_in_domain، بفحوص الإشغال كعمليات AND على أقنعة OccupancyBitsets."""
+    bit = bitsets.bit(day_idx, slot_idx)
+    reason = _slot_conflict_in_bitsets(domain, day_idx, slot_idx, bit, bitsets)
+    if reason:
+        return False, reason
+
+    candidates, specific_hall = domain.rooms(day_idx, slot_idx)
+    available_room = None
+    free_rooms = bitsets.free_rooms
+    if specific_hall:
+        if not bitsets.room.get(specific_hall, 0) & bit: available_room = specific_hall
+    elif free_rooms is not None and free_rooms.rooms_data is domain.model.rooms_data:
+        # ✨ المرشحات هي كل قاعات النوع، فالاختيار العشوائي من الشاغرة منها مباشرة
+        available_room = free_rooms.choice(day_idx, slot_idx, domain.room_type)
+    else:
+        # بلا مجمّع قاعات مطابق: أول قاعة شاغرة في أقنعة الإشغال من المرشحات بعد خلطها عشوائياً
+        potential_rooms = list(candidates)
+        random.shuffle(potential_rooms)
+        for room_name in potential_rooms:
+            if not bitsets.room.get(room_name, 0) & bit:
+                available_room = room_name
+                break
+    if not available_room:
+        return False, "No valid and available room found"
+
+    if _consecutive_hall_clash_in_bitsets(domain, lecture, slot_idx, bit, available_room, bitsets, consecutive_large_hall_rule):
+        return False, f"Consecutive large hall violation for room {available_room}"
+
+    return True, available_room
+
+def _slot_open_in_bitsets(domain, lecture, day_idx, slot_idx, bitsets, consecutive_large_hall_rule):
+    """هل تقبل الفترة المحاضرة في قاعة شاغرة واحدة على الأقل؟ (لعدّ الندم: بلا خلط عشوائي للقاعات)"""
+    bit = bitsets.bit(day_idx, slot_idx)
+    if _slot_conflict_in_bitsets(domain, day_idx, slot_idx, bit, bitsets):
+        return False
+    candidates, specific_hall = domain.rooms(day_idx, slot_idx)
+    free_rooms = bitsets.free_rooms
+    if not specific_hall and free_rooms is not None and free_rooms.rooms_data is domain.model.rooms_data:
+        candidates = free_rooms.available(day_idx, slot_idx, domain.room_type)
+    for room_name in ((specific_hall,) if specific_hall else candidates):
+        if not bitsets.room.get(room_name, 0) & bit and \
+           not _consecutive_hall_clash_in_bitsets(domain, lecture, slot_idx, bit, room_name, bitsets, consecutive_large_hall_rule):
+            return True
+    return False
+
+# ✨✨✨ النسخة الجديدة والمبسطة - استبدل الدالة بالكامل بهذه ✨✨✨
+def is_placement_valid(lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, teacher_constraints, special_constraints, identifiers_by_level, rules_grid, globally_unavailable_slots, rooms_data, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    domain = model.domain(lecture)
+    return _is_placement_valid_in_domain(domain, lecture, day_idx, slot_idx, final_schedule, teacher_schedule, room_schedule, consecutive_large_hall_rule)
+
+
 # النسخة النهائية والشاملة للدالة
-def calculate_slot_fitness(teacher_name, day_idx, slot_idx, teacher_schedule, special_constraints, prefer_morning_slots=False):
+def calculate_slot_fitness(teacher_name, day_idx, slot_idx, teacher_schedule, special_constraints, prefer_morning_slots=False, model=None):
     """
     تحسب جودة الخانة مع مكافآت وعقوبات لكل القيود المرنة.
     """
+    model = _model_from_settings(model, special_constraints=special_constraints)
     fitness = 100  # درجة أساسية
     teacher_slots = teacher_schedule.get(teacher_name, set())
     prof_constraints = special_constraints.get(teacher_name, {})
@@ -3790,8 +7518,8 @@ def calculate_slot_fitness(teacher_name, day_idx, slot_idx, teacher_schedule, sp
             fitness += 150
 
     # 2. مكافأة للأيام المتتالية (إذا طُلب ذلك)
-    distribution_rule = prof_constraints.get('distribution_rule', 'غير محدد')
-    if 'متتاليان' in distribution_rule or 'متتالية' in distribution_rule:
+    _, needs_consecutive_days = model.distribution_target(teacher_name)
+    if needs_consecutive_days:
         worked_days = {d for d, s in teacher_slots}
         if worked_days:
             is_adjacent_day = any(abs(day_idx - worked_day) == 1 for worked_day in worked_days)
@@ -3826,153 +7554,132 @@ def calculate_slot_fitness(teacher_name, day_idx, slot_idx, teacher_schedule, sp
 # هذه الدالة الجديدة ستحل محل دالتي التحقق من التوزيع القديمتين
 # ================== بداية الكود الجديد المقترح ==================
 
-def validate_teacher_constraints_in_solution(teacher_schedule, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, last_slot_restrictions, num_slots, constraint_severities, max_sessions_per_day=None, non_sharing_teacher_pairs=[]):
+def _teacher_violation_vector(teacher_name, assigned_slots, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, saturday_idx, last_slot_restrictions, num_slots, model, max_sessions_per_day):
+    """
+    أخطاء القيود الفردية لأستاذ واحد مقسمة حسب القسم، مع أيام عمله (لقيود الأزواج):
+    (الأيام اليدوية، البدء والانتهاء، السبت، آخر الحصص، الحصص اليومية، التوزيع، أيام العمل).
+    """
+    penalties = model.penalties
+    involved_lectures = lectures_by_teacher_map.get(teacher_name, [])
+    manual, start_end, saturday, last_slot, max_sessions, distribution = [], [], [], [], [], []
+    work_days = frozenset(d for d, s in assigned_slots)
+    constraints = teacher_constraints.get(teacher_name, {})
+    prof_constraints = special_constraints.get(teacher_name)
+
+    # --- 1. قيود الأيام اليدوية (صارم دائماً) ---
+    if 'allowed_days' in constraints and any(day_idx not in constraints['allowed_days'] for day_idx in work_days):
+        manual.append(Violation('manual_days', (), teacher_name, "قيد الأيام اليدوية", 100, involved_lectures))
+
+    # --- 2. أوقات البدء والانتهاء (صارمة دائماً) ---
+    if prof_constraints is not None:
+        for failure in validate_start_end_times({teacher_name: assigned_slots}, {teacher_name: prof_constraints}, teacher_constraints):
+            if teacher_name: failure["involved_lectures"] = involved_lectures
+            start_end.append(failure)
+
+    # --- 3. بقية القيود (ديناميكية) ---
+    if saturday_idx != -1 and saturday_teachers and teacher_name not in saturday_teachers and saturday_idx in work_days:
+        saturday.append(Violation('saturday_work', (), teacher_name, "قيد السبت", penalties['saturday_work'], involved_lectures))
+
+    if num_slots > 0 and last_slot_restrictions and teacher_name in last_slot_restrictions:
+        restriction = last_slot_restrictions[teacher_name]
+        restricted_indices = []
+        if restriction == 'last_1' and num_slots >= 1: restricted_indices.append(num_slots - 1)
+        elif restriction == 'last_2' and num_slots >= 2: restricted_indices.extend([num_slots - 1, num_slots - 2])
+
+        if any(slot_idx in restricted_indices for _, slot_idx in assigned_slots):
+            last_slot.append(Violation('last_slot', (len(restricted_indices),), teacher_name, "قيد آخر الحصص", penalties['last_slot'], involved_lectures))
+
+    if max_sessions_per_day:
+        sessions_per_day = defaultdict(int)
+        for day_idx, _ in assigned_slots: sessions_per_day[day_idx] += 1
+
+        for day_idx, count in sessions_per_day.items():
+            if count > max_sessions_per_day:
+                max_sessions.append(Violation('max_sessions', (count, max_sessions_per_day), teacher_name, "قيد الحصص اليومية", penalties['max_sessions'], involved_lectures))
+
+    # --- 4. قيود التوزيع ---
+    if prof_constraints is not None and not constraints.get('allowed_days'):
+        target_days, needs_consecutive_days = model.distribution_target(teacher_name)
+        if target_days != 0:
+            day_indices = sorted(work_days)
+            num_days = len(day_indices)
+            penalty = penalties['distribution']
+
+            if distribution_rule_type == 'required' and num_days != target_days:
+                # هذا يبقى صارم
+                distribution.append(Violation('distribution_required', (target_days, num_days), teacher_name, "قيد التوزيع (صارم)", penalties['distribution_required'], involved_lectures))
+            elif distribution_rule_type == 'allowed' and num_days > target_days:
+                distribution.append(Violation('distribution_allowed', (target_days, num_days), teacher_name, "قيد التوزيع (مرن)", penalty, involved_lectures))
+
+            if needs_consecutive_days:
+                if num_days > 1 and any(day_indices[i+1] - day_indices[i] != 1 for i in range(num_days - 1)):
+                    distribution.append(Violation('distribution_consecutive', (), teacher_name, "قيد التوزيع", penalty, involved_lectures))
+
+    return manual, start_end, saturday, last_slot, max_sessions, distribution, work_days
+
+def validate_teacher_constraints_in_solution(teacher_schedule, special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers, teacher_pairs, day_to_idx, last_slot_restrictions, num_slots, constraint_severities, max_sessions_per_day=None, non_sharing_teacher_pairs=[], vector_cache=None, model=None):
     """
     النسخة النهائية: تتحقق من كل قيود الأساتذة وتضيف قائمة المحاضرات المتورطة (`involved_lectures`) لكل خطأ.
+    الأخطاء سجلات Violation مضغوطة، عدا أخطاء أوقات البدء والانتهاء التي تبقى قواميس.
+    vector_cache: ذاكرة TeacherValidationCache اختيارية؛ معها لا يُعاد فحص إلا الأساتذة الذين تغيرت فتراتهم.
     """
+    model = _model_from_settings(model, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 constraint_severities=constraint_severities, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
+    penalties = model.penalties
+    saturday_idx = day_to_idx.get('السبت', -1)
+    if vector_cache is not None:
+        vector_cache.bind((special_constraints, teacher_constraints, lectures_by_teacher_map, distribution_rule_type, saturday_teachers,
+                           day_to_idx, last_slot_restrictions, num_slots, constraint_severities, max_sessions_per_day))
+
+    vectors = {}
+    def vector_of(teacher_name):
+        if teacher_name in vectors: return vectors[teacher_name]
+        assigned_slots = teacher_schedule.get(teacher_name)
+        if not assigned_slots:
+            vector = None
+        else:
+            compute = lambda: _teacher_violation_vector(
+                teacher_name, assigned_slots, special_constraints, teacher_constraints, lectures_by_teacher_map,
+                distribution_rule_type, saturday_teachers, saturday_idx, last_slot_restrictions, num_slots, model, max_sessions_per_day
+            )
+            vector = vector_cache.vector(teacher_name, assigned_slots, compute) if vector_cache is not None else compute()
+        vectors[teacher_name] = vector
+        return vector
 
+    # ✨ تجميع الأخطاء قسماً قسماً وبنفس ترتيب المرور الأصلي على كل مصدر
     failures = []
+    def collect(section, teacher_names):
+        for teacher_name in teacher_names:
+            vector = vector_of(teacher_name)
+            if vector is not None and vector[section]: failures.extend(vector[section])
 
-    # --- 1. التحقق من قيود الأيام اليدوية (صارم دائماً) ---
-    for teacher_name, constraints in teacher_constraints.items():
-        if 'allowed_days' in constraints:
-            allowed_days_set = constraints['allowed_days']
-            assigned_slots = teacher_schedule.get(teacher_name, set())
-            for day_idx, _ in assigned_slots:
-                if day_idx not in allowed_days_set:
-                    failures.append({
-                        "course_name": "قيد الأيام اليدوية", 
-                        "teacher_name": teacher_name,
-                        "reason": "الأستاذ يعمل في يوم غير مسموح به يدويًا.",
-                        "penalty": 100, # ✨ هذا قيد صارم دائماً
-                        "involved_lectures": lectures_by_teacher_map.get(teacher_name, [])
-                    })
-                    break 
-
-    # --- 2. التحقق من أوقات البدء والانتهاء (صارمة دائماً) ---
-    start_end_time_failures = validate_start_end_times(teacher_schedule, special_constraints, teacher_constraints)
-    for failure in start_end_time_failures:
-        teacher_name = failure.get('teacher_name')
-        if teacher_name:
-            failure["involved_lectures"] = lectures_by_teacher_map.get(teacher_name, [])
-        failures.append(failure)
-
-    # --- 3. التحقق من بقية القيود (الآن أصبحت ديناميكية) ---
-    saturday_idx = day_to_idx.get('السبت', -1)
-    if saturday_idx != -1 and saturday_teachers:
-        # ✨ تحديد العقوبة بناءً على اختيار المستخدم
-        penalty = SEVERITY_PENALTIES.get(constraint_severities.get('saturday_work', 'low'), 1)
-        for teacher_name, slots in teacher_schedule.items():
-            if teacher_name not in saturday_teachers and any(day == saturday_idx for day, _ in slots):
-                failures.append({
-                    "course_name": "قيد السبت", "teacher_name": teacher_name,
-                    "reason": "الأستاذ لا يجب أن يعمل يوم السبت.", "penalty": penalty,
-                    "involved_lectures": lectures_by_teacher_map.get(teacher_name, [])
-                })
-
-    if num_slots > 0 and last_slot_restrictions:
-        penalty = SEVERITY_PENALTIES.get(constraint_severities.get('last_slot', 'low'), 1)
-        for teacher_name, restriction in last_slot_restrictions.items():
-            teacher_slots = teacher_schedule.get(teacher_name, set())
-            if not teacher_slots: continue
-
-            restricted_indices = []
-            if restriction == 'last_1' and num_slots >= 1: restricted_indices.append(num_slots - 1)
-            elif restriction == 'last_2' and num_slots >= 2: restricted_indices.extend([num_slots - 1, num_slots - 2])
-
-            if any(slot_idx in restricted_indices for _, slot_idx in teacher_slots):
-                failures.append({
-                    "course_name": f"قيد آخر الحصص", "teacher_name": teacher_name,
-                    "reason": f"الأستاذ لا يجب أن يعمل في آخر {len(restricted_indices)} حصص.", "penalty": penalty,
-                    "involved_lectures": lectures_by_teacher_map.get(teacher_name, [])
-                })
+    collect(0, teacher_constraints)
+    collect(1, special_constraints)
+    if saturday_idx != -1 and saturday_teachers: collect(2, teacher_schedule)
+    if num_slots > 0 and last_slot_restrictions: collect(3, last_slot_restrictions)
+    if max_sessions_per_day: collect(4, teacher_schedule)
 
-    if max_sessions_per_day:
-        penalty = SEVERITY_PENALTIES.get(constraint_severities.get('max_sessions', 'low'), 1)
-        for teacher_name, slots in teacher_schedule.items():
-            sessions_per_day = defaultdict(int)
-            for day_idx, _ in slots: sessions_per_day[day_idx] += 1
-
-            for day_idx, count in sessions_per_day.items():
-                if count > max_sessions_per_day:
-                    failures.append({
-                        "course_name": "قيد الحصص اليومية", "teacher_name": teacher_name,
-                        "reason": f"تجاوز الحد الأقصى للحصص ({count} > {max_sessions_per_day}).", "penalty": penalty,
-                        "involved_lectures": lectures_by_teacher_map.get(teacher_name, [])
-                    })
-
-    # الكود الجديد (الصحيح)
     if teacher_pairs or non_sharing_teacher_pairs:
-        # ✨ نقوم بإنشاء القاموس هنا في البداية إذا كان أي من القيدين مستخدماً
-        teacher_work_days = {t: {d for d, s in sl} for t, sl in teacher_schedule.items()}
+        def work_days_of(teacher_name):
+            vector = vector_of(teacher_name)
+            return vector[6] if vector is not None else frozenset()
 
         if teacher_pairs:
-            penalty = SEVERITY_PENALTIES.get(constraint_severities.get('teacher_pairs', 'low'), 1)
+            penalty = penalties['teacher_pairs']
             for t1, t2 in teacher_pairs:
-                days1, days2 = teacher_work_days.get(t1, set()), teacher_work_days.get(t2, set())
-                if days1 != days2:
+                if work_days_of(t1) != work_days_of(t2):
                     involved = lectures_by_teacher_map.get(t1, []) + lectures_by_teacher_map.get(t2, [])
-                    failures.append({
-                        "course_name": "قيد الأزواج", "teacher_name": f"{t1} و {t2}",
-                        "reason": "أيام عمل الأستاذين غير متطابقة.", "penalty": penalty,
-                        "involved_lectures": involved
-                    })
+                    failures.append(Violation('teacher_pairs', (), f"{t1} و {t2}", "قيد الأزواج", penalty, involved))
 
         if non_sharing_teacher_pairs:
-            penalty = SEVERITY_PENALTIES.get(constraint_severities.get('non_sharing_days', 'hard'), 100)
+            penalty = penalties['non_sharing_days']
             for t1, t2 in non_sharing_teacher_pairs:
-                days1 = teacher_work_days.get(t1, set())
-                days2 = teacher_work_days.get(t2, set())
-
                 # التحقق مما إذا كان هناك تقاطع في أيام العمل
-                if days1.intersection(days2):
+                if work_days_of(t1) & work_days_of(t2):
                     involved = lectures_by_teacher_map.get(t1, []) + lectures_by_teacher_map.get(t2, [])
-                    failures.append({
-                        "course_name": "قيد عدم التشارك", "teacher_name": f"{t1} و {t2}",
-                        "reason": "يجب ألا يعمل هذان الأستاذان في نفس الأيام.", "penalty": penalty,
-                        "involved_lectures": involved
-                    })
-    
-    # --- 4. التحقق من قيود التوزيع ---
-    penalty = SEVERITY_PENALTIES.get(constraint_severities.get('distribution', 'low'), 1)
-    for teacher_name, prof_constraints in special_constraints.items():
-        if teacher_constraints.get(teacher_name, {}).get('allowed_days'): continue
-        rule = prof_constraints.get('distribution_rule', 'غير محدد')
-        if rule == 'غير محدد': continue
-
-        assigned_slots = teacher_schedule.get(teacher_name, set())
-        if not assigned_slots: continue
-
-        day_indices = sorted(list({d for d, s in assigned_slots}))
-        num_days = len(day_indices)
-        target_days = 0
-        if 'يومان' in rule or 'يومين' in rule: target_days = 2
-        elif 'ثلاثة أيام' in rule or '3 أيام' in rule: target_days = 3
-        if target_days == 0: continue
-
-        involved_lectures = lectures_by_teacher_map.get(teacher_name, [])
-
-        if distribution_rule_type == 'required' and num_days != target_days:
-            failures.append({
-                "course_name": "قيد التوزيع (صارم)", "teacher_name": teacher_name,
-                "reason": f"يجب أن يعمل {target_days} أيام بالضبط (يعمل حالياً {num_days}).", "penalty": 100, # هذا يبقى صارم
-                "involved_lectures": involved_lectures
-            })
-        elif distribution_rule_type == 'allowed' and num_days > target_days:
-            failures.append({
-                "course_name": "قيد التوزيع (مرن)", "teacher_name": teacher_name,
-                "reason": f"يجب أن يعمل {target_days} أيام كحد أقصى (يعمل حالياً {num_days}).", "penalty": penalty,
-                "involved_lectures": involved_lectures
-            })
-
-        if 'متتاليان' in rule or 'متتالية' in rule:
-            if num_days > 1 and any(day_indices[i+1] - day_indices[i] != 1 for i in range(num_days - 1)):
-                failures.append({
-                    "course_name": "قيد التوزيع", "teacher_name": teacher_name,
-                    "reason": "أيام عمل الأستاذ ليست متتالية كما هو مطلوب.", "penalty": penalty,
-                    "involved_lectures": involved_lectures
-                })
+                    failures.append(Violation('non_sharing_days', (), f"{t1} و {t2}", "قيد عدم التشارك", penalty, involved))
 
+    collect(5, special_constraints)
     return failures
 
 # ✨✨✨ النسخة النهائية والصحيحة - استبدل الدالة بالكامل بهذه ✨✨✨
@@ -4311,17 +8018,8 @@ def get_schedules_by_professor():
 
 # ✨✨ --- بداية الإضافة: دالة مساعدة لتوليد جدول القاعات الفارغة --- ✨✨
 def _generate_free_rooms_schedule(schedule_by_level, days, slots, rooms_data):
-    all_room_names = {room['name'] for room in rooms_data}
-    occupied_rooms_by_slot = [[set() for _ in slots] for _ in days]
-    for grid in schedule_by_level.values():
-        for day_idx in range(len(days)):
-            for slot_idx in range(len(slots)):
-                if day_idx < len(grid) and slot_idx < len(grid[day_idx]):
-                    for lecture in grid[day_idx][slot_idx]:
-                        if lecture.get('room'): 
-                            occupied_rooms_by_slot[day_idx][slot_idx].add(lecture.get('room'))
-
-    free_rooms_schedule = [[sorted(list(all_room_names - occupied_rooms_by_slot[d][s])) for s in range(len(slots))] for d in range(len(days))]
+    free_rooms = FreeRoomPool.from_schedule(schedule_by_level, rooms_data)
+    free_rooms_schedule = [[sorted(free_rooms.free(d, s)) for s in range(len(slots))] for d in range(len(days))]
     return free_rooms_schedule
 # ✨✨ --- نهاية الإضافة --- ✨✨
 
@@ -5014,7 +8712,13 @@ def get_dashboard_stats():
 # =====================================================================
 # START: LARGE NEIGHBORHOOD SEARCH (LNS) - MODIFIED
 # =====================================================================
-def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, max_iterations, ruin_factor, prioritize_primary, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, initial_solution=None, max_sessions_per_day=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, lns_stagnation_threshold=100):
+def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, max_iterations, ruin_factor, prioritize_primary, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, initial_solution=None, max_sessions_per_day=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, lns_stagnation_threshold=100, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     
     # ✨ 1. إضافة الدالة المساعدة لتحويل اللياقة إلى درجة رقمية
     def fitness_tuple_to_score(fitness_tuple):
@@ -5047,11 +8751,13 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
         identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
         lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
         day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
-        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model
     )
 
     current_fitness = initial_fitness
     best_fitness_so_far = initial_fitness
+    # ✨ مقيّم تزايدي يتتبع الحل الحالي ويقيّم المرشح عبر الخلايا المتغيرة فقط
+    fitness_evaluator = IncrementalFitnessEvaluator(copy.deepcopy(current_solution), all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
     best_solution_so_far = copy.deepcopy(current_solution)
     
     # ✨ 3. تحديث رسالة السجل الأولية
@@ -5078,10 +8784,10 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
                 best_solution_so_far, all_lectures, days, slots, rooms_data, teachers, all_levels, teacher_constraints, 
                 special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map, globally_unavailable_slots, 
                 saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
-                consecutive_large_hall_rule, prefer_morning_slots, extra_teachers_on_hard_error=mutation_hard_intensity, soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                consecutive_large_hall_rule, prefer_morning_slots, extra_teachers_on_hard_error=mutation_hard_intensity, soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, 
-                constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            fitness_evaluator.reset(copy.deepcopy(current_solution))
+            current_fitness = fitness_evaluator.fitness()
             stagnation_counter = 0 # إعادة تصفير العداد
 
         # ✨✨ --- بداية الجزء الجديد الخاص بالبحث الجواري الواسع --- ✨✨
@@ -5097,10 +8803,11 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
                 consecutive_large_hall_rule, prefer_morning_slots,
                 extra_teachers_on_hard_error=intensity,
                 soft_error_shake_probability=mutation_soft_probability,
-                non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
             
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            fitness_evaluator.reset(copy.deepcopy(current_solution))
+            current_fitness = fitness_evaluator.fitness()
             
             # إعادة تعيين الإشارة والعدادات
             SCHEDULING_STATE['force_mutation'] = False 
@@ -5131,7 +8838,7 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
         if not unique_teacher_names: continue
         adaptive_ruin_factor = ruin_factor * (1 - (i / max_iterations) * 0.5)
         num_to_ruin = max(1, min(int(len(unique_teacher_names) * adaptive_ruin_factor), len(unique_teacher_names)))
-        _, current_failures_list = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+        current_failures_list = fitness_evaluator.failures()
         prof_conflict_weights = defaultdict(int)
         for failure in current_failures_list:
             teacher = failure.get('teacher_name')
@@ -5160,18 +8867,18 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
                         teacher_schedule_rebuild.setdefault(lec['teacher_name'], set()).add((day_idx, slot_idx))
                         if lec.get('room'): room_schedule_rebuild.setdefault(lec['room'], set()).add((day_idx, slot_idx))
         lectures_to_reinsert_sorted = sorted(lectures_to_reinsert, key=lambda lec: calculate_lecture_difficulty(lec, lectures_by_teacher_map.get(lec.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True)
-        for lecture in lectures_to_reinsert_sorted:
-            find_slot_for_single_lecture(lecture, new_solution_candidate, teacher_schedule_rebuild, room_schedule_rebuild, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots)
+        # ✨ الإصلاح بالندم (الصعوبة تحسم التعادل)
+        RegretRepair(
+            new_solution_candidate, teacher_schedule_rebuild, room_schedule_rebuild, days, slots, rules_grid, rooms_data,
+            teacher_constraints, globally_unavailable_slots, special_constraints, identifiers_by_level,
+            saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments,
+            consecutive_large_hall_rule, prefer_morning_slots,
+            primary_slots=primary_slots, reserve_slots=reserve_slots, prioritize_primary=prioritize_primary, model=model
+        ).repair(lectures_to_reinsert_sorted)
         # ...
         
         # ✨ 4. حساب لياقة الحل الجديد
-        new_fitness, _ = calculate_fitness(
-            new_solution_candidate, all_lectures, days, slots, teachers, rooms_data, all_levels,
-            identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
-            lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
-            day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
-            specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-        )
+        new_fitness = fitness_evaluator.evaluate_schedule(new_solution_candidate)
         
         # ✨ 5. معيار القبول الهجين
         # استخراج عدد الأخطاء للمقارنة
@@ -5196,7 +8903,7 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
 
         if accept_move:
             current_solution = new_solution_candidate
-            current_fitness = new_fitness
+            current_fitness = fitness_evaluator.sync(new_solution_candidate)
             
             # ✨ 6. تحديث أفضل حل بناءً على اللياقة
             if current_fitness > best_fitness_so_far:
@@ -5207,7 +8914,7 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
                 unplaced, hard, soft = -best_fitness_so_far[0], -best_fitness_so_far[1], -best_fitness_so_far[2]
                 log_q.put(f'   >>> إنجاز جديد! أخطاء (نقص, صارم, مرن)=({unplaced}, {hard}, {soft})')
                 
-                _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                errors_for_best = fitness_evaluator.failures()
                 progress_percentage = calculate_progress_percentage(errors_for_best)
                 log_q.put(f"PROGRESS:{progress_percentage:.1f}")
 
@@ -5227,7 +8934,7 @@ def run_large_neighborhood_search(log_q, all_lectures, days, slots, rooms_data,
         identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
         lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
         day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
-        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
     )
     
     final_cost = fitness_tuple_to_score(final_fitness)
@@ -5313,7 +9020,7 @@ def run_vns_local_search(
     lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
     day_to_idx, rules_grid, prioritize_primary, level_specific_large_rooms, 
     specific_small_room_assignments, constraint_severities, last_slot_restrictions, max_iterations=1,
-    consecutive_large_hall_rule="none", prefer_morning_slots=False, use_strict_hierarchy=False, max_sessions_per_day=None, non_sharing_teacher_pairs=[]
+    consecutive_large_hall_rule="none", prefer_morning_slots=False, use_strict_hierarchy=False, max_sessions_per_day=None, non_sharing_teacher_pairs=[], model=None
 ):
     """
     بحث محلي ذكي وموجه بالأولويات:
@@ -5321,26 +9028,31 @@ def run_vns_local_search(
     2. ثم يستهدف الأخطاء المرنة.
     3. ثم يقوم بالتبديل العشوائي للتحسينات الطفيفة.
     """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     improved_schedule = copy.deepcopy(schedule_to_improve)
     
-    def _evaluate(schedule):
-        return calculate_fitness(
-            schedule, all_lectures, days, slots, teachers, rooms_data, all_levels, 
-            identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
-            lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
-            day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
-            specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy,
-            max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
-            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-        )
-
-    current_fitness, _ = _evaluate(improved_schedule)
+    # ✨ المقيّم التزايدي يتتبع الجدول المحسن ويقيّم كل محاولة عبر الخلايا المتغيرة فقط
+    fitness_evaluator = IncrementalFitnessEvaluator(
+        copy.deepcopy(improved_schedule), all_lectures, days, slots, teachers, rooms_data, all_levels, 
+        identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, 
+        lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, 
+        day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, 
+        specific_small_room_assignments, constraint_severities, use_strict_hierarchy=use_strict_hierarchy,
+        max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule,
+        prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
+    )
+    current_fitness = fitness_evaluator.fitness()
 
     for _ in range(max_iterations):
         temp_schedule = copy.deepcopy(improved_schedule)
         
         # --- بداية المنطق الجديد الموجه بالأولويات ---
-        _, failures_list = _evaluate(temp_schedule)
+        failures_list = fitness_evaluator.failures()
         hard_errors = [f for f in failures_list if f.get('penalty', 0) >= 100]
         soft_errors = [f for f in failures_list if 0 < f.get('penalty', 0) < 100]
 
@@ -5387,7 +9099,7 @@ def run_vns_local_search(
                     (primary_slots if any(rule.get('rule_type') == 'SPECIFIC_LARGE_HALL' for rule in rules_grid[day_idx][slot_idx]) else reserve_slots).append((day_idx, slot_idx))
 
             for lecture in sorted(lectures_to_reinsert, key=lambda l: calculate_lecture_difficulty(l, lectures_by_teacher_map.get(l.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True):
-                find_slot_for_single_lecture(lecture, temp_schedule, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots)
+                find_slot_for_single_lecture(lecture, temp_schedule, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots, model=model)
 
         elif move_type == 'swap':
             # إذا لا توجد أخطاء، قم بتبديل عشوائي لتحسين الضغط
@@ -5412,11 +9124,11 @@ def run_vns_local_search(
             temp_schedule[p2['level']][d1][s1].append(lec2)
         # --- نهاية المنطق الجديد ---
 
-        new_fitness, _ = _evaluate(temp_schedule)
+        new_fitness = fitness_evaluator.evaluate_schedule(temp_schedule)
 
         if new_fitness > current_fitness:
             improved_schedule = temp_schedule
-            current_fitness = new_fitness
+            current_fitness = fitness_evaluator.sync(temp_schedule)
 
     return improved_schedule
 # =====================================================================
@@ -5431,7 +9143,13 @@ def run_variable_neighborhood_search(
     lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs,
     day_to_idx, rules_grid, max_iterations, k_max, prioritize_primary,
     scheduling_state, last_slot_restrictions, level_specific_large_rooms,
-    specific_small_room_assignments, constraint_severities, algorithm_settings, initial_solution=None, max_sessions_per_day=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, vns_stagnation_threshold=50):
+    specific_small_room_assignments, constraint_severities, algorithm_settings, initial_solution=None, max_sessions_per_day=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, vns_stagnation_threshold=50, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
 
     log_q.put('--- بدء VNS (معيار القبول الصارم) ---')
     
@@ -5450,7 +9168,7 @@ def run_variable_neighborhood_search(
         log_q.put('   - VNS: الانطلاق من الحل المبدئي المحسّن.')
         current_solution = copy.deepcopy(initial_solution)
 
-    initial_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    initial_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
     current_fitness, best_fitness_so_far = initial_fitness, initial_fitness
     best_solution_so_far = copy.deepcopy(current_solution)
 
@@ -5475,11 +9193,11 @@ def run_variable_neighborhood_search(
                 best_solution_so_far, all_lectures, days, slots, rooms_data, teachers, all_levels, teacher_constraints, 
                 special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map, globally_unavailable_slots, 
                 saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
-                consecutive_large_hall_rule, prefer_morning_slots, extra_teachers_on_hard_error=mutation_hard_intensity, soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                consecutive_large_hall_rule, prefer_morning_slots, extra_teachers_on_hard_error=mutation_hard_intensity, soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
             # نقوم بإعادة تقييم الحل الجديد وتحديث اللياقة الحالية
             current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, 
-                constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
             stagnation_counter = 0 # إعادة تصفير العداد
 
         if scheduling_state.get('should_stop'): raise StopByUserException()
@@ -5493,9 +9211,9 @@ def run_variable_neighborhood_search(
                 consecutive_large_hall_rule, prefer_morning_slots,
                 extra_teachers_on_hard_error=intensity,
                 soft_error_shake_probability=mutation_soft_probability,
-                non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
             SCHEDULING_STATE['force_mutation'] = False 
             SCHEDULING_STATE.pop('mutation_intensity', None)
             stagnation_counter = 0
@@ -5507,7 +9225,7 @@ def run_variable_neighborhood_search(
             log_q.put(f'--- دورة التحسين {i + 1}/{max_iterations} | أفضل لياقة (ن,ص,م) = ({unplaced}, {hard}, {soft}) ---')
             time.sleep(0.01)
 
-        _, current_failures = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+        _, current_failures = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
 
         k = 1
         while k <= k_max:
@@ -5541,7 +9259,7 @@ def run_variable_neighborhood_search(
                             if lec.get('teacher_name'): temp_teacher_schedule_shake[lec['teacher_name']].add((d_idx, s_idx))
                             if lec.get('room'): temp_room_schedule_shake[lec.get('room')].add((d_idx, s_idx))
             for lecture in lectures_to_reinsert:
-                find_slot_for_single_lecture(lecture, shaken_solution, temp_teacher_schedule_shake, temp_room_schedule_shake, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots)
+                find_slot_for_single_lecture(lecture, shaken_solution, temp_teacher_schedule_shake, temp_room_schedule_shake, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots, model=model)
 
             vns_ls_iterations = int(algorithm_settings.get('vns_local_search_iterations', 0))
             solution_to_evaluate = shaken_solution
@@ -5554,11 +9272,11 @@ def run_variable_neighborhood_search(
                     specific_small_room_assignments, constraint_severities, last_slot_restrictions, 
                     max_iterations=vns_ls_iterations, consecutive_large_hall_rule=consecutive_large_hall_rule, 
                     prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy,
-                    max_sessions_per_day=max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    max_sessions_per_day=max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
                 solution_to_evaluate = improved_shaken_solution
 
-            new_fitness, _ = calculate_fitness(solution_to_evaluate, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            new_fitness, _ = calculate_fitness(solution_to_evaluate, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
 
             # --- ✨ بداية معيار القبول الهجين والمستقر ---
             accept_move = False
@@ -5595,7 +9313,7 @@ def run_variable_neighborhood_search(
                     unplaced_best, hard_best, soft_best = -best_fitness_so_far[0], -best_fitness_so_far[1], -best_fitness_so_far[2]
                     log_q.put(f'   >>> إنجاز جديد! أفضل لياقة (ن,ص,م) = ({unplaced_best}, {hard_best}, {soft_best})')
                     
-                    _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                    _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
                     progress_percentage = calculate_progress_percentage(errors_for_best)
                     log_q.put(f"PROGRESS:{progress_percentage:.1f}")
 
@@ -5612,7 +9330,7 @@ def run_variable_neighborhood_search(
     
     # --- الفحص النهائي وإرجاع النتيجة (لا تغيير) ---
     log_q.put('انتهت خوارزمية VNS.')
-    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
     unplaced, hard, soft = -final_fitness[0], -final_fitness[1], -final_fitness[2]
     final_cost = (unplaced * 1000) + (hard * 100) + soft
     final_progress = calculate_progress_percentage(final_failures_list)
@@ -5634,11 +9352,16 @@ def _perform_flexible_swap(
     day_to_idx, level_specific_large_rooms, specific_small_room_assignments, 
     consecutive_large_hall_rule, prefer_morning_slots,
     current_failures, # [+++ تعديل استراتيجي +++] استقبال الأخطاء الحالية
-    num_swaps=3
+    num_swaps=3, model=None
 ):
     """
     يقوم بسلسلة من التبديلات الاستراتيجية التي تستهدف الأخطاء، مع إعادة بناء موسعة.
     """
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, special_constraints=special_constraints,
+                                 teacher_constraints=teacher_constraints, globally_unavailable_slots=globally_unavailable_slots,
+                                 saturday_teachers=saturday_teachers, day_to_idx=day_to_idx)
     if not flex_pools:
         return None, None
 
@@ -5732,9 +9455,14 @@ def _perform_flexible_swap(
         for slot_idx in range(len(slots)):
             (primary_slots if any(r.get('rule_type') == 'SPECIFIC_LARGE_HALL' for r in rules_grid[day_idx][slot_idx]) else reserve_slots).append((day_idx, slot_idx))
 
-    # إعادة جدولة كل المحاضرات التي تم إزالتها
-    for lecture in sorted(lectures_to_rebuild_all, key=lambda l: calculate_lecture_difficulty(l, temp_map_for_sorting.get(l.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True):
-        find_slot_for_single_lecture(lecture, shaken_solution, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, True, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots)
+    # إعادة جدولة كل المحاضرات التي تم إزالتها (بالندم، والصعوبة تحسم التعادل)
+    RegretRepair(
+        shaken_solution, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data,
+        teacher_constraints, globally_unavailable_slots, special_constraints, identifiers_by_level,
+        saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments,
+        consecutive_large_hall_rule, prefer_morning_slots,
+        primary_slots=primary_slots, reserve_slots=reserve_slots, prioritize_primary=True, model=model
+    ).repair(sorted(lectures_to_rebuild_all, key=lambda l: calculate_lecture_difficulty(l, temp_map_for_sorting.get(l.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True))
     
     return shaken_solution, swapped_teachers_overall
 
@@ -5750,8 +9478,14 @@ def run_vns_with_flex_assignments(
     scheduling_state, last_slot_restrictions, level_specific_large_rooms,
     specific_small_room_assignments, constraint_severities, flexible_categories, algorithm_settings, max_sessions_per_day=None,
     initial_schedule=None, initial_teacher_schedule=None, initial_room_schedule=None,
-    consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, vns_stagnation_threshold=50
+    consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, vns_stagnation_threshold=50, model=None
 ):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     log_q.put('--- بدء VNS المرن (ذاتي التكيف والاستراتيجي) ---')
 
     start_temperature = 1.5  # حرارة ابتدائية عالية جداً (مغامرة)
@@ -5792,14 +9526,14 @@ def run_vns_with_flex_assignments(
         all_scheduled_ids = {lec['id'] for grid in current_solution.values() for day in grid for slot in day for lec in slot}
         lectures_to_place = [lec for lec in all_lectures if lec.get('teacher_name') and lec.get('id') not in all_scheduled_ids]
         for lecture in sorted(lectures_to_place, key=lambda l: calculate_lecture_difficulty(l, updated_lectures_by_teacher_map.get(l.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True):
-            find_slot_for_single_lecture(lecture, current_solution, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots)
+            find_slot_for_single_lecture(lecture, current_solution, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, model=model)
     else:
         current_solution, temp_teacher_schedule, temp_room_schedule = {level: [[[] for _ in slots] for _ in days] for level in all_levels}, defaultdict(set), defaultdict(set)
         lectures_with_teacher = [lec for lec in all_lectures if lec.get('teacher_name')]
         for lecture in sorted(lectures_with_teacher, key=lambda l: calculate_lecture_difficulty(l, updated_lectures_by_teacher_map.get(l.get('teacher_name'), []), special_constraints, teacher_constraints), reverse=True):
-            find_slot_for_single_lecture(lecture, current_solution, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots)
+            find_slot_for_single_lecture(lecture, current_solution, temp_teacher_schedule, temp_room_schedule, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, model=model)
     
-    current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
     best_fitness_so_far, best_solution_so_far = current_fitness, copy.deepcopy(current_solution)
     unplaced, hard, soft = -best_fitness_so_far[0], -best_fitness_so_far[1], -best_fitness_so_far[2]
     log_q.put(f' - اكتمل البناء المبدئي. اللياقة (نقص, صارم, مرن) = ({unplaced}, {hard}, {soft})')
@@ -5813,7 +9547,7 @@ def run_vns_with_flex_assignments(
     shake_strategy_weights = {'lectures': 1.0, 'teachers': 1.0, 'days': 1.0}
 
     for i in range(max_iterations):
-        _, current_failures = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+        _, current_failures = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
 
         if stagnation_counter >= STAGNATION_LIMIT:
             swapped_solution, swapped_teachers = _perform_flexible_swap(
@@ -5823,7 +9557,7 @@ def run_vns_with_flex_assignments(
                 day_to_idx, level_specific_large_rooms, specific_small_room_assignments, 
                 consecutive_large_hall_rule, prefer_morning_slots,
                 current_failures=current_failures, # [+++ تعديل استراتيجي +++] تمرير الأخطاء
-                num_swaps=3
+                num_swaps=3, model=model
             )
             # ... (بقية منطق الركود يبقى كما هو) ...
             if swapped_solution:
@@ -5832,15 +9566,17 @@ def run_vns_with_flex_assignments(
                     updated_lectures_by_teacher_map.clear()
                     for lec in all_lectures:
                         if lec.get('teacher_name'): updated_lectures_by_teacher_map[lec.get('teacher_name')].append(lec)
+                    # الإسناد تغير داخل نفس الكائنات، فالنتائج المحفوظة لم تعد صالحة
+                    clear_fitness_cache()
             else:
                 log_q.put('   >>> لم يتم العثور على تبديل مناسب. تطبيق طفرة قوية كخطة بديلة...')
                 current_solution = mutate(
                     best_solution_so_far, all_lectures, days, slots, rooms_data, teachers, all_levels, teacher_constraints, 
                     special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map, globally_unavailable_slots, 
                     saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, 
-                    consecutive_large_hall_rule, prefer_morning_slots, extra_teachers_on_hard_error=mutation_hard_intensity, soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    consecutive_large_hall_rule, prefer_morning_slots, extra_teachers_on_hard_error=mutation_hard_intensity, soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
             stagnation_counter = 0
 
         # ... (بقية الحلقة تبقى كما هي حتى نصل لاختيار استراتيجية الهز) ...
@@ -5855,9 +9591,9 @@ def run_vns_with_flex_assignments(
                 consecutive_large_hall_rule, prefer_morning_slots,
                 extra_teachers_on_hard_error=intensity,
                 soft_error_shake_probability=mutation_soft_probability,
-                non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
             )
-            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            current_fitness, _ = calculate_fitness(current_solution, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
             SCHEDULING_STATE['force_mutation'] = False 
             SCHEDULING_STATE.pop('mutation_intensity', None)
             stagnation_counter = 0
@@ -5902,7 +9638,7 @@ def run_vns_with_flex_assignments(
                             if lec.get('teacher_name'): temp_teacher_schedule_shake[lec['teacher_name']].add((d_idx, s_idx))
                             if lec.get('room'): temp_room_schedule_shake[lec.get('room')].add((d_idx, s_idx))
             for lecture in lectures_to_reinsert:
-                find_slot_for_single_lecture(lecture, shaken_solution, temp_teacher_schedule_shake, temp_room_schedule_shake, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots)
+                find_slot_for_single_lecture(lecture, shaken_solution, temp_teacher_schedule_shake, temp_room_schedule_shake, days, slots, rules_grid, rooms_data, teacher_constraints, globally_unavailable_slots, special_constraints, primary_slots, reserve_slots, identifiers_by_level, prioritize_primary, saturday_teachers, day_to_idx, level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots, model=model)
 
             vns_ls_iterations = int(algorithm_settings.get('vns_local_search_iterations', 0))
             solution_to_evaluate = shaken_solution
@@ -5915,10 +9651,10 @@ def run_vns_with_flex_assignments(
                     specific_small_room_assignments, constraint_severities, last_slot_restrictions, 
                     max_iterations=vns_ls_iterations, consecutive_large_hall_rule=consecutive_large_hall_rule, 
                     prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy,
-                    max_sessions_per_day=max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    max_sessions_per_day=max_sessions_per_day, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
 
-            new_fitness, _ = calculate_fitness(solution_to_evaluate, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            new_fitness, _ = calculate_fitness(solution_to_evaluate, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, mode="count", model=model)
 
             # --- بداية معيار القبول بالتبريد التدريجي (Simulated Annealing) ---
             accept_move = False
@@ -5967,7 +9703,7 @@ def run_vns_with_flex_assignments(
                     if progress_channel: progress_channel['best_solution_so_far'] = best_solution_so_far
                     unplaced_best, hard_best, soft_best = -best_fitness_so_far[0], -best_fitness_so_far[1], -best_fitness_so_far[2]
                     log_q.put(f'   >>> إنجاز جديد! أفضل لياقة (ن,ص,م) = ({unplaced_best}, {hard_best}, {soft_best})')
-                    _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+                    _, errors_for_best = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
                     progress_percentage = calculate_progress_percentage(errors_for_best)
                     log_q.put(f"PROGRESS:{progress_percentage:.1f}")
                 k = 1
@@ -5982,7 +9718,7 @@ def run_vns_with_flex_assignments(
     
     # ... (الكود الختامي لإرجاع النتيجة يبقى كما هو) ...
     log_q.put('انتهت خوارزمية VNS المرنة.')
-    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, all_lectures, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, updated_lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities=constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
     unplaced, hard, soft = -final_fitness[0], -final_fitness[1], -final_fitness[2]
     final_cost = (unplaced * 1000) + (hard * 100) + soft
     final_progress = calculate_progress_percentage(final_failures_list)
@@ -5996,22 +9732,31 @@ def run_vns_with_flex_assignments(
 # =====================================================================
 # START: CLONAL SELECTION ALGORITHM (CLONALG)
 # =====================================================================
-def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, population_size, generations, selection_size, clone_factor, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, initial_solution_seed=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, ga_stagnation_threshold=15):
+def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, population_size, generations, selection_size, clone_factor, scheduling_state, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, initial_solution_seed=None, consecutive_large_hall_rule="none", progress_channel=None, prefer_morning_slots=False, use_strict_hierarchy=False, non_sharing_teacher_pairs=[], mutation_hard_intensity=3, mutation_soft_probability=0.5, ga_stagnation_threshold=15, model=None):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     
     log_q.put('--- بدء خوارزمية التحسين بالاستنساخ (CLONALG) ---')
 
     # 1. إنشاء مجموعة أولية من الأجسام المضادة (الحلول)
     log_q.put(f'   - جاري إنشاء مجموعة الأجسام المضادة الأولية ({population_size} حل)...')
     
-    population = create_initial_population(population_size, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments)
+    # ✨ الأجسام المضادة كروموسومات؛ الاستنساخ نسخ مصفوفتين والطفرة الفائقة على الجدول المفكوك
+    codec = AssignmentCodec(lectures_to_schedule, days, slots, rooms_data, all_levels, model=model)
+    population = [codec.encode(schedule) for schedule in create_initial_population(population_size, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments, model=model)]
     time.sleep(0)
 
     if initial_solution_seed:
         log_q.put('   - تم دمج الحل المبدئي (الطماع) في الجيل الأول.')
         if population:
-            population[0] = initial_solution_seed
+            population[0] = codec.encode(initial_solution_seed)
 
     best_solution_so_far = None
+    best_chromosome_so_far = None
     best_fitness_so_far = (-float('inf'), -float('inf'), -float('inf'))
     
     # متغيرات كشف الركود
@@ -6020,6 +9765,9 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
     stagnation_percentage = float(ga_stagnation_threshold) / 100.0
     STAGNATION_LIMIT = max(15, int(generations * stagnation_percentage))
 
+    # ✨ تقييم الجيل والنسخ المستنسخة دفعة واحدة (نفس نتيجة calculate_fitness لكل حل)
+    population_evaluator = PopulationFitnessEvaluator(lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, use_strict_hierarchy=use_strict_hierarchy, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
+
     # 2. حلقة التطور الرئيسية
     for gen in range(generations):
         if scheduling_state.get('should_stop'):
@@ -6032,15 +9780,15 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
             
             # نفس منطق الخوارزمية الجينية: نطفر أفضل حل ونستبدل به أسوأ حل
             if best_solution_so_far and population:
-                mutated_solution = mutate(
-                    best_solution_so_far, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                mutated_solution = mutate_chromosome(
+                    codec, best_chromosome_so_far, days, slots, rooms_data, teachers, all_levels,
                     teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                     globally_unavailable_slots, saturday_teachers, day_to_idx,
                     level_specific_large_rooms, specific_small_room_assignments, constraint_severities,
                     consecutive_large_hall_rule, prefer_morning_slots,
                     extra_teachers_on_hard_error=intensity,
                     soft_error_shake_probability=mutation_soft_probability,
-                    non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
                 # استبدال أسوأ فرد في الجيل الحالي (الأخير في القائمة) بالنسخة المطفرة
                 population[-1] = mutated_solution
@@ -6054,12 +9802,12 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
         # آلية كشف الركود وإعادة التشغيل الجزئي
         if stagnation_counter >= STAGNATION_LIMIT:
             log_q.put(f'   >>> ⚠️ تم كشف الركود لـ {STAGNATION_LIMIT} جيل. تفعيل إعادة التشغيل الجزئي...')
-            new_population = [best_solution_so_far]
+            new_population = [best_chromosome_so_far]
             new_random_solutions = create_initial_population(
                 population_size - 1, lectures_to_schedule, days, slots, rooms_data, all_levels, 
-                level_specific_large_rooms, specific_small_room_assignments
+                level_specific_large_rooms, specific_small_room_assignments, model=model
             )
-            population = new_population + new_random_solutions
+            population = new_population + [codec.encode(schedule) for schedule in new_random_solutions]
             stagnation_counter = 0 
             log_q.put(f'   >>> تم حقن {population_size - 1} حل عشوائي جديد.')
             continue 
@@ -6068,22 +9816,20 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
         time.sleep(0)
 
         # === الخطوة أ: تقييم الجيل الحالي ===
-        population_with_fitness = []
-        for schedule in population:
-            fitness, _ = calculate_fitness(schedule, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-            population_with_fitness.append((schedule, fitness))
+        population_with_fitness = list(zip(population, population_evaluator.evaluate(population, codec=codec)))
         
         population_with_fitness.sort(key=lambda item: item[1], reverse=True)
 
         # تحديث أفضل حل تم العثور عليه
         if population_with_fitness[0][1] > best_fitness_so_far:
             best_fitness_so_far = population_with_fitness[0][1]
-            best_solution_so_far = copy.deepcopy(population_with_fitness[0][0])
+            best_chromosome_so_far = population_with_fitness[0][0].copy()
+            best_solution_so_far = codec.decode(best_chromosome_so_far)
             if progress_channel: progress_channel['best_solution_so_far'] = best_solution_so_far
             
             log_q.put(f'   >>> إنجاز جديد! أفضل أخطاء = ({-best_fitness_so_far[0]}, {-best_fitness_so_far[1]}, {-best_fitness_so_far[2]})')
             
-            _, errors_for_best = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+            _, errors_for_best = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
             progress_percentage = calculate_progress_percentage(errors_for_best)
             log_q.put(f"PROGRESS:{progress_percentage:.1f}")
 
@@ -6125,11 +9871,9 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
             
             # 4. إنشاء النسخ وتطبيق الطفرة عليها
             for _ in range(num_clones):
-                clone = copy.deepcopy(antibody)
-                
-                # استدعاء دالة الطفرة مرة واحدة بالشدة المحسوبة
-                mutated_clone = mutate(
-                    clone, lectures_to_schedule, days, slots, rooms_data, teachers, all_levels,
+                # استدعاء دالة الطفرة مرة واحدة بالشدة المحسوبة (على نسخة من مصفوفتي الكروموسوم)
+                mutated_clone = mutate_chromosome(
+                    codec, antibody, days, slots, rooms_data, teachers, all_levels,
                     teacher_constraints, special_constraints, identifiers_by_level, rules_grid, lectures_by_teacher_map,
                     globally_unavailable_slots, saturday_teachers, day_to_idx, 
                     level_specific_large_rooms, specific_small_room_assignments, 
@@ -6138,16 +9882,13 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
                     prefer_morning_slots, 
                     mutation_intensity=intensity,
                     extra_teachers_on_hard_error=mutation_hard_intensity,
-                    soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+                    soft_error_shake_probability=mutation_soft_probability, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
                 )
                 cloned_and_mutated_antibodies.append(mutated_clone)
 
         # === الخطوة ج: اختيار الناجين للجيل القادم (الطريقة الفعالة) ===
         # 1. تقييم الحلول الجديدة (المستنسخة) فقط
-        new_clones_with_fitness = []
-        for schedule in cloned_and_mutated_antibodies:
-            fitness, _ = calculate_fitness(schedule, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-            new_clones_with_fitness.append((schedule, fitness))
+        new_clones_with_fitness = list(zip(cloned_and_mutated_antibodies, population_evaluator.evaluate(cloned_and_mutated_antibodies, codec=codec)))
             
         # 2. دمج الحلول القديمة مع الجديدة، ترتيبها، واختيار الأفضل
         combined_population = population_with_fitness + new_clones_with_fitness
@@ -6177,9 +9918,9 @@ def run_clonalg(log_q, lectures_to_schedule, days, slots, rooms_data, teachers,
     log_q.put('انتهت خوارزمية التحسين بالاستنساخ.')
 
     if not best_solution_so_far:
-        best_solution_so_far = population_with_fitness[0][0] if population_with_fitness else create_initial_population(1, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments)[0]
+        best_solution_so_far = codec.decode(population_with_fitness[0][0]) if population_with_fitness else create_initial_population(1, lectures_to_schedule, days, slots, rooms_data, all_levels, level_specific_large_rooms, specific_small_room_assignments, model=model)[0]
 
-    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
+    final_fitness, final_failures_list = calculate_fitness(best_solution_so_far, lectures_to_schedule, days, slots, teachers, rooms_data, all_levels, identifiers_by_level, special_constraints, teacher_constraints, distribution_rule_type, lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs, day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, prefer_morning_slots=prefer_morning_slots, use_strict_hierarchy=use_strict_hierarchy, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
 
     unplaced_count = -final_fitness[0]
     hard_errors = -final_fitness[1]
@@ -6255,6 +9996,12 @@ def run_refinement_task(schedule, settings, days, slots, log_q, all_courses, tea
         # ================== نهاية الكود الجديد الذي يجب إضافته ==================
         
         refinement_level = algorithm_settings.get('refinement_level', 'balanced')
+        model = ConstraintModel(
+            rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+            level_specific_large_rooms=level_specific_large_rooms, specific_small_room_assignments=specific_small_room_assignments,
+            constraint_severities=constraint_severities, special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+            globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers, day_to_idx=day_to_idx
+        )
         # 1. استدعاء دالة التحسين
         refined_schedule, refinement_log = refine_and_compact_schedule(
             schedule, log_q, selected_teachers, all_courses, days, slots, rooms_data, teachers, all_levels, 
@@ -6262,7 +10009,7 @@ def run_refinement_task(schedule, settings, days, slots, log_q, all_courses, tea
             lectures_by_teacher_map, globally_unavailable_slots, saturday_teachers, teacher_pairs,
             day_to_idx, rules_grid, phase_5_settings.get('last_slot_restrictions', {}),
             level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day,
-            consecutive_large_hall_rule, refinement_level=refinement_level, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+            consecutive_large_hall_rule, refinement_level=refinement_level, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model
         )
 
         
@@ -6273,7 +10020,7 @@ def run_refinement_task(schedule, settings, days, slots, log_q, all_courses, tea
 
         # 3. تجميع النتيجة النهائية
         final_result = {
-            "schedule": refined_schedule,
+            "schedule": render_schedule(refined_schedule),
             "days": days,
             "slots": slots,
             "prof_schedules": refined_prof_schedules,
@@ -6321,21 +10068,24 @@ def refine_and_compact_schedule(
     day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms,
     specific_small_room_assignments, constraint_severities, max_sessions_per_day=None, 
     consecutive_large_hall_rule="none", prefer_morning_slots=False, non_sharing_teacher_pairs=[], 
-    refinement_level='balanced'
+    refinement_level='balanced', model=None
 ):
+    model = _model_from_settings(model, rooms_data=rooms_data, rules_grid=rules_grid, identifiers_by_level=identifiers_by_level,
+                                 level_specific_large_rooms=level_specific_large_rooms,
+                                 specific_small_room_assignments=specific_small_room_assignments, constraint_severities=constraint_severities,
+                                 special_constraints=special_constraints, teacher_constraints=teacher_constraints,
+                                 globally_unavailable_slots=globally_unavailable_slots, saturday_teachers=saturday_teachers,
+                                 day_to_idx=day_to_idx)
     refined_schedule = copy.deepcopy(initial_schedule)
     refinement_log = []
 
     base_args = { "days": days, "slots": slots, "teachers": teachers, "rooms_data": rooms_data, "levels": all_levels, "identifiers_by_level": identifiers_by_level, "special_constraints": special_constraints, "teacher_constraints": teacher_constraints, "distribution_rule_type": distribution_rule_type, "lectures_by_teacher_map": lectures_by_teacher_map, "globally_unavailable_slots": globally_unavailable_slots, "saturday_teachers": saturday_teachers, "teacher_pairs": teacher_pairs, "day_to_idx": day_to_idx, "rules_grid": rules_grid, "last_slot_restrictions": last_slot_restrictions, "level_specific_large_rooms": level_specific_large_rooms, "specific_small_room_assignments": specific_small_room_assignments, "constraint_severities": constraint_severities, "max_sessions_per_day": max_sessions_per_day, "consecutive_large_hall_rule": consecutive_large_hall_rule }
     
-    cost_args_violations = {**base_args, "prefer_morning_slots": False}
     cost_args_compaction = {**base_args, "prefer_morning_slots": True}
 
-    initial_violations_failures = calculate_schedule_cost(refined_schedule, **cost_args_violations, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-    violation_cost = sum(f.get('penalty', 1) for f in initial_violations_failures)
-    
-    initial_total_failures = calculate_schedule_cost(refined_schedule, **cost_args_compaction, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-    compaction_cost = sum(f.get('penalty', 1) for f in initial_total_failures) - violation_cost
+    # ✨ المقيّم التزايدي يعطي تكلفة القيود وتكلفة الضغط معاً (عقوبات تفضيل الفترات المبكرة منفصلة عن البقية)
+    fitness_evaluator = IncrementalFitnessEvaluator(refined_schedule, all_lectures, **cost_args_compaction, non_sharing_teacher_pairs=non_sharing_teacher_pairs, model=model)
+    violation_cost, compaction_cost = fitness_evaluator.penalty_totals()
 
     moves_made = 0
     log_q.put(f"⏳ بدء التحسين. تكلفة القيود: {violation_cost} | تكلفة الضغط: {compaction_cost}")
@@ -6428,7 +10178,7 @@ def refine_and_compact_schedule(
                         lec_to_rebuild, temp_schedule_deep, temp_teacher_map, temp_room_map,
                         days, slots, rules_grid, rooms_data, teacher_constraints, set(), special_constraints,
                         [], slots_to_search_deep, identifiers_by_level, False, saturday_teachers, day_to_idx,
-                        level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=True
+                        level_specific_large_rooms, specific_small_room_assignments, consecutive_large_hall_rule, prefer_morning_slots=True, model=model
                     )
                     if not success: unplaced_in_rebuild.append(lec_to_rebuild)
                 
@@ -6439,20 +10189,16 @@ def refine_and_compact_schedule(
                 newly_built_teacher_slots = temp_teacher_map.get(teacher, set())
                 new_penalty = _calculate_end_of_day_penalty(newly_built_teacher_slots, len(slots))
                 
-                new_violations_deep = calculate_schedule_cost(temp_schedule_deep, **cost_args_violations, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-                new_violation_cost_deep = sum(f.get('penalty', 1) for f in new_violations_deep)
+                new_violation_cost_deep, new_compaction_cost_deep = fitness_evaluator.evaluate_schedule_penalties(temp_schedule_deep)
 
                 if new_penalty < old_penalty and new_violation_cost_deep <= violation_cost:
-                    new_total_deep = calculate_schedule_cost(temp_schedule_deep, **cost_args_compaction, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-                    new_compaction_cost_deep = sum(f.get('penalty', 1) for f in new_total_deep) - new_violation_cost_deep
-                    
                     log_message_summary = f"إعادة بناء ناجحة لجدول الأستاذ '{teacher}' (عقوبة نهاية اليوم: {old_penalty} -> {new_penalty})"
                     log_message_details = f"✅ تحسين عميق [ضغط: {compaction_cost} -> {new_compaction_cost_deep} | قيود: {violation_cost} -> {new_violation_cost_deep}]: {log_message_summary}"
                     
                     log_q.put(log_message_details)
                     refinement_log.append(f"  - {log_message_summary}")
 
-                    refined_schedule = temp_schedule_deep
+                    fitness_evaluator.sync(temp_schedule_deep)
                     violation_cost = new_violation_cost_deep
                     compaction_cost = new_compaction_cost_deep
                     moves_made += 1
@@ -6463,31 +10209,16 @@ def refine_and_compact_schedule(
                 teacher_work_days = sorted(list({d for d, s in teacher_schedule_map.get(teacher, set())}))
                 for target_day_idx in teacher_work_days:
                     for target_slot_idx in range(original_slot):
-                        temp_schedule = copy.deepcopy(refined_schedule)
-                        
-                        levels_for_this_lecture = lecture.get('levels', [])
-                        for level_name in levels_for_this_lecture:
-                            if level_name in temp_schedule:
-                                temp_schedule[level_name][original_day][original_slot] = [l for l in temp_schedule[level_name][original_day][original_slot] if l.get('id') != lecture.get('id')]
-                        
+                        # الخلية الهدف تسبق الخلية الأصلية دائماً، لذا لا تؤثر إزالة المحاضرة على فحص القاعة
                         # ✨ [الإصلاح 2] تمرير خريطة القاعات الصحيحة بدلاً من قاموس فارغ
-                        available_room = _find_valid_and_available_room(lecture, target_day_idx, target_slot_idx, temp_schedule, room_schedule_map, rooms_data, rules_grid, identifiers_by_level, level_specific_large_rooms, specific_small_room_assignments)
+                        available_room = _find_valid_and_available_room(lecture, target_day_idx, target_slot_idx, refined_schedule, room_schedule_map, rooms_data, rules_grid, identifiers_by_level, level_specific_large_rooms, specific_small_room_assignments, model=model)
 
                         if not available_room: continue
 
-                        lecture_clone = lecture.copy()
-                        lecture_clone['room'] = available_room
-                        for level_name in levels_for_this_lecture:
-                            if level_name in temp_schedule:
-                                temp_schedule[level_name][target_day_idx][target_slot_idx].append(lecture_clone)
-                        
-                        new_violations_failures = calculate_schedule_cost(temp_schedule, **cost_args_violations, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-                        new_violation_cost = sum(f.get('penalty', 1) for f in new_violations_failures)
+                        # ✨ تقييم النقل تزايدياً دون نسخ الجدول
+                        new_violation_cost, new_compaction_cost = fitness_evaluator.evaluate_move_penalties(lecture, target_day_idx, target_slot_idx, available_room)
 
                         if new_violation_cost > violation_cost: continue
-
-                        new_total_failures = calculate_schedule_cost(temp_schedule, **cost_args_compaction, non_sharing_teacher_pairs=non_sharing_teacher_pairs)
-                        new_compaction_cost = sum(f.get('penalty', 1) for f in new_total_failures) - new_violation_cost
                         
                         accept_move = False
                         if refinement_level == 'simple':
@@ -6504,7 +10235,7 @@ def refine_and_compact_schedule(
                             log_q.put(log_message_details)
                             refinement_log.append(log_message)
                             
-                            refined_schedule = temp_schedule
+                            fitness_evaluator.apply_move(lecture, target_day_idx, target_slot_idx, available_room)
                             violation_cost = new_violation_cost
                             compaction_cost = new_compaction_cost
                             moves_made += 1
@@ -6538,14 +10269,14 @@ def get_performance_report():
                 SELECT
                     id, settings_name, algorithm_name, unplaced_count,
                     hard_errors, soft_errors, total_cost, execution_time,
-                    timestamp, algorithm_params,
+                    timestamp, algorithm_params, evaluation_profile,
                     ROW_NUMBER() OVER (PARTITION BY algorithm_name, algorithm_params ORDER BY timestamp DESC) as rn
                 FROM performance_log
                 WHERE settings_name = ?
             )
             SELECT
                 algorithm_name, unplaced_count, hard_errors, soft_errors,
-                total_cost, execution_time, timestamp, algorithm_params
+                total_cost, execution_time, timestamp, algorithm_params, evaluation_profile
             FROM RankedRuns
             WHERE rn <= 5
             ORDER BY algorithm_name, algorithm_params, timestamp DESC;
@@ -6567,7 +10298,13 @@ def get_performance_report():
             
             # المفتاح الآن هو اسم الخوارزمية + إعداداتها
             config_key = f"{row['algorithm_name']}{params_str}"
-            performance_by_config[config_key].append(dict(row))
+            row_data = dict(row)
+            if row_data.get('evaluation_profile'):
+                try:
+                    row_data['evaluation_profile'] = json.loads(row_data['evaluation_profile'])
+                except json.JSONDecodeError:
+                    row_data['evaluation_profile'] = None
+            performance_by_config[config_key].append(row_data)
         
         return jsonify(performance_by_config)
 
@@ -6631,18 +10368,19 @@ def validate_schedule_api():
     last_slot_restrictions = settings.get('last_slot_restrictions', [])
     level_specific_large_rooms = settings.get('level_specific_large_rooms', {})
     specific_small_room_assignments = settings.get('specific_small_room_assignments', {})
-    # استدعاء دالة فحص التكاليف التي تقوم بكل العمل
-    conflicts = calculate_schedule_cost(
-        schedule, days, slots, teachers, rooms_data, all_levels,
-        identifiers_by_level, settings.get('special_constraints', {}), 
-        teacher_constraints, settings.get('distribution_rule_type', 'allowed'),
-        lectures_by_teacher_map, globally_unavailable_slots, 
-        settings.get('saturday_teachers', []), 
-        [], # teacher_pairs - يمكن تركه فارغًا لأن الفحص الأساسي يغطيه
-        day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-    )
+    # استدعاء دالة فحص التكاليف التي تقوم بكل العمل (خارج مُحلِّل أي تشغيل جارٍ)
+    with _without_evaluation_profiler():
+        conflicts = calculate_schedule_cost(
+            schedule, days, slots, teachers, rooms_data, all_levels,
+            identifiers_by_level, settings.get('special_constraints', {}), 
+            teacher_constraints, settings.get('distribution_rule_type', 'allowed'),
+            lectures_by_teacher_map, globally_unavailable_slots, 
+            settings.get('saturday_teachers', []), 
+            [], # teacher_pairs - يمكن تركه فارغًا لأن الفحص الأساسي يغطيه
+            day_to_idx, rules_grid, last_slot_restrictions, level_specific_large_rooms, specific_small_room_assignments, constraint_severities, max_sessions_per_day=max_sessions_per_day, consecutive_large_hall_rule=consecutive_large_hall_rule, prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+        )
     
-    return jsonify(conflicts)
+    return jsonify(render_failures(conflicts))
 
 
 # ✨✨ --- استبدل المسار القديم بالكامل بهذا المسار المحدث --- ✨✨
@@ -6762,35 +10500,36 @@ def comprehensive_check_api():
                 })
 
         # ================== المهمة الثانية والثالثة: البحث عن التكرار ==================
-        # استدعاء دالة الفحص مع تمرير كل البيانات التي تم تحميلها
-        conflicts = calculate_schedule_cost(
-            schedule=schedule,
-            days=days,
-            slots=slots,
-            teachers=teachers,
-            rooms_data=rooms_data,
-            levels=all_levels,
-            identifiers_by_level=identifiers_by_level,
-            special_constraints=settings.get('special_constraints', {}),
-            teacher_constraints=teacher_constraints,
-            distribution_rule_type=settings.get('distribution_rule_type', 'allowed'),
-            lectures_by_teacher_map=lectures_by_teacher_map,
-            globally_unavailable_slots=set(),
-            saturday_teachers=settings.get('saturday_teachers', []),
-            teacher_pairs=[],
-            day_to_idx=day_to_idx,
-            rules_grid=rules_grid,
-            last_slot_restrictions=settings.get('last_slot_restrictions', {}),
-            level_specific_large_rooms=level_specific_large_rooms,
-            # === ✨ الخطوة الثانية: تمرير المعامل الجديد هنا ===
-            specific_small_room_assignments=specific_small_room_assignments,
-            constraint_severities=constraint_severities,
-            max_sessions_per_day=max_sessions_per_day,
-            consecutive_large_hall_rule=consecutive_large_hall_rule,
-            prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
-        )
+        # استدعاء دالة الفحص مع تمرير كل البيانات التي تم تحميلها (خارج مُحلِّل أي تشغيل جارٍ)
+        with _without_evaluation_profiler():
+            conflicts = calculate_schedule_cost(
+                schedule=schedule,
+                days=days,
+                slots=slots,
+                teachers=teachers,
+                rooms_data=rooms_data,
+                levels=all_levels,
+                identifiers_by_level=identifiers_by_level,
+                special_constraints=settings.get('special_constraints', {}),
+                teacher_constraints=teacher_constraints,
+                distribution_rule_type=settings.get('distribution_rule_type', 'allowed'),
+                lectures_by_teacher_map=lectures_by_teacher_map,
+                globally_unavailable_slots=set(),
+                saturday_teachers=settings.get('saturday_teachers', []),
+                teacher_pairs=[],
+                day_to_idx=day_to_idx,
+                rules_grid=rules_grid,
+                last_slot_restrictions=settings.get('last_slot_restrictions', {}),
+                level_specific_large_rooms=level_specific_large_rooms,
+                # === ✨ الخطوة الثانية: تمرير المعامل الجديد هنا ===
+                specific_small_room_assignments=specific_small_room_assignments,
+                constraint_severities=constraint_severities,
+                max_sessions_per_day=max_sessions_per_day,
+                consecutive_large_hall_rule=consecutive_large_hall_rule,
+                prefer_morning_slots=prefer_morning_slots, non_sharing_teacher_pairs=non_sharing_teacher_pairs
+            )
 
-        for conflict in conflicts:
+        for conflict in render_failures(conflicts):
             reason = conflict.get('reason', '')
             if 'تعارض الأستاذ' in reason:
                 conflict['type'] = 'duplicate_teacher'
@@ -7031,6 +10770,15 @@ def force_mutation():
 # ✨✨ --- نهاية الإضافة الجديدة --- ✨✨
 
 if __name__ == '__main__':
+    # ضروري لعمليات المجمّع الفرعية عند تشغيل البرنامج كملف تنفيذي مجمّد
+    multiprocessing.freeze_support()
+    # ✨ مقاييس الأداء وفحص تطابق المقيّمات تعمل دون قاعدة بيانات أو خادم:
+    # python app.py --benchmark population | python app.py --check-equivalence
+    if len(sys.argv) > 2 and sys.argv[1] == '--benchmark':
+        sys.exit(run_benchmark(sys.argv[2]))
+    if len(sys.argv) > 1 and sys.argv[1] == '--check-equivalence':
+        _print_benchmark(check_evaluator_equivalence())
+        sys.exit(0)
     # --- بداية التعديل ---
     # إنشاء سياق تطبيق يدويًا لتهيئة قاعدة البيانات
     with app.app_context():
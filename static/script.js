@@ -413,6 +413,9 @@ function collectAllCurrentSettings() {
         method: document.querySelector('input[name="scheduling_method"]:checked').value,
         use_strict_hierarchy: document.getElementById('strict-hierarchy-cb').checked,
         timeout: document.getElementById('timeout-input').value,
+        backtracking_backjumping: document.getElementById('backtracking-backjumping-cb').checked,
+        backtracking_workers: document.getElementById('backtracking-workers-input').value,
+        backtracking_seed: document.getElementById('backtracking-seed-input').value,
         tabu_iterations: document.getElementById('tabu-iterations-input').value,
         tabu_tenure: document.getElementById('tabu-tenure-input').value,
         tabu_neighborhood_size: document.getElementById('tabu-neighborhood-size-input').value,
@@ -453,6 +456,11 @@ function collectAllCurrentSettings() {
         max_sessions_per_day: document.getElementById('max-sessions-per-day-select').value,
         consecutive_large_hall_rule: document.getElementById('consecutive-large-hall-select').value,
         intensive_search_attempts: document.getElementById('intensive-search-attempts').value,
+        fitness_cache_size: document.getElementById('fitness-cache-size-input').value,
+        enable_evaluation_profiling: document.getElementById('enable-evaluation-profiling-cb').checked,
+        greedy_starts: document.getElementById('greedy-starts-input').value,
+        greedy_workers: document.getElementById('greedy-workers-input').value,
+        greedy_seed: document.getElementById('greedy-seed-input').value,
         distribution_rule_type: document.querySelector('input[name="distribution_rule_type"]:checked').value,
         prioritize_primary: document.getElementById('prioritize-primary-slots-cb').checked,
         prefer_morning_slots: document.getElementById('prefer-morning-slots-cb').checked,
@@ -684,6 +692,7 @@ function setupEventListeners() {
     document.querySelectorAll('input[name="scheduling_method"]').forEach(radio => {
         radio.addEventListener('change', (event) => {
             document.getElementById('timeout-container').style.display = 'none';
+            document.getElementById('backtracking-settings-container').style.display = 'none';
             document.getElementById('tabu-search-container').style.display = 'none';
             document.getElementById('genetic-algorithm-container').style.display = 'none';
             document.getElementById('lns-container').style.display = 'none';
@@ -692,7 +701,8 @@ function setupEventListeners() {
             document.getElementById('clonalg-container').style.display = 'none';
             document.getElementById('hyper-heuristic-container').style.display = 'none';
 
-            if (event.target.value === 'backtracking') document.getElementById('timeout-container').style.display = 'block';
+            if (event.target.value === 'backtracking' || event.target.value === 'cp_sat') document.getElementById('timeout-container').style.display = 'block';
+            if (event.target.value === 'backtracking') document.getElementById('backtracking-settings-container').style.display = 'block';
             else if (event.target.value === 'tabu_search') document.getElementById('tabu-search-container').style.display = 'block';
             else if (event.target.value === 'genetic_algorithm') document.getElementById('genetic-algorithm-container').style.display = 'block';
             else if (event.target.value === 'large_neighborhood_search') document.getElementById('lns-container').style.display = 'block';
@@ -2099,9 +2109,17 @@ function applySettingsToUI(settings) {
             document.querySelectorAll('input[name="hh_llh_select"]').forEach(cb => cb.checked = true);
         }
         document.getElementById('timeout-input').value = algoSettings.timeout || 30;
+        document.getElementById('backtracking-backjumping-cb').checked = algoSettings.backtracking_backjumping !== undefined ? algoSettings.backtracking_backjumping : true;
+        document.getElementById('backtracking-workers-input').value = algoSettings.backtracking_workers !== undefined ? algoSettings.backtracking_workers : 1;
+        document.getElementById('backtracking-seed-input').value = algoSettings.backtracking_seed || '';
         document.getElementById('tabu-iterations-input').value = algoSettings.tabu_iterations || 1000;
         // ... (بقية حقول الخوارزميات تقع ضمن هذا النطاق ويجب أن تعمل بشكل صحيح) ...
         document.getElementById('intensive-search-attempts').value = algoSettings.intensive_search_attempts || 1;
+        document.getElementById('fitness-cache-size-input').value = algoSettings.fitness_cache_size !== undefined ? algoSettings.fitness_cache_size : 4096;
+        document.getElementById('enable-evaluation-profiling-cb').checked = algoSettings.enable_evaluation_profiling || false;
+        document.getElementById('greedy-starts-input').value = algoSettings.greedy_starts || 30;
+        document.getElementById('greedy-workers-input').value = algoSettings.greedy_workers !== undefined ? algoSettings.greedy_workers : 2;
+        document.getElementById('greedy-seed-input').value = algoSettings.greedy_seed || '';
         if (algoSettings.distribution_rule_type) {
             document.querySelector(`input[name="distribution_rule_type"][value="${algoSettings.distribution_rule_type}"]`).checked = true;
         }
@@ -2778,6 +2796,9 @@ function loadSettingsAndBuildUI() {
             }
             // ملء الحقول بالقيم المحفوظة
             document.getElementById('timeout-input').value = algo.timeout || 30;
+            document.getElementById('backtracking-backjumping-cb').checked = algo.backtracking_backjumping !== undefined ? algo.backtracking_backjumping : true;
+            document.getElementById('backtracking-workers-input').value = algo.backtracking_workers !== undefined ? algo.backtracking_workers : 1;
+            document.getElementById('backtracking-seed-input').value = algo.backtracking_seed || '';
             document.getElementById('tabu-iterations-input').value = algo.tabu_iterations || 1000;
             document.getElementById('tabu-tenure-input').value = algo.tabu_tenure || 10;
             document.getElementById('tabu-neighborhood-size-input').value = algo.tabu_neighborhood_size || 50;
@@ -2867,6 +2888,11 @@ function loadSettingsAndBuildUI() {
                 }
             }
             document.getElementById('strict-hierarchy-cb').checked = algo.use_strict_hierarchy || false;
+            document.getElementById('fitness-cache-size-input').value = algo.fitness_cache_size !== undefined ? algo.fitness_cache_size : 4096;
+            document.getElementById('enable-evaluation-profiling-cb').checked = algo.enable_evaluation_profiling || false;
+            document.getElementById('greedy-starts-input').value = algo.greedy_starts || 30;
+            document.getElementById('greedy-workers-input').value = algo.greedy_workers !== undefined ? algo.greedy_workers : 2;
+            document.getElementById('greedy-seed-input').value = algo.greedy_seed || '';
         }
 
             if (settings.algorithm_settings && settings.algorithm_settings.refinement_selected_teachers) {